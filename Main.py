@@ -5,17 +5,22 @@ Este script inicia el gestor de documentos y la interfaz de chat.
 
 import logging
 import argparse
+import json
 import os
 import sys
+import time
 from pathlib import Path
 
 # Añadir el directorio raíz al path para importar los módulos de la aplicación
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app.core.document_manager import DocumentManager
-from app.query.chat_interface import CommandLineChatInterface
+# Los módulos de cada comando (LangChain, cargadores de documentos, cliente de Google Drive, Supabase)
+# se importan dentro de la función que los usa: importarlos aquí añadía más de un segundo al arranque
+# de cualquier comando. tests/test_startup.py comprueba que no vuelvan a importarse al cargar Main.py.
 from app.config.settings import OPENAI_API_KEY, SUPABASE_URL, SUPABASE_KEY, GOOGLE_APPLICATION_CREDENTIALS
-from app.database.admin_cli import main as admin_main
+from app.utils.metrics import start_metrics_server
+from app.utils.metrics_collector import MetricsCollector, MetricsReporter, parse_address
+from app.utils.profiler import SamplingProfiler, profile_path
 
 # Configurar logging de manera más robusta
 # Primero eliminar cualquier handler existente
@@ -44,8 +49,12 @@ logger = logging.getLogger(__name__)
 logger.info("=== INICIO DE SESIÓN ===")
 logger.info("Logger configurado para escribir en: {}".format(os.path.abspath("rag_app.log")))
 
-def check_environment():
-    """Verifica que las variables de entorno necesarias estén configuradas."""
+def check_environment(require_drive: bool = True):
+    """Verifica que las variables de entorno necesarias estén configuradas.
+    
+    Args:
+        require_drive: Si es False, no se exigen las credenciales de Google Drive.
+    """
     missing_vars = []
     
     if not OPENAI_API_KEY:
@@ -57,11 +66,12 @@ def check_environment():
     if not SUPABASE_KEY:
         missing_vars.append("SUPABASE_KEY")
     
-    if not GOOGLE_APPLICATION_CREDENTIALS:
-        missing_vars.append("GOOGLE_APPLICATION_CREDENTIALS")
-    elif not os.path.exists(GOOGLE_APPLICATION_CREDENTIALS):
-        logger.error(f"El archivo de credenciales de Google no existe: {GOOGLE_APPLICATION_CREDENTIALS}")
-        missing_vars.append("GOOGLE_APPLICATION_CREDENTIALS (archivo no encontrado)")
+    if require_drive:
+        if not GOOGLE_APPLICATION_CREDENTIALS:
+            missing_vars.append("GOOGLE_APPLICATION_CREDENTIALS")
+        elif not os.path.exists(GOOGLE_APPLICATION_CREDENTIALS):
+            logger.error(f"El archivo de credenciales de Google no existe: {GOOGLE_APPLICATION_CREDENTIALS}")
+            missing_vars.append("GOOGLE_APPLICATION_CREDENTIALS (archivo no encontrado)")
     
     if missing_vars:
         logger.error(f"Faltan las siguientes variables de entorno: {', '.join(missing_vars)}")
@@ -72,6 +82,8 @@ def check_environment():
 
 def process_all_documents():
     """Procesa todos los documentos en la carpeta monitoreada."""
+    from app.core.document_manager import DocumentManager
+    
     logger.info("Iniciando procesamiento de todos los documentos...")
     
     document_manager = DocumentManager()
@@ -81,6 +93,8 @@ def process_all_documents():
 
 def start_monitoring():
     """Inicia el monitoreo de la carpeta de Google Drive."""
+    from app.core.document_manager import DocumentManager
+    
     logger.info("Iniciando monitoreo de la carpeta de Google Drive...")
     
     document_manager = DocumentManager()
@@ -100,15 +114,58 @@ def start_monitoring():
 
 def start_chat():
     """Inicia la interfaz de chat."""
+    from app.query.chat_interface import CommandLineChatInterface
+    
     logger.info("Iniciando interfaz de chat...")
     
     chat_interface = CommandLineChatInterface()
     chat_interface.run()
 
+def run_batch(args):
+    """Responde un lote de preguntas y escribe los resultados en JSONL."""
+    from app.query.batch_query import load_questions
+    from app.query.rag_query import RAGQuerySystem
+    
+    questions = load_questions(args.input)
+    logger.info(f"Iniciando consulta por lotes de {len(questions)} preguntas desde {args.input}")
+    
+    rag_system = RAGQuerySystem()
+    summary = rag_system.query_batch(
+        questions,
+        args.output,
+        num_results=args.top_k,
+        similarity_threshold=args.threshold,
+        resume=not args.no_resume,
+        log_queries=args.log_queries,
+        search_workers=args.search_workers,
+        llm_workers=args.llm_workers,
+        embedding_batch_size=args.embedding_batch_size
+    )
+    
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+def run_collector(args):
+    """Combina las métricas de varios procesos y guarda las estadísticas periódicamente."""
+    collector = MetricsCollector(parse_address(args.address))
+    collector.start()
+    try:
+        while True:
+            time.sleep(args.interval)
+            stats = collector.get_performance_stats()
+            with open(args.output, "w") as f:
+                json.dump(stats, f, indent=2)
+            logger.info(f"Estadísticas de {len(stats['workers'])} procesos guardadas en {args.output}")
+    except KeyboardInterrupt:
+        logger.info("Colector de métricas detenido")
+    finally:
+        collector.stop()
+
 def run_admin(args):
     """Ejecuta la herramienta de administración de la base de datos."""
-    # Eliminar el comando "admin" de los argumentos
-    sys.argv.pop(1)
+    from app.database.admin_cli import main as admin_main
+    
+    # Pasar a la herramienta solo los argumentos que siguen al comando "admin"
+    sys.argv = [f"{sys.argv[0]} admin"] + args.admin_args
     
     # Ejecutar la herramienta de administración
     admin_main()
@@ -117,6 +174,14 @@ def main():
     """Función principal."""
     parser = argparse.ArgumentParser(description="Aplicación RAG para consulta de documentos")
     
+    parser.add_argument("--metrics-port", type=int, help="Publica las métricas en formato OpenMetrics en http://0.0.0.0:PUERTO/metrics")
+    
+    parser.add_argument("--metrics-collector", metavar="HOST:PUERTO", help="Envía las estadísticas de rendimiento al colector indicado (ver el comando collector)")
+    
+    parser.add_argument("--profile", metavar="RUTA", help="Perfila el comando por muestreo y guarda el perfil (.json para speedscope, pilas colapsadas en otro caso)")
+    
+    parser.add_argument("--profile-interval", type=float, default=0.01, help="Segundos entre muestras del profiler")
+    
     # Definir los subcomandos
     subparsers = parser.add_subparsers(dest="command", help="Comando a ejecutar")
     
@@ -129,38 +194,89 @@ def main():
     # Subcomando para iniciar la interfaz de chat
     chat_parser = subparsers.add_parser("chat", help="Inicia la interfaz de chat")
     
+    # Subcomando para consultas por lotes
+    batch_parser = subparsers.add_parser("batch", help="Responde un lote de preguntas y escribe los resultados en JSONL")
+    batch_parser.add_argument("input", help="Archivo de preguntas (.txt una por línea, o .jsonl con 'id' y 'question')")
+    batch_parser.add_argument("-o", "--output", default="batch_results.jsonl", help="Archivo JSONL de resultados (sirve de checkpoint)")
+    batch_parser.add_argument("--top-k", type=int, default=5, help="Número de fragmentos a recuperar por pregunta")
+    batch_parser.add_argument("--threshold", type=float, default=0.1, help="Umbral de similitud (0-1)")
+    batch_parser.add_argument("--search-workers", type=int, default=8, help="Búsquedas por similitud simultáneas")
+    batch_parser.add_argument("--llm-workers", type=int, default=4, help="Llamadas simultáneas máximas al LLM")
+    batch_parser.add_argument("--embedding-batch-size", type=int, default=100, help="Preguntas por llamada de embeddings")
+    batch_parser.add_argument("--no-resume", action="store_true", help="Ignora el checkpoint y sobrescribe la salida")
+    batch_parser.add_argument("--log-queries", action="store_true", help="Registra cada consulta en la tabla 'queries'")
+    
+    # Subcomando para combinar las métricas de varios procesos
+    collector_parser = subparsers.add_parser("collector", help="Combina las estadísticas de rendimiento enviadas por varios procesos")
+    collector_parser.add_argument("--address", default="127.0.0.1:9150", help="Dirección de escucha (HOST:PUERTO)")
+    collector_parser.add_argument("-o", "--output", default="performance_metrics.json", help="Archivo JSON con las estadísticas combinadas")
+    collector_parser.add_argument("--interval", type=float, default=10.0, help="Segundos entre escrituras del archivo")
+    
     # Subcomando para ejecutar la herramienta de administración
     admin_parser = subparsers.add_parser("admin", help="Ejecuta la herramienta de administración de la base de datos")
+    admin_parser.add_argument("admin_args", nargs=argparse.REMAINDER,
+                              help="Comando de administración y sus opciones (p. ej. list, stats --json)")
     
     # Parsear los argumentos
     args = parser.parse_args()
     
-    # Ejecutar el comando correspondiente
-    if args.command == "process":
-        # Verificar las variables de entorno
-        if not check_environment():
-            return
-        process_all_documents()
-    elif args.command == "monitor":
-        # Verificar las variables de entorno
-        if not check_environment():
-            return
-        start_monitoring()
-    elif args.command == "chat":
-        # Verificar las variables de entorno
-        if not check_environment():
-            return
-        start_chat()
-    elif args.command == "admin":
-        # No verificar todas las variables de entorno
-        # Solo necesitamos las credenciales de Supabase para la administración
-        if not SUPABASE_URL or not SUPABASE_KEY:
-            logger.error("Faltan las credenciales de Supabase")
-            logger.error("Por favor, configura las variables SUPABASE_URL y SUPABASE_KEY en el archivo .env")
-            return
-        run_admin(args)
-    else:
-        parser.print_help()
+    # Exponer las métricas para Prometheus mientras dure el comando
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    
+    # Enviar las estadísticas de este proceso al colector
+    reporter = None
+    if args.metrics_collector:
+        reporter = MetricsReporter(parse_address(args.metrics_collector))
+        reporter.start()
+    
+    # Perfilar el comando si se solicitó (el perfil se guarda también al interrumpirlo)
+    profiler = None
+    if args.profile and args.command:
+        profiler = SamplingProfiler(interval=args.profile_interval)
+        profiler.start()
+    
+    try:
+        # Ejecutar el comando correspondiente
+        if args.command == "process":
+            # Verificar las variables de entorno
+            if not check_environment():
+                return
+            process_all_documents()
+        elif args.command == "monitor":
+            # Verificar las variables de entorno
+            if not check_environment():
+                return
+            start_monitoring()
+        elif args.command == "chat":
+            # El chat no usa Google Drive (las estadísticas se consultan directamente en Supabase)
+            if not check_environment(require_drive=False):
+                return
+            start_chat()
+        elif args.command == "batch":
+            # Las consultas por lotes no necesitan acceso a Google Drive
+            if not check_environment(require_drive=False):
+                return
+            run_batch(args)
+        elif args.command == "collector":
+            run_collector(args)
+        elif args.command == "admin":
+            # No verificar todas las variables de entorno
+            # Solo necesitamos las credenciales de Supabase para la administración
+            if not SUPABASE_URL or not SUPABASE_KEY:
+                logger.error("Faltan las credenciales de Supabase")
+                logger.error("Por favor, configura las variables SUPABASE_URL y SUPABASE_KEY en el archivo .env")
+                return
+            run_admin(args)
+        else:
+            parser.print_help()
+    finally:
+        if profiler:
+            profiler.stop()
+            profiler.write(profile_path(args.profile, args.command))
+        if reporter:
+            # Enviar el estado final: un comando más corto que el intervalo no llegaría a enviar nada
+            reporter.stop()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
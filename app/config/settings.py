@@ -20,6 +20,8 @@ LLM_MODEL = "gpt-4o-mini"
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 SUPABASE_COLLECTION_NAME = os.getenv("SUPABASE_COLLECTION_NAME", "documents")
+# Conexión directa a Postgres (opcional): cargas masivas con COPY en lugar de PostgREST
+SUPABASE_DB_URL = os.getenv("SUPABASE_DB_URL")
 
 # Configuración de Google Drive
 GOOGLE_APPLICATION_CREDENTIALS = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
@@ -3,6 +3,7 @@ Gestor de documentos.
 Este módulo coordina el procesamiento de documentos, la generación de embeddings y la base de datos vectorial.
 """
 
+import functools
 import logging
 import os
 from typing import Dict, Any, List, Optional
@@ -12,11 +13,11 @@ from datetime import datetime
 import json
 import time
 
-from app.drive.google_drive_client import GoogleDriveClient
-from app.drive.folder_monitor import GoogleDriveFolderMonitor
-from app.document_processing.document_loader import DocumentProcessor
-from app.document_processing.embeddings import EmbeddingGenerator
+from app.database.statistics import DocumentStatistics
 from app.database.vector_store import VectorDatabase
+from app.utils.performance_metrics import performance_tracker
+from app.utils.tracing import tracer
+from app.utils.usage import estimate_cost
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -25,19 +26,44 @@ class DocumentManager:
     """Clase para gestionar documentos y coordinar los diferentes componentes."""
     
     def __init__(self):
-        """Inicializa el gestor de documentos."""
-        self.drive_client = GoogleDriveClient()
-        self.document_processor = DocumentProcessor()
-        self.embedding_generator = EmbeddingGenerator()
+        """Inicializa el gestor de documentos.
+        
+        Los componentes de ingesta se crean la primera vez que se usan: el cliente y el monitor de
+        Google Drive autentican la cuenta de servicio y descargan el documento de descubrimiento de
+        la API, y el monitor lee además su archivo de estado.
+        """
         self.vector_db = VectorDatabase()
-        self.folder_monitor = GoogleDriveFolderMonitor()
+        logger.info("Gestor de documentos inicializado")
+    
+    @functools.cached_property
+    def drive_client(self):
+        """Cliente de Google Drive."""
+        from app.drive.google_drive_client import GoogleDriveClient
+        return GoogleDriveClient()
+    
+    @functools.cached_property
+    def document_processor(self):
+        """Procesador de documentos."""
+        from app.document_processing.document_loader import DocumentProcessor
+        return DocumentProcessor()
+    
+    @functools.cached_property
+    def embedding_generator(self):
+        """Generador de embeddings."""
+        from app.document_processing.embeddings import EmbeddingGenerator
+        return EmbeddingGenerator()
+    
+    @functools.cached_property
+    def folder_monitor(self):
+        """Monitor de la carpeta de Google Drive, con los callbacks de eventos registrados."""
+        from app.drive.folder_monitor import GoogleDriveFolderMonitor
+        monitor = GoogleDriveFolderMonitor()
         
         # Registrar callbacks para eventos de archivos
-        self.folder_monitor.register_callback("new_file", self.process_new_file)
-        self.folder_monitor.register_callback("modified_file", self.process_modified_file)
-        self.folder_monitor.register_callback("deleted_file", self.process_deleted_file)
-        
-        logger.info("Gestor de documentos inicializado")
+        monitor.register_callback("new_file", self.process_new_file)
+        monitor.register_callback("modified_file", self.process_modified_file)
+        monitor.register_callback("deleted_file", self.process_deleted_file)
+        return monitor
     
     def start(self):
         """Inicia el monitoreo de la carpeta de Google Drive."""
@@ -46,7 +72,9 @@ class DocumentManager:
     
     def stop(self):
         """Detiene el monitoreo de la carpeta de Google Drive."""
-        self.folder_monitor.stop_monitoring()
+        # Si el monitor no llegó a crearse no hay nada que detener
+        if "folder_monitor" in self.__dict__:
+            self.folder_monitor.stop_monitoring()
         logger.info("Gestor de documentos detenido")
     
     def process_new_file(self, file_data: Dict[str, Any]):
@@ -261,6 +289,8 @@ class DocumentManager:
         except Exception as e:
             logger.error(f"Error al procesar el archivo eliminado {file_data.get('id', '')}: {e}")
     
+    @performance_tracker.track_time("document_processing")
+    @tracer.traced("ingest.process_file")
     def _process_file(self, file_path: str, file_metadata: Dict[str, Any]):
         """Procesa un archivo y lo añade a la base de datos vectorial.
         
@@ -270,8 +300,17 @@ class DocumentManager:
         """
         start_time = time.time()
         
+        # La traza de ingesta identifica la versión del documento de la que salen sus fragmentos
+        ingest_span = tracer.current_span()
+        ingest_span.set_attributes(**{
+            "document.file_id": file_metadata.get("file_id"),
+            "document.name": file_metadata.get("name"),
+            "document.version": file_metadata.get("checksum")
+        })
+        
         # Procesar el archivo para obtener fragmentos
-        chunks = self.document_processor.process_file(file_path, file_metadata)
+        with tracer.span("ingest.chunking"):
+            chunks = self.document_processor.process_file(file_path, file_metadata)
         
         if not chunks:
             logger.warning(f"No se pudieron extraer fragmentos del archivo {file_metadata.get('name')}")
@@ -310,7 +349,10 @@ class DocumentManager:
                 enriched_texts_metadata.append(chunk.get('metadata', {}))
                 
         # Generar embeddings utilizando metadatos enriquecidos
-        embeddings = self.embedding_generator.generate_embeddings_batch(batch_texts, enriched_texts_metadata)
+        usage = {}
+        with tracer.span("ingest.embedding", chunk_count=chunks_count) as embedding_span:
+            embeddings = self.embedding_generator.generate_embeddings_batch(batch_texts, enriched_texts_metadata, usage=usage)
+            embedding_span.set_attribute("embedding.tokens", usage.get("embedding_tokens"))
         
         embedding_time = time.time() - embedding_start_time
         logger.info(f"Generación de embeddings completada en {embedding_time:.2f} segundos")
@@ -319,26 +361,37 @@ class DocumentManager:
         db_start_time = time.time()
         logger.info(f"Guardando {chunks_count} fragmentos en la base de datos...")
         
-        success_count = 0
-        for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-            # Registrar progreso cada 50 fragmentos o en el último
-            if i % 50 == 0 or i == chunks_count - 1:
-                logger.info(f"Guardando en BD: {i+1}/{chunks_count} fragmentos ({(i+1)/chunks_count*100:.1f}%)")
-                
-            if embedding:
-                content = chunk.get('content', '')
-                metadata = chunk.get('metadata', {})
-                chunk_id = chunk.get('id', self._generate_chunk_id(file_metadata.get("file_id", ""), i))
-                
-                # Añadir a la base de datos (solo guardar el contenido original, no el enriquecido)
-                if self.vector_db.add_document(chunk_id, content, metadata, embedding):
-                    success_count += 1
-            else:
-                logger.error(f"No se pudo generar embedding para el fragmento {i} del archivo {file_metadata.get('name')}")
+        with tracer.span("ingest.db_write", chunk_count=chunks_count) as db_span:
+            documents = []
+            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
+                if embedding:
+                    metadata = chunk.get('metadata', {})
+                    # Enlazar el fragmento con su versión y su traza de ingesta (ver tracing.annotate_retrieval)
+                    metadata["checksum"] = file_metadata.get("checksum", "")
+                    metadata["ingest_trace_id"] = ingest_span.trace_id
+                    # Solo se guarda el contenido original, no el enriquecido
+                    documents.append({
+                        "id": chunk.get('id', self._generate_chunk_id(file_metadata.get("file_id", ""), i)),
+                        "content": chunk.get('content', ''),
+                        "metadata": metadata,
+                        "embedding": embedding
+                    })
+                else:
+                    logger.error(f"No se pudo generar embedding para el fragmento {i} del archivo {file_metadata.get('name')}")
+            
+            # Todos los fragmentos del archivo en una sola escritura (COPY o upserts por lotes)
+            success_count = self.vector_db.add_documents(documents)
+            db_span.set_attribute("ingest.saved_chunks", success_count)
         
         db_time = time.time() - db_start_time
         total_time = time.time() - start_time
         
+        # Registrar el consumo de tokens del archivo (ver "costs" en la herramienta de administración)
+        usage["cost"] = estimate_cost(usage)
+        ingest_span.set_attributes(**{"ingest.chunk_count": chunks_count, "cost_usd": usage["cost"]})
+        performance_tracker.track_usage("ingest", file_metadata.get("name", ""), usage)
+        self.vector_db.record_file_usage(file_metadata.get("file_id", ""), dict(usage, chunks=chunks_count))
+        logger.info(f"Consumo de embeddings: {usage.get('embedding_tokens', 0)} tokens (~${usage['cost']:.4f})")
         logger.info(f"Se añadieron {success_count} de {chunks_count} fragmentos a la base de datos")
         logger.info(f"Guardado en BD completado en {db_time:.2f} segundos")
         logger.info(f"Procesamiento total completado en {total_time:.2f} segundos (~{total_time/60:.2f} minutos)")
@@ -467,28 +520,9 @@ class DocumentManager:
         """Obtiene estadísticas sobre los documentos procesados.
         
         Returns:
-            Dict[str, Any]: Estadísticas de los documentos.
+            Dict[str, Any]: Estadísticas de los documentos (ver DocumentStatistics.get_statistics).
         """
-        try:
-            # Para una implementación real, necesitaríamos consultas SQL más complejas
-            # Aquí asumimos que podemos hacerlo a través de la API de Supabase
-            
-            # Por ahora, devolver información básica
-            stats = {
-                "total_files": 0,
-                "total_chunks": 0,
-                "last_processed": datetime.now().isoformat()
-            }
-            
-            logger.info("Estadísticas de documentos obtenidas")
-            return stats
-        except Exception as e:
-            logger.error(f"Error al obtener estadísticas de documentos: {e}")
-            return {
-                "error": str(e),
-                "total_files": 0,
-                "total_chunks": 0
-            }
+        return DocumentStatistics(self.vector_db).get_statistics()
     
     def _normalize_date_string(self, date_str: str) -> str:
         """Normaliza un string de fecha para comparación.
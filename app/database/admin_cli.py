@@ -10,14 +10,19 @@ import os
 import json
 from tabulate import tabulate
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # Añadir el directorio raíz al path para importar los módulos de la aplicación
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from app.database.vector_store import VectorDatabase
+from app.database.bulk_import import import_export
+from app.database.export import DEFAULT_PAGE_SIZE, EMBEDDING_DTYPES, EMBEDDING_MODES, EXPORT_FORMATS, export_tables
+from app.database.statistics import DocumentStatistics, format_bytes, format_statistics
 from app.database.setup_scripts.setup_database import setup_database, check_database
 from app.config.settings import SUPABASE_URL, SUPABASE_KEY
+from app.utils.slow_query_log import read_entries, slow_query_log, summarize
+from app.utils.usage import usage_cost
 
 # Configurar logging
 logging.basicConfig(
@@ -35,13 +40,16 @@ def list_files(args):
     """
     try:
         db = VectorDatabase()
-        response = db.supabase.table("files").select("*").execute()
+        # Solo las columnas de la tabla (sin metadatos); los fragmentos se cuentan en el servidor
+        response = db.supabase.table("files").select("id, name, mime_type, status, processed_at").execute()
         files = response.data
         
         if not files:
             print("No hay archivos en la base de datos.")
             return
         
+        chunk_counts = DocumentStatistics(db).get_chunk_counts()
+        
         # Formatear la salida en una tabla
         table_data = []
         for file in files:
@@ -55,16 +63,19 @@ def list_files(args):
                     pass
             
             # Añadir fila a la tabla
+            counts = chunk_counts.get(file.get("id"), {})
             table_data.append([
                 file.get("id", ""),
                 file.get("name", ""),
                 file.get("mime_type", ""),
                 file.get("status", ""),
-                processed_at
+                processed_at,
+                counts.get("chunks", "-" if not chunk_counts else 0),
+                format_bytes(counts["content_bytes"]) if counts else "-"
             ])
         
         # Imprimir la tabla
-        headers = ["ID", "Nombre", "Tipo MIME", "Estado", "Procesado en"]
+        headers = ["ID", "Nombre", "Tipo MIME", "Estado", "Procesado en", "Fragmentos", "Contenido"]
         print(tabulate(table_data, headers=headers, tablefmt="grid"))
         
         print(f"\nTotal: {len(files)} archivos")
@@ -136,7 +147,7 @@ def show_file_details(args):
         print(f"Error: {e}")
 
 def delete_file(args):
-    """Elimina un archivo de la base de datos.
+    """Elimina los fragmentos de uno o varios archivos de la base de datos.
     
     Args:
         args: Argumentos de la línea de comandos.
@@ -144,30 +155,58 @@ def delete_file(args):
     try:
         db = VectorDatabase()
         
-        # Verificar que el archivo existe
-        response = db.supabase.table("files").select("*").eq("id", args.file_id).execute()
+        # Verificar que los archivos existen
+        response = db.supabase.table("files").select("id, name").in_("id", args.file_ids).execute()
+        files = {file["id"]: file for file in response.data or []}
         
-        if not response.data or len(response.data) == 0:
-            print(f"Archivo con ID {args.file_id} no encontrado.")
+        for file_id in args.file_ids:
+            if file_id not in files:
+                print(f"Archivo con ID {file_id} no encontrado.")
+        if not files:
             return
         
-        file = response.data[0]
-        
         # Confirmar eliminación
         if not args.force:
-            confirm = input(f"¿Estás seguro de que deseas eliminar el archivo '{file.get('name', args.file_id)}'? (s/N): ")
+            names = ", ".join(f"'{file.get('name', file_id)}'" for file_id, file in files.items())
+            confirm = input(f"¿Estás seguro de que deseas eliminar {'los archivos' if len(files) > 1 else 'el archivo'} {names}? (s/N): ")
             if confirm.lower() != "s":
                 print("Operación cancelada.")
                 return
         
-        # Eliminar el archivo y sus fragmentos
-        deleted_count = db.delete_chunks_by_file_id(args.file_id)
+        # Eliminar los fragmentos de todos los archivos en una sola llamada
+        deleted = db.delete_chunks_by_file_ids(list(files))
         
-        print(f"Se eliminaron {deleted_count} fragmentos del archivo '{file.get('name', args.file_id)}'.")
+        DocumentStatistics.clear_cache()
+        
+        for file_id, file in files.items():
+            print(f"Se eliminaron {deleted.get(file_id, 0)} fragmentos del archivo '{file.get('name', file_id)}'.")
     except Exception as e:
         logger.error(f"Error al eliminar el archivo: {e}")
         print(f"Error: {e}")
 
+def backfill_file_ids(args):
+    """Migra los fragmentos antiguos por lotes: metadatos en texto JSON a objeto y columna file_id.
+    
+    Args:
+        args: Argumentos de la línea de comandos.
+    """
+    try:
+        db = VectorDatabase()
+        total = 0
+        while True:
+            updated = db.supabase.rpc("backfill_document_file_ids", {"batch_size": args.batch_size}).execute().data
+            if not updated:
+                break
+            total += updated
+            print(f"  {total} fragmentos actualizados...", end="\r", flush=True)
+        
+        DocumentStatistics.clear_cache()
+        
+        print(f"Se migraron {total} fragmentos (columna file_id y metadatos guardados como texto JSON).")
+    except Exception as e:
+        logger.error(f"Error al rellenar file_id: {e}")
+        print(f"Error: {e}")
+
 def list_queries(args):
     """Lista las consultas realizadas.
     
@@ -219,6 +258,97 @@ def list_queries(args):
         logger.error(f"Error al listar consultas: {e}")
         print(f"Error: {e}")
 
+def show_costs(args):
+    """Muestra el consumo de tokens total y los archivos y consultas más costosos.
+    
+    Args:
+        args: Argumentos de la línea de comandos.
+    """
+    try:
+        db = VectorDatabase()
+        
+        # Consumo de la última ingesta de cada archivo (guardado en sus metadatos)
+        files = []
+        for file in db.supabase.table("files").select("id, name, metadata").execute().data:
+            metadata = file.get("metadata") or {}
+            if isinstance(metadata, str):
+                metadata = json.loads(metadata)
+            if metadata.get("usage"):
+                files.append((file.get("name") or file.get("id"), metadata["usage"]))
+        
+        # Consumo de las consultas más recientes
+        response = (db.supabase.table("queries").select("id, query, usage, created_at")
+                    .not_.is_("usage", "null").order("created_at", desc=True).limit(args.scan).execute())
+        queries = [(query.get("query", ""), query["usage"]) for query in response.data]
+        
+        for title, items in (("Archivos", files), ("Consultas", queries)):
+            total_cost = sum(usage_cost(usage) for _, usage in items)
+            print(f"\n=== {title} más costosos ({len(items)} con consumo registrado, total ${total_cost:.4f}) ===")
+            ranked = sorted(items, key=lambda item: usage_cost(item[1]), reverse=True)[:args.top]
+            table_data = [
+                [
+                    label[:60],
+                    usage.get("embedding_tokens", 0),
+                    usage.get("input_tokens", 0),
+                    usage.get("output_tokens", 0),
+                    f"{usage_cost(usage):.5f}"
+                ]
+                for label, usage in ranked
+            ]
+            headers = ["Nombre" if title == "Archivos" else "Consulta", "Tokens embedding", "Tokens entrada", "Tokens salida", "Coste (USD)"]
+            print(tabulate(table_data, headers=headers, tablefmt="grid"))
+    except Exception as e:
+        logger.error(f"Error al calcular los costes: {e}")
+        print(f"Error: {e}")
+
+def show_slow_queries(args):
+    """Resume el registro de consultas lentas por periodo y muestra las más lentas.
+    
+    Args:
+        args: Argumentos de la línea de comandos.
+    """
+    try:
+        since = datetime.now() - timedelta(days=args.days) if args.days else None
+        entries = read_entries(args.file, since)
+        if not entries:
+            print(f"No hay consultas lentas registradas en {args.file}")
+            return
+        
+        print(f"\n=== Consultas lentas por {args.by} ({len(entries)} en total) ===")
+        table_data = [
+            [
+                row["period"],
+                row["count"],
+                f"{row['p50']:.2f}",
+                f"{row['p95']:.2f}",
+                f"{row['max']:.2f}",
+                row["avg_prompt_tokens"] or "-",
+                ", ".join(f"{cause}: {count}" for cause, count in row["causes"].items())
+            ]
+            for row in summarize(entries, args.by)
+        ]
+        headers = ["Periodo", "Consultas", "p50 (s)", "p95 (s)", "Máx (s)", "Tokens prompt", "Causas"]
+        print(tabulate(table_data, headers=headers, tablefmt="grid"))
+        
+        print(f"\n=== {args.top} consultas más lentas ===")
+        slowest = sorted(entries, key=lambda entry: entry["total"], reverse=True)[:args.top]
+        table_data = [
+            [
+                entry["timestamp"][:19],
+                entry["query"][:50] + "..." if len(entry["query"]) > 50 else entry["query"],
+                f"{entry['total']:.2f}",
+                f"{entry['dominant_stage']} ({entry['dominant_share']:.0%})",
+                entry.get("prompt_tokens") or "-",
+                len(entry.get("chunks", []))
+            ]
+            for entry in slowest
+        ]
+        headers = ["Fecha", "Consulta", "Total (s)", "Etapa dominante", "Tokens prompt", "Fragmentos"]
+        print(tabulate(table_data, headers=headers, tablefmt="grid"))
+    except Exception as e:
+        logger.error(f"Error al resumir las consultas lentas: {e}")
+        print(f"Error: {e}")
+
 def run_setup(args):
     """Ejecuta el script de configuración de la base de datos.
     
@@ -242,51 +372,75 @@ def run_setup(args):
             print("Error al configurar la base de datos.")
             sys.exit(1)
 
+def show_statistics(args):
+    """Muestra las estadísticas de la base de datos calculadas en el servidor.
+    
+    Args:
+        args: Argumentos de la línea de comandos.
+    """
+    stats = DocumentStatistics().get_statistics(refresh=args.refresh)
+    if args.json:
+        print(json.dumps(stats, indent=2, ensure_ascii=False))
+        return
+    if "error" in stats:
+        print(f"Error: {stats['error']}")
+        return
+    print(tabulate(format_statistics(stats), headers=["Métrica", "Valor"], tablefmt="grid"))
+
 def export_data(args):
-    """Exporta datos de la base de datos.
+    """Exporta datos de la base de datos por páginas, sin cargar las tablas completas en memoria.
     
     Args:
         args: Argumentos de la línea de comandos.
     """
     try:
         db = VectorDatabase()
-        data = {}
+        tables = [table for table, selected in (("files", args.files), ("queries", args.queries),
+                                                (db.collection_name, args.documents)) if selected]
+        if not tables:
+            print("Indica qué exportar con --files, --queries o --documents.")
+            return
+        fmt = args.format or ("json" if args.output.endswith((".json", ".json.gz")) else "jsonl")
         
-        # Exportar archivos
-        if args.files:
-            response = db.supabase.table("files").select("*").execute()
-            data["files"] = response.data
+        def progress(table, rows):
+            print(f"  {table}: {rows} filas...", end="\r", flush=True)
         
-        # Exportar consultas
-        if args.queries:
-            response = db.supabase.table("queries").select("*").execute()
-            data["queries"] = response.data
+        counts = export_tables(db.supabase, tables, args.output, fmt=fmt, embeddings=args.embeddings,
+                               page_size=args.page_size, resume=args.resume, compress=args.gzip,
+                               collection_name=db.collection_name, dtype=args.dtype, progress=progress)
         
-        # Exportar documentos (fragmentos)
-        if args.documents:
-            # Advertencia: esto puede ser una operación costosa si hay muchos documentos
-            response = db.supabase.table(db.collection_name).select("*").execute()
-            data["documents"] = response.data
+        print(f"Datos exportados a {args.output} ({fmt}).")
         
-        # Guardar datos en un archivo
-        with open(args.output, "w") as f:
-            json.dump(data, f, indent=2)
+        # Imprimir estadísticas
+        print("\nEstadísticas:")
+        for table, rows in counts.items():
+            print(f"  {'documents' if table == db.collection_name else table}: {rows}")
+    except Exception as e:
+        logger.error(f"Error al exportar datos: {e}")
+        print(f"Error: {e}")
+
+def import_data(args):
+    """Importa una exportación en la base de datos (COPY con conexión directa o upserts por lotes).
+    
+    Args:
+        args: Argumentos de la línea de comandos.
+    """
+    try:
+        db = VectorDatabase()
         
-        print(f"Datos exportados a {args.output}.")
+        def progress(table, rows):
+            print(f"  {table}: {rows} filas...", end="\r", flush=True)
         
-        # Imprimir estadísticas
-        stats = {
-            "files": len(data.get("files", [])),
-            "queries": len(data.get("queries", [])),
-            "documents": len(data.get("documents", []))
-        }
+        counts = import_export(args.path, client=db.supabase, db_url=args.db_url, tables=args.tables,
+                               batch_size=args.batch_size, collection_name=db.collection_name, progress=progress)
+        DocumentStatistics.clear_cache()
         
+        print(f"Datos importados de {args.path}.")
         print("\nEstadísticas:")
-        for key, value in stats.items():
-            if key in data:
-                print(f"  {key}: {value}")
+        for table, rows in counts.items():
+            print(f"  {table}: {rows}")
     except Exception as e:
-        logger.error(f"Error al exportar datos: {e}")
+        logger.error(f"Error al importar datos: {e}")
         print(f"Error: {e}")
 
 def main():
@@ -306,13 +460,30 @@ def main():
     
     # Comando para eliminar un archivo
     delete_parser = subparsers.add_parser("delete", help="Elimina un archivo de la base de datos")
-    delete_parser.add_argument("file_id", help="ID del archivo a eliminar")
+    delete_parser.add_argument("file_ids", nargs="+", metavar="file_id", help="ID de los archivos a eliminar")
     delete_parser.add_argument("-f", "--force", action="store_true", help="No pedir confirmación")
     
     # Comando para listar consultas
     queries_parser = subparsers.add_parser("queries", help="Lista las consultas realizadas")
     queries_parser.add_argument("--limit", type=int, default=20, help="Número máximo de consultas a mostrar")
     
+    # Comando para mostrar el consumo de tokens
+    costs_parser = subparsers.add_parser("costs", help="Muestra los archivos y consultas con mayor consumo de tokens")
+    costs_parser.add_argument("--top", type=int, default=10, help="Número de archivos y consultas a mostrar")
+    costs_parser.add_argument("--scan", type=int, default=1000, help="Número de consultas recientes a analizar")
+    
+    # Comando para resumir el registro de consultas lentas
+    slow_parser = subparsers.add_parser("slow-queries", help="Resume el registro de consultas lentas")
+    slow_parser.add_argument("--file", default=slow_query_log.path, help="Archivo JSONL del registro")
+    slow_parser.add_argument("--days", type=int, default=7, help="Días a analizar (0 para todo el registro)")
+    slow_parser.add_argument("--by", choices=["hour", "day", "week"], default="day", help="Periodo de agregación")
+    slow_parser.add_argument("--top", type=int, default=10, help="Número de consultas más lentas a mostrar")
+    
+    # Comando para mostrar las estadísticas de la base de datos
+    stats_parser = subparsers.add_parser("stats", help="Muestra estadísticas de archivos, fragmentos y tamaños")
+    stats_parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    stats_parser.add_argument("--refresh", action="store_true", help="Ignora las estadísticas en caché")
+    
     # Comando para ejecutar el script de configuración
     setup_parser = subparsers.add_parser("setup", help="Ejecuta el script de configuración de la base de datos")
     setup_parser.add_argument("--check", action="store_true", help="Verifica la configuración de la base de datos")
@@ -322,7 +493,29 @@ def main():
     export_parser.add_argument("--files", action="store_true", help="Exportar información de archivos")
     export_parser.add_argument("--queries", action="store_true", help="Exportar consultas")
     export_parser.add_argument("--documents", action="store_true", help="Exportar documentos (fragmentos)")
-    export_parser.add_argument("-o", "--output", default="export.json", help="Archivo de salida")
+    export_parser.add_argument("-o", "--output", default="export.json",
+                               help="Archivo (.json) o directorio (jsonl, parquet, npy) de salida")
+    export_parser.add_argument("--format", choices=EXPORT_FORMATS,
+                               help="Formato de salida (por defecto json si la salida termina en .json y jsonl si no)")
+    export_parser.add_argument("--embeddings", choices=EMBEDDING_MODES, default="include",
+                               help="Incluir los embeddings como números, omitirlos o empaquetarlos en binario (float32)")
+    export_parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help="Filas por petición")
+    export_parser.add_argument("--resume", action="store_true", help="Reanudar una exportación jsonl, parquet o npy interrumpida")
+    export_parser.add_argument("--gzip", action="store_true", help="Comprimir los archivos JSONL con gzip")
+    export_parser.add_argument("--dtype", choices=EMBEDDING_DTYPES, default="float32",
+                               help="Tipo de las matrices de embeddings del formato npy")
+    
+    # Comando para migrar los fragmentos antiguos a la columna file_id
+    backfill_parser = subparsers.add_parser("backfill-file-ids",
+                                            help="Rellena la columna file_id de los fragmentos que solo la tienen en metadata")
+    backfill_parser.add_argument("--batch-size", type=int, default=5000, help="Fragmentos por lote")
+    
+    # Comando para importar datos
+    import_parser = subparsers.add_parser("import", help="Importa una exportación en la base de datos")
+    import_parser.add_argument("path", help="Archivo JSON o directorio de la exportación")
+    import_parser.add_argument("--tables", nargs="+", help="Tablas a importar (por defecto todas)")
+    import_parser.add_argument("--batch-size", type=int, help="Filas por lote")
+    import_parser.add_argument("--db-url", help="Cadena de conexión a Postgres (por defecto SUPABASE_DB_URL)")
     
     args = parser.parse_args()
     
@@ -341,10 +534,20 @@ def main():
         delete_file(args)
     elif args.command == "queries":
         list_queries(args)
+    elif args.command == "costs":
+        show_costs(args)
+    elif args.command == "slow-queries":
+        show_slow_queries(args)
+    elif args.command == "stats":
+        show_statistics(args)
     elif args.command == "setup":
         run_setup(args)
     elif args.command == "export":
         export_data(args)
+    elif args.command == "import":
+        import_data(args)
+    elif args.command == "backfill-file-ids":
+        backfill_file_ids(args)
     else:
         parser.print_help()
 
@@ -0,0 +1,87 @@
+"""
+Importación masiva de exportaciones de `admin export`.
+Carga en Supabase las tablas de una exportación en cualquiera de sus formatos (ver export.py). Con
+una conexión directa a Postgres (SUPABASE_DB_URL) cada lote se envía con COPY y se fusiona con
+INSERT ... ON CONFLICT; sin ella, se envía por PostgREST como un upsert por lote. En ambos casos
+las filas existentes se actualizan, así que una importación interrumpida se puede repetir.
+"""
+
+import contextlib
+import itertools
+import logging
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from app.database.export import list_export, read_export
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Filas por lote: COPY admite lotes grandes; PostgREST tiene un límite de tamaño por petición
+COPY_BATCH_SIZE = 5000
+REST_BATCH_SIZE = 500
+
+def _batches(rows: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Agrupa las filas en lotes sin leer más de un lote a la vez."""
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+def _columns(batch: List[Dict[str, Any]]) -> List[str]:
+    """Columnas presentes en un lote, en el orden en que aparecen."""
+    return list(dict.fromkeys(column for row in batch for column in row))
+
+def import_export(path: str, client=None, db_url: Optional[str] = None, tables: Optional[List[str]] = None,
+                  batch_size: Optional[int] = None, collection_name: str = "documents",
+                  progress: Optional[Callable[[str, int], None]] = None) -> Dict[str, int]:
+    """Importa las tablas de una exportación.
+
+    Args:
+        path: Archivo JSON o directorio de la exportación.
+        client: Cliente de Supabase (si no hay conexión directa).
+        db_url: Cadena de conexión a Postgres (por defecto SUPABASE_DB_URL). Si no hay ninguna,
+            se usa el cliente de Supabase.
+        tables: Tablas a importar (por defecto todas las de la exportación).
+        batch_size: Filas por lote (por defecto COPY_BATCH_SIZE o REST_BATCH_SIZE).
+        collection_name: Tabla de fragmentos.
+        progress: Función opcional llamada con (tabla, filas importadas) tras cada lote.
+
+    Returns:
+        Dict[str, int]: Filas importadas de cada tabla.
+    """
+    from app.config.settings import SUPABASE_DB_URL
+    from app.database.postgres import copy_rows, pooled_connection
+
+    # En el JSON histórico la tabla de fragmentos se llama siempre 'documents'
+    legacy_json = not os.path.isdir(path)
+    available = [collection_name if legacy_json and table == "documents" else table for table in list_export(path)]
+    tables = [table for table in (tables or available) if table in available]
+    # Los archivos antes que sus fragmentos
+    tables.sort(key=lambda table: ("files", collection_name, "queries").index(table)
+                if table in ("files", collection_name, "queries") else 3)
+
+    direct = bool(db_url or SUPABASE_DB_URL)
+    if not direct and client is None:
+        raise ValueError("Se necesita un cliente de Supabase o una conexión directa a Postgres")
+    batch_size = batch_size or (COPY_BATCH_SIZE if direct else REST_BATCH_SIZE)
+    counts = {}
+    with (pooled_connection(db_url) if direct else contextlib.nullcontext()) as conn:
+        for table in tables:
+            counts[table] = 0
+            source = "documents" if legacy_json and table == collection_name else table
+            for batch in _batches(read_export(path, source), batch_size):
+                if direct:
+                    copy_rows(conn, table, _columns(batch), batch)
+                else:
+                    client.table(table).upsert(batch).execute()
+                counts[table] += len(batch)
+                if progress:
+                    progress(table, counts[table])
+            logger.info(f"Tabla {table} importada: {counts[table]} filas")
+            if table == "queries" and not direct and counts[table]:
+                logger.warning("PostgREST no actualiza la secuencia de queries.id: ejecuta "
+                               "SELECT setval('queries_id_seq', (SELECT MAX(id) FROM queries)) antes de registrar consultas")
+    return counts
@@ -0,0 +1,444 @@
+"""
+Exportación por páginas de las tablas de Supabase.
+Este módulo recorre las tablas con paginación por clave (keyset: `id > último id` ordenado por id),
+de modo que la memoria no depende del tamaño de la tabla y ninguna página queda recortada por el
+límite de filas de PostgREST, y escribe las filas en JSON, JSONL (opcionalmente comprimido con
+gzip), Parquet o JSONL con los embeddings en matrices .npy. Las exportaciones en directorio guardan
+en `_state.json` el último id escrito de cada tabla para poder reanudarlas.
+
+Formatos:
+    json     Un único archivo {"files": [...], "queries": [...], "documents": [...]} (el formato
+             histórico de `admin export`).
+    jsonl    Un directorio con <tabla>.jsonl (o .jsonl.gz) por tabla.
+    parquet  Un directorio con <tabla>/part-NNNNN.parquet por tabla (requiere pyarrow).
+    npy      Como jsonl, pero los embeddings de la tabla de fragmentos se guardan aparte, en
+             <tabla>/embeddings-NNNNN.npy (matrices float32 o float16 que se pueden abrir con
+             np.load(mmap_mode='r')) y <tabla>/ids-NNNNN.json (ids de las filas de cada matriz).
+
+Los embeddings pueden exportarse como lista de números ('include'), omitirse ('exclude') o
+empaquetarse en binario ('binary': float32 little-endian, en base64 en JSON/JSONL y como bytes en
+Parquet), que ocupa unas 2,5 veces menos que el texto.
+"""
+
+import base64
+import gzip
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Filas por página: el máximo que devuelve PostgREST por defecto en Supabase
+DEFAULT_PAGE_SIZE = 1000
+
+# Filas por archivo Parquet y por matriz .npy (16384 embeddings de 1536 dimensiones: 96 MB en float32)
+PARQUET_ROWS_PER_FILE = 50000
+NPY_ROWS_PER_SHARD = 16384
+
+EXPORT_FORMATS = ("json", "jsonl", "parquet", "npy")
+EMBEDDING_MODES = ("include", "exclude", "binary")
+EMBEDDING_DTYPES = ("float32", "float16")
+
+# Codificación de los embeddings en modo 'binary'
+BINARY_ENCODING = "float32-le"
+
+STATE_FILE = "_state.json"
+
+# Columnas de la tabla de fragmentos sin el embedding
+DOCUMENT_COLUMNS = ["id", "content", "metadata", "file_id", "created_at", "updated_at"]
+
+def parse_embedding(value: Any) -> Optional[List[float]]:
+    """Convierte un embedding de PostgREST (texto '[0.1,...]' o lista) en lista de números."""
+    if value is None or isinstance(value, list):
+        return value
+    return json.loads(value)
+
+def pack_embedding(value: Any) -> Optional[bytes]:
+    """Empaqueta un embedding como float32 little-endian."""
+    import numpy as np
+
+    embedding = parse_embedding(value)
+    return None if embedding is None else np.asarray(embedding, dtype="<f4").tobytes()
+
+def unpack_embedding(value: Any) -> Optional[List[float]]:
+    """Recupera un embedding empaquetado con pack_embedding (bytes o base64)."""
+    import numpy as np
+
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = base64.b64decode(value)
+    return np.frombuffer(value, dtype="<f4").tolist()
+
+def iter_pages(client, table: str, columns: str = "*", page_size: int = DEFAULT_PAGE_SIZE,
+               after: Any = None, key: str = "id") -> Iterator[List[Dict[str, Any]]]:
+    """Recorre una tabla por páginas ordenadas por clave.
+
+    Cada página pide las filas con `key > último valor` en lugar de usar OFFSET, así que el coste
+    de cada petición no crece con la posición. El recorrido termina con una página vacía y no con
+    una incompleta: si el servidor limita las filas por debajo de page_size, la página siguiente
+    continúa donde se quedó.
+
+    Args:
+        client: Cliente de Supabase.
+        table: Nombre de la tabla.
+        columns: Columnas a seleccionar (deben incluir la clave).
+        page_size: Filas por página.
+        after: Valor de la clave a partir del cual continuar (None para empezar desde el principio).
+        key: Columna única por la que se ordena.
+
+    Returns:
+        Iterator[List[Dict[str, Any]]]: Páginas de filas.
+    """
+    while True:
+        query = client.table(table).select(columns).order(key)
+        if after is not None:
+            query = query.gt(key, after)
+        rows = query.limit(page_size).execute().data or []
+        if not rows:
+            return
+        yield rows
+        after = rows[-1][key]
+
+def _columns(table: str, collection_name: str, embeddings: str) -> str:
+    """Columnas a seleccionar de una tabla."""
+    if table == collection_name and embeddings == "exclude":
+        return ", ".join(DOCUMENT_COLUMNS)
+    return "*"
+
+def _encode_row(row: Dict[str, Any], embeddings: str, binary_as_text: bool) -> Dict[str, Any]:
+    """Prepara una fila para escribirla según el modo de embeddings."""
+    if "embedding" not in row:
+        return row
+    row = dict(row)
+    if embeddings == "binary":
+        packed = pack_embedding(row["embedding"])
+        row["embedding"] = base64.b64encode(packed).decode("ascii") if binary_as_text and packed is not None else packed
+    else:
+        row["embedding"] = parse_embedding(row["embedding"])
+    return row
+
+def _open_text(path: str, mode: str):
+    """Abre un archivo de texto, comprimido con gzip si termina en .gz."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+class _JsonlTable:
+    """Escribe una tabla en JSONL, con un punto de reanudación al final de cada página."""
+
+    def __init__(self, path: str, offset: Optional[int]):
+        self.path = path
+        if offset is None:
+            open(path, "wb").close()
+        else:
+            # Descartar lo escrito tras el último punto de reanudación
+            with open(path, "r+b") as f:
+                f.truncate(offset)
+
+    def write(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        # Cada página se escribe como un miembro gzip completo: el archivo es válido tras cada página
+        with _open_text(self.path, "a") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+        return {"offset": os.path.getsize(self.path)}
+
+    def close(self):
+        pass
+
+def _remove_parts(directory: str, part: int):
+    """Elimina los archivos numerados (part-, embeddings-, ids-) desde el número indicado."""
+    for name in os.listdir(directory):
+        number = name.split("-")[-1].split(".")[0]
+        if number.isdigit() and int(number) >= part:
+            os.remove(os.path.join(directory, name))
+
+class _NpyTable(_JsonlTable):
+    """Escribe las filas en JSONL y sus embeddings en matrices .npy con su índice de ids."""
+
+    def __init__(self, path: str, offset: Optional[int], directory: str, part: int, rows_per_shard: int,
+                 dtype: str):
+        super().__init__(path, offset)
+        self.directory = directory
+        self.part = part
+        self.rows_per_shard = rows_per_shard
+        self.dtype = dtype
+        self.ids: List[Any] = []
+        self.vectors: List[Any] = []
+        os.makedirs(directory, exist_ok=True)
+        _remove_parts(directory, part)
+
+    def write(self, rows: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        import numpy as np
+
+        embedded = [row for row in rows if row.get("embedding") is not None]
+        if embedded:
+            # Convertir cada página en cuanto llega: una lista de floats de Python ocupa 6 veces más
+            self.ids.extend(row["id"] for row in embedded)
+            self.vectors.append(np.asarray([row["embedding"] for row in embedded], dtype=self.dtype))
+        super().write([{key: value for key, value in row.items() if key != "embedding"} for row in rows])
+        if len(self.ids) < self.rows_per_shard:
+            return None
+        return self.flush()
+
+    def flush(self) -> Dict[str, Any]:
+        import numpy as np
+
+        if self.ids:
+            np.save(os.path.join(self.directory, f"embeddings-{self.part:05d}.npy"), np.concatenate(self.vectors))
+            with open(os.path.join(self.directory, f"ids-{self.part:05d}.json"), "w", encoding="utf-8") as f:
+                json.dump(self.ids, f)
+            self.part += 1
+            self.ids, self.vectors = [], []
+        return {"offset": os.path.getsize(self.path), "part": self.part}
+
+    def close(self) -> Dict[str, Any]:
+        return self.flush()
+
+class _ParquetTable:
+    """Escribe una tabla en archivos Parquet de hasta PARQUET_ROWS_PER_FILE filas."""
+
+    def __init__(self, directory: str, part: int, rows_per_file: int):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("El formato parquet requiere pyarrow (pip install pyarrow)")
+        self.pa, self.pq = pyarrow, pyarrow.parquet
+        self.directory = directory
+        self.part = part
+        self.rows_per_file = rows_per_file
+        self.buffer: List[Dict[str, Any]] = []
+        os.makedirs(directory, exist_ok=True)
+        # Partes posteriores al último punto de reanudación
+        _remove_parts(directory, part)
+
+    def write(self, rows: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        self.buffer.extend(rows)
+        if len(self.buffer) < self.rows_per_file:
+            return None
+        return self.flush()
+
+    def flush(self) -> Optional[Dict[str, Any]]:
+        if not self.buffer:
+            return None
+        # Metadatos y otros objetos anidados se guardan como texto JSON
+        rows = [{key: json.dumps(value, ensure_ascii=False, default=str) if isinstance(value, (dict, list)) else value
+                 for key, value in row.items()} for row in self.buffer]
+        path = os.path.join(self.directory, f"part-{self.part:05d}.parquet")
+        self.pq.write_table(self.pa.Table.from_pylist(rows), path)
+        self.part += 1
+        self.buffer = []
+        return {"part": self.part}
+
+    def close(self) -> Optional[Dict[str, Any]]:
+        return self.flush()
+
+def _load_state(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _save_state(path: str, state: Dict[str, Any]):
+    # Escritura atómica: una interrupción no deja el estado a medias
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+def export_tables(client, tables: Iterable[str], output: str, fmt: str = "jsonl", embeddings: str = "include",
+                  page_size: int = DEFAULT_PAGE_SIZE, resume: bool = False, compress: bool = False,
+                  collection_name: str = "documents", rows_per_file: Optional[int] = None,
+                  dtype: str = "float32", progress: Optional[Callable[[str, int], None]] = None) -> Dict[str, int]:
+    """Exporta tablas completas por páginas.
+
+    Args:
+        client: Cliente de Supabase.
+        tables: Tablas a exportar.
+        output: Archivo (json) o directorio (jsonl, parquet, npy) de salida.
+        fmt: 'json', 'jsonl', 'parquet' o 'npy'.
+        embeddings: 'include', 'exclude' o 'binary' (en npy siempre se incluyen, en las matrices).
+        page_size: Filas por petición.
+        resume: Continuar una exportación interrumpida (jsonl, parquet y npy) desde su _state.json.
+        compress: Comprimir los archivos JSONL con gzip.
+        collection_name: Tabla de fragmentos (la que tiene embeddings).
+        rows_per_file: Filas por archivo Parquet o por matriz .npy.
+        dtype: Tipo de las matrices .npy: 'float32' o 'float16' (la mitad de tamaño, con unos
+            3 decimales de precisión).
+        progress: Función opcional llamada con (tabla, filas exportadas) tras cada página.
+
+    Returns:
+        Dict[str, int]: Filas exportadas de cada tabla (en total, incluidas las de ejecuciones
+        anteriores si se reanuda).
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Formato no soportado: {fmt}")
+    if embeddings not in EMBEDDING_MODES:
+        raise ValueError(f"Modo de embeddings no soportado: {embeddings}")
+    if dtype not in EMBEDDING_DTYPES:
+        raise ValueError(f"Tipo de embeddings no soportado: {dtype}")
+    if fmt == "npy" and embeddings != "include":
+        raise ValueError("El formato npy siempre guarda los embeddings, en matrices binarias")
+    tables = list(tables)
+    if fmt == "json":
+        if resume:
+            raise ValueError("Solo las exportaciones jsonl, parquet y npy se pueden reanudar")
+        return _export_json(client, tables, output, embeddings, page_size, collection_name, progress)
+
+    os.makedirs(output, exist_ok=True)
+    state_path = os.path.join(output, STATE_FILE)
+    options = {"format": fmt, "embeddings": embeddings, "compress": compress}
+    if fmt == "npy":
+        options["dtype"] = dtype
+    if resume and os.path.exists(state_path):
+        state = _load_state(state_path)
+        if state["options"] != options:
+            raise ValueError(f"La exportación de {output} se hizo con otras opciones: {state['options']}")
+        for table in tables:
+            state["tables"].setdefault(table, {"cursor": None, "rows": 0, "done": False})
+    else:
+        state = {"options": options, "tables": {table: {"cursor": None, "rows": 0, "done": False} for table in tables}}
+    if embeddings == "binary":
+        state["embedding_encoding"] = BINARY_ENCODING
+    _save_state(state_path, state)
+
+    for table in tables:
+        table_state = state["tables"][table]
+        if table_state["done"]:
+            logger.info(f"Tabla {table} ya exportada ({table_state['rows']} filas)")
+            continue
+        started = table_state["cursor"] is not None
+        path = os.path.join(output, f"{table}.jsonl" + (".gz" if compress else ""))
+        offset, part = (table_state.get("offset"), table_state.get("part", 0)) if started else (None, 0)
+        if fmt == "npy" and table == collection_name:
+            writer = _NpyTable(path, offset, os.path.join(output, table), part, rows_per_file or NPY_ROWS_PER_SHARD,
+                               dtype)
+        elif fmt in ("jsonl", "npy"):
+            writer = _JsonlTable(path, offset)
+        else:
+            writer = _ParquetTable(os.path.join(output, table), part, rows_per_file or PARQUET_ROWS_PER_FILE)
+        # En Parquet y npy las filas se acumulan hasta completar un archivo; el cursor solo avanza al escribirlo
+        pending_rows, pending_cursor = 0, None
+        columns = _columns(table, collection_name, embeddings)
+        for rows in iter_pages(client, table, columns, page_size, table_state["cursor"]):
+            checkpoint = writer.write([_encode_row(row, embeddings, fmt == "jsonl") for row in rows])
+            pending_rows += len(rows)
+            pending_cursor = rows[-1]["id"]
+            if checkpoint is not None:
+                table_state.update(checkpoint, cursor=pending_cursor, rows=table_state["rows"] + pending_rows)
+                pending_rows = 0
+                _save_state(state_path, state)
+            if progress:
+                progress(table, table_state["rows"] + pending_rows)
+        checkpoint = writer.close()
+        if checkpoint is not None:
+            table_state.update(checkpoint)
+        table_state.update(cursor=pending_cursor or table_state["cursor"], rows=table_state["rows"] + pending_rows,
+                           done=True)
+        _save_state(state_path, state)
+        logger.info(f"Tabla {table} exportada: {table_state['rows']} filas")
+    return {table: state["tables"][table]["rows"] for table in tables}
+
+def _export_json(client, tables: List[str], output: str, embeddings: str, page_size: int,
+                 collection_name: str, progress: Optional[Callable[[str, int], None]]) -> Dict[str, int]:
+    """Escribe las tablas en un único objeto JSON, fila a fila."""
+    counts = {}
+    with _open_text(output, "w") as f:
+        f.write("{")
+        for position, table in enumerate(tables):
+            key = "documents" if table == collection_name else table
+            f.write(("," if position else "") + f"\n  {json.dumps(key)}: [")
+            counts[table] = 0
+            for rows in iter_pages(client, table, _columns(table, collection_name, embeddings), page_size):
+                for row in rows:
+                    f.write(("," if counts[table] else "") + "\n    ")
+                    f.write(json.dumps(_encode_row(row, embeddings, True), ensure_ascii=False, default=str))
+                    counts[table] += 1
+                if progress:
+                    progress(table, counts[table])
+            f.write("\n  ]")
+        f.write("\n}\n")
+    return counts
+
+def read_export(path: str, table: str) -> Iterator[Dict[str, Any]]:
+    """Lee las filas de una tabla de una exportación en cualquiera de los formatos.
+
+    Los embeddings empaquetados en binario se devuelven como lista de números.
+
+    Args:
+        path: Archivo JSON o directorio de la exportación.
+        table: Tabla a leer ('files', 'queries' o 'documents').
+
+    Returns:
+        Iterator[Dict[str, Any]]: Filas de la tabla (ninguna si no se exportó).
+    """
+    if not os.path.isdir(path):
+        with _open_text(path, "r") as f:
+            rows = json.load(f).get(table, [])
+        for row in rows:
+            # En JSON los embeddings binarios van en base64; los de texto, como lista
+            if isinstance(row.get("embedding"), str) and not row["embedding"].startswith("["):
+                row["embedding"] = unpack_embedding(row["embedding"])
+            yield row
+        return
+
+    state = _load_state(os.path.join(path, STATE_FILE))
+    binary = state["options"]["embeddings"] == "binary"
+    if state["options"]["format"] == "parquet":
+        directory = os.path.join(path, table)
+        if not os.path.isdir(directory):
+            return
+        import pyarrow.parquet as pq
+        for name in sorted(os.listdir(directory)):
+            for row in pq.read_table(os.path.join(directory, name)).to_pylist():
+                if binary and row.get("embedding") is not None:
+                    row["embedding"] = unpack_embedding(row["embedding"])
+                yield row
+        return
+
+    file_path = os.path.join(path, f"{table}.jsonl" + (".gz" if state["options"]["compress"] else ""))
+    if not os.path.exists(file_path):
+        return
+    # En npy los embeddings están en las matrices, en el mismo orden que las filas que los tienen
+    vectors = (vector for ids, matrix in read_embedding_shards(path, table) for vector in zip(ids, matrix))
+    pending = next(vectors, None)
+    with _open_text(file_path, "r") as f:
+        for line in f:
+            row = json.loads(line)
+            if binary and row.get("embedding") is not None:
+                row["embedding"] = unpack_embedding(row["embedding"])
+            elif pending is not None and pending[0] == row["id"]:
+                row["embedding"] = pending[1].astype("float32").tolist()
+                pending = next(vectors, None)
+            yield row
+
+def read_embedding_shards(path: str, table: str = "documents") -> Iterator[Tuple[List[Any], Any]]:
+    """Recorre las matrices de embeddings de una exportación npy sin cargarlas en memoria.
+
+    Args:
+        path: Directorio de la exportación.
+        table: Tabla de fragmentos.
+
+    Returns:
+        Iterator[Tuple[List[Any], np.ndarray]]: Para cada matriz, los ids de sus filas y la matriz
+        abierta con mmap (float32 o float16, forma (filas, dimensiones)).
+    """
+    import numpy as np
+
+    directory = os.path.join(path, table)
+    if not os.path.isdir(directory):
+        return
+    for name in sorted(os.listdir(directory)):
+        if name.startswith("ids-"):
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                ids = json.load(f)
+            yield ids, np.load(os.path.join(directory, name.replace("ids-", "embeddings-").replace(".json", ".npy")),
+                               mmap_mode="r")
+
+def list_export(path: str) -> List[str]:
+    """Tablas contenidas en una exportación (en el JSON histórico, 'documents' es la de fragmentos)."""
+    if os.path.isdir(path):
+        return list(_load_state(os.path.join(path, STATE_FILE))["tables"])
+    with _open_text(path, "r") as f:
+        return list(json.load(f))
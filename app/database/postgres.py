@@ -0,0 +1,256 @@
+"""
+Conexión directa a Postgres para cargas masivas.
+PostgREST recibe cada lote como un documento JSON y los embeddings como listas de números en texto.
+Con la cadena de conexión de la base de datos de Supabase (SUPABASE_DB_URL) las filas se envían con
+COPY ... FROM STDIN a una tabla temporal y se fusionan con INSERT ... ON CONFLICT, en una sola
+transacción por lote. COPY usa el formato binario cuando todas las columnas tienen codificador (los
+embeddings viajan como float4, sin pasar por texto) y el formato texto en otro caso.
+
+Las conexiones se toman de un pool pequeño por proceso (RAG_DB_POOL_SIZE, 4 por defecto); si todas
+están en uso, se espera a que se libere una.
+"""
+
+import json
+import logging
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from app.config.settings import SUPABASE_DB_URL
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Conexiones como máximo por cadena de conexión
+POOL_SIZE = int(os.getenv("RAG_DB_POOL_SIZE", "4"))
+
+def _db_url(db_url: Optional[str]) -> str:
+    db_url = db_url or SUPABASE_DB_URL
+    if not db_url:
+        raise RuntimeError("Configura SUPABASE_DB_URL (Project Settings > Database > Connection string) "
+                           "para usar la conexión directa")
+    return db_url
+
+def connect(db_url: Optional[str] = None):
+    """Abre una conexión directa a Postgres.
+
+    Args:
+        db_url: Cadena de conexión (por defecto SUPABASE_DB_URL).
+
+    Returns:
+        psycopg2.extensions.connection: Conexión abierta.
+    """
+    import psycopg2
+
+    return psycopg2.connect(_db_url(db_url))
+
+class ConnectionPool:
+    """Pool de conexiones que espera (en lugar de fallar) cuando todas están en uso."""
+
+    def __init__(self, db_url: str, size: int = POOL_SIZE):
+        """Inicializa el pool; las conexiones se abren a medida que se necesitan.
+
+        Args:
+            db_url: Cadena de conexión.
+            size: Conexiones como máximo.
+        """
+        from psycopg2.pool import ThreadedConnectionPool
+
+        self.pool = ThreadedConnectionPool(0, size, db_url)
+        self.available = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        """Conexión del pool, devuelta al salir (y descartada si quedó cerrada)."""
+        with self.available:
+            conn = self.pool.getconn()
+            try:
+                yield conn
+            finally:
+                self.pool.putconn(conn, close=bool(conn.closed))
+
+    def close(self):
+        """Cierra todas las conexiones."""
+        self.pool.closeall()
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+@contextmanager
+def pooled_connection(db_url: Optional[str] = None):
+    """Conexión del pool compartido del proceso para la cadena de conexión indicada.
+
+    Args:
+        db_url: Cadena de conexión (por defecto SUPABASE_DB_URL).
+    """
+    db_url = _db_url(db_url)
+    with _pools_lock:
+        pool = _pools.get(db_url)
+        if pool is None:
+            pool = _pools[db_url] = ConnectionPool(db_url)
+    with pool.connection() as conn:
+        yield conn
+
+def _copy_value(value: Any) -> str:
+    """Formatea un valor para COPY en formato texto."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, (dict, list)):
+        # Los embeddings como lista tienen la misma sintaxis que el tipo vector: [0.1,0.2,...]
+        value = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    elif hasattr(value, "tolist"):
+        value = json.dumps(value.tolist(), separators=(",", ":"))
+    else:
+        value = str(value)
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+def copy_line(row: Dict[str, Any], columns: List[str]) -> str:
+    """Línea de COPY (formato texto) con las columnas indicadas de una fila."""
+    return "\t".join(_copy_value(row.get(column)) for column in columns) + "\n"
+
+def _json_text(value: Any) -> str:
+    # Las cadenas ya son JSON (p. ej. metadatos guardados con json.dumps)
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+_POSTGRES_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+def _binary_timestamp(value: Any) -> bytes:
+    # Microsegundos desde 2000-01-01; los valores sin zona horaria se toman como UTC
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    delta = value - _POSTGRES_EPOCH
+    return struct.pack(">q", (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds)
+
+def _binary_vector(value: Any) -> bytes:
+    # Formato de vector_recv de pgvector: dimensiones (int16), reservado (int16) y float4 big-endian
+    import numpy as np
+
+    if isinstance(value, str):
+        value = json.loads(value)
+    array = np.asarray(value, dtype=">f4")
+    return struct.pack(">hh", len(array), 0) + array.tobytes()
+
+# Codificadores del formato binario de COPY por tipo de columna (pg_type.typname)
+BINARY_ENCODERS: Dict[str, Callable[[Any], bytes]] = {
+    "text": lambda value: str(value).encode("utf-8"),
+    "varchar": lambda value: str(value).encode("utf-8"),
+    "jsonb": lambda value: b"\x01" + _json_text(value).encode("utf-8"),
+    "json": lambda value: _json_text(value).encode("utf-8"),
+    "int2": lambda value: struct.pack(">h", int(value)),
+    "int4": lambda value: struct.pack(">i", int(value)),
+    "int8": lambda value: struct.pack(">q", int(value)),
+    "float4": lambda value: struct.pack(">f", float(value)),
+    "float8": lambda value: struct.pack(">d", float(value)),
+    "bool": lambda value: b"\x01" if value else b"\x00",
+    "timestamp": _binary_timestamp,
+    "timestamptz": _binary_timestamp,
+    "vector": _binary_vector,
+}
+
+def binary_copy(rows: Iterable[Dict[str, Any]], columns: List[str], types: List[str]) -> Iterator[bytes]:
+    """Datos de COPY en formato binario: cabecera, una tupla por fila y marca de fin.
+
+    Args:
+        rows: Filas a enviar.
+        columns: Columnas, en el orden del COPY.
+        types: Tipo de cada columna (claves de BINARY_ENCODERS).
+
+    Returns:
+        Iterator[bytes]: Fragmentos de los datos.
+    """
+    encoders = [BINARY_ENCODERS[name] for name in types]
+    yield b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+    field_count = struct.pack(">h", len(columns))
+    for row in rows:
+        fields = [field_count]
+        for column, encode in zip(columns, encoders):
+            value = row.get(column)
+            if value is None:
+                fields.append(struct.pack(">i", -1))
+            else:
+                data = encode(value)
+                fields.append(struct.pack(">i", len(data)) + data)
+        yield b"".join(fields)
+    yield struct.pack(">h", -1)
+
+def _column_types(cursor, table: str) -> Dict[str, str]:
+    """Tipo (pg_type.typname) de cada columna de una tabla."""
+    cursor.execute("SELECT a.attname, t.typname FROM pg_attribute a JOIN pg_type t ON t.oid = a.atttypid "
+                   "WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped", (table,))
+    return dict(cursor.fetchall())
+
+class _CopyStream:
+    """Archivo de solo lectura que genera los datos de COPY a medida que Postgres los pide."""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self.chunks = chunks
+        self.buffer = bytearray()
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        size = len(self.buffer) if size < 0 else size
+        chunk = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return chunk
+
+    readline = read
+
+def copy_rows(conn, table: str, columns: List[str], rows: Iterable[Dict[str, Any]], key: str = "id",
+              binary: Optional[bool] = None) -> int:
+    """Inserta o actualiza filas con COPY en una tabla temporal y INSERT ... ON CONFLICT.
+
+    Todo el lote se aplica en una transacción: si falla, la tabla queda como estaba.
+
+    Args:
+        conn: Conexión de psycopg2.
+        table: Tabla de destino.
+        columns: Columnas a cargar (deben incluir la clave).
+        rows: Filas a cargar; se leen a medida que se envían.
+        key: Columna única para resolver conflictos.
+        binary: Formato de COPY: True binario, False texto y None binario si todas las columnas
+            tienen codificador.
+
+    Returns:
+        int: Filas insertadas o actualizadas.
+    """
+    from psycopg2 import sql
+
+    staging = sql.Identifier(f"{table}_staging")
+    column_list = sql.SQL(", ").join(map(sql.Identifier, columns))
+    updates = [sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(column)) for column in columns if column != key]
+    # Solo con la clave no hay nada que actualizar: las filas existentes se dejan como están
+    conflict = (sql.SQL("DO UPDATE SET {}").format(sql.SQL(", ").join(updates)) if updates
+                else sql.SQL("DO NOTHING"))
+    with conn, conn.cursor() as cursor:
+        cursor.execute(sql.SQL("CREATE TEMP TABLE {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP")
+                       .format(staging, sql.Identifier(table)))
+        column_types = _column_types(cursor, table) if binary is not False else {}
+        types = [column_types.get(column) for column in columns]
+        if binary is None:
+            binary = all(name in BINARY_ENCODERS for name in types)
+        if binary:
+            copy = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT binary)")
+            data = binary_copy(rows, columns, types)
+        else:
+            copy = sql.SQL("COPY {} ({}) FROM STDIN")
+            data = (copy_line(row, columns).encode("utf-8") for row in rows)
+        cursor.copy_expert(copy.format(staging, column_list), _CopyStream(data))
+        cursor.execute(sql.SQL("INSERT INTO {0} ({1}) SELECT {1} FROM {2} ON CONFLICT ({3}) {4}")
+                       .format(sql.Identifier(table), column_list, staging, sql.Identifier(key), conflict))
+        count = cursor.rowcount
+        # Las tablas con id SERIAL (queries) deben seguir numerando después de los ids cargados
+        cursor.execute("SELECT pg_get_serial_sequence(%s, %s)", (table, key))
+        sequence = cursor.fetchone()[0]
+        if sequence:
+            cursor.execute(sql.SQL("SELECT setval(%s, GREATEST((SELECT MAX({}) FROM {}), 1))")
+                           .format(sql.Identifier(key), sql.Identifier(table)), (sequence,))
+    return count
@@ -107,7 +107,7 @@ def check_database():
         
         # Verificar la existencia de tablas y funciones necesarias
         tables = ["documents", "files", "queries"]
-        functions = ["match_documents", "get_chunks_by_file_id", "delete_chunks_by_file_id"]
+        functions = ["match_documents", "get_chunks_by_file_id", "delete_chunks_by_file_id", "delete_chunks_by_file_ids"]
         
         # Verificar tablas
         logger.info("Verificando tablas...")
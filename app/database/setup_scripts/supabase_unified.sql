@@ -61,7 +61,7 @@ END;
 $$;
 
 -- Crear función para obtener todos los fragmentos de un archivo específico
--- Versión mejorada que maneja tanto el campo metadata->>'file_id' como la columna file_id
+-- Usa la columna indexada file_id (los fragmentos antiguos se migran con backfill_document_file_ids)
 CREATE OR REPLACE FUNCTION get_chunks_by_file_id(file_id_param TEXT)
 RETURNS TABLE (
     id TEXT,
@@ -77,35 +77,119 @@ BEGIN
         documents.content,
         documents.metadata
     FROM documents
-    WHERE
-        documents.metadata->>'file_id' = file_id_param
-        OR (documents.file_id = file_id_param AND documents.file_id IS NOT NULL)
+    WHERE documents.file_id = file_id_param
     ORDER BY (documents.metadata->>'chunk_index')::INTEGER;
 END;
 $$;
 
--- Crear función para eliminar todos los fragmentos de un archivo
--- Versión mejorada para manejar correctamente el conteo y evitar errores
+-- Eliminar los fragmentos de un archivo en una sola sentencia sobre la columna indexada file_id
+-- Devuelve el número de fragmentos eliminados. Los fragmentos antiguos que solo tenían el file_id
+-- en metadata se migran con backfill_document_file_ids (ver más abajo)
 CREATE OR REPLACE FUNCTION delete_chunks_by_file_id(file_id TEXT)
 RETURNS INTEGER
-LANGUAGE plpgsql
+LANGUAGE sql
 AS $$
-DECLARE
-    deleted_count INTEGER;
-BEGIN
-    -- Contar primero cuántos registros se eliminarán
-    SELECT COUNT(*) INTO deleted_count
+    WITH deleted AS (
+        DELETE FROM documents
+        WHERE documents.file_id = delete_chunks_by_file_id.file_id
+        RETURNING 1
+    )
+    SELECT COUNT(*)::INTEGER FROM deleted;
+$$;
+
+-- Eliminar los fragmentos de varios archivos a la vez
+-- Devuelve una fila por archivo con fragmentos eliminados
+CREATE OR REPLACE FUNCTION delete_chunks_by_file_ids(file_ids TEXT[])
+RETURNS TABLE (
+    file_id TEXT,
+    deleted INTEGER
+)
+LANGUAGE sql
+AS $$
+    WITH deleted AS (
+        DELETE FROM documents
+        WHERE documents.file_id = ANY(delete_chunks_by_file_ids.file_ids)
+        RETURNING documents.file_id
+    )
+    SELECT deleted.file_id, COUNT(*)::INTEGER FROM deleted GROUP BY deleted.file_id;
+$$;
+
+-- Migración única de los fragmentos antiguos: convierte en objeto los metadatos guardados como
+-- texto JSON (add_document guardaba json.dumps(metadata), un escalar de texto en jsonb) y copia
+-- metadata->>'file_id' a la columna file_id cuando falta. Actualiza como máximo batch_size filas
+-- por llamada y devuelve cuántas actualizó; se repite hasta que devuelve 0
+-- (python Main.py admin backfill-file-ids)
+CREATE OR REPLACE FUNCTION backfill_document_file_ids(batch_size INTEGER DEFAULT 5000)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    WITH pending AS (
+        SELECT
+            documents.id,
+            CASE WHEN jsonb_typeof(documents.metadata) = 'string'
+                 THEN (documents.metadata #>> '{}')::JSONB
+                 ELSE documents.metadata END AS metadata
+        FROM documents
+        WHERE jsonb_typeof(documents.metadata) = 'string'
+           OR ((documents.file_id IS NULL OR documents.file_id = '')
+               AND documents.metadata ->> 'file_id' <> '')
+        LIMIT batch_size
+    ), updated AS (
+        UPDATE documents
+        SET metadata = pending.metadata,
+            file_id = COALESCE(NULLIF(documents.file_id, ''), pending.metadata ->> 'file_id')
+        FROM pending
+        WHERE documents.id = pending.id
+        RETURNING 1
+    )
+    SELECT COUNT(*)::INTEGER FROM updated;
+$$;
+
+-- Estadísticas de la base de datos calculadas en el servidor (ver app/database/statistics.py)
+-- Solo devuelve agregados: nunca transfiere contenido ni embeddings. Los fragmentos se agrupan por
+-- la columna indexada file_id; los que no la tienen (NULL o '') forman un único grupo con
+-- file_id NULL hasta que se migran con backfill_document_file_ids
+CREATE OR REPLACE FUNCTION get_document_statistics()
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+    WITH per_file AS (
+        SELECT COUNT(*) AS chunks
+        FROM documents
+        GROUP BY NULLIF(documents.file_id, '')
+    )
+    SELECT jsonb_build_object(
+        'total_files', (SELECT COUNT(*) FROM files),
+        'total_chunks', (SELECT COUNT(*) FROM documents),
+        'total_queries', (SELECT COUNT(*) FROM queries),
+        'files_with_chunks', (SELECT COUNT(*) FROM per_file),
+        'chunks_per_file', (SELECT jsonb_build_object('min', MIN(chunks), 'avg', ROUND(AVG(chunks), 1), 'max', MAX(chunks)) FROM per_file),
+        'content_bytes', (SELECT COALESCE(SUM(octet_length(content)), 0) FROM documents),
+        'embedding_bytes', (SELECT COALESCE(SUM(pg_column_size(embedding)), 0) FROM documents),
+        'table_bytes', pg_total_relation_size('documents'),
+        'index_bytes', pg_indexes_size('documents'),
+        'embedding_index_bytes', COALESCE(pg_relation_size(to_regclass('documents_embedding_idx')), 0),
+        'last_processed', (SELECT MAX(processed_at) FROM files)
+    );
+$$;
+
+-- Número de fragmentos y bytes de contenido de cada archivo (file_id NULL: sin archivo asignado)
+CREATE OR REPLACE FUNCTION get_chunk_counts_by_file()
+RETURNS TABLE (
+    file_id TEXT,
+    chunks BIGINT,
+    content_bytes BIGINT
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        NULLIF(documents.file_id, '') AS file_id,
+        COUNT(*) AS chunks,
+        COALESCE(SUM(octet_length(documents.content)), 0) AS content_bytes
     FROM documents
-    WHERE metadata->>'file_id' = file_id 
-          OR (file_id = documents.file_id AND documents.file_id IS NOT NULL);
-    
-    -- Luego eliminar sin usar RETURNING
-    DELETE FROM documents
-    WHERE metadata->>'file_id' = file_id
-          OR (file_id = documents.file_id AND documents.file_id IS NOT NULL);
-
-    RETURN deleted_count;
-END;
+    GROUP BY 1;
 $$;
 
 -- Crear tabla para el seguimiento de consultas
@@ -115,9 +199,66 @@ CREATE TABLE IF NOT EXISTS queries (
     response TEXT,
     sources JSONB,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-    user_feedback INTEGER
+    user_feedback INTEGER,
+    usage JSONB
+);
+
+-- Consumo de tokens y coste de cada consulta (bases de datos creadas antes de esta columna)
+ALTER TABLE queries ADD COLUMN IF NOT EXISTS usage JSONB;
+
+-- Registro opcional de consultas lentas (ver RAG_SLOW_QUERY_TABLE en app/utils/slow_query_log.py)
+CREATE TABLE IF NOT EXISTS slow_queries (
+    id SERIAL PRIMARY KEY,
+    timestamp TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    route TEXT,
+    query TEXT NOT NULL,
+    total DOUBLE PRECISION NOT NULL,
+    steps JSONB,
+    dominant_stage TEXT,
+    dominant_share DOUBLE PRECISION,
+    cause TEXT,
+    prompt_tokens INTEGER,
+    output_tokens INTEGER,
+    chunks JSONB,
+    trace_id TEXT
 );
 
+CREATE INDEX IF NOT EXISTS slow_queries_timestamp_idx ON slow_queries (timestamp);
+
+-- Vaciar tablas completas con TRUNCATE (ver utilities/clear_database.py --truncate)
+-- Solo admite las tablas del sistema y solo puede llamarla la clave de servicio
+CREATE OR REPLACE FUNCTION truncate_tables(table_names TEXT[])
+RETURNS VOID
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF NOT table_names <@ ARRAY['documents', 'files', 'queries', 'slow_queries'] THEN
+        RAISE EXCEPTION 'truncate_tables solo admite documents, files, queries y slow_queries';
+    END IF;
+    EXECUTE 'TRUNCATE TABLE ' || (SELECT string_agg(quote_ident(name), ', ') FROM unnest(table_names) AS name);
+END;
+$$;
+
+-- En Supabase los privilegios por defecto del esquema public conceden EXECUTE directamente a anon y
+-- authenticated (no solo a PUBLIC): hay que quitárselo a ambos para que la clave anónima no pueda
+-- vaciar las tablas a través de esta función SECURITY DEFINER
+REVOKE EXECUTE ON FUNCTION truncate_tables(TEXT[]) FROM PUBLIC;
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'anon') THEN
+        REVOKE EXECUTE ON FUNCTION truncate_tables(TEXT[]) FROM anon;
+    END IF;
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'authenticated') THEN
+        REVOKE EXECUTE ON FUNCTION truncate_tables(TEXT[]) FROM authenticated;
+    END IF;
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'service_role') THEN
+        GRANT EXECUTE ON FUNCTION truncate_tables(TEXT[]) TO service_role;
+    END IF;
+END;
+$$;
+
 -- Crear tabla para la verificación de salud
 CREATE TABLE IF NOT EXISTS healthcheck (
     id SERIAL PRIMARY KEY,
@@ -130,4 +271,5 @@ COMMENT ON DATABASE postgres IS 'Base de datos para el sistema RAG - Versión un
 COMMENT ON TABLE documents IS 'Almacena los fragmentos de documentos con sus embeddings y metadatos. Incluye columna file_id para optimizar búsquedas';
 COMMENT ON TABLE files IS 'Almacena información sobre los archivos procesados';
 COMMENT ON TABLE queries IS 'Registra las consultas realizadas y sus respuestas';
+COMMENT ON TABLE slow_queries IS 'Consultas que superaron el umbral de latencia, con la etapa dominante';
 COMMENT ON TABLE healthcheck IS 'Utilizada para verificar el estado del sistema'; 
\ No newline at end of file
@@ -0,0 +1,174 @@
+"""
+Estadísticas de la base de datos vectorial.
+Este módulo calcula las estadísticas con consultas de agregación en el servidor (funciones
+get_document_statistics y get_chunk_counts_by_file de supabase_unified.sql), sin descargar
+fragmentos ni embeddings, y las guarda en caché durante unos segundos.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from app.database.vector_store import VectorDatabase
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Segundos que se reutilizan las estadísticas (0 desactiva la caché)
+STATS_TTL = float(os.getenv("RAG_STATS_TTL", "60"))
+
+def format_bytes(size: Optional[float]) -> str:
+    """Formatea un tamaño en bytes (p. ej. '12.3 MB')."""
+    if size is None:
+        return "N/A"
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+def format_statistics(stats: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """Filas (métrica, valor) para mostrar las estadísticas en una tabla.
+
+    Args:
+        stats: Resultado de DocumentStatistics.get_statistics.
+
+    Returns:
+        List[Tuple[str, str]]: Métricas disponibles con su valor formateado.
+    """
+    rows = [
+        ("Total de archivos", str(stats.get("total_files", 0))),
+        ("Total de fragmentos", str(stats.get("total_chunks", 0))),
+        ("Total de consultas", str(stats.get("total_queries", 0)))
+    ]
+    per_file = stats.get("chunks_per_file")
+    if per_file and per_file.get("avg") is not None:
+        rows.append(("Fragmentos por archivo (mín/media/máx)", f"{per_file['min']} / {per_file['avg']} / {per_file['max']}"))
+    for key, label in (("content_bytes", "Contenido"), ("embedding_bytes", "Embeddings"),
+                       ("table_bytes", "Tabla de fragmentos (con índices)"), ("index_bytes", "Índices"),
+                       ("embedding_index_bytes", "Índice vectorial")):
+        if key in stats:
+            rows.append((label, format_bytes(stats[key])))
+    rows.append(("Última actualización", str(stats.get("last_processed") or "N/A")))
+    return rows
+
+class DocumentStatistics:
+    """Servicio ligero de estadísticas de documentos y consultas."""
+
+    # Caché compartida por todas las instancias del proceso: clave -> (expiración, valor)
+    _cache: Dict[Tuple[str, str], Tuple[float, Any]] = {}
+    _cache_lock = threading.Lock()
+
+    def __init__(self, vector_db: Optional["VectorDatabase"] = None, ttl: Optional[float] = None):
+        """Inicializa el servicio de estadísticas.
+
+        Args:
+            vector_db: Base de datos vectorial a consultar (basta con un objeto con `supabase` y
+                `collection_name`). Si no se proporciona, se crea una.
+            ttl: Segundos que se reutiliza un resultado (por defecto RAG_STATS_TTL).
+        """
+        if vector_db is None:
+            # Importación diferida: la API web usa este módulo sin las dependencias de VectorDatabase
+            from app.database.vector_store import VectorDatabase
+            vector_db = VectorDatabase()
+        self.vector_db = vector_db
+        self.ttl = STATS_TTL if ttl is None else ttl
+
+    def _cached(self, name: str, compute, refresh: bool) -> Any:
+        """Devuelve el valor en caché o lo calcula si caducó."""
+        key = (self.vector_db.collection_name, name)
+        now = time.monotonic()
+        if not refresh and self.ttl > 0:
+            with self._cache_lock:
+                entry = self._cache.get(key)
+            if entry and entry[0] > now:
+                return entry[1]
+        value = compute()
+        if self.ttl > 0:
+            with self._cache_lock:
+                self._cache[key] = (now + self.ttl, value)
+        return value
+
+    @classmethod
+    def clear_cache(cls):
+        """Descarta las estadísticas en caché (p. ej. tras procesar o eliminar archivos)."""
+        with cls._cache_lock:
+            cls._cache.clear()
+
+    def _count(self, table: str) -> int:
+        """Cuenta las filas de una tabla con COUNT(*) en el servidor (petición HEAD, sin filas).
+
+        Args:
+            table: Nombre de la tabla.
+
+        Returns:
+            int: Número de filas.
+        """
+        response = self.vector_db.supabase.table(table).select("id", count="exact", head=True).execute()
+        return response.count or 0
+
+    def _last_processed(self) -> Optional[str]:
+        """Fecha del último archivo procesado."""
+        response = (self.vector_db.supabase.table("files").select("processed_at")
+                    .order("processed_at", desc=True).limit(1).execute())
+        return response.data[0]["processed_at"] if response.data else None
+
+    def _compute_statistics(self) -> Dict[str, Any]:
+        try:
+            return self.vector_db.supabase.rpc("get_document_statistics", {}).execute().data
+        except Exception as e:
+            # Bases de datos creadas antes de la función: solo los recuentos
+            logger.warning(f"No se pudo llamar a get_document_statistics ({e}); "
+                           "ejecuta supabase_unified.sql para obtener los tamaños")
+            return {
+                "total_files": self._count("files"),
+                "total_chunks": self._count(self.vector_db.collection_name),
+                "total_queries": self._count("queries"),
+                "last_processed": self._last_processed()
+            }
+
+    def get_statistics(self, refresh: bool = False) -> Dict[str, Any]:
+        """Obtiene las estadísticas de documentos y consultas.
+
+        Args:
+            refresh: Si es True, ignora la caché.
+
+        Returns:
+            Dict[str, Any]: 'total_files', 'total_chunks', 'total_queries', 'files_with_chunks',
+            'chunks_per_file' (min, avg, max), 'content_bytes', 'embedding_bytes', 'table_bytes',
+            'index_bytes', 'embedding_index_bytes' y 'last_processed'. Sin la función SQL solo
+            los recuentos y 'last_processed'; con 'error' si no se pudieron obtener.
+        """
+        try:
+            stats = self._cached("statistics", self._compute_statistics, refresh)
+            logger.info("Estadísticas de documentos obtenidas")
+            return dict(stats)
+        except Exception as e:
+            logger.error(f"Error al obtener estadísticas de documentos: {e}")
+            return {
+                "error": str(e),
+                "total_files": 0,
+                "total_chunks": 0
+            }
+
+    def get_chunk_counts(self, refresh: bool = False) -> Dict[str, Dict[str, int]]:
+        """Obtiene el número de fragmentos y los bytes de contenido de cada archivo.
+
+        Args:
+            refresh: Si es True, ignora la caché.
+
+        Returns:
+            Dict[str, Dict[str, int]]: file_id -> {'chunks', 'content_bytes'}; vacío si la
+            función SQL no existe o falla.
+        """
+        def compute():
+            rows = self.vector_db.supabase.rpc("get_chunk_counts_by_file", {}).execute().data or []
+            return {row["file_id"]: {"chunks": row["chunks"], "content_bytes": row["content_bytes"]} for row in rows}
+
+        try:
+            return self._cached("chunk_counts", compute, refresh)
+        except Exception as e:
+            logger.warning(f"No se pudo obtener el número de fragmentos por archivo: {e}")
+            return {}
@@ -9,12 +9,16 @@ import uuid
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 
-from app.config.settings import SUPABASE_COLLECTION_NAME
+from app.config.settings import SUPABASE_COLLECTION_NAME, SUPABASE_DB_URL
 from app.database.supabase_client import get_supabase_client
+from app.utils.performance_metrics import performance_tracker
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
+# Fragmentos por petición al guardar por PostgREST
+WRITE_BATCH_SIZE = 500
+
 class VectorDatabase:
     """Clase para gestionar la base de datos vectorial."""
     
@@ -30,6 +34,7 @@ class VectorDatabase:
         self.supabase = self.supabase_store.get_client()
         logger.info(f"Base de datos vectorial inicializada con colección: {self.collection_name}")
         
+    @performance_tracker.track_time("db_write")
     def add_document(self, document_id: str, content: str, metadata: dict, embedding: List[float]) -> bool:
         """Añade un documento a la base de datos vectorial.
         
@@ -47,9 +52,6 @@ class VectorDatabase:
             file_id = metadata.get("file_id", "")
             chunk_index = metadata.get("chunk_index", "")
             
-            # Preparar los metadatos para almacenamiento
-            metadata_json = json.dumps(metadata)
-            
             # Verificar si el documento ya existe
             response = self.supabase.table(self.collection_name).select("*").eq("id", document_id).execute()
             
@@ -58,7 +60,7 @@ class VectorDatabase:
                 logger.info(f"Actualizando fragmento existente {chunk_index} de archivo {file_id}")
                 response = self.supabase.table(self.collection_name).update({
                     "content": content,
-                    "metadata": metadata_json,
+                    "metadata": metadata,  # Objeto JSON, como en add_documents
                     "embedding": embedding,
                     "file_id": file_id  # Usar la nueva columna file_id
                 }).eq("id", document_id).execute()
@@ -68,7 +70,7 @@ class VectorDatabase:
                 response = self.supabase.table(self.collection_name).insert({
                     "id": document_id,
                     "content": content,
-                    "metadata": metadata_json,
+                    "metadata": metadata,  # Objeto JSON, como en add_documents
                     "embedding": embedding,
                     "file_id": file_id  # Usar la nueva columna file_id
                 }).execute()
@@ -82,6 +84,58 @@ class VectorDatabase:
             logger.error(f"Error al añadir el documento {document_id}: {e}")
             return False
     
+    @performance_tracker.track_time("db_write")
+    def add_documents(self, documents: List[Dict[str, Any]]) -> int:
+        """Añade o actualiza varios fragmentos en una sola operación.
+        
+        Con SUPABASE_DB_URL los fragmentos se envían con COPY por una conexión directa del pool
+        (ver app/database/postgres.py); sin ella, como upserts de WRITE_BATCH_SIZE fragmentos por
+        PostgREST. En ambos casos el registro de cada archivo se actualiza una sola vez.
+        
+        Los metadatos se guardan como objeto JSON (jsonb); los fragmentos antiguos que los tenían como
+        texto JSON se convierten con `python Main.py admin backfill-file-ids`.
+        
+        Args:
+            documents: Fragmentos con 'id', 'content', 'metadata' y 'embedding'.
+            
+        Returns:
+            int: Número de fragmentos guardados. Si falla la escritura, los ya confirmados: 0 con COPY
+            (una sola transacción) y los de los lotes anteriores por PostgREST.
+        """
+        if not documents:
+            return 0
+        rows = [{
+            "id": document["id"],
+            "content": document["content"],
+            "metadata": document["metadata"],
+            "embedding": document["embedding"],
+            "file_id": document["metadata"].get("file_id", "")
+        } for document in documents]
+        saved = 0
+        try:
+            if SUPABASE_DB_URL:
+                from app.database.postgres import copy_rows, pooled_connection
+                with pooled_connection() as conn:
+                    copy_rows(conn, self.collection_name, list(rows[0]), rows)
+                saved = len(rows)
+            else:
+                for start in range(0, len(rows), WRITE_BATCH_SIZE):
+                    batch = rows[start:start + WRITE_BATCH_SIZE]
+                    self.supabase.table(self.collection_name).upsert(batch).execute()
+                    saved += len(batch)
+            
+            # Actualizar el registro de cada archivo con los metadatos de su último fragmento
+            for metadata in {row["file_id"]: row["metadata"] for row in rows}.values():
+                self._update_file_record(metadata)
+            
+            logger.info(f"{len(rows)} fragmentos guardados en {self.collection_name}")
+            return len(rows)
+        except Exception as e:
+            # Los lotes anteriores ya están confirmados; el archivo no se registra como procesado
+            logger.error(f"Error al guardar los fragmentos ({saved} de {len(rows)} guardados): {e}")
+            return saved
+    
+    @performance_tracker.track_time("db_write")
     def update_document(self, doc_id: str, content: str, metadata: Dict[str, Any], embedding: List[float]) -> bool:
         """Actualiza un documento existente.
         
@@ -203,63 +257,52 @@ class VectorDatabase:
     def delete_chunks_by_file_id(self, file_id: str) -> int:
         """Elimina todos los fragmentos de un archivo específico.
         
+        Usa la función delete_chunks_by_file_id de supabase_unified.sql: una sola llamada que
+        elimina por la columna indexada file_id y devuelve el número de fragmentos.
+        
         Args:
             file_id: Identificador único del archivo.
             
         Returns:
             int: Número de fragmentos eliminados.
         """
+        return self.delete_chunks_by_file_ids([file_id]).get(file_id, 0)
+    
+    def delete_chunks_by_file_ids(self, file_ids: List[str]) -> Dict[str, int]:
+        """Elimina los fragmentos de varios archivos en una sola llamada.
+        
+        Args:
+            file_ids: Identificadores de los archivos.
+            
+        Returns:
+            Dict[str, int]: Fragmentos eliminados de cada archivo (los archivos sin fragmentos no aparecen).
+        """
+        if not file_ids:
+            return {}
         try:
-            # Intentar eliminar usando la columna file_id directamente (método preferido)
-            logger.info(f"Eliminando fragmentos de la tabla 'documents' para archivo: {file_id} usando columna file_id")
-            
-            # Primero contar cuántos fragmentos hay
-            result = self.supabase.table(self.collection_name).select("id").eq("file_id", file_id).execute()
-            count = len(result.data) if result.data else 0
-            
-            if count > 0:
-                # Eliminar los fragmentos
-                result = self.supabase.table(self.collection_name).delete().eq("file_id", file_id).execute()
-                deleted_count = len(result.data) if result.data else 0
-                logger.info(f"Se eliminaron {deleted_count} fragmentos de la tabla 'documents' usando columna file_id")
-                return deleted_count
+            if len(file_ids) == 1:
+                result = self.supabase.rpc("delete_chunks_by_file_id", {"file_id": file_ids[0]}).execute()
+                deleted = {file_ids[0]: int(result.data or 0)}
             else:
-                logger.info("No se encontraron fragmentos en tabla 'documents' usando columna file_id, intentando con metadata")
-            
-            # Método alternativo: intentar con metadata->>'file_id'
-            result = self.supabase.table(self.collection_name).select("id").filter("metadata->>'file_id'", "eq", file_id).execute()
-            count = len(result.data) if result.data else 0
-            
-            if count == 0:
-                logger.info(f"No se encontraron fragmentos en la tabla 'documents' para el archivo {file_id}")
-                return 0
-            
-            # Eliminar los fragmentos
-            result = self.supabase.table(self.collection_name).delete().filter("metadata->>'file_id'", "eq", file_id).execute()
-            deleted_count = len(result.data) if result.data else count
-            logger.info(f"Se eliminaron {deleted_count} fragmentos de la tabla 'documents' usando metadata->>'file_id'")
-            
-            return deleted_count
-        
+                result = self.supabase.rpc("delete_chunks_by_file_ids", {"file_ids": list(file_ids)}).execute()
+                deleted = {row["file_id"]: row["deleted"] for row in result.data or []}
         except Exception as e:
-            logger.error(f"Error al eliminar fragmentos de la tabla 'documents': {e}")
-            
-            # Plan C: Usar la función SQL directamente
+            # Bases de datos creadas antes de las funciones: un DELETE por la columna file_id
+            logger.warning(f"No se pudo llamar a la función de eliminación ({e}); "
+                           "ejecuta supabase_unified.sql y 'admin backfill-file-ids'")
             try:
-                logger.info("Intentando con función RPC delete_chunks_by_file_id para eliminar de la tabla 'documents'")
-                result = self.supabase.rpc(
-                    "delete_chunks_by_file_id", 
-                    {"file_id": file_id}
-                ).execute()
-                
-                if hasattr(result, 'data') and result.data:
-                    deleted_count = result.data[0]
-                    logger.info(f"Función RPC: Se eliminaron {deleted_count} fragmentos de la tabla 'documents'")
-                    return deleted_count
-                return 0
+                deleted = {}
+                for file_id in file_ids:
+                    result = (self.supabase.table(self.collection_name)
+                              .delete(count="exact", returning="minimal").eq("file_id", file_id).execute())
+                    deleted[file_id] = result.count or 0
             except Exception as e2:
-                logger.error(f"Error con función RPC para eliminar de tabla 'documents': {e2}")
-                return 0
+                logger.error(f"Error al eliminar fragmentos de la tabla '{self.collection_name}': {e2}")
+                return {}
+        
+        logger.info(f"Se eliminaron {sum(deleted.values())} fragmentos de la tabla '{self.collection_name}' "
+                    f"para {len(file_ids)} archivo(s)")
+        return {file_id: count for file_id, count in deleted.items() if count}
     
     def _update_or_create_file_record(self, metadata: Dict[str, Any]) -> bool:
         """Actualiza o crea un registro de archivo.
@@ -363,13 +406,42 @@ class VectorDatabase:
             logger.error(f"Error al actualizar registro de archivo: {e}")
             return False
     
-    def log_query(self, query: str, response: str, sources: List[Dict[str, Any]]) -> bool:
+    def record_file_usage(self, file_id: str, usage: Dict[str, Any]) -> bool:
+        """Guarda el consumo de tokens de la última ingesta en los metadatos del archivo.
+        
+        Args:
+            file_id: ID del archivo.
+            usage: Consumo de tokens y coste de la ingesta (ver app.utils.usage).
+            
+        Returns:
+            bool: True si se guardó correctamente, False en caso contrario.
+        """
+        try:
+            response = self.supabase.table("files").select("metadata").eq("id", file_id).execute()
+            if not response.data:
+                return False
+            
+            # Los metadatos del archivo se guardan como texto JSON
+            metadata = response.data[0].get("metadata") or {}
+            if isinstance(metadata, str):
+                metadata = json.loads(metadata)
+            metadata["usage"] = usage
+            
+            self.supabase.table("files").update({"metadata": json.dumps(metadata)}).eq("id", file_id).execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error al guardar el consumo del archivo {file_id}: {e}")
+            return False
+    
+    def log_query(self, query: str, response: str, sources: List[Dict[str, Any]],
+                  usage: Optional[Dict[str, Any]] = None) -> bool:
         """Registra una consulta en la base de datos.
         
         Args:
             query: Consulta realizada.
             response: Respuesta generada.
             sources: Fuentes utilizadas para generar la respuesta.
+            usage: Consumo de tokens y coste de la consulta (ver app.utils.usage).
             
         Returns:
             bool: True si se registró correctamente, False en caso contrario.
@@ -382,9 +454,19 @@ class VectorDatabase:
                 "sources": sources,
                 "created_at": datetime.now().isoformat()
             }
+            if usage:
+                query_data["usage"] = usage
             
             # Insertar la consulta
-            result = self.supabase.table("queries").insert(query_data).execute()
+            try:
+                result = self.supabase.table("queries").insert(query_data).execute()
+            except Exception as e:
+                # Bases de datos creadas antes de la columna 'usage': registrar la consulta sin ella
+                if "usage" not in str(e):
+                    raise
+                logger.warning("La tabla 'queries' no tiene la columna 'usage'; ejecuta la migración de docs/maintenance/performance.md")
+                query_data.pop("usage")
+                result = self.supabase.table("queries").insert(query_data).execute()
             
             logger.info(f"Consulta registrada correctamente")
             return True
@@ -10,17 +10,9 @@ import hashlib
 from pathlib import Path
 import re
 
-from langchain_community.document_loaders import (
-    Docx2txtLoader,
-    TextLoader,
-    UnstructuredFileLoader
-)
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 
-# Importar PyMuPDF para manejo de PDFs
-import fitz  # PyMuPDF
-
 from app.config.settings import CHUNK_SIZE, CHUNK_OVERLAP
 
 # Configurar logging
@@ -57,17 +49,21 @@ class DocumentProcessor:
         try:
             file_extension = Path(file_path).suffix.lower()
             
+            # Los cargadores se importan al usarlos: langchain_community y unstructured tardan en cargarse
             # Usar PyMuPDF para PDFs
             if file_extension == ".pdf":
                 documents = self._load_pdf_with_pymupdf(file_path)
             elif file_extension in [".docx", ".doc"]:
+                from langchain_community.document_loaders import Docx2txtLoader
                 loader = Docx2txtLoader(file_path)
                 documents = loader.load()
             elif file_extension == ".txt":
+                from langchain_community.document_loaders import TextLoader
                 loader = TextLoader(file_path)
                 documents = loader.load()
             else:
                 # Para otros formatos, intentar con el cargador genérico
+                from langchain_community.document_loaders import UnstructuredFileLoader
                 loader = UnstructuredFileLoader(file_path)
                 documents = loader.load()
             
@@ -86,6 +82,8 @@ class DocumentProcessor:
         Returns:
             List[Document]: Lista de documentos, uno por página del PDF.
         """
+        import fitz  # PyMuPDF
+        
         documents = []
         
         try:
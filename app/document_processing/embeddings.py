@@ -4,13 +4,14 @@ Este módulo proporciona funciones para generar embeddings de texto utilizando O
 """
 
 import logging
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 import time
 
 from langchain_openai import OpenAIEmbeddings
 from openai import RateLimitError
 
 from app.config.settings import OPENAI_API_KEY, EMBEDDING_MODEL
+from app.utils.usage import add_usage, count_tokens
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -32,13 +33,15 @@ class EmbeddingGenerator:
         )
         logger.info(f"Generador de embeddings inicializado con el modelo {model_name}")
     
-    def generate_embedding(self, text: str, metadata: dict = None, max_retries: int = 3) -> Optional[List[float]]:
+    def generate_embedding(self, text: str, metadata: dict = None, max_retries: int = 3,
+                           usage: Optional[Dict[str, Any]] = None) -> Optional[List[float]]:
         """Genera un embedding para un texto.
         
         Args:
             text: Texto para generar el embedding.
             metadata: Metadatos opcionales para enriquecer el texto antes de generar embedding.
             max_retries: Número máximo de reintentos en caso de error.
+            usage: Registro de consumo (ver app.utils.usage) al que se suman los tokens usados.
             
         Returns:
             List[float] o None: Vector de embedding si se generó correctamente, None en caso contrario.
@@ -53,6 +56,7 @@ class EmbeddingGenerator:
         while retries < max_retries:
             try:
                 embedding = self.embeddings.embed_query(text)
+                self._record_usage(usage, [text])
                 return embedding
             except RateLimitError:
                 wait_time = (2 ** retries) * 1  # Espera exponencial
@@ -66,13 +70,15 @@ class EmbeddingGenerator:
         logger.error(f"No se pudo generar el embedding después de {max_retries} intentos")
         return None
     
-    def generate_embeddings_batch(self, texts: List[str], metadata_list: List[dict] = None, batch_size: int = 20) -> List[Optional[List[float]]]:
+    def generate_embeddings_batch(self, texts: List[str], metadata_list: List[dict] = None, batch_size: int = 20,
+                                  usage: Optional[Dict[str, Any]] = None) -> List[Optional[List[float]]]:
         """Genera embeddings para una lista de textos usando la API en modo batch real.
         
         Args:
             texts: Lista de textos para generar embeddings.
             metadata_list: Lista opcional de metadatos para enriquecer los textos.
             batch_size: Tamaño del lote para procesar de una vez.
+            usage: Registro de consumo (ver app.utils.usage) al que se suman los tokens usados.
             
         Returns:
             List[Optional[List[float]]]: Lista de vectores de embedding.
@@ -117,6 +123,7 @@ class EmbeddingGenerator:
                     logger.info(f"Respuesta recibida para fragmentos {i+1}-{batch_end} de {len(enriched_texts)} - HTTP 200 OK")
                     
                     all_embeddings.extend(batch_embeddings)
+                    self._record_usage(usage, batch)
                     
                     # Breve pausa para evitar límites de tasa
                     if i + batch_size < len(enriched_texts):
@@ -192,4 +199,9 @@ class EmbeddingGenerator:
             return False
         except Exception as e:
             logger.error(f"DIAGNÓSTICO FALLIDO: Error general al conectar con la API de OpenAI: {e}")
-            return False 
\ No newline at end of file
+            return False
+    
+    def _record_usage(self, usage: Optional[Dict[str, Any]], texts: List[str]):
+        """Suma al registro de consumo los tokens de una llamada correcta."""
+        if usage is not None:
+            add_usage(usage, {"embedding_model": self.model_name, "embedding_tokens": count_tokens(texts, self.model_name)})
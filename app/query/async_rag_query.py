@@ -0,0 +1,242 @@
+"""
+Sistema de consultas RAG asíncrono.
+Este módulo proporciona una variante de RAGQuerySystem basada en asyncio: el embedding, la búsqueda
+por similitud, la llamada al LLM y el registro de la consulta no bloquean hilos, de modo que un solo
+proceso puede atender muchas consultas simultáneas.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+import httpx
+from openai import AsyncOpenAI
+
+from app.config.settings import (
+    EMBEDDING_MODEL,
+    LLM_MODEL,
+    OPENAI_API_KEY,
+    SUPABASE_KEY,
+    SUPABASE_URL,
+)
+from app.query.rag_query import RAG_PROMPT_TEMPLATE, RAGQuerySystem
+from app.utils.performance_metrics import performance_tracker
+from app.utils.slow_query_log import slow_query_log
+from app.utils.usage import estimate_cost
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+
+class AsyncRAGQuerySystem:
+    """Variante asíncrona de RAGQuerySystem basada en AsyncOpenAI y llamadas PostgREST con httpx."""
+
+    def __init__(self, model_name: str = LLM_MODEL, api_key: str = OPENAI_API_KEY,
+                 embedding_model: str = EMBEDDING_MODEL, supabase_url: str = SUPABASE_URL,
+                 supabase_key: str = SUPABASE_KEY, openai_client: Optional[AsyncOpenAI] = None,
+                 http_client: Optional[httpx.AsyncClient] = None, embedding_cache_size: int = 1000):
+        """Inicializa el sistema de consultas asíncrono.
+
+        Args:
+            model_name: Nombre del modelo de lenguaje.
+            api_key: Clave API de OpenAI.
+            embedding_model: Nombre del modelo de embeddings.
+            supabase_url: URL del proyecto de Supabase.
+            supabase_key: Clave de API de Supabase.
+            openai_client: Cliente AsyncOpenAI opcional (por defecto se crea uno).
+            http_client: Cliente httpx.AsyncClient opcional para la API REST de Supabase.
+            embedding_cache_size: Número máximo de embeddings de consultas en caché.
+        """
+        self.model_name = model_name
+        self.embedding_model = embedding_model
+        self.openai_client = openai_client or AsyncOpenAI(api_key=api_key)
+        self.http_client = http_client or httpx.AsyncClient(
+            base_url=f"{supabase_url}/rest/v1",
+            headers={
+                "apikey": supabase_key or "",
+                "Authorization": f"Bearer {supabase_key}",
+                "Content-Type": "application/json"
+            },
+            timeout=10.0
+        )
+        self.embedding_cache_size = embedding_cache_size
+        self._embedding_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._background_tasks: Set[asyncio.Task] = set()
+
+        logger.info(f"Sistema de consultas RAG asíncrono inicializado con el modelo {model_name}")
+
+    async def aquery(self, question: str, num_results: int = 5, similarity_threshold: float = 0.1,
+                     timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Realiza una consulta RAG de forma asíncrona.
+
+        Args:
+            question: Pregunta del usuario.
+            num_results: Número de resultados a recuperar.
+            similarity_threshold: Umbral de similitud mínima (0-1).
+            timeout: Tiempo máximo total en segundos. Al agotarse se cancelan las llamadas en curso.
+
+        Returns:
+            Dict[str, Any]: Respuesta y metadatos, con el mismo formato que RAGQuerySystem.query.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+
+        def remaining() -> Optional[float]:
+            return None if deadline is None else max(0.0, deadline - loop.time())
+
+        try:
+            logger.info(f"Procesando consulta asíncrona: {question}")
+            total_start_time = time.time()
+            usage: Dict[str, Any] = {}
+
+            embedding_start_time = time.time()
+            query_embedding = await asyncio.wait_for(self._embed(question, remaining(), usage), remaining())
+            embedding_time = time.time() - embedding_start_time
+
+            search_start_time = time.time()
+            results = await asyncio.wait_for(
+                self._search(query_embedding, num_results, similarity_threshold), remaining()
+            )
+            search_time = time.time() - search_start_time
+
+            llm_time = 0.0
+            if results:
+                llm_start_time = time.time()
+                answer = await asyncio.wait_for(self._complete(question, results, remaining(), usage), remaining())
+                llm_time = time.time() - llm_start_time
+                sources = RAGQuerySystem._extract_sources(results)
+            else:
+                logger.warning("No se encontraron resultados para la consulta")
+                answer = "No encontré información relevante para responder a tu pregunta."
+                sources = []
+
+            usage["cost"] = estimate_cost(usage)
+            performance_tracker.track_usage("query", question, usage)
+
+            # El registro en 'queries' se ejecuta en segundo plano, sin retrasar la respuesta
+            self._spawn(self._log_query(question, answer, sources, usage))
+
+            total_time = time.time() - total_start_time
+            performance_tracker.track_query(
+                query_time=total_time,
+                embedding_time=embedding_time,
+                search_time=search_time,
+                llm_time=llm_time,
+                model=self.model_name,
+                route="async"
+            )
+            slow_query_log.record(
+                "async", question, total_time,
+                {"embedding": embedding_time, "search": search_time, "llm": llm_time},
+                usage=usage, chunks=results
+            )
+
+            logger.info(f"Consulta asíncrona procesada correctamente en {total_time:.3f} segundos")
+            return {"answer": answer, "sources": sources, "success": True, "usage": usage}
+        except asyncio.TimeoutError:
+            logger.error(f"La consulta superó el tiempo máximo de {timeout}s y se canceló")
+            performance_tracker.count_query("timeout", self.model_name, "async")
+            return {
+                "answer": "Lo siento, la consulta tardó demasiado y se canceló.",
+                "sources": [],
+                "success": False,
+                "timed_out": True
+            }
+        except Exception as e:
+            logger.error(f"Error al procesar la consulta asíncrona: {e}")
+            performance_tracker.count_query("error", self.model_name, "async")
+            return {
+                "answer": "Lo siento, ocurrió un error al procesar tu consulta.",
+                "sources": [],
+                "success": False
+            }
+
+    async def _embed(self, question: str, timeout: Optional[float], usage: Dict[str, Any]) -> List[float]:
+        """Obtiene el embedding de la consulta, usando la caché si es posible, y anota sus tokens en usage."""
+        cached = self._embedding_cache.get(question)
+        if cached is not None:
+            self._embedding_cache.move_to_end(question)
+            return cached
+
+        response = await self.openai_client.embeddings.create(
+            input=[question.replace("\n", " ")],
+            model=self.embedding_model,
+            timeout=timeout
+        )
+        embedding = response.data[0].embedding
+        if getattr(response, "usage", None):
+            usage.update(embedding_model=self.embedding_model, embedding_tokens=response.usage.prompt_tokens)
+
+        self._embedding_cache[question] = embedding
+        if len(self._embedding_cache) > self.embedding_cache_size:
+            self._embedding_cache.popitem(last=False)
+        return embedding
+
+    async def _search(self, query_embedding: List[float], top_k: int, threshold: float) -> List[Dict[str, Any]]:
+        """Llama a la función RPC match_documents a través de PostgREST."""
+        response = await self.http_client.post("/rpc/match_documents", json={
+            "query_embedding": query_embedding,
+            "match_threshold": threshold,
+            "match_count": top_k
+        })
+        response.raise_for_status()
+        results = response.json()
+        logger.info(f"Búsqueda por similitud completada: {len(results)} resultados")
+        return results
+
+    async def _complete(self, question: str, results: List[Dict[str, Any]], timeout: Optional[float],
+                        usage: Dict[str, Any]) -> str:
+        """Genera la respuesta del LLM con el mismo prompt que la variante síncrona y anota sus tokens en usage."""
+        prompt = RAG_PROMPT_TEMPLATE.format(
+            context=RAGQuerySystem._prepare_context(results),
+            question=question
+        )
+        completion = await self.openai_client.chat.completions.create(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.1,
+            timeout=timeout
+        )
+        if getattr(completion, "usage", None):
+            usage.update(llm_model=self.model_name, input_tokens=completion.usage.prompt_tokens,
+                         output_tokens=completion.usage.completion_tokens)
+        return completion.choices[0].message.content
+
+    async def _log_query(self, question: str, answer: str, sources: List[Dict[str, Any]],
+                         usage: Dict[str, Any]) -> None:
+        """Registra la consulta en la tabla 'queries'."""
+        query_data = {
+            "query": question,
+            "response": answer,
+            "sources": sources,
+            "created_at": datetime.now().isoformat()
+        }
+        if usage:
+            query_data["usage"] = usage
+        try:
+            response = await self.http_client.post("/queries", json=query_data, headers={"Prefer": "return=minimal"})
+            if response.is_error and "usage" in query_data and "usage" in response.text:
+                # Bases de datos creadas antes de la columna 'usage': registrar la consulta sin ella
+                logger.warning("La tabla 'queries' no tiene la columna 'usage'; ejecuta la migración de docs/maintenance/performance.md")
+                query_data.pop("usage")
+                response = await self.http_client.post("/queries", json=query_data, headers={"Prefer": "return=minimal"})
+            response.raise_for_status()
+            logger.info("Consulta registrada correctamente")
+        except Exception as e:
+            logger.error(f"Error al registrar la consulta: {e}")
+
+    def _spawn(self, coroutine) -> None:
+        """Lanza una tarea en segundo plano conservando una referencia hasta que termine."""
+        task = asyncio.ensure_future(coroutine)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def aclose(self) -> None:
+        """Espera las tareas en segundo plano y cierra los clientes HTTP."""
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        await self.http_client.aclose()
+        await self.openai_client.close()
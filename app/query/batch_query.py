@@ -0,0 +1,293 @@
+"""
+Consultas RAG por lotes.
+Este módulo permite responder miles de preguntas (por ejemplo, conjuntos de evaluación nocturnos)
+agrupando los embeddings, paralelizando las búsquedas y limitando la concurrencia de llamadas al LLM.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from app.utils.performance_metrics import performance_tracker
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Etapas para las que se agregan tiempos en el resumen del lote
+BATCH_STAGES = ("embedding", "search", "llm", "total")
+
+
+def load_questions(file_path: str) -> List[Dict[str, str]]:
+    """Carga preguntas desde un archivo de texto (una por línea) o JSONL.
+
+    Args:
+        file_path: Ruta al archivo. Las líneas JSONL deben tener 'question' y opcionalmente 'id'.
+
+    Returns:
+        List[Dict[str, str]]: Preguntas normalizadas con 'id' y 'question'.
+    """
+    questions = []
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if file_path.endswith(".jsonl"):
+                questions.append(json.loads(line))
+            else:
+                questions.append(line)
+    return normalize_questions(questions)
+
+
+def normalize_questions(questions: Iterable[Any]) -> List[Dict[str, str]]:
+    """Normaliza preguntas en diccionarios con un ID estable.
+
+    Args:
+        questions: Textos o diccionarios con 'question' y opcionalmente 'id'.
+
+    Returns:
+        List[Dict[str, str]]: Preguntas con 'id' y 'question'.
+    """
+    normalized = []
+    for item in questions:
+        if isinstance(item, dict):
+            question = item.get("question", "")
+            question_id = item.get("id")
+        else:
+            question = str(item)
+            question_id = None
+
+        if not question:
+            continue
+
+        # El ID por defecto es un hash del texto para que la reanudación no dependa del orden
+        if question_id is None:
+            question_id = hashlib.md5(question.encode()).hexdigest()
+
+        normalized.append({"id": str(question_id), "question": question})
+    return normalized
+
+
+class BatchQueryRunner:
+    """Ejecuta lotes de consultas RAG con embeddings agrupados y concurrencia acotada."""
+
+    def __init__(self, rag_system, search_workers: int = 8, llm_workers: int = 4, embedding_batch_size: int = 100):
+        """Inicializa el ejecutor de lotes.
+
+        Args:
+            rag_system: Instancia de RAGQuerySystem cuyos componentes se reutilizan.
+            search_workers: Número de búsquedas por similitud simultáneas. Todas comparten
+                            el cliente de Supabase, cuyo pool de conexiones HTTP es seguro entre hilos.
+            llm_workers: Número máximo de llamadas simultáneas al LLM.
+            embedding_batch_size: Número de preguntas por llamada a la API de embeddings.
+        """
+        self.rag_system = rag_system
+        self.search_workers = max(1, search_workers)
+        self.llm_workers = max(1, llm_workers)
+        self.embedding_batch_size = max(1, embedding_batch_size)
+        self._llm_semaphore = threading.BoundedSemaphore(self.llm_workers)
+
+    def run(self, questions: Iterable[Any], output_path: str, num_results: int = 5,
+            similarity_threshold: float = 0.1, resume: bool = True, log_queries: bool = False) -> Dict[str, Any]:
+        """Procesa el lote y escribe cada resultado en JSONL en cuanto está disponible.
+
+        Args:
+            questions: Textos o diccionarios con 'id' y 'question'.
+            output_path: Archivo JSONL de salida; con resume=True actúa como checkpoint.
+            num_results: Número de fragmentos a recuperar por pregunta.
+            similarity_threshold: Umbral de similitud mínima (0-1).
+            resume: Si es True, omite las preguntas ya respondidas con éxito en output_path.
+            log_queries: Si es True, registra cada consulta en la tabla 'queries'.
+
+        Returns:
+            Dict[str, Any]: Resumen del lote con conteos y tiempos agregados por etapa.
+        """
+        batch_start = time.time()
+        all_questions = normalize_questions(questions)
+
+        completed_ids = self._load_completed_ids(output_path) if resume else set()
+        pending = [q for q in all_questions if q["id"] not in completed_ids]
+
+        logger.info(f"Lote de consultas: {len(all_questions)} preguntas, {len(completed_ids)} ya completadas, "
+                    f"{len(pending)} pendientes")
+
+        timings: Dict[str, List[float]] = {stage: [] for stage in BATCH_STAGES}
+        succeeded = 0
+        failed = 0
+        processed = 0
+
+        mode = "a" if resume else "w"
+        with open(output_path, mode, encoding="utf-8") as output_file, \
+                ThreadPoolExecutor(max_workers=self.search_workers) as executor:
+            # Si la ejecución anterior se interrumpió a mitad de línea, empezar en una línea nueva
+            if resume and output_file.tell() > 0 and not self._ends_with_newline(output_path):
+                output_file.write("\n")
+
+            for start in range(0, len(pending), self.embedding_batch_size):
+                batch = pending[start:start + self.embedding_batch_size]
+
+                # Un único grupo de llamadas a la API de embeddings para todo el bloque
+                embedding_start = time.time()
+                embeddings = self.rag_system.embedding_generator.generate_embeddings_batch(
+                    [q["question"] for q in batch],
+                    batch_size=self.embedding_batch_size
+                )
+                embedding_time = (time.time() - embedding_start) / len(batch)
+
+                futures = [
+                    executor.submit(self._answer, question, embedding, embedding_time,
+                                    num_results, similarity_threshold, log_queries)
+                    for question, embedding in zip(batch, embeddings)
+                ]
+
+                for future in as_completed(futures):
+                    record = future.result()
+                    output_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    output_file.flush()
+
+                    processed += 1
+                    if record["success"]:
+                        succeeded += 1
+                        for stage in BATCH_STAGES:
+                            timings[stage].append(record["timings"].get(stage, 0.0))
+                    else:
+                        failed += 1
+
+                logger.info(f"Progreso del lote: {processed}/{len(pending)} preguntas "
+                            f"({processed/len(pending)*100:.1f}%), {failed} con error")
+
+        summary = {
+            "total_questions": len(all_questions),
+            "skipped": len(completed_ids & {q["id"] for q in all_questions}),
+            "processed": processed,
+            "succeeded": succeeded,
+            "failed": failed,
+            "wall_time": time.time() - batch_start,
+            "stages": {stage: self._aggregate(values) for stage, values in timings.items()},
+            "output_path": os.path.abspath(output_path)
+        }
+        logger.info(f"Lote completado en {summary['wall_time']:.2f}s: {succeeded} correctas, {failed} con error")
+        return summary
+
+    def _answer(self, question: Dict[str, str], embedding: Optional[List[float]], embedding_time: float,
+                num_results: int, similarity_threshold: float, log_queries: bool) -> Dict[str, Any]:
+        """Busca y responde una pregunta cuyo embedding ya fue generado.
+
+        Returns:
+            Dict[str, Any]: Registro JSONL de la pregunta.
+        """
+        record = {"id": question["id"], "question": question["question"]}
+
+        if not embedding:
+            record.update({"answer": None, "sources": [], "success": False,
+                           "error": "No se pudo generar el embedding"})
+            return record
+
+        try:
+            start_time = time.time()
+            search_start = time.time()
+            results = self.rag_system.vector_db.similarity_search(
+                query_embedding=embedding,
+                top_k=num_results,
+                threshold=similarity_threshold
+            )
+            search_time = time.time() - search_start
+
+            llm_time = 0.0
+            if results:
+                with self._llm_semaphore:
+                    llm_start = time.time()
+                    answer = self.rag_system.generate_answer(question["question"], results)
+                    llm_time = time.time() - llm_start
+                sources = self.rag_system._extract_sources(results)
+            else:
+                answer = "No encontré información relevante para responder a tu pregunta."
+                sources = []
+
+            if log_queries:
+                self.rag_system.vector_db.log_query(question["question"], answer, sources)
+
+            total_time = embedding_time + (time.time() - start_time)
+            performance_tracker.track_query(
+                query_time=total_time,
+                embedding_time=embedding_time,
+                search_time=search_time,
+                llm_time=llm_time,
+                model=getattr(self.rag_system, "model_name", ""),
+                route="batch"
+            )
+
+            record.update({
+                "answer": answer,
+                "sources": sources,
+                "success": True,
+                "timings": {
+                    "embedding": embedding_time,
+                    "search": search_time,
+                    "llm": llm_time,
+                    "total": total_time
+                }
+            })
+        except Exception as e:
+            logger.error(f"Error al procesar la pregunta {question['id']} del lote: {e}")
+            performance_tracker.count_query("error", getattr(self.rag_system, "model_name", ""), "batch")
+            record.update({"answer": None, "sources": [], "success": False, "error": str(e)})
+
+        return record
+
+    def _load_completed_ids(self, output_path: str) -> Set[str]:
+        """Lee el checkpoint y devuelve los IDs ya respondidos con éxito.
+
+        Args:
+            output_path: Archivo JSONL de resultados de una ejecución anterior.
+
+        Returns:
+            Set[str]: IDs de las preguntas completadas.
+        """
+        completed = set()
+        if not os.path.exists(output_path):
+            return completed
+
+        with open(output_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Última línea truncada por una interrupción: se volverá a procesar
+                    continue
+                if record.get("success"):
+                    completed.add(str(record.get("id")))
+        return completed
+
+    def _ends_with_newline(self, file_path: str) -> bool:
+        """Indica si el archivo termina en salto de línea."""
+        with open(file_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _aggregate(self, values: List[float]) -> Dict[str, float]:
+        """Calcula estadísticas agregadas de una etapa.
+
+        Args:
+            values: Tiempos de la etapa en segundos.
+
+        Returns:
+            Dict[str, float]: Conteo, suma, promedio y percentiles.
+        """
+        if not values:
+            return {"count": 0, "sum": 0.0, "avg": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+
+        return {
+            "count": len(values),
+            "sum": sum(values),
+            "avg": statistics.mean(values),
+            "p50": performance_tracker._percentile(values, 50),
+            "p95": performance_tracker._percentile(values, 95),
+            "max": max(values)
+        }
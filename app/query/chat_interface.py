@@ -16,9 +16,10 @@ from rich.console import Console
 from rich.table import Table
 from rich.markdown import Markdown
 
+from app.database.statistics import DocumentStatistics, format_statistics
 from app.query.rag_query import RAGQuerySystem
 from app.utils.performance_metrics import PerformanceTracker
-from app.core.document_manager import DocumentManager
+from app.utils.profiler import idle
 
 logger = logging.getLogger(__name__)
 
@@ -32,7 +33,7 @@ class CommandLineChatInterface(cmd.Cmd):
         super().__init__()
         self.console = Console()
         self.rag_system = RAGQuerySystem()
-        self.document_manager = DocumentManager()
+        self.statistics = DocumentStatistics(self.rag_system.vector_db)
         self.performance_tracker = self.rag_system.performance_tracker
         self.conversation_history: List[Dict] = []
         self.similarity_threshold = 0.1  # Umbral predeterminado (modificado de 0.3 a 0.1)
@@ -91,16 +92,15 @@ class CommandLineChatInterface(cmd.Cmd):
         return True
     
     def do_statistics(self, arg: str) -> None:
-        """Muestra estadísticas sobre los documentos y consultas."""
-        stats = self.document_manager.get_document_statistics()
+        """Muestra estadísticas sobre los documentos y consultas ('statistics refresh' ignora la caché)."""
+        stats = self.statistics.get_statistics(refresh=arg.strip() == "refresh")
         
         table = Table(title="Estadísticas de Documentos")
         table.add_column("Métrica", style="cyan")
         table.add_column("Valor", style="magenta")
         
-        table.add_row("Total de archivos", str(stats.get('total_files', 0)))
-        table.add_row("Total de fragmentos", str(stats.get('total_chunks', 0)))
-        table.add_row("Última actualización", str(stats.get('last_processed', 'N/A')))
+        for label, value in format_statistics(stats):
+            table.add_row(label, value)
         
         self.console.print(table)
     
@@ -246,7 +246,9 @@ class CommandLineChatInterface(cmd.Cmd):
             # Usar una implementación personalizada del bucle de comandos para evitar problemas con readline
             while True:
                 try:
-                    line = input(self.prompt)
+                    # El tiempo esperando al usuario no cuenta en el perfil (--profile)
+                    with idle():
+                        line = input(self.prompt)
                     if not line:
                         self.emptyline()
                         continue
@@ -5,8 +5,7 @@ Este módulo proporciona funciones para realizar consultas RAG utilizando la bas
 
 import logging
 import json
-import time
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional
 
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
@@ -14,12 +13,35 @@ from langchain.schema import Document
 
 from app.document_processing.embeddings import EmbeddingGenerator
 from app.database.vector_store import VectorDatabase
+from app.query.batch_query import BatchQueryRunner
 from app.config.settings import LLM_MODEL, OPENAI_API_KEY
 from app.utils.performance_metrics import performance_tracker
+from app.utils.single_flight import SingleFlight, make_key
+from app.utils.slow_query_log import slow_query_log
+from app.utils.tracing import annotate_retrieval, tracer
+from app.utils.usage import add_usage, count_tokens, estimate_cost
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
+# Plantilla para el prompt de RAG (compartida por las variantes síncrona y asíncrona)
+RAG_PROMPT_TEMPLATE = """Eres un asistente útil que responde preguntas basándose únicamente en el contexto proporcionado.
+            
+            Contexto:
+            {context}
+            
+            Pregunta: {question}
+            
+            Instrucciones importantes:
+            1. Responde solo con información que esté presente en el contexto proporcionado.
+            2. Si el contexto no contiene la información necesaria para responder, di "No tengo suficiente información para responder a esta pregunta."
+            3. No uses conocimiento externo o general que no esté en el contexto.
+            4. Proporciona respuestas detalladas y precisas basadas únicamente en el contexto.
+            5. Cita las fuentes de información cuando sea posible, refiriéndote al nombre del documento y número de fragmento.
+            6. Si hay información contradictoria en el contexto, señálala y explica las diferentes perspectivas.
+            
+            Respuesta:"""
+
 class RAGQuerySystem:
     """Clase para realizar consultas RAG utilizando la base de datos vectorial."""
     
@@ -30,6 +52,7 @@ class RAGQuerySystem:
             model_name: Nombre del modelo de lenguaje.
             api_key: Clave API de OpenAI.
         """
+        self.model_name = model_name
         self.embedding_generator = EmbeddingGenerator()
         self.vector_db = VectorDatabase()
         self.llm = ChatOpenAI(
@@ -42,28 +65,13 @@ class RAGQuerySystem:
         self.performance_tracker = performance_tracker
         
         # Plantilla para el prompt de RAG
-        self.prompt_template = ChatPromptTemplate.from_template(
-            """Eres un asistente útil que responde preguntas basándose únicamente en el contexto proporcionado.
-            
-            Contexto:
-            {context}
-            
-            Pregunta: {question}
-            
-            Instrucciones importantes:
-            1. Responde solo con información que esté presente en el contexto proporcionado.
-            2. Si el contexto no contiene la información necesaria para responder, di "No tengo suficiente información para responder a esta pregunta."
-            3. No uses conocimiento externo o general que no esté en el contexto.
-            4. Proporciona respuestas detalladas y precisas basadas únicamente en el contexto.
-            5. Cita las fuentes de información cuando sea posible, refiriéndote al nombre del documento y número de fragmento.
-            6. Si hay información contradictoria en el contexto, señálala y explica las diferentes perspectivas.
-            
-            Respuesta:"""
-        )
+        self.prompt_template = ChatPromptTemplate.from_template(RAG_PROMPT_TEMPLATE)
+        
+        # Consultas idénticas simultáneas comparten un único cálculo
+        self._single_flight = SingleFlight()
         
         logger.info(f"Sistema de consultas RAG inicializado con el modelo {model_name}")
     
-    @performance_tracker.track_time("total_query_time")
     def query(self, question: str, num_results: int = 5, similarity_threshold: float = 0.1) -> Dict[str, Any]:
         """Realiza una consulta RAG.
         
@@ -75,89 +83,136 @@ class RAGQuerySystem:
         Returns:
             Dict[str, Any]: Respuesta y metadatos.
         """
+        key = make_key(question, num_results=num_results, similarity_threshold=similarity_threshold)
+        result, shared = self._single_flight.do(
+            key, lambda: self._query(question, num_results, similarity_threshold)
+        )
+        if shared:
+            logger.info("Respuesta compartida con una consulta idéntica en curso")
+        
+        # Copia para que los llamadores no compartan el mismo diccionario
+        return dict(result)
+    
+    def query_stream(self, question: str, num_results: int = 5, similarity_threshold: float = 0.1) -> Iterator[str]:
+        """Realiza una consulta RAG devolviendo la respuesta en fragmentos a medida que se genera.
+        
+        Las consultas idénticas simultáneas comparten el mismo flujo; quien llega a mitad de la
+        respuesta recibe primero el texto ya generado.
+        
+        Args:
+            question: Pregunta del usuario.
+            num_results: Número de resultados a recuperar.
+            similarity_threshold: Umbral de similitud mínima (0-1).
+            
+        Returns:
+            Iterator[str]: Fragmentos de texto de la respuesta.
+        """
+        key = make_key(question, num_results=num_results, similarity_threshold=similarity_threshold)
+        return self._single_flight.stream(
+            key, lambda: self._stream_answer(question, num_results, similarity_threshold)
+        )
+    
+    def _query(self, question: str, num_results: int, similarity_threshold: float) -> Dict[str, Any]:
+        """Ejecuta la consulta RAG completa (embedding, búsqueda y LLM)."""
         try:
             # Configurar temporalmente el logger a nivel DEBUG para ver los metadatos
             logger.setLevel(logging.DEBUG)
             
             logger.info(f"Procesando consulta: {question}")
             
-            total_start_time = time.time()
-            
-            # Generar embedding para la consulta
-            embedding_start_time = time.time()
-            query_embedding = self.embedding_generator.generate_embedding(question)
-            embedding_time = time.time() - embedding_start_time
-            
-            if not query_embedding:
-                logger.error("No se pudo generar el embedding para la consulta")
-                return {
-                    "answer": "Lo siento, no pude procesar tu consulta en este momento.",
-                    "sources": [],
-                    "success": False
-                }
-            
-            # Realizar búsqueda por similitud
-            search_start_time = time.time()
-            results = self.vector_db.similarity_search(
-                query_embedding=query_embedding, 
-                top_k=num_results,
-                threshold=similarity_threshold
-            )
-            search_time = time.time() - search_start_time
+            # Consumo de tokens de la consulta (embedding y LLM)
+            usage = {}
             
-            if not results:
-                logger.warning("No se encontraron resultados para la consulta")
+            with tracer.span("rag.query", model=self.model_name, top_k=num_results,
+                             similarity_threshold=similarity_threshold) as query_span:
+                # Generar embedding para la consulta
+                with tracer.span("rag.embedding") as embedding_span:
+                    query_embedding = self.embedding_generator.generate_embedding(question, usage=usage)
+                    embedding_span.set_attribute("embedding.tokens", usage.get("embedding_tokens"))
+                
+                if not query_embedding:
+                    logger.error("No se pudo generar el embedding para la consulta")
+                    return {
+                        "answer": "Lo siento, no pude procesar tu consulta en este momento.",
+                        "sources": [],
+                        "success": False
+                    }
+                
+                # Realizar búsqueda por similitud
+                with tracer.span("rag.search", top_k=num_results) as search_span:
+                    results = self.vector_db.similarity_search(
+                        query_embedding=query_embedding, 
+                        top_k=num_results,
+                        threshold=similarity_threshold
+                    )
+                    annotate_retrieval(search_span, results)
+                
+                if not results:
+                    logger.warning("No se encontraron resultados para la consulta")
+                    usage["cost"] = estimate_cost(usage)
+                    response = {
+                        "answer": "No encontré información relevante para responder a tu pregunta.",
+                        "sources": [],
+                        "success": True,
+                        "usage": usage
+                    }
+                    
+                    # Registrar la consulta en la base de datos
+                    with tracer.span("rag.log_query"):
+                        self.vector_db.log_query(question, response["answer"], response["sources"], usage)
+                    performance_tracker.track_usage("query", question, usage)
+                    
+                    # Registrar tiempos en el rastreador de rendimiento
+                    performance_tracker.track_query(
+                        query_time=query_span.duration,
+                        embedding_time=embedding_span.duration,
+                        search_time=search_span.duration,
+                        llm_time=0.0,  # No se llamó al LLM
+                        model=self.model_name
+                    )
+                    slow_query_log.record(
+                        "app", question, query_span.duration,
+                        {"embedding": embedding_span.duration, "search": search_span.duration},
+                        usage=usage, trace_id=query_span.trace_id
+                    )
+                    
+                    return response
+                
+                # Generar la respuesta a partir de los fragmentos recuperados
+                with tracer.span("rag.llm", model=self.model_name) as llm_span:
+                    answer = self.generate_answer(question, results, usage=usage)
+                
+                # Extraer las fuentes
+                sources = self._extract_sources(results)
+                
+                usage["cost"] = estimate_cost(usage)
+                query_span.set_attribute("cost_usd", usage["cost"])
                 response = {
-                    "answer": "No encontré información relevante para responder a tu pregunta.",
-                    "sources": [],
-                    "success": True
+                    "answer": answer,
+                    "sources": sources,
+                    "success": True,
+                    "usage": usage
                 }
                 
                 # Registrar la consulta en la base de datos
-                self.vector_db.log_query(question, response["answer"], response["sources"])
-                
-                # Registrar tiempos en el rastreador de rendimiento
-                total_time = time.time() - total_start_time
-                performance_tracker.track_query(
-                    query_time=total_time,
-                    embedding_time=embedding_time,
-                    search_time=search_time,
-                    llm_time=0.0  # No se llamó al LLM
-                )
-                
-                return response
-            
-            # Preparar el contexto para el LLM
-            context = self._prepare_context(results)
-            
-            # Generar la respuesta
-            llm_start_time = time.time()
-            chain = self.prompt_template | self.llm
-            llm_response = chain.invoke({
-                "context": context,
-                "question": question
-            })
-            llm_time = time.time() - llm_start_time
-            
-            # Extraer las fuentes
-            sources = self._extract_sources(results)
-            
-            response = {
-                "answer": llm_response.content,
-                "sources": sources,
-                "success": True
-            }
-            
-            # Registrar la consulta en la base de datos
-            self.vector_db.log_query(question, response["answer"], sources)
+                with tracer.span("rag.log_query"):
+                    self.vector_db.log_query(question, response["answer"], sources, usage)
+                performance_tracker.track_usage("query", question, usage)
             
             # Registrar tiempos en el rastreador de rendimiento
-            total_time = time.time() - total_start_time
+            total_time = query_span.duration
+            embedding_time, search_time, llm_time = embedding_span.duration, search_span.duration, llm_span.duration
             performance_tracker.track_query(
                 query_time=total_time,
                 embedding_time=embedding_time,
                 search_time=search_time,
-                llm_time=llm_time
+                llm_time=llm_time,
+                model=self.model_name
+            )
+            slow_query_log.record(
+                "app", question, total_time,
+                {"embedding": embedding_time, "search": search_time, "llm": llm_time},
+                usage=usage, chunks=results, trace_id=query_span.trace_id
             )
             
             logger.info(f"Consulta procesada correctamente en {total_time:.3f} segundos")
@@ -166,13 +221,122 @@ class RAGQuerySystem:
             return response
         except Exception as e:
             logger.error(f"Error al procesar la consulta: {e}")
+            performance_tracker.count_query("error", self.model_name)
             return {
                 "answer": "Lo siento, ocurrió un error al procesar tu consulta.",
                 "sources": [],
                 "success": False
             }
     
-    def _prepare_context(self, results: List[Dict[str, Any]]) -> str:
+    def generate_answer(self, question: str, results: List[Dict[str, Any]],
+                        usage: Optional[Dict[str, Any]] = None) -> str:
+        """Genera la respuesta del LLM para una pregunta y sus fragmentos recuperados.
+        
+        Args:
+            question: Pregunta del usuario.
+            results: Resultados de la búsqueda por similitud.
+            usage: Registro de consumo (ver app.utils.usage) al que se suman los tokens del LLM.
+            
+        Returns:
+            str: Respuesta generada por el LLM.
+        """
+        context = self._prepare_context(results)
+        chain = self.prompt_template | self.llm
+        llm_response = chain.invoke({
+            "context": context,
+            "question": question
+        })
+        
+        # Tokens informados por la API (LangChain los expone en usage_metadata)
+        token_usage = getattr(llm_response, "usage_metadata", None)
+        if not isinstance(token_usage, dict):
+            token_usage = {}
+        llm_usage = {
+            "llm_model": self.model_name,
+            "input_tokens": token_usage.get("input_tokens", 0),
+            "output_tokens": token_usage.get("output_tokens", 0)
+        }
+        if usage is not None:
+            add_usage(usage, llm_usage)
+        
+        # Anotar el span activo (rag.llm) con el tamaño del contexto y los tokens consumidos
+        span = tracer.current_span()
+        if span is not None:
+            span.set_attributes(**{
+                "llm.context_chars": len(context),
+                "llm.input_tokens": llm_usage["input_tokens"],
+                "llm.output_tokens": llm_usage["output_tokens"]
+            })
+        return llm_response.content
+    
+    def _stream_answer(self, question: str, num_results: int, similarity_threshold: float) -> Iterator[str]:
+        """Genera la respuesta en fragmentos y registra la consulta y su consumo al terminar."""
+        usage = {}
+        query_embedding = self.embedding_generator.generate_embedding(question, usage=usage)
+        if not query_embedding:
+            yield "Lo siento, no pude procesar tu consulta en este momento."
+            return
+        
+        results = self.vector_db.similarity_search(
+            query_embedding=query_embedding,
+            top_k=num_results,
+            threshold=similarity_threshold
+        )
+        if not results:
+            answer = "No encontré información relevante para responder a tu pregunta."
+            yield answer
+            usage["cost"] = estimate_cost(usage)
+            self.vector_db.log_query(question, answer, [], usage)
+            performance_tracker.track_usage("query", question, usage)
+            return
+        
+        # Pedir a la API el consumo en el último fragmento (LangChain lo expone en usage_metadata)
+        context = self._prepare_context(results)
+        chain = self.prompt_template | self.llm.bind(stream_options={"include_usage": True})
+        answer_parts = []
+        token_usage = None
+        for chunk in chain.stream({"context": context, "question": question}):
+            if chunk.content:
+                answer_parts.append(chunk.content)
+                yield chunk.content
+            if isinstance(getattr(chunk, "usage_metadata", None), dict):
+                token_usage = chunk.usage_metadata
+        answer = "".join(answer_parts)
+        
+        if token_usage is None:
+            # Versiones de LangChain que no exponen el consumo en streaming: contar con el tokenizador
+            prompt = self.prompt_template.format(context=context, question=question)
+            token_usage = {"input_tokens": count_tokens([prompt], self.model_name),
+                           "output_tokens": count_tokens([answer], self.model_name)}
+        add_usage(usage, {
+            "llm_model": self.model_name,
+            "input_tokens": token_usage.get("input_tokens", 0),
+            "output_tokens": token_usage.get("output_tokens", 0)
+        })
+        usage["cost"] = estimate_cost(usage)
+        self.vector_db.log_query(question, answer, self._extract_sources(results), usage)
+        performance_tracker.track_usage("query", question, usage)
+    
+    def query_batch(self, questions: List[Any], output_path: str, **kwargs) -> Dict[str, Any]:
+        """Realiza un lote de consultas RAG y escribe los resultados en JSONL.
+        
+        Args:
+            questions: Preguntas como textos o diccionarios con 'id' y 'question'.
+            output_path: Ruta del archivo JSONL de resultados (también sirve de checkpoint).
+            **kwargs: Parámetros adicionales para BatchQueryRunner.run.
+            
+        Returns:
+            Dict[str, Any]: Resumen del lote con tiempos agregados por etapa.
+        """
+        runner_options = {
+            key: kwargs.pop(key)
+            for key in ("search_workers", "llm_workers", "embedding_batch_size")
+            if key in kwargs
+        }
+        return BatchQueryRunner(self, **runner_options).run(questions, output_path, **kwargs)
+    
+    @staticmethod
+    def _prepare_context(results: List[Dict[str, Any]]) -> str:
         """Prepara el contexto para el LLM a partir de los resultados de la búsqueda.
         
         Args:
@@ -203,7 +367,8 @@ class RAGQuerySystem:
         
         return "\n".join(context_parts)
     
-    def _extract_sources(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _extract_sources(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Extrae información de las fuentes de los resultados.
         
         Args:
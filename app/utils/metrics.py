@@ -0,0 +1,270 @@
+"""
+Métricas con memoria constante y exportación en formato OpenMetrics.
+Este módulo proporciona contadores e histogramas de cubetas fijas con etiquetas, un registro global
+y un servidor HTTP mínimo que publica las métricas en /metrics para Prometheus.
+"""
+
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Tipo de contenido del formato de texto OpenMetrics
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+class LatencyHistogram:
+    """Histograma de latencias con cubetas fijas, seguro entre hilos.
+
+    A diferencia de PerformanceTracker no guarda las muestras, por lo que su memoria es constante
+    aunque registre millones de solicitudes.
+    """
+
+    # Límites superiores de las cubetas en segundos (el último tramo es infinito)
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, buckets: Optional[List[float]] = None):
+        """Inicializa el histograma.
+
+        Args:
+            buckets: Límites superiores de las cubetas en segundos, en orden creciente.
+        """
+        self.buckets = tuple(buckets or self.DEFAULT_BUCKETS)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        """Registra una latencia en segundos."""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Obtiene una copia coherente del histograma.
+
+        Returns:
+            Dict[str, Any]: Conteo, suma, promedio, percentiles estimados y cubetas acumuladas.
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+            total_sum = self._sum
+
+        cumulative = []
+        running = 0
+        for bound, count in zip(list(self.buckets) + [float("inf")], counts):
+            running += count
+            cumulative.append((bound, running))
+
+        return {
+            "count": total,
+            "sum": total_sum,
+            "avg": total_sum / total if total else 0.0,
+            "p50": self._estimate_percentile(cumulative, total, 50),
+            "p95": self._estimate_percentile(cumulative, total, 95),
+            "p99": self._estimate_percentile(cumulative, total, 99),
+            "buckets": {("+Inf" if bound == float("inf") else str(bound)): value for bound, value in cumulative}
+        }
+
+    @staticmethod
+    def _estimate_percentile(cumulative: List[tuple], total: int, percentile: int) -> float:
+        """Estima un percentil interpolando linealmente dentro de la cubeta que lo contiene."""
+        if not total:
+            return 0.0
+        target = percentile / 100 * total
+        lower_bound, lower_count = 0.0, 0
+        for bound, count in cumulative:
+            if count >= target:
+                if bound == float("inf"):
+                    # Sin límite superior conocido: se informa el último límite finito
+                    return lower_bound
+                fraction = (target - lower_count) / (count - lower_count) if count > lower_count else 1.0
+                return lower_bound + (bound - lower_bound) * fraction
+            lower_bound, lower_count = bound, count
+        return lower_bound
+
+
+def _escape(value: Any) -> str:
+    """Escapa un valor de etiqueta según el formato OpenMetrics."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str], extra: Optional[Tuple[str, str]] = None) -> str:
+    """Formatea un conjunto de etiquetas como {clave="valor",...}."""
+    items = list(labels.items()) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+
+class _Metric:
+    """Base de las familias de métricas con etiquetas."""
+
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"La métrica {self.name} requiere las etiquetas {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _items(self) -> List[Tuple[Dict[str, str], Any]]:
+        with self._lock:
+            children = list(self._children.items())
+        return [(dict(zip(self.labelnames, key)), child) for key, child in sorted(children)]
+
+    def render(self) -> List[str]:
+        lines = [f"# TYPE {self.name} {self.metric_type}", f"# HELP {self.name} {self.documentation}"]
+        for labels, child in self._items():
+            lines.extend(self._render_child(labels, child))
+        return lines
+
+
+class Counter(_Metric):
+    """Contador monótono con etiquetas."""
+
+    metric_type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        """Incrementa el contador para el conjunto de etiquetas dado."""
+        key = self._key(labels)
+        with self._lock:
+            self._children[key] = self._children.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        """Devuelve el valor actual del contador."""
+        with self._lock:
+            return self._children.get(self._key(labels), 0.0)
+
+    def _render_child(self, labels, value):
+        return [f"{self.name}_total{_format_labels(labels)} {value}"]
+
+
+class Histogram(_Metric):
+    """Histograma de cubetas fijas con etiquetas."""
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Optional[List[float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def labels(self, **labels) -> LatencyHistogram:
+        """Obtiene (o crea) el histograma de un conjunto de etiquetas."""
+        key = self._key(labels)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = LatencyHistogram(self.buckets)
+            return child
+
+    def observe(self, value: float, **labels):
+        """Registra una observación en segundos."""
+        self.labels(**labels).observe(value)
+
+    def _render_child(self, labels, child):
+        snapshot = child.snapshot()
+        lines = [
+            f"{self.name}_bucket{_format_labels(labels, ('le', bound))} {count}"
+            for bound, count in snapshot["buckets"].items()
+        ]
+        lines.append(f"{self.name}_count{_format_labels(labels)} {snapshot['count']}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {snapshot['sum']}")
+        return lines
+
+
+class MetricsRegistry:
+    """Registro de métricas exportables."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, tuple(labelnames), **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"La métrica {name} ya está registrada con otro tipo o etiquetas")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        """Obtiene o registra un contador."""
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Optional[List[float]] = None) -> Histogram:
+        """Obtiene o registra un histograma."""
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """Genera la exposición completa en formato de texto OpenMetrics."""
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+# Registro global de la aplicación
+registry = MetricsRegistry()
+
+# Duración de las etapas del sistema RAG (embedding, search, llm, total, ingest, db_write)
+STAGE_DURATION = registry.histogram(
+    "rag_stage_duration_seconds", "Duración de cada etapa del sistema RAG en segundos.",
+    ("stage", "model", "route")
+)
+QUERIES = registry.counter("rag_queries", "Consultas RAG procesadas.", ("route", "model", "status"))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Publica el registro global en GET /metrics."""
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Inicia en segundo plano un servidor que publica /metrics.
+
+    Args:
+        port: Puerto de escucha.
+        host: Dirección de escucha.
+
+    Returns:
+        ThreadingHTTPServer: Servidor iniciado (usar shutdown() para detenerlo).
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-server").start()
+    logger.info(f"Métricas disponibles en http://{host}:{server.server_address[1]}/metrics")
+    return server
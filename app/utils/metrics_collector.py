@@ -0,0 +1,167 @@
+"""
+Agregación de métricas de rendimiento de varios procesos.
+Cada proceso trabajador ejecuta un `MetricsReporter` que envía periódicamente el estado de su
+`PerformanceTracker` (ver export_state) a un `MetricsCollector` por un socket TCP local, una línea
+JSON por mensaje. El colector conserva el último estado de cada trabajador y los combina al
+consultar las estadísticas, por lo que reenviar un estado nunca duplica mediciones.
+"""
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from app.utils.performance_metrics import PerformanceTracker, performance_tracker
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_COLLECTOR_ADDRESS = ("127.0.0.1", 9150)
+
+
+def parse_address(value: str) -> Tuple[str, int]:
+    """Convierte 'HOST:PUERTO' (o solo 'PUERTO') en una tupla de dirección.
+
+    Args:
+        value: Dirección del colector.
+
+    Returns:
+        Tuple[str, int]: (host, puerto).
+    """
+    host, _, port = value.rpartition(":")
+    return host or DEFAULT_COLLECTOR_ADDRESS[0], int(port)
+
+
+class _StateHandler(socketserver.StreamRequestHandler):
+    """Recibe los estados enviados por un trabajador."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                message = json.loads(line)
+                self.server.collector.update(message["worker"], message["state"])
+            except (ValueError, KeyError) as e:
+                logger.warning(f"Mensaje de métricas descartado: {e}")
+
+
+class MetricsCollector:
+    """Servidor que combina las métricas de rendimiento de varios procesos."""
+
+    def __init__(self, address: Tuple[str, int] = DEFAULT_COLLECTOR_ADDRESS):
+        """Inicializa el colector (no empieza a escuchar hasta llamar a start).
+
+        Args:
+            address: Tupla (host, puerto); use puerto 0 para uno libre.
+        """
+        self.address = address
+        self.states: Dict[str, Dict[str, Any]] = {}
+        self.last_seen: Dict[str, float] = {}
+        self._server: Optional[socketserver.ThreadingTCPServer] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> Tuple[str, int]:
+        """Empieza a escuchar en segundo plano.
+
+        Returns:
+            Tuple[str, int]: Dirección real de escucha.
+        """
+        self._server = socketserver.ThreadingTCPServer(self.address, _StateHandler)
+        self._server.daemon_threads = True
+        self._server.collector = self
+        self.address = self._server.server_address[:2]
+        threading.Thread(target=self._server.serve_forever, daemon=True, name="metrics-collector").start()
+        logger.info(f"Colector de métricas escuchando en {self.address[0]}:{self.address[1]}")
+        return self.address
+
+    def stop(self):
+        """Deja de escuchar."""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def update(self, worker: str, state: Dict[str, Any]):
+        """Sustituye el estado de un trabajador por el más reciente."""
+        with self._lock:
+            self.states[worker] = state
+            self.last_seen[worker] = time.time()
+
+    def get_performance_stats(self) -> Dict[str, Any]:
+        """Combina los estados de todos los trabajadores.
+
+        Returns:
+            Dict[str, Any]: Estadísticas con el formato de PerformanceTracker.get_performance_stats,
+            más la lista de trabajadores y la hora de su último envío.
+        """
+        with self._lock:
+            states = list(self.states.values())
+            workers = dict(self.last_seen)
+        merged = PerformanceTracker()
+        for state in states:
+            merged.merge_state(state)
+        stats = merged.get_performance_stats()
+        stats["workers"] = workers
+        return stats
+
+
+class MetricsReporter:
+    """Envía periódicamente el estado de un rastreador al colector."""
+
+    def __init__(self, address: Tuple[str, int] = DEFAULT_COLLECTOR_ADDRESS,
+                 tracker: PerformanceTracker = performance_tracker, interval: float = 10.0,
+                 worker: Optional[str] = None):
+        """Inicializa el informador.
+
+        Args:
+            address: Dirección del colector.
+            tracker: Rastreador cuyo estado se envía.
+            interval: Segundos entre envíos.
+            worker: Identificador del proceso (por defecto 'host:pid').
+        """
+        self.address = address
+        self.tracker = tracker
+        self.interval = interval
+        self.worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._socket: Optional[socket.socket] = None
+
+    def start(self):
+        """Inicia el envío periódico en un hilo en segundo plano."""
+        threading.Thread(target=self._run, daemon=True, name="metrics-reporter").start()
+        logger.info(f"Enviando métricas al colector {self.address[0]}:{self.address[1]} cada {self.interval}s")
+
+    def stop(self):
+        """Envía el último estado y detiene el hilo."""
+        self._stop.set()
+        self.report()
+        self._close()
+
+    def report(self) -> bool:
+        """Envía el estado actual del rastreador.
+
+        Returns:
+            bool: True si se envió; si el colector no está disponible se reintenta en el siguiente ciclo.
+        """
+        message = json.dumps({"worker": self.worker, "state": self.tracker.export_state()}) + "\n"
+        try:
+            if self._socket is None:
+                self._socket = socket.create_connection(self.address, timeout=5)
+            self._socket.sendall(message.encode())
+            return True
+        except OSError as e:
+            logger.debug(f"No se pudo enviar las métricas al colector: {e}")
+            self._close()
+            return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    def _close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
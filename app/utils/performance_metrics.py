@@ -3,29 +3,80 @@ Métricas de rendimiento para la aplicación RAG.
 Este módulo proporciona funciones para hacer un seguimiento del rendimiento de la base de datos vectorial y el sistema RAG.
 """
 
+import functools
+import heapq
+import itertools
 import logging
+import threading
 import time
 import json
 from typing import Dict, Any, List, Optional, Callable
 from datetime import datetime
 import statistics
 
+from app.utils.metrics import QUERIES, STAGE_DURATION
+from app.utils.sketches import DDSketch, RingBuffer
+from app.utils.usage import add_usage
+
 # Configurar logging
 logger = logging.getLogger(__name__)
 
+# Nombre de la etapa exportada en /metrics para cada operación del rastreador
+STAGE_NAMES = {
+    "embedding_generation": "embedding",
+    "similarity_search": "search",
+    "llm_response": "llm",
+    "total_query_time": "total",
+    "document_processing": "ingest",
+    "db_write": "db_write"
+}
+
+# Número de valores recientes conservados por operación
+WINDOW_SIZE = 100
+
+# Cada hilo acumula sus mediciones y las vuelca a las estructuras compartidas al llegar a
+# FLUSH_SIZE valores o tras FLUSH_INTERVAL segundos; las lecturas vuelcan antes todos los buffers
+FLUSH_SIZE = 64
+FLUSH_INTERVAL = 1.0
+
+# Número de consultas y archivos más costosos conservados por tipo
+TOP_USAGE_SIZE = 20
+
+
+class _ThreadBuffer:
+    """Mediciones pendientes de un hilo (su candado solo se disputa al volcarlas)."""
+    
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def drain(self) -> List[tuple]:
+        """Devuelve y vacía las mediciones pendientes."""
+        with self.lock:
+            pending, self.pending = self.pending, []
+            self.last_flush = time.monotonic()
+        return pending
+
+
 class PerformanceTracker:
     """Clase para hacer un seguimiento del rendimiento de la aplicación RAG."""
     
     def __init__(self):
         """Inicializa el rastreador de rendimiento."""
-        self.metrics = {
-            "embedding_generation": [],
-            "similarity_search": [],
-            "document_processing": [],
-            "llm_response": [],
-            "total_query_time": []
-        }
+        # Últimos valores (buffers circulares) y percentiles de todo el historial (sketches)
+        self.metrics = {operation: RingBuffer(WINDOW_SIZE) for operation in STAGE_NAMES}
+        self.sketches = {operation: DDSketch() for operation in STAGE_NAMES}
         self.query_counts = 0
+        # Consumo de tokens acumulado y los elementos más costosos por tipo ('query' o 'ingest')
+        self.usage_totals: Dict[str, Dict[str, Any]] = {}
+        self.top_usage: Dict[str, List[tuple]] = {}
+        self._usage_sequence = itertools.count()
+        # El registro de una medición solo toca el buffer del hilo que la produce
+        self._local = threading.local()
+        self._buffers: List[_ThreadBuffer] = []
+        self._lock = threading.Lock()
         logger.info("Rastreador de rendimiento inicializado")
     
     def track_time(self, operation: str) -> Callable:
@@ -38,24 +89,42 @@ class PerformanceTracker:
             Callable: Función decorada.
         """
         def decorator(func):
+            @functools.wraps(func)
             def wrapper(*args, **kwargs):
                 start_time = time.time()
                 result = func(*args, **kwargs)
                 end_time = time.time()
                 execution_time = end_time - start_time
                 
-                if operation in self.metrics:
-                    self.metrics[operation].append(execution_time)
-                    if len(self.metrics[operation]) > 100:
-                        # Limitar a los últimos 100 valores para evitar un crecimiento excesivo
-                        self.metrics[operation] = self.metrics[operation][-100:]
+                self.track_stage(operation, execution_time)
                 
                 logger.debug(f"Operación {operation} completada en {execution_time:.4f} segundos")
                 return result
             return wrapper
         return decorator
     
-    def track_query(self, query_time: float, embedding_time: float, search_time: float, llm_time: float):
+    def track_stage(self, operation: str, seconds: float, model: str = "", route: str = "app"):
+        """Registra la duración de una operación y la exporta como histograma.
+        
+        Args:
+            operation: Nombre de la operación (clave de self.metrics).
+            seconds: Duración en segundos.
+            model: Modelo usado en la operación (etiqueta de la métrica).
+            route: Origen de la operación, p. ej. 'app', 'batch' o una ruta HTTP.
+        """
+        if operation in self.metrics:
+            buffer = self._thread_buffer()
+            with buffer.lock:
+                buffer.pending.append((operation, seconds))
+                due = len(buffer.pending) >= FLUSH_SIZE or time.monotonic() - buffer.last_flush >= FLUSH_INTERVAL
+            if due:
+                self._apply(buffer.drain())
+        
+        # Los histogramas exportados acumulan todas las observaciones con memoria constante
+        STAGE_DURATION.observe(seconds, stage=STAGE_NAMES.get(operation, operation), model=model, route=route)
+    
+    def track_query(self, query_time: float, embedding_time: float, search_time: float, llm_time: float,
+                    model: str = "", route: str = "app"):
         """Registra los tiempos de una consulta completa.
         
         Args:
@@ -63,29 +132,110 @@ class PerformanceTracker:
             embedding_time: Tiempo de generación de embeddings.
             search_time: Tiempo de búsqueda por similitud.
             llm_time: Tiempo de respuesta del LLM.
+            model: Modelo de lenguaje usado (etiqueta de las métricas).
+            route: Origen de la consulta, p. ej. 'app', 'batch' o una ruta HTTP.
         """
-        self.metrics["total_query_time"].append(query_time)
-        self.metrics["embedding_generation"].append(embedding_time)
-        self.metrics["similarity_search"].append(search_time)
-        self.metrics["llm_response"].append(llm_time)
+        self.track_stage("total_query_time", query_time, model, route)
+        self.track_stage("embedding_generation", embedding_time, model, route)
+        self.track_stage("similarity_search", search_time, model, route)
+        self.track_stage("llm_response", llm_time, model, route)
+        self.count_query("ok", model, route)
+    
+    def count_query(self, status: str, model: str = "", route: str = "app"):
+        """Incrementa el contador exportado de consultas.
+        
+        Args:
+            status: Resultado de la consulta ('ok' o 'error').
+            model: Modelo de lenguaje usado.
+            route: Origen de la consulta.
+        """
+        QUERIES.inc(route=route, model=model, status=status)
+        if status == "ok":
+            with self._lock:
+                self.query_counts += 1
+            logger.debug(f"Consulta #{self.query_counts} registrada")
+    
+    def track_usage(self, kind: str, key: str, usage: Dict[str, Any]):
+        """Acumula el consumo de tokens de una consulta o de un archivo ingerido.
         
-        # Limitar a los últimos 100 valores
-        for key in self.metrics:
-            if len(self.metrics[key]) > 100:
-                self.metrics[key] = self.metrics[key][-100:]
+        Args:
+            kind: Tipo de operación ('query' o 'ingest').
+            key: Identificador legible (texto de la consulta o nombre del archivo).
+            usage: Registro de consumo con su coste (ver app.utils.usage).
+        """
+        with self._lock:
+            add_usage(self.usage_totals.setdefault(kind, {"count": 0}), usage)
+            self.usage_totals[kind]["count"] += 1
+            self._push_top(kind, usage.get("cost", 0.0), key, usage)
+    
+    def get_usage_stats(self) -> Dict[str, Any]:
+        """Obtiene el consumo acumulado y los elementos más costosos por tipo.
         
-        self.query_counts += 1
-        logger.debug(f"Consulta #{self.query_counts} registrada")
+        Returns:
+            Dict[str, Any]: Por tipo, 'total' (tokens y coste) y 'top' (de mayor a menor coste).
+        """
+        with self._lock:
+            return {
+                kind: {
+                    "total": dict(total),
+                    "top": [{"key": key, **usage} for _, _, key, usage in sorted(self.top_usage.get(kind, []), reverse=True)]
+                }
+                for kind, total in self.usage_totals.items()
+            }
+    
+    def _push_top(self, kind: str, cost: float, key: str, usage: Dict[str, Any]):
+        """Mantiene un montículo con los TOP_USAGE_SIZE elementos más costosos (requiere self._lock)."""
+        heap = self.top_usage.setdefault(kind, [])
+        # El número de secuencia desempata sin comparar los diccionarios
+        entry = (cost, next(self._usage_sequence), key, usage)
+        if len(heap) < TOP_USAGE_SIZE:
+            heapq.heappush(heap, entry)
+        elif cost > heap[0][0]:
+            heapq.heapreplace(heap, entry)
+    
+    def flush(self):
+        """Vuelca a las estructuras compartidas las mediciones pendientes de todos los hilos."""
+        with self._lock:
+            buffers = list(self._buffers)
+            # Los buffers de hilos terminados se descartan tras su último volcado
+            self._buffers = [buffer for buffer in buffers if buffer.thread.is_alive()]
+        for buffer in buffers:
+            self._apply(buffer.drain())
+    
+    def _thread_buffer(self) -> _ThreadBuffer:
+        """Obtiene (o crea y registra) el buffer del hilo actual."""
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = self._local.buffer = _ThreadBuffer()
+            with self._lock:
+                self._buffers.append(buffer)
+        return buffer
+    
+    def _apply(self, measurements: List[tuple]):
+        """Añade un lote de mediciones a los buffers circulares y sketches compartidos."""
+        if not measurements:
+            return
+        with self._lock:
+            for operation, seconds in measurements:
+                # Buffers de tamaño fijo: registrar no reserva memoria
+                self.metrics[operation].append(seconds)
+                self.sketches[operation].add(seconds)
     
     def get_performance_stats(self) -> Dict[str, Any]:
         """Obtiene estadísticas de rendimiento.
         
+        El promedio, mínimo, máximo y mediana corresponden a los últimos valores; los percentiles
+        (p50, p90, p95, p99) se estiman sobre todo el historial con el sketch de cada operación.
+        
         Returns:
             Dict[str, Any]: Estadísticas de rendimiento.
         """
+        self.flush()
         stats = {}
         
-        for operation, times in self.metrics.items():
+        for operation, buffer in self.metrics.items():
+            times = buffer.values()
+            sketch = self.sketches[operation]
             if times:
                 stats[operation] = {
                     "avg": statistics.mean(times),
@@ -93,14 +243,14 @@ class PerformanceTracker:
                     "max": max(times),
                     "median": statistics.median(times),
                     "count": len(times),
-                    "latest": times[-1]
+                    "latest": times[-1],
+                    "total_count": sketch.count
                 }
                 
                 # Calcular percentiles si hay suficientes datos
-                if len(times) >= 10:
-                    stats[operation]["p90"] = self._percentile(times, 90)
-                    stats[operation]["p95"] = self._percentile(times, 95)
-                    stats[operation]["p99"] = self._percentile(times, 99)
+                if sketch.count >= 10:
+                    for percentile in (50, 90, 95, 99):
+                        stats[operation][f"p{percentile}"] = sketch.quantile(percentile / 100)
             else:
                 stats[operation] = {
                     "avg": 0,
@@ -108,20 +258,80 @@ class PerformanceTracker:
                     "max": 0,
                     "median": 0,
                     "count": 0,
-                    "latest": 0
+                    "latest": 0,
+                    "total_count": 0
                 }
         
         stats["total_queries"] = self.query_counts
+        stats["usage"] = self.get_usage_stats()
         stats["timestamp"] = datetime.now().isoformat()
         
         return stats
     
     def reset_metrics(self):
         """Reinicia las métricas de rendimiento."""
-        for key in self.metrics:
-            self.metrics[key] = []
+        self.flush()
+        with self._lock:
+            for operation in self.metrics:
+                self.metrics[operation].clear()
+                self.sketches[operation].clear()
+            self.usage_totals.clear()
+            self.top_usage.clear()
         logger.info("Métricas de rendimiento reiniciadas")
     
+    def export_state(self) -> Dict[str, Any]:
+        """Serializa los buffers y sketches para combinarlos en otro proceso.
+        
+        Returns:
+            Dict[str, Any]: Estado serializable en JSON.
+        """
+        self.flush()
+        with self._lock:
+            return {
+                "query_counts": self.query_counts,
+                "usage": {
+                    kind: {"total": total, "top": [[cost, key, usage] for cost, _, key, usage in self.top_usage.get(kind, [])]}
+                    for kind, total in self.usage_totals.items()
+                },
+                "operations": {
+                    operation: {
+                        "window": self.metrics[operation].to_dict(),
+                        "sketch": self.sketches[operation].to_dict()
+                    }
+                    for operation in self.metrics
+                }
+            }
+    
+    def merge_state(self, state: Dict[str, Any]):
+        """Combina el estado exportado por otro rastreador (p. ej. de otro proceso).
+        
+        La ventana de cada operación crece con la de cada estado combinado, de modo que el promedio,
+        mínimo y máximo describen a todos los procesos.
+        
+        Args:
+            state: Resultado de export_state.
+        """
+        with self._lock:
+            self.query_counts += state.get("query_counts", 0)
+            for kind, data in state.get("usage", {}).items():
+                total = self.usage_totals.setdefault(kind, {"count": 0})
+                add_usage(total, data["total"])
+                total["count"] += data["total"].get("count", 0)
+                for cost, key, usage in data["top"]:
+                    self._push_top(kind, cost, key, usage)
+            for operation, data in state.get("operations", {}).items():
+                window = RingBuffer.from_dict(data["window"])
+                current = self.metrics.get(operation)
+                if current is not None and len(current):
+                    # La ventana combinada suma las capacidades para conservar los últimos valores de
+                    # cada proceso, no solo los del último combinado
+                    combined = RingBuffer(current.capacity + window.capacity)
+                    combined.merge(current)
+                    combined.merge(window)
+                    window = combined
+                self.metrics[operation] = window
+                self.sketches.setdefault(operation, DDSketch()).merge(DDSketch.from_dict(data["sketch"]))
+    
     def _percentile(self, data: List[float], percentile: int) -> float:
         """Calcula un percentil de los datos.
         
@@ -0,0 +1,257 @@
+"""
+Profiler por muestreo.
+Un hilo en segundo plano lee periódicamente las pilas de todos los hilos (`sys._current_frames`) y
+cuenta cuántas veces aparece cada pila. Al terminar se escribe el perfil en formato de pilas
+colapsadas (flamegraph.pl, speedscope) o en JSON de speedscope (https://www.speedscope.app).
+
+Los hilos bloqueados en una primitiva de espera (colas, Condition/Event, select, accept, lectura de
+un socket) no cuentan: así los trabajadores ociosos de un pool o el bucle de `serve_forever` no
+ocupan el perfil. Las esperas que ocurren en C sin un marco reconocible (p. ej. `input()` en el
+chat) se marcan con `with idle():`. En procesos de larga duración el perfil se puede escribir
+periódicamente.
+
+No necesita herramientas externas ni instrumentar el código, y su coste está acotado: si tomar una
+muestra tarda más de `max_overhead` del intervalo, el intervalo se alarga automáticamente.
+
+Uso:
+    with SamplingProfiler().profile("ingesta.speedscope.json"):
+        document_manager.process_all_files()
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Marco de pila: (función, archivo, línea de inicio de la función)
+Frame = Tuple[str, str, int]
+
+# Marcos (archivo, función) en los que un hilo está esperando y no trabajando
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("socket.py", "accept"),
+    ("socket.py", "readinto"),
+    # Trabajador de ThreadPoolExecutor bloqueado en su cola (SimpleQueue.get está en C)
+    ("thread.py", "_worker"),
+}
+
+# Hilos marcados como en espera con idle()
+_idle_threads = set()
+
+
+@contextmanager
+def idle() -> Iterator[None]:
+    """Marca el hilo actual como en espera durante el bloque, para que no se muestree.
+
+    Sirve para las esperas que no se reconocen por su marco: `input()` está en C y el marco
+    superior es el de quien lo llama, que también ejecuta trabajo real.
+    """
+    thread_id = threading.get_ident()
+    _idle_threads.add(thread_id)
+    try:
+        yield
+    finally:
+        _idle_threads.discard(thread_id)
+
+
+class SamplingProfiler:
+    """Profiler por muestreo de todos los hilos del proceso."""
+
+    def __init__(self, interval: float = 0.01, max_overhead: float = 0.02, max_depth: int = 128,
+                 include_idle: bool = False):
+        """Inicializa el profiler.
+
+        Args:
+            interval: Segundos entre muestras (0.01 = 100 muestras por segundo).
+            max_overhead: Fracción máxima del tiempo dedicada a tomar muestras.
+            max_depth: Número máximo de marcos por pila.
+            include_idle: Si es True también se muestrean los hilos en espera (ver IDLE_FRAMES).
+        """
+        self.interval = interval
+        self.max_overhead = max_overhead
+        self.max_depth = max_depth
+        self.include_idle = include_idle
+        self.samples: Dict[Tuple[Frame, ...], float] = {}
+        self.sample_count = 0
+        self.sampling_time = 0.0
+        self.start_time: Optional[float] = None
+        self.end_time: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Inicia el hilo de muestreo."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self.start_time = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"Profiler iniciado ({1 / self.interval:.0f} muestras/s)")
+
+    def stop(self):
+        """Detiene el hilo de muestreo."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.end_time = time.perf_counter()
+        logger.info(f"Profiler detenido: {self.sample_count} muestras, sobrecarga {self.overhead():.2%}")
+
+    @contextmanager
+    def profile(self, path: str) -> Iterator["SamplingProfiler"]:
+        """Perfila el bloque y escribe el resultado en `path` al salir (también si hay excepción)."""
+        self.start()
+        try:
+            yield self
+        finally:
+            self.stop()
+            self.write(path)
+
+    def duration(self) -> float:
+        """Segundos perfilados."""
+        if self.start_time is None:
+            return 0.0
+        return (self.end_time or time.perf_counter()) - self.start_time
+
+    def overhead(self) -> float:
+        """Fracción del tiempo perfilado dedicada a tomar muestras."""
+        duration = self.duration()
+        return self.sampling_time / duration if duration else 0.0
+
+    def _run(self):
+        """Bucle de muestreo; cada pila se pondera con el tiempo transcurrido desde la muestra anterior."""
+        own_id = threading.get_ident()
+        last = time.perf_counter()
+        wait = self.interval
+        while not self._stop.wait(wait):
+            started = time.perf_counter()
+            elapsed = started - last
+            last = started
+            with self._lock:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id or (not self.include_idle and
+                                               (thread_id in _idle_threads or self._is_idle(frame))):
+                        continue
+                    stack = self._stack(frame)
+                    self.samples[stack] = self.samples.get(stack, 0.0) + elapsed
+            self.sample_count += 1
+            cost = time.perf_counter() - started
+            self.sampling_time += cost
+            # Mantener la sobrecarga por debajo de max_overhead aunque haya muchos hilos o pilas profundas
+            wait = max(self.interval, cost / self.max_overhead)
+
+    @staticmethod
+    def _is_idle(frame) -> bool:
+        """Indica si el hilo está bloqueado en una primitiva de espera."""
+        return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES
+
+    def _stack(self, frame) -> Tuple[Frame, ...]:
+        """Convierte un marco en la pila desde la raíz."""
+        stack: List[Frame] = []
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    def collapsed(self, samples: Optional[Dict[Tuple[Frame, ...], float]] = None) -> str:
+        """Perfil en formato de pilas colapsadas: 'archivo:función;...  milisegundos' por línea."""
+        samples = self.samples if samples is None else samples
+        lines = []
+        for stack, seconds in sorted(samples.items(), key=lambda item: item[1], reverse=True):
+            names = ";".join(f"{os.path.basename(filename)}:{name}" for name, filename, _ in stack)
+            lines.append(f"{names} {max(1, round(seconds * 1000))}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str = "RAGLEC", samples: Optional[Dict[Tuple[Frame, ...], float]] = None) -> dict:
+        """Perfil en el formato JSON de speedscope (perfil 'sampled' ponderado en segundos)."""
+        stacks = self.samples if samples is None else samples
+        frames: List[dict] = []
+        index: Dict[Frame, int] = {}
+        profile_samples, weights = [], []
+        for stack, seconds in stacks.items():
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+            profile_samples.append([index[frame] for frame in stack])
+            weights.append(seconds)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": profile_samples,
+                "weights": weights
+            }],
+            "name": name,
+            "exporter": "app.utils.profiler"
+        }
+
+    def write(self, path: str, reset: bool = False) -> bool:
+        """Escribe el perfil: JSON de speedscope si `path` termina en .json y pilas colapsadas si no.
+
+        Args:
+            path: Archivo de destino.
+            reset: Si es True, las muestras escritas se descartan y el siguiente perfil empieza de cero.
+
+        Returns:
+            bool: False si no había muestras y no se escribió nada.
+        """
+        with self._lock:
+            samples = self.samples
+            if reset:
+                self.samples = {}
+        if not samples:
+            logger.debug("Perfil vacío: no se escribe")
+            return False
+        with open(path, "w") as f:
+            if path.endswith(".json"):
+                json.dump(self.speedscope(os.path.basename(path), samples), f)
+            else:
+                f.write(self.collapsed(samples))
+        logger.info(f"Perfil guardado en {path}")
+        return True
+
+    def write_every(self, seconds: float, make_path: Callable[[], str]):
+        """Escribe y reinicia el perfil cada `seconds` segundos hasta que se detenga el profiler.
+
+        Args:
+            seconds: Intervalo entre escrituras.
+            make_path: Función que devuelve la ruta de cada archivo (p. ej. con profile_path).
+        """
+        def run():
+            while not self._stop.wait(seconds):
+                try:
+                    self.write(make_path(), reset=True)
+                except OSError as e:
+                    logger.error(f"Error al guardar el perfil: {e}")
+
+        threading.Thread(target=run, name="profiler-writer", daemon=True).start()
+
+
+def profile_path(path: str, run: str) -> str:
+    """Añade el nombre de la ejecución y un sello de tiempo a la ruta para no sobrescribir perfiles.
+
+    Ejemplo: profile_path("perfiles/rag.json", "process") -> "perfiles/rag-process-20250310-120411.json".
+    """
+    base, ext = os.path.splitext(path)
+    return f"{base}-{run}-{time.strftime('%Y%m%d-%H%M%S')}{ext or '.collapsed'}"
@@ -0,0 +1,157 @@
+"""
+Agrupación de solicitudes idénticas en curso (single-flight).
+Este módulo permite que varias llamadas concurrentes con la misma clave compartan un único cálculo:
+la primera lo ejecuta y las demás esperan su resultado. Para respuestas en streaming, los
+consumidores que llegan tarde reciben primero los fragmentos ya generados y luego los nuevos.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+
+def make_key(text: str, **params) -> str:
+    """Construye una clave estable a partir del texto normalizado y los parámetros.
+
+    Args:
+        text: Texto de la consulta; se ignoran mayúsculas y espacios redundantes.
+        **params: Parámetros que afectan al resultado (deben ser serializables en JSON).
+
+    Returns:
+        str: Clave hash de la consulta.
+    """
+    normalized = re.sub(r"\s+", " ", text or "").strip().lower()
+    payload = json.dumps({"text": normalized, "params": params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class _Call:
+    """Cálculo en curso compartido por los llamadores de una misma clave."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.done = False
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.chunks = []
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Ejecuta una sola vez los cálculos concurrentes con la misma clave."""
+
+    def __init__(self):
+        """Inicializa el grupo de llamadas en curso."""
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """Ejecuta fn o espera al cálculo en curso con la misma clave.
+
+        Args:
+            key: Clave de la llamada (ver make_key).
+            fn: Función sin argumentos que realiza el cálculo.
+            timeout: Tiempo máximo de espera para los llamadores que no ejecutan el cálculo.
+
+        Returns:
+            Tuple[Any, bool]: Resultado y si fue compartido con una llamada anterior.
+
+        Raises:
+            TimeoutError: Si el cálculo compartido no termina dentro de timeout.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            logger.debug(f"Uniendo la solicitud al cálculo en curso {key[:12]}")
+            with call.condition:
+                if not call.condition.wait_for(lambda: call.done, timeout):
+                    raise TimeoutError("El cálculo compartido no terminó a tiempo")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            with call.condition:
+                call.done = True
+                call.condition.notify_all()
+            if call.waiters:
+                logger.info(f"Cálculo {key[:12]} compartido con {call.waiters} solicitudes idénticas")
+
+        return call.result, False
+
+    def stream(self, key: str, producer: Callable[[], Iterable[Any]]) -> Iterator[Any]:
+        """Consume un flujo compartido entre los llamadores con la misma clave.
+
+        El productor se ejecuta en un hilo propio, de modo que el flujo continúa aunque el primer
+        consumidor lo abandone. Quien se une a mitad del flujo recibe todos los fragmentos desde el inicio.
+
+        Args:
+            key: Clave de la llamada (ver make_key).
+            producer: Función sin argumentos que devuelve un iterable de fragmentos.
+
+        Returns:
+            Iterator[Any]: Fragmentos del flujo.
+        """
+        with self._lock:
+            call = self._streams.get(key)
+            if call is None:
+                call = self._streams[key] = _Call()
+                threading.Thread(target=self._produce, args=(key, call, producer), daemon=True).start()
+            else:
+                call.waiters += 1
+                logger.debug(f"Uniendo el consumidor al flujo en curso {key[:12]}")
+
+        return self._consume(call)
+
+    def _produce(self, key: str, call: _Call, producer: Callable[[], Iterable[Any]]):
+        """Ejecuta el productor y publica cada fragmento para los consumidores."""
+        try:
+            for chunk in producer():
+                with call.condition:
+                    call.chunks.append(chunk)
+                    call.condition.notify_all()
+        except BaseException as e:
+            call.error = e
+        finally:
+            with self._lock:
+                del self._streams[key]
+            with call.condition:
+                call.done = True
+                call.condition.notify_all()
+
+    @staticmethod
+    def _consume(call: _Call) -> Iterator[Any]:
+        """Itera los fragmentos publicados, esperando los nuevos hasta que el flujo termine."""
+        index = 0
+        while True:
+            with call.condition:
+                call.condition.wait_for(lambda: index < len(call.chunks) or call.done)
+                pending = call.chunks[index:]
+                finished = call.done
+            for chunk in pending:
+                yield chunk
+            index += len(pending)
+            if finished and index >= len(call.chunks):
+                if call.error is not None:
+                    raise call.error
+                return
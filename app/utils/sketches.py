@@ -0,0 +1,197 @@
+"""
+Estructuras de memoria constante para estadísticas de latencia.
+Este módulo proporciona un buffer circular respaldado por `array('d')` para los valores más recientes
+y un DDSketch para percentiles de todo el historial con error relativo acotado. Ambos son seguros
+entre hilos, se pueden combinar (merge) y serializar para agregar datos de varios procesos.
+"""
+
+import math
+import threading
+from array import array
+from typing import Any, Dict, List
+
+
+class RingBuffer:
+    """Buffer circular de tamaño fijo con los últimos valores registrados."""
+
+    def __init__(self, capacity: int = 100):
+        """Inicializa el buffer.
+
+        Args:
+            capacity: Número máximo de valores conservados.
+        """
+        self.capacity = capacity
+        self._values = array("d", bytes(8 * capacity))
+        self._next = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def append(self, value: float):
+        """Añade un valor sobrescribiendo el más antiguo si el buffer está lleno (sin reservar memoria)."""
+        with self._lock:
+            self._values[self._next] = value
+            self._next = (self._next + 1) % self.capacity
+            if self._size < self.capacity:
+                self._size += 1
+
+    def values(self) -> List[float]:
+        """Devuelve los valores en orden de llegada (del más antiguo al más reciente)."""
+        with self._lock:
+            if self._size < self.capacity:
+                return self._values[:self._size].tolist()
+            return (self._values[self._next:] + self._values[:self._next]).tolist()
+
+    def latest(self) -> float:
+        """Devuelve el último valor registrado (0.0 si está vacío)."""
+        with self._lock:
+            return self._values[self._next - 1] if self._size else 0.0
+
+    def clear(self):
+        """Elimina todos los valores."""
+        with self._lock:
+            self._next = 0
+            self._size = 0
+
+    def merge(self, other: "RingBuffer"):
+        """Añade los valores de otro buffer (los suyos se consideran más recientes)."""
+        for value in other.values():
+            self.append(value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializa el buffer para enviarlo a otro proceso."""
+        return {"capacity": self.capacity, "values": self.values()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RingBuffer":
+        """Reconstruye un buffer serializado con to_dict."""
+        buffer = cls(data["capacity"])
+        for value in data["values"]:
+            buffer.append(value)
+        return buffer
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class DDSketch:
+    """Sketch de cuantiles con error relativo acotado (DDSketch).
+
+    Cada valor positivo se asigna a la cubeta ceil(log_gamma(x)); el cuantil estimado tiene un error
+    relativo máximo de `relative_accuracy`. Dos sketches con la misma precisión se combinan sumando
+    sus cubetas, por lo que el resultado es idéntico al de haber registrado todos los valores en uno.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048):
+        """Inicializa el sketch.
+
+        Args:
+            relative_accuracy: Error relativo máximo de los cuantiles (0-1).
+            max_bins: Número máximo de cubetas; al superarse se combinan las de valores más bajos.
+        """
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._bins: Dict[int, int] = {}
+        self._zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._lock = threading.Lock()
+
+    def add(self, value: float):
+        """Registra un valor (las latencias negativas se tratan como cero)."""
+        with self._lock:
+            if value <= 0:
+                self._zero_count += 1
+            else:
+                key = math.ceil(math.log(value) / self._log_gamma)
+                self._bins[key] = self._bins.get(key, 0) + 1
+                if len(self._bins) > self.max_bins:
+                    self._collapse()
+            self.count += 1
+            self.sum += value
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estima el cuantil q (0-1).
+
+        Returns:
+            float: Valor estimado (0.0 si el sketch está vacío).
+        """
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = q * (self.count - 1)
+            seen = self._zero_count
+            if rank < seen:
+                return 0.0
+            for key in sorted(self._bins):
+                seen += self._bins[key]
+                if seen > rank:
+                    # Punto medio de la cubeta en escala relativa, acotado por los extremos observados
+                    estimate = 2 * self._gamma ** key / (self._gamma + 1)
+                    return min(max(estimate, self.min), self.max)
+            return self.max
+
+    def merge(self, other: "DDSketch"):
+        """Combina otro sketch con la misma precisión en este."""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Solo se pueden combinar sketches con la misma precisión relativa")
+        with other._lock:
+            bins = dict(other._bins)
+            zero_count, count, total = other._zero_count, other.count, other.sum
+            minimum, maximum = other.min, other.max
+        with self._lock:
+            for key, value in bins.items():
+                self._bins[key] = self._bins.get(key, 0) + value
+            while len(self._bins) > self.max_bins:
+                self._collapse()
+            self._zero_count += zero_count
+            self.count += count
+            self.sum += total
+            self.min = min(self.min, minimum)
+            self.max = max(self.max, maximum)
+
+    def clear(self):
+        """Elimina todos los valores registrados."""
+        with self._lock:
+            self._bins.clear()
+            self._zero_count = 0
+            self.count = 0
+            self.sum = 0.0
+            self.min = math.inf
+            self.max = -math.inf
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializa el sketch (compatible con JSON) para enviarlo a otro proceso."""
+        with self._lock:
+            return {
+                "relative_accuracy": self.relative_accuracy,
+                "bins": {str(key): value for key, value in self._bins.items()},
+                "zero_count": self._zero_count,
+                "count": self.count,
+                "sum": self.sum,
+                "min": self.min if self.count else None,
+                "max": self.max if self.count else None
+            }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DDSketch":
+        """Reconstruye un sketch serializado con to_dict."""
+        sketch = cls(data["relative_accuracy"])
+        sketch._bins = {int(key): value for key, value in data["bins"].items()}
+        sketch._zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        sketch.sum = data["sum"]
+        if data["count"]:
+            sketch.min = data["min"]
+            sketch.max = data["max"]
+        return sketch
+
+    def _collapse(self):
+        """Combina las dos cubetas de valores más bajos (los percentiles altos no pierden precisión)."""
+        lowest, second = sorted(self._bins)[:2]
+        self._bins[second] += self._bins.pop(lowest)
@@ -0,0 +1,262 @@
+"""
+Registro de consultas lentas.
+Las consultas que superan un umbral de latencia se guardan, sin necesidad de activar LOG_DEBUG, en un
+archivo JSONL con rotación y opcionalmente en una tabla de Supabase. Cada entrada incluye los tiempos
+por etapa, los tokens del prompt, los fragmentos recuperados con su similitud y la etapa dominante,
+de modo que se puede saber por qué fue lenta sin reproducirla.
+
+Configuración por variables de entorno:
+    RAG_SLOW_QUERY_THRESHOLD: Umbral en segundos (por defecto 5; 0 desactiva el registro).
+    RAG_SLOW_QUERY_LOG: Archivo JSONL (por defecto slow_queries.jsonl).
+    RAG_SLOW_QUERY_TABLE: Tabla de Supabase donde guardar también las entradas (opcional).
+"""
+
+import glob
+import json
+import logging
+import os
+import statistics
+import threading
+from datetime import datetime, timedelta
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, Iterable, List, Optional
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Etapa dominante -> clasificación de la causa de la lentitud
+STAGE_CAUSES = {
+    "rewrite": "reescritura",
+    "embedding": "embedding",
+    "search": "busqueda",
+    "search_docs": "busqueda",
+    "context_building": "contexto",
+    "llm": "llm",
+    "openai_call": "llm",
+}
+
+# Por debajo de esta fracción del total ninguna etapa domina
+DOMINANT_SHARE = 0.5
+
+
+def classify(total: float, steps: Dict[str, float]) -> Dict[str, Any]:
+    """Determina la etapa que explica la latencia de una consulta.
+
+    Args:
+        total: Duración total en segundos.
+        steps: Etapa -> duración en segundos.
+
+    Returns:
+        Dict[str, Any]: 'dominant_stage', su fracción del total ('dominant_share') y la causa:
+        la de STAGE_CAUSES, 'sin_atribuir' si el tiempo fuera de las etapas es el mayor, o 'mixta'.
+    """
+    if total <= 0:
+        return {"dominant_stage": None, "dominant_share": 0.0, "cause": "mixta"}
+    timings = dict(steps)
+    timings["unaccounted"] = max(0.0, total - sum(steps.values()))
+    stage, seconds = max(timings.items(), key=lambda item: item[1])
+    share = seconds / total
+    if share < DOMINANT_SHARE:
+        cause = "mixta"
+    elif stage == "unaccounted":
+        cause = "sin_atribuir"
+    else:
+        cause = STAGE_CAUSES.get(stage, stage)
+    return {"dominant_stage": stage, "dominant_share": round(share, 3), "cause": cause}
+
+
+class _RotatingFile(RotatingFileHandler):
+    """RotatingFileHandler que propaga los errores de escritura en lugar de imprimirlos en stderr."""
+
+    def handleError(self, record):
+        raise
+
+
+class SlowQueryLog:
+    """Registro de las consultas que superan el umbral de latencia."""
+
+    def __init__(self, path: str = "slow_queries.jsonl", threshold: float = 5.0, max_bytes: int = 10 * 1024 * 1024,
+                 backup_count: int = 5, table: Optional[str] = None):
+        """Inicializa el registro (el archivo se crea con la primera consulta lenta).
+
+        Si el archivo no se puede escribir (p. ej. en el sistema de archivos de solo lectura de Vercel),
+        se registra el error y el archivo se desactiva; la consulta no se ve afectada.
+
+        Args:
+            path: Archivo JSONL; al llegar a max_bytes se rota a path.1, path.2...
+            threshold: Umbral en segundos; 0 o negativo desactiva el registro.
+            max_bytes: Tamaño máximo de cada archivo.
+            backup_count: Número de archivos rotados que se conservan.
+            table: Tabla de Supabase donde insertar también cada entrada (opcional).
+        """
+        self.path = path
+        self.threshold = threshold
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.table = table
+        self._handler: Optional[RotatingFileHandler] = None
+        self._file_failed = False
+        self._client = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "SlowQueryLog":
+        """Crea el registro a partir de las variables de entorno del módulo."""
+        return cls(
+            path=os.getenv("RAG_SLOW_QUERY_LOG", "slow_queries.jsonl"),
+            threshold=float(os.getenv("RAG_SLOW_QUERY_THRESHOLD", "5")),
+            table=os.getenv("RAG_SLOW_QUERY_TABLE") or None
+        )
+
+    def record(self, route: str, query: str, total: float, steps: Dict[str, float],
+               usage: Optional[Dict[str, Any]] = None, chunks: Optional[List[Dict[str, Any]]] = None,
+               trace_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Registra la consulta si supera el umbral.
+
+        Args:
+            route: Origen de la consulta ('app', 'async', '/api/query'...).
+            query: Texto de la consulta.
+            total: Duración total en segundos.
+            steps: Etapa -> duración en segundos.
+            usage: Consumo de tokens (ver app.utils.usage).
+            chunks: Fragmentos recuperados con 'id' y 'similarity'.
+            trace_id: Traza asociada (ver app.utils.tracing).
+
+        Returns:
+            Dict[str, Any] o None: Entrada registrada, o None si la consulta no fue lenta.
+        """
+        if self.threshold <= 0 or total < self.threshold:
+            return None
+
+        usage = usage or {}
+        entry = {
+            "timestamp": datetime.now().isoformat(),
+            "route": route,
+            "query": query,
+            "total": round(total, 4),
+            "steps": {stage: round(seconds, 4) for stage, seconds in steps.items()},
+            **classify(total, steps),
+            "prompt_tokens": usage.get("input_tokens"),
+            "output_tokens": usage.get("output_tokens"),
+            "chunks": [
+                {"id": chunk.get("id"), "similarity": round(float(chunk.get("similarity") or 0.0), 4)}
+                for chunk in chunks or []
+            ],
+            "trace_id": trace_id
+        }
+        logger.warning(f"Consulta lenta ({total:.2f}s, causa: {entry['cause']}): {query[:80]}")
+        # El registro nunca debe convertir en error una consulta que ya tiene respuesta
+        try:
+            self._write(entry)
+        except Exception as e:
+            logger.error(f"Error al escribir la consulta lenta en '{self.path}': {e}")
+        if self.table:
+            try:
+                threading.Thread(target=self._insert, args=(entry,), daemon=True).start()
+            except Exception as e:
+                logger.error(f"Error al guardar la consulta lenta en la tabla '{self.table}': {e}")
+        return entry
+
+    def _write(self, entry: Dict[str, Any]):
+        """Añade la entrada al archivo, rotándolo si es necesario (deja de intentarlo si la ruta falla)."""
+        with self._lock:
+            if self._file_failed:
+                return
+            if self._handler is None:
+                self._handler = _RotatingFile(self.path, maxBytes=self.max_bytes, backupCount=self.backup_count,
+                                              encoding="utf-8", delay=True)
+                self._handler.setFormatter(logging.Formatter("%(message)s"))
+            record = logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                                       json.dumps(entry, ensure_ascii=False), None, None)
+            try:
+                self._handler.emit(record)
+            except OSError as e:
+                logger.error(f"No se puede escribir el registro de consultas lentas en '{self.path}': {e}; "
+                             f"se desactiva el archivo")
+                self._file_failed = True
+                self._handler.close()
+                self._handler = None
+
+    def _insert(self, entry: Dict[str, Any]):
+        """Inserta la entrada en la tabla de Supabase (en segundo plano, sin retrasar la respuesta)."""
+        try:
+            if self._client is None:
+                from supabase import create_client
+
+                from app.config.settings import SUPABASE_KEY, SUPABASE_URL
+                self._client = create_client(SUPABASE_URL, SUPABASE_KEY)
+            self._client.table(self.table).insert(entry).execute()
+        except Exception as e:
+            logger.error(f"Error al guardar la consulta lenta en la tabla '{self.table}': {e}")
+
+
+def read_entries(path: str, since: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Lee las entradas del archivo y de sus copias rotadas, de la más antigua a la más reciente.
+
+    Args:
+        path: Archivo JSONL del registro.
+        since: Si se indica, solo las entradas posteriores.
+
+    Returns:
+        List[Dict[str, Any]]: Entradas registradas.
+    """
+    # Solo las copias de RotatingFileHandler (path.1, path.2...): se ignoran path.bak, archivos de intercambio, etc.
+    rotated = [name for name in glob.glob(f"{glob.escape(path)}.*") if name[len(path) + 1:].isdigit()]
+    rotated.sort(key=lambda name: int(name[len(path) + 1:]), reverse=True)
+    entries = []
+    for file_path in rotated + ([path] if os.path.exists(path) else []):
+        with open(file_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if since is None or datetime.fromisoformat(entry["timestamp"]) >= since:
+                    entries.append(entry)
+    return entries
+
+
+def summarize(entries: Iterable[Dict[str, Any]], period: str = "day") -> List[Dict[str, Any]]:
+    """Resume las consultas lentas por periodo.
+
+    Args:
+        entries: Entradas del registro.
+        period: 'hour', 'day' o 'week'.
+
+    Returns:
+        List[Dict[str, Any]]: Por periodo: número de consultas, latencia p50/p95/máxima, tokens medios
+        del prompt y número de consultas por causa.
+    """
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in entries:
+        timestamp = datetime.fromisoformat(entry["timestamp"])
+        if period == "hour":
+            key = timestamp.strftime("%Y-%m-%d %H:00")
+        elif period == "week":
+            key = (timestamp - timedelta(days=timestamp.weekday())).strftime("%Y-%m-%d")
+        else:
+            key = timestamp.strftime("%Y-%m-%d")
+        groups.setdefault(key, []).append(entry)
+
+    summary = []
+    for key in sorted(groups):
+        group = groups[key]
+        totals = sorted(entry["total"] for entry in group)
+        causes: Dict[str, int] = {}
+        for entry in group:
+            causes[entry["cause"]] = causes.get(entry["cause"], 0) + 1
+        prompt_tokens = [entry["prompt_tokens"] for entry in group if entry.get("prompt_tokens")]
+        summary.append({
+            "period": key,
+            "count": len(group),
+            "p50": statistics.median(totals),
+            "p95": totals[min(len(totals) - 1, int(0.95 * len(totals)))],
+            "max": totals[-1],
+            "avg_prompt_tokens": round(statistics.mean(prompt_tokens)) if prompt_tokens else None,
+            "causes": dict(sorted(causes.items(), key=lambda item: item[1], reverse=True))
+        })
+    return summary
+
+
+# Instancia global del registro de consultas lentas
+slow_query_log = SlowQueryLog.from_env()
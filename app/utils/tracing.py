@@ -0,0 +1,382 @@
+"""
+Trazas por solicitud del pipeline RAG.
+Este módulo proporciona un trazador ligero compatible con el modelo de OpenTelemetry: cada operación
+abre un span (como gestor de contexto o decorador) que hereda del span activo, guarda sus atributos
+(tokens, top_k, fragmentos, aciertos de caché...) y, al terminar la traza, se exporta en formato
+OTLP/JSON a un archivo o a un colector local (p. ej. un OpenTelemetry Collector o Jaeger).
+
+Configuración por variables de entorno:
+    RAG_TRACE_FILE: Archivo JSONL donde se añade cada traza (una línea OTLP/JSON por traza).
+    RAG_TRACE_ENDPOINT: URL OTLP/HTTP del colector (p. ej. http://localhost:4318/v1/traces).
+"""
+
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+import urllib.request
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "raglec"
+
+# Span activo en el hilo o tarea actual
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """Operación con duración, atributos y relación padre-hijo dentro de una traza."""
+
+    def __init__(self, name: str, trace_id: str, parent: Optional["Span"] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent = parent
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.links: List[Dict[str, str]] = []
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.children: List["Span"] = []
+
+    @property
+    def duration(self) -> float:
+        """Duración en segundos (hasta ahora si el span no ha terminado)."""
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def set_attribute(self, key: str, value: Any):
+        """Añade o sustituye un atributo (se ignoran los valores None)."""
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        """Añade varios atributos a la vez."""
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def add_link(self, trace_id: str, attributes: Optional[Dict[str, Any]] = None):
+        """Enlaza el span con otra traza (p. ej. la ingesta de un documento recuperado)."""
+        self.links.append({"trace_id": trace_id, "attributes": dict(attributes or {})})
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Convierte el span al formato OTLP/JSON."""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1}
+        }
+        if self.parent is not None:
+            span["parentSpanId"] = self.parent.span_id
+        if self.links:
+            span["links"] = [
+                # El span enlazado no se conoce: se usa un identificador nulo, válido en OTLP
+                {"traceId": link["trace_id"], "spanId": "0" * 16, "attributes": _otlp_attributes(link["attributes"])}
+                for link in self.links
+            ]
+        return span
+
+    def child(self, name: str) -> Optional["Span"]:
+        """Devuelve el primer hijo con ese nombre (None si no existe)."""
+        return next((child for child in self.children if child.name == name), None)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Resumen legible del span y sus hijos (para registros y depuración)."""
+        return {
+            "name": self.name,
+            "duration": round(self.duration, 4),
+            "attributes": self.attributes,
+            "children": [child.to_dict() for child in self.children]
+        }
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    """Convierte un valor de atributo al tipo AnyValue de OTLP."""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(item) for item in value]}}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+def to_otlp_payload(spans: List[Span]) -> Dict[str, Any]:
+    """Agrupa spans en el documento ExportTraceServiceRequest de OTLP/JSON."""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})},
+            "scopeSpans": [{
+                "scope": {"name": __name__},
+                "spans": [span.to_otlp() for span in spans]
+            }]
+        }]
+    }
+
+
+class OTLPFileExporter:
+    """Añade cada traza como una línea OTLP/JSON a un archivo."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]):
+        line = json.dumps(to_otlp_payload(spans), ensure_ascii=False) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+class OTLPHttpExporter:
+    """Envía las trazas a un colector OTLP/HTTP desde un hilo en segundo plano."""
+
+    def __init__(self, endpoint: str, timeout: float = 2.0, max_queue: int = 1000):
+        """Inicializa el exportador.
+
+        Args:
+            endpoint: URL del colector (p. ej. http://localhost:4318/v1/traces).
+            timeout: Tiempo máximo de cada envío en segundos.
+            max_queue: Trazas pendientes como máximo; si se llena se descartan las nuevas.
+        """
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self._queue: queue.Queue = queue.Queue(max_queue)
+        threading.Thread(target=self._run, daemon=True, name="trace-exporter").start()
+
+    def export(self, spans: List[Span]):
+        try:
+            self._queue.put_nowait(to_otlp_payload(spans))
+        except queue.Full:
+            logger.debug("Cola de trazas llena; traza descartada")
+
+    def _run(self):
+        while True:
+            payload = self._queue.get()
+            request = urllib.request.Request(
+                self.endpoint, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"}
+            )
+            try:
+                urllib.request.urlopen(request, timeout=self.timeout).close()
+            except OSError as e:
+                logger.debug(f"No se pudo enviar la traza al colector: {e}")
+
+
+class Tracer:
+    """Crea spans anidados y exporta cada traza al terminar su span raíz."""
+
+    def __init__(self, exporters: Optional[List[Any]] = None):
+        """Inicializa el trazador.
+
+        Args:
+            exporters: Objetos con un método export(spans); sin exportadores las trazas solo
+                están disponibles en memoria (Span.to_dict).
+        """
+        self.exporters = list(exporters or [])
+        self._on_end: List[Callable[[Span], None]] = []
+
+    def add_exporter(self, exporter: Any):
+        """Añade un exportador de trazas."""
+        self.exporters.append(exporter)
+
+    def on_trace_end(self, callback: Callable[[Span], None]):
+        """Registra una función que recibe el span raíz de cada traza terminada."""
+        self._on_end.append(callback)
+
+    def current_span(self) -> Optional[Span]:
+        """Devuelve el span activo (None fuera de una traza)."""
+        return _current_span.get()
+
+    def span(self, name: str, **attributes) -> "_SpanContext":
+        """Abre un span hijo del activo (o la raíz de una traza nueva).
+
+        Uso:
+            with tracer.span("rag.search", top_k=5) as span:
+                span.set_attribute("rag.chunk_count", len(results))
+        """
+        return _SpanContext(self, name, attributes)
+
+    def traced(self, name: Optional[str] = None, **attributes) -> Callable:
+        """Decorador que ejecuta la función dentro de un span.
+
+        Args:
+            name: Nombre del span (por defecto, el nombre calificado de la función).
+            **attributes: Atributos fijos del span.
+        """
+        def decorator(func):
+            span_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name, **attributes):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @contextlib.contextmanager
+    def record_steps(self, name: str, start_time: float, steps: Dict[str, float],
+                     attributes: Optional[Dict[str, Any]] = None) -> Iterator[Span]:
+        """Registra una traza a partir de duraciones ya medidas de etapas consecutivas.
+
+        Sirve para código que mide sus etapas por su cuenta (p. ej. la API web autocontenida). Dentro
+        del bloque se pueden anotar los spans de cada etapa (Span.child); la traza se exporta al salir.
+
+        Args:
+            name: Nombre del span raíz.
+            start_time: Inicio de la operación (time.time()).
+            steps: Etapa -> duración en segundos, en orden de ejecución.
+            attributes: Atributos del span raíz.
+
+        Returns:
+            Iterator[Span]: Span raíz, con un hijo por etapa.
+        """
+        root = Span(name, secrets.token_hex(16), None, attributes)
+        root.start_ns = int(start_time * 1e9)
+        offset = root.start_ns
+        for step, seconds in steps.items():
+            child = Span(step, root.trace_id, root)
+            child.start_ns = offset
+            child.end_ns = offset = offset + int(seconds * 1e9)
+            root.children.append(child)
+        try:
+            yield root
+        finally:
+            self._finish(root)
+
+    def _start(self, name: str, attributes: Dict[str, Any]) -> Span:
+        parent = _current_span.get()
+        trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        span = Span(name, trace_id, parent, attributes)
+        if parent is not None:
+            parent.children.append(span)
+        return span
+
+    def _finish(self, span: Span):
+        span.end_ns = time.time_ns()
+        if span.parent is not None:
+            return
+        spans = _flatten(span)
+        for exporter in self.exporters:
+            try:
+                exporter.export(spans)
+            except Exception as e:
+                logger.error(f"Error al exportar la traza {span.trace_id}: {e}")
+        for callback in self._on_end:
+            try:
+                callback(span)
+            except Exception as e:
+                logger.error(f"Error al procesar la traza {span.trace_id}: {e}")
+
+
+class _SpanContext:
+    """Gestor de contexto que activa un span mientras dura el bloque."""
+
+    def __init__(self, tracer: Tracer, name: str, attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self) -> Span:
+        self.span = self.tracer._start(self.name, self.attributes)
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.span.error = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self.token)
+        self.tracer._finish(self.span)
+        return False
+
+
+def _flatten(root: Span) -> List[Span]:
+    spans = [root]
+    for child in root.children:
+        spans.extend(_flatten(child))
+    return spans
+
+
+def document_versions(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Obtiene los documentos distintos de unos fragmentos recuperados con su versión.
+
+    Los fragmentos guardan el checksum del archivo y el identificador de la traza con la que se
+    ingirieron (ver DocumentManager._process_file).
+
+    Args:
+        results: Filas o resultados de búsqueda con 'metadata'.
+
+    Returns:
+        List[Dict[str, Any]]: Un elemento por archivo con file_id, name, version e ingest_trace_id.
+    """
+    documents = {}
+    for result in results or []:
+        metadata = result.get("metadata")
+        if not isinstance(metadata, dict):
+            continue
+        file_id = metadata.get("file_id")
+        if file_id and file_id not in documents:
+            documents[file_id] = {
+                "file_id": file_id,
+                "name": metadata.get("name", ""),
+                "version": metadata.get("checksum", ""),
+                "ingest_trace_id": metadata.get("ingest_trace_id", "")
+            }
+    return list(documents.values())
+
+
+def annotate_retrieval(span: Span, results: List[Dict[str, Any]], documents: Optional[List[Dict[str, Any]]] = None):
+    """Anota un span de búsqueda con los fragmentos recuperados y la versión de cada documento.
+
+    Cada documento se enlaza con su traza de ingesta, de modo que una respuesta lenta o incorrecta
+    se puede seguir hasta la versión del documento de la que procede.
+
+    Args:
+        span: Span de la búsqueda.
+        results: Resultados con 'metadata' y 'similarity'.
+        documents: Versiones ya calculadas con document_versions (opcional).
+    """
+    span.set_attribute("rag.chunk_count", len(results))
+    if results:
+        span.set_attribute("rag.top_similarity", max(float(result.get("similarity") or 0.0) for result in results))
+
+    documents = document_versions(results) if documents is None else documents
+    if documents:
+        span.set_attribute("rag.documents", [f"{document['name']}@{document['version'][:8]}" for document in documents])
+    for document in documents:
+        if document["ingest_trace_id"]:
+            span.add_link(document["ingest_trace_id"], {
+                "document.file_id": document["file_id"],
+                "document.version": document["version"]
+            })
+
+
+def create_tracer_from_env() -> Tracer:
+    """Crea el trazador con los exportadores indicados en RAG_TRACE_FILE y RAG_TRACE_ENDPOINT."""
+    tracer = Tracer()
+    if os.getenv("RAG_TRACE_FILE"):
+        tracer.add_exporter(OTLPFileExporter(os.getenv("RAG_TRACE_FILE")))
+    if os.getenv("RAG_TRACE_ENDPOINT"):
+        tracer.add_exporter(OTLPHttpExporter(os.getenv("RAG_TRACE_ENDPOINT")))
+    return tracer
+
+
+# Instancia global del trazador
+tracer = create_tracer_from_env()
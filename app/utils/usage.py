@@ -0,0 +1,128 @@
+"""
+Consumo de tokens y coste de las llamadas a OpenAI.
+Este módulo define el formato del registro de consumo que se adjunta a cada consulta y a cada
+archivo ingerido, cuenta tokens de embeddings y estima el coste en dólares a partir de una tabla
+de precios por millón de tokens.
+
+Formato del registro (todas las claves son opcionales):
+    {"llm_model": str, "input_tokens": int, "output_tokens": int,
+     "embedding_model": str, "embedding_tokens": int, "cost": float}
+"""
+
+import functools
+import json
+import logging
+import os
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Precio en USD por millón de tokens: (entrada, salida). Se puede ampliar o corregir con la
+# variable RAG_MODEL_PRICES, p. ej. '{"gpt-4o-mini": [0.15, 0.6]}'
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+    "text-embedding-ada-002": (0.10, 0.0),
+}
+MODEL_PRICES.update({model: tuple(prices) for model, prices in json.loads(os.getenv("RAG_MODEL_PRICES", "{}")).items()})
+
+# Claves numéricas que se suman al agregar registros
+USAGE_COUNTERS = ("input_tokens", "output_tokens", "embedding_tokens", "cost")
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+def model_price(model: str) -> Optional[Tuple[float, float]]:
+    """Obtiene el precio de un modelo, aceptando versiones con fecha (p. ej. gpt-4o-2024-08-06).
+
+    Returns:
+        Tuple[float, float] o None: Precio (entrada, salida) por millón de tokens.
+    """
+    if not model:
+        return None
+    if model in MODEL_PRICES:
+        return MODEL_PRICES[model]
+    # El prefijo más largo evita confundir gpt-4o-mini con gpt-4o
+    matches = [name for name in MODEL_PRICES if model.startswith(name)]
+    return MODEL_PRICES[max(matches, key=len)] if matches else None
+
+
+def estimate_cost(usage: Dict[str, Any]) -> float:
+    """Estima el coste en USD de un registro de consumo.
+
+    Args:
+        usage: Registro de consumo (ver el formato del módulo).
+
+    Returns:
+        float: Coste estimado; los modelos sin precio conocido cuentan como 0.
+    """
+    cost = 0.0
+    llm_price = model_price(usage.get("llm_model", ""))
+    if llm_price:
+        cost += (usage.get("input_tokens", 0) * llm_price[0] + usage.get("output_tokens", 0) * llm_price[1]) / 1e6
+    elif usage.get("input_tokens") or usage.get("output_tokens"):
+        logger.debug(f"Precio desconocido para el modelo {usage.get('llm_model')}")
+    embedding_price = model_price(usage.get("embedding_model", ""))
+    if embedding_price:
+        cost += usage.get("embedding_tokens", 0) * embedding_price[0] / 1e6
+    return round(cost, 8)
+
+
+def count_tokens(texts: Iterable[str], model: str) -> int:
+    """Cuenta los tokens de entrada de una llamada de embeddings.
+
+    La API factura exactamente los tokens de entrada, así que contarlos con el tokenizador del
+    modelo da el mismo valor que la respuesta (que LangChain no expone). Sin tiktoken se estima.
+
+    Args:
+        texts: Textos enviados.
+        model: Modelo de embeddings.
+
+    Returns:
+        int: Número de tokens.
+    """
+    encoding = _encoding_for(model)
+    if encoding is None:
+        return sum(len(text) // 4 + 1 for text in texts if text)
+    return sum(len(encoding.encode(text)) for text in texts if text)
+
+
+@functools.lru_cache(maxsize=8)
+def _encoding_for(model: str):
+    """Obtiene el tokenizador del modelo (None si tiktoken no está instalado o no puede cargarlo)."""
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # tiktoken descarga el vocabulario la primera vez; sin red se usa la estimación
+        logger.warning(f"No se pudo cargar el tokenizador de {model}; se estimarán los tokens: {e}")
+        return None
+
+
+def add_usage(total: Dict[str, Any], usage: Dict[str, Any]) -> Dict[str, Any]:
+    """Suma un registro de consumo a otro (modifica y devuelve total)."""
+    for key in USAGE_COUNTERS:
+        if usage.get(key):
+            total[key] = total.get(key, 0) + usage[key]
+    for key in ("llm_model", "embedding_model"):
+        if usage.get(key):
+            total.setdefault(key, usage[key])
+    return total
+
+
+def usage_cost(usage: Dict[str, Any]) -> float:
+    """Coste de un registro: el guardado o, si falta (p. ej. consultas registradas en Vercel), el estimado."""
+    return usage["cost"] if usage.get("cost") is not None else estimate_cost(usage)
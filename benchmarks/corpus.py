@@ -0,0 +1,133 @@
+"""
+Generador de un corpus sintético de documentos PDF y DOCX para las pruebas de rendimiento.
+
+Cada documento trata un "tema" (un puñado de palabras propias repetidas a lo largo del texto), de
+modo que las preguntas generadas con `make_queries` recuperan fragmentos de un documento concreto.
+El corpus es reproducible: la misma semilla genera los mismos archivos.
+"""
+
+import os
+import random
+from typing import Any, Dict, List, Sequence
+
+COMMON_WORDS = (
+    "el la los las un una de del en con por para sobre entre desde hasta según durante mediante "
+    "sistema proceso documento información datos resultado análisis informe proyecto servicio "
+    "usuario cliente contrato empresa equipo gestión control calidad seguridad riesgo política "
+    "norma requisito objetivo plan fase etapa revisión versión registro archivo sección capítulo "
+    "anexo tabla figura página valor costo precio plazo fecha periodo año mes semana día hora "
+    "debe puede permite incluye establece define describe indica presenta requiere garantiza "
+    "nuevo actual general específico principal importante necesario adecuado correspondiente "
+    "técnico financiero legal operativo administrativo interno externo anual mensual total"
+).split()
+
+TOPIC_SYLLABLES = "ka lo mi ne ru ta ve zo pa ri su do fe gu bi".split()
+
+MIME_TYPES = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+
+
+def _topic_words(rng: random.Random, count: int = 4) -> List[str]:
+    """Palabras inventadas propias de un documento."""
+    return ["".join(rng.choice(TOPIC_SYLLABLES) for _ in range(rng.randint(3, 4))) for _ in range(count)]
+
+
+def _paragraph(rng: random.Random, topic: Sequence[str], words: int) -> str:
+    """Párrafo de `words` palabras con aproximadamente un 8 % de palabras del tema."""
+    text = [rng.choice(topic) if rng.random() < 0.08 else rng.choice(COMMON_WORDS) for _ in range(words)]
+    return " ".join(text).capitalize() + "."
+
+
+def _write_pdf(path: str, paragraphs: List[str], pages: int):
+    import fitz  # PyMuPDF
+
+    pdf = fitz.open()
+    per_page = max(1, len(paragraphs) // pages)
+    for start in range(0, len(paragraphs), per_page):
+        page = pdf.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 545, 792), "\n\n".join(paragraphs[start:start + per_page]), fontsize=9)
+    pdf.save(path)
+    pdf.close()
+
+
+def _write_docx(path: str, paragraphs: List[str], pages: int):
+    import docx
+
+    document = docx.Document()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    document.save(path)
+
+
+def generate_corpus(directory: str, files: int = 20, pages: int = 5, formats: Sequence[str] = ("pdf", "docx"),
+                    seed: int = 42) -> List[Dict[str, Any]]:
+    """Genera el corpus en un directorio.
+
+    Args:
+        directory: Directorio de salida (se crea si no existe).
+        files: Número de documentos.
+        pages: Páginas aproximadas por documento (unas 450 palabras por página).
+        formats: Formatos, asignados de forma alternada ('pdf', 'docx').
+        seed: Semilla del generador.
+
+    Returns:
+        List[Dict[str, Any]]: Por documento: 'path', 'name', 'mime_type', 'file_id' y 'topic'.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    corpus = []
+    for index in range(files):
+        file_format = formats[index % len(formats)]
+        topic = _topic_words(rng)
+        paragraphs = [_paragraph(rng, topic, rng.randint(60, 120)) for _ in range(pages * 5)]
+        name = f"documento_{index:03d}.{file_format}"
+        path = os.path.join(directory, name)
+        (_write_pdf if file_format == "pdf" else _write_docx)(path, paragraphs, pages)
+        corpus.append({
+            "path": path,
+            "name": name,
+            "mime_type": MIME_TYPES[file_format],
+            "file_id": f"bench-{seed}-{index:03d}",
+            "topic": topic
+        })
+    return corpus
+
+
+def generate_chunks(documents: int = 50, chunks_per_document: int = 10, seed: int = 42) -> List[Dict[str, Any]]:
+    """Genera fragmentos de texto sin escribir archivos (para poblar la base de datos directamente).
+
+    Returns:
+        List[Dict[str, Any]]: Por documento: 'name', 'file_id', 'topic' y 'chunks' (textos).
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for index in range(documents):
+        topic = _topic_words(rng)
+        corpus.append({
+            "name": f"documento_{index:03d}.pdf",
+            "file_id": f"bench-{seed}-{index:03d}",
+            "topic": topic,
+            "chunks": [" ".join(_paragraph(rng, topic, rng.randint(60, 120)) for _ in range(4))
+                       for _ in range(chunks_per_document)]
+        })
+    return corpus
+
+
+def make_queries(corpus: List[Dict[str, Any]], count: int, seed: int = 7) -> List[Dict[str, Any]]:
+    """Genera preguntas sobre los temas del corpus.
+
+    Returns:
+        List[Dict[str, Any]]: Por pregunta: 'question' y 'file_id' del documento esperado.
+    """
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        document = rng.choice(corpus)
+        words = rng.sample(document["topic"], 2)
+        queries.append({
+            "question": f"¿Qué establece el documento sobre {words[0]} y {words[1]} en el plan {rng.choice(COMMON_WORDS)}?",
+            "file_id": document["file_id"]
+        })
+    return queries
@@ -0,0 +1,221 @@
+"""
+Servidor local que imita la API de OpenAI (embeddings y chat) para las pruebas de rendimiento.
+
+Responde a POST /v1/embeddings y POST /v1/chat/completions con el mismo formato que la API real,
+con una latencia configurable y un límite de solicitudes por segundo (429 con Retry-After, como la
+API). Los embeddings son deterministas: cada palabra suma un vector fijo, así que las consultas
+recuperan los fragmentos con los que comparten vocabulario.
+
+Uso:
+    with FakeOpenAIServer(embedding_latency=0.05, chat_latency=0.8) as server:
+        os.environ["OPENAI_BASE_URL"] = server.url
+"""
+
+import base64
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Union
+
+import numpy as np
+
+EMBEDDING_DIMENSIONS = 1536
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def fake_embedding(item: Union[str, List[int]], dimensions: int = EMBEDDING_DIMENSIONS) -> np.ndarray:
+    """Embedding determinista y normalizado de un texto (o de una lista de tokens).
+
+    Args:
+        item: Texto o lista de identificadores de tokens.
+        dimensions: Dimensión del vector.
+
+    Returns:
+        np.ndarray: Vector float32 de norma 1.
+    """
+    words = WORD_PATTERN.findall(item.lower()) if isinstance(item, str) else [str(token) for token in item]
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in words:
+        seed = zlib.crc32(word.encode())
+        vector[seed % dimensions] += 1.0 if seed & 1 else -1.0
+        vector[(seed >> 11) % dimensions] += 0.5
+    norm = np.linalg.norm(vector)
+    if not norm:
+        vector[0] = 1.0
+        return vector
+    return vector / norm
+
+
+def count_words(item: Union[str, List[int]]) -> int:
+    """Aproxima los tokens de un texto (las listas de tokens se cuentan exactamente)."""
+    return len(WORD_PATTERN.findall(item)) * 4 // 3 + 1 if isinstance(item, str) else len(item)
+
+
+class TokenBucket:
+    """Límite de solicitudes por segundo con ráfagas de hasta `burst` solicitudes."""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> Optional[float]:
+        """Consume un permiso.
+
+        Returns:
+            float o None: None si se admite la solicitud; si no, segundos hasta el próximo permiso.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return None
+            return (1 - self.tokens) / self.rate
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Manejador de las rutas imitadas de la API de OpenAI."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server: "FakeOpenAIServer" = self.server.owner
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        path = self.path.rstrip("/")
+
+        if path.endswith("/embeddings"):
+            handler, kind = self._embeddings, "embeddings"
+        elif path.endswith("/chat/completions"):
+            handler, kind = self._chat, "chat"
+        else:
+            self._send(404, {"error": {"message": f"Ruta desconocida: {self.path}", "type": "invalid_request_error"}})
+            return
+
+        retry_after = server.limiter.try_acquire() if server.limiter else None
+        if retry_after is not None:
+            server.count(kind, rate_limited=True)
+            self._send(429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                       {"Retry-After": f"{retry_after:.3f}", "retry-after-ms": str(int(retry_after * 1000))})
+            return
+
+        server.count(kind)
+        self._send(200, handler(server, body))
+
+    def _embeddings(self, server: "FakeOpenAIServer", body: dict) -> dict:
+        items = body["input"]
+        if isinstance(items, str) or (items and isinstance(items[0], int)):
+            items = [items]
+        server.sleep(server.embedding_latency + server.embedding_latency_per_item * len(items))
+
+        data = []
+        for index, item in enumerate(items):
+            vector = fake_embedding(item)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode()
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        tokens = sum(count_words(item) for item in items)
+        return {"object": "list", "data": data, "model": body.get("model", "text-embedding-3-small"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    def _chat(self, server: "FakeOpenAIServer", body: dict) -> dict:
+        prompt_tokens = sum(count_words(message.get("content") or "") for message in body.get("messages", []))
+        completion_tokens = min(body.get("max_tokens") or body.get("max_completion_tokens") or server.completion_tokens,
+                                server.completion_tokens)
+        server.sleep(server.chat_latency + server.chat_latency_per_token * completion_tokens)
+        # Con cita, como piden los prompts de la aplicación (ver add_citation_warning en web/api/query.py)
+        content = "(Documento 1) " + " ".join(["respuesta"] * max(1, completion_tokens * 3 // 4))
+        return {
+            "id": f"chatcmpl-bench-{random.getrandbits(32):08x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}
+        }
+
+    def _send(self, status: int, payload: dict, headers: Optional[dict] = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeOpenAIServer:
+    """Servidor de la API imitada en un hilo en segundo plano."""
+
+    def __init__(self, embedding_latency: float = 0.05, embedding_latency_per_item: float = 0.001,
+                 chat_latency: float = 0.5, chat_latency_per_token: float = 0.005, completion_tokens: int = 200,
+                 rate_limit: Optional[float] = None, jitter: float = 0.2, port: int = 0):
+        """Inicializa el servidor.
+
+        Args:
+            embedding_latency: Latencia base de /embeddings en segundos.
+            embedding_latency_per_item: Latencia adicional por texto del lote.
+            chat_latency: Latencia hasta el primer token de /chat/completions.
+            chat_latency_per_token: Latencia por token generado.
+            completion_tokens: Tokens de cada respuesta del chat (acotados por max_tokens).
+            rate_limit: Solicitudes por segundo admitidas (None = sin límite).
+            jitter: Desviación de la latencia (log-normal; 0 = latencia fija).
+            port: Puerto de escucha (0 = uno libre).
+        """
+        self.embedding_latency = embedding_latency
+        self.embedding_latency_per_item = embedding_latency_per_item
+        self.chat_latency = chat_latency
+        self.chat_latency_per_token = chat_latency_per_token
+        self.completion_tokens = completion_tokens
+        self.jitter = jitter
+        self.limiter = TokenBucket(rate_limit) if rate_limit else None
+        self.requests = {"embeddings": 0, "chat": 0, "rate_limited": 0}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), FakeOpenAIHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.owner = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """URL base para OPENAI_BASE_URL."""
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}/v1"
+
+    def sleep(self, seconds: float):
+        """Simula la latencia de la API."""
+        if seconds > 0:
+            time.sleep(seconds * (random.lognormvariate(0, self.jitter) if self.jitter else 1.0))
+
+    def count(self, kind: str, rate_limited: bool = False):
+        """Cuenta una solicitud atendida o rechazada."""
+        with self._lock:
+            self.requests["rate_limited" if rate_limited else kind] += 1
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
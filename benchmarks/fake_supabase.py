@@ -0,0 +1,376 @@
+"""
+Sustituto en memoria del cliente de Supabase para las pruebas de rendimiento.
+
+Implementa el subconjunto del cliente que usa la aplicación (table().select/insert/update/upsert/
+delete con filtros, order, limit y range, y rpc()) sobre listas de filas en memoria. Las funciones
+de supabase_unified.sql (match_documents, get_chunks_by_file_id, delete_chunks_by_file_id(s),
+estadísticas, truncate_tables y backfill_document_file_ids) se reproducen en Python y NumPy.
+Cada `execute()` espera `latency` segundos para simular el viaje de red.
+
+Uso:
+    db = FakeSupabase(latency=0.01)
+    supabase_client.supabase_client = FakeSupabaseStore(db)
+"""
+
+import copy
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+
+class FakeResponse:
+    """Respuesta con la misma forma que la de postgrest (data y count)."""
+
+    def __init__(self, data: Any, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+def _metadata(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Metadatos de una fila (la aplicación los guarda como cadena JSON)."""
+    metadata = row.get("metadata") or {}
+    return json.loads(metadata) if isinstance(metadata, str) else metadata
+
+
+def _value(row: Dict[str, Any], column: str) -> Any:
+    """Valor de una columna, admitiendo rutas JSON del tipo metadata->>'file_id'."""
+    if "->>" in column:
+        base, key = column.split("->>", 1)
+        data = _metadata(row) if base == "metadata" else (row.get(base) or {})
+        value = data.get(key.strip("'\""))
+        return None if value is None else str(value)
+    return row.get(column)
+
+
+class FakeQuery:
+    """Constructor de consultas sobre una tabla en memoria."""
+
+    def __init__(self, db: "FakeSupabase", table: str):
+        self.db = db
+        self.table = table
+        self.action = "select"
+        self.payload: Any = None
+        self.columns = "*"
+        self.count_mode: Optional[str] = None
+        self.head = False
+        self.filters: List[Callable[[Dict[str, Any]], bool]] = []
+        self.ordering: List[tuple] = []
+        self.limit_count: Optional[int] = None
+        self.offset = 0
+        self._negate = False
+
+    # Acciones
+    def select(self, columns: str = "*", count: Optional[str] = None, head: bool = False) -> "FakeQuery":
+        self.columns, self.count_mode, self.head = columns, count, head
+        return self
+
+    def insert(self, rows, **kwargs) -> "FakeQuery":
+        self.action, self.payload = "insert", rows
+        return self
+
+    def upsert(self, rows, **kwargs) -> "FakeQuery":
+        self.action, self.payload = "upsert", rows
+        return self
+
+    def update(self, values: Dict[str, Any]) -> "FakeQuery":
+        self.action, self.payload = "update", values
+        return self
+
+    def delete(self, count: Optional[str] = None, returning: str = "representation") -> "FakeQuery":
+        self.action, self.payload = "delete", (count, returning)
+        return self
+
+    # Filtros
+    @property
+    def not_(self) -> "FakeQuery":
+        self._negate = True
+        return self
+
+    def _add(self, predicate: Callable[[Dict[str, Any]], bool]) -> "FakeQuery":
+        negate, self._negate = self._negate, False
+        self.filters.append((lambda row: not predicate(row)) if negate else predicate)
+        return self
+
+    def eq(self, column: str, value) -> "FakeQuery":
+        return self._add(lambda row: _value(row, column) == value)
+
+    def neq(self, column: str, value) -> "FakeQuery":
+        return self._add(lambda row: _value(row, column) != value)
+
+    def gt(self, column: str, value) -> "FakeQuery":
+        return self._add(lambda row: _value(row, column) is not None and _value(row, column) > value)
+
+    def lt(self, column: str, value) -> "FakeQuery":
+        return self._add(lambda row: _value(row, column) is not None and _value(row, column) < value)
+
+    def gte(self, column: str, value) -> "FakeQuery":
+        return self._add(lambda row: _value(row, column) is not None and _value(row, column) >= value)
+
+    def lte(self, column: str, value) -> "FakeQuery":
+        return self._add(lambda row: _value(row, column) is not None and _value(row, column) <= value)
+
+    def in_(self, column: str, values) -> "FakeQuery":
+        values = set(values)
+        return self._add(lambda row: _value(row, column) in values)
+
+    def is_(self, column: str, value) -> "FakeQuery":
+        expected = None if value in (None, "null") else value
+        return self._add(lambda row: _value(row, column) is expected)
+
+    def filter(self, column: str, operator: str, value) -> "FakeQuery":
+        operators = {"eq": self.eq, "neq": self.neq, "gt": self.gt, "lt": self.lt, "gte": self.gte,
+                     "lte": self.lte}
+        return operators[operator](column, value)
+
+    # Orden y paginación
+    def order(self, column: str, desc: bool = False) -> "FakeQuery":
+        self.ordering.append((column, desc))
+        return self
+
+    def limit(self, count: int) -> "FakeQuery":
+        self.limit_count = count
+        return self
+
+    def range(self, start: int, end: int) -> "FakeQuery":
+        self.offset, self.limit_count = start, end - start + 1
+        return self
+
+    def execute(self) -> FakeResponse:
+        self.db.round_trip()
+        with self.db.lock:
+            return getattr(self, f"_{self.action}")()
+
+    def _matching(self) -> List[Dict[str, Any]]:
+        return [row for row in self.db.tables.setdefault(self.table, []) if all(f(row) for f in self.filters)]
+
+    def _select(self) -> FakeResponse:
+        rows = self._matching()
+        count = len(rows) if self.count_mode else None
+        if self.head:
+            return FakeResponse([], count)
+        for column, desc in reversed(self.ordering):
+            rows.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+        end = None if self.limit_count is None else self.offset + self.limit_count
+        rows = rows[self.offset:end]
+        if self.columns.replace(" ", "") != "*":
+            names = [name.strip() for name in self.columns.split(",")]
+            rows = [{name: row.get(name) for name in names} for row in rows]
+        return FakeResponse(copy.deepcopy(rows), count)
+
+    def _insert(self) -> FakeResponse:
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        table = self.db.tables.setdefault(self.table, [])
+        inserted = []
+        for row in rows:
+            row = dict(row)
+            if "id" not in row:
+                self.db.sequence += 1
+                row["id"] = self.db.sequence
+            row.setdefault("created_at", time.strftime("%Y-%m-%dT%H:%M:%S"))
+            table.append(row)
+            inserted.append(copy.deepcopy(row))
+        self.db.changed(self.table)
+        return FakeResponse(inserted)
+
+    def _upsert(self) -> FakeResponse:
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        table = self.db.tables.setdefault(self.table, [])
+        by_id = {row.get("id"): row for row in table}
+        result = []
+        for row in rows:
+            if row.get("id") in by_id:
+                by_id[row["id"]].update(row)
+                result.append(copy.deepcopy(by_id[row["id"]]))
+            else:
+                self.payload = row
+                result.extend(self._insert().data)
+        self.db.changed(self.table)
+        return FakeResponse(result)
+
+    def _update(self) -> FakeResponse:
+        rows = self._matching()
+        for row in rows:
+            row.update(self.payload)
+        self.db.changed(self.table)
+        return FakeResponse(copy.deepcopy(rows))
+
+    def _delete(self) -> FakeResponse:
+        rows = self._matching()
+        ids = {id(row) for row in rows}
+        self.db.tables[self.table] = [row for row in self.db.tables[self.table] if id(row) not in ids]
+        self.db.changed(self.table)
+        count, returning = self.payload
+        return FakeResponse([] if returning == "minimal" else rows, len(rows) if count else None)
+
+
+class FakeRPC:
+    """Llamada diferida a una función de la base de datos."""
+
+    def __init__(self, db: "FakeSupabase", name: str, params: Dict[str, Any]):
+        self.db = db
+        self.name = name
+        self.params = params
+
+    def execute(self) -> FakeResponse:
+        self.db.round_trip()
+        function = self.db.functions.get(self.name)
+        if function is None:
+            raise Exception(f"Could not find the function public.{self.name}")
+        with self.db.lock:
+            return FakeResponse(function(**self.params))
+
+
+class FakeSupabase:
+    """Base de datos en memoria con las tablas y funciones de supabase_unified.sql."""
+
+    def __init__(self, latency: float = 0.0, collection_name: str = "documents"):
+        """Inicializa la base de datos vacía.
+
+        Args:
+            latency: Segundos de espera por cada execute() (viaje de red simulado).
+            collection_name: Tabla de fragmentos.
+        """
+        self.latency = latency
+        self.collection_name = collection_name
+        self.tables: Dict[str, List[Dict[str, Any]]] = {collection_name: [], "files": [], "queries": []}
+        self.sequence = 0
+        self.round_trips = 0
+        self.lock = threading.RLock()
+        self._matrix: Optional[np.ndarray] = None
+        self.functions = {
+            "match_documents": self.match_documents,
+            "get_chunks_by_file_id": self.get_chunks_by_file_id,
+            "delete_chunks_by_file_id": self.delete_chunks_by_file_id,
+            "delete_chunks_by_file_ids": self.delete_chunks_by_file_ids,
+            "backfill_document_file_ids": self.backfill_document_file_ids,
+            "get_document_statistics": self.get_document_statistics,
+            "get_chunk_counts_by_file": self.get_chunk_counts_by_file,
+            "truncate_tables": self.truncate_tables,
+        }
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: Optional[Dict[str, Any]] = None) -> FakeRPC:
+        return FakeRPC(self, name, params or {})
+
+    def round_trip(self):
+        """Cuenta un viaje a la base de datos y simula su latencia."""
+        with self.lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def changed(self, table: str):
+        """Invalida la matriz de embeddings si cambió la tabla de fragmentos."""
+        if table == self.collection_name:
+            self._matrix = None
+
+    def match_documents(self, query_embedding, match_threshold: float, match_count: int) -> List[Dict[str, Any]]:
+        """Búsqueda por similitud coseno, como match_documents en SQL."""
+        rows = self.tables[self.collection_name]
+        if not rows:
+            return []
+        if self._matrix is None:
+            matrix = np.array([row["embedding"] for row in rows], dtype=np.float32)
+            self._matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        query = np.asarray(query_embedding, dtype=np.float32)
+        similarities = self._matrix @ (query / max(np.linalg.norm(query), 1e-12))
+        order = np.argsort(-similarities)[:match_count]
+        return [
+            {"id": rows[i]["id"], "content": rows[i]["content"], "metadata": _metadata(rows[i]),
+             "similarity": float(similarities[i])}
+            for i in order if similarities[i] > match_threshold
+        ]
+
+    def get_chunks_by_file_id(self, file_id_param: str) -> List[Dict[str, Any]]:
+        """Fragmentos de un archivo ordenados por chunk_index."""
+        rows = [row for row in self.tables[self.collection_name] if row.get("file_id") == file_id_param]
+        rows.sort(key=lambda row: int(_metadata(row).get("chunk_index", 0)))
+        return [{"id": row["id"], "content": row["content"], "metadata": _metadata(row)} for row in rows]
+
+    def delete_chunks_by_file_id(self, file_id: str) -> int:
+        """Elimina los fragmentos de un archivo (por la columna file_id) y devuelve cuántos se eliminaron."""
+        return sum(row["deleted"] for row in self.delete_chunks_by_file_ids([file_id]))
+
+    def delete_chunks_by_file_ids(self, file_ids: List[str]) -> List[Dict[str, Any]]:
+        """Elimina los fragmentos de varios archivos; una fila (file_id, deleted) por archivo afectado."""
+        file_ids = set(file_ids)
+        deleted: Dict[str, int] = {}
+        kept = []
+        for row in self.tables[self.collection_name]:
+            if row.get("file_id") in file_ids:
+                deleted[row["file_id"]] = deleted.get(row["file_id"], 0) + 1
+            else:
+                kept.append(row)
+        self.tables[self.collection_name] = kept
+        self.changed(self.collection_name)
+        return [{"file_id": file_id, "deleted": count} for file_id, count in deleted.items()]
+
+    def backfill_document_file_ids(self, batch_size: int = 5000) -> int:
+        """Convierte en objeto los metadatos en texto JSON y copia metadata.file_id a la columna file_id
+        en hasta batch_size fragmentos que lo necesitan."""
+        updated = 0
+        for row in self.tables[self.collection_name]:
+            if updated >= batch_size:
+                break
+            as_text = isinstance(row.get("metadata"), str)
+            if as_text or (not row.get("file_id") and _metadata(row).get("file_id")):
+                row["metadata"] = _metadata(row)
+                row["file_id"] = row.get("file_id") or row["metadata"].get("file_id")
+                updated += 1
+        return updated
+
+    def get_chunk_counts_by_file(self) -> List[Dict[str, Any]]:
+        """Fragmentos y bytes de contenido de cada archivo, agrupados por la columna file_id como en SQL
+        (NULL y '' forman un único grupo con file_id None)."""
+        counts: Dict[Optional[str], Dict[str, Any]] = {}
+        for row in self.tables[self.collection_name]:
+            file_id = row.get("file_id") or None
+            entry = counts.setdefault(file_id, {"file_id": file_id, "chunks": 0, "content_bytes": 0})
+            entry["chunks"] += 1
+            entry["content_bytes"] += len(row.get("content", "").encode())
+        return list(counts.values())
+
+    def truncate_tables(self, table_names: List[str]) -> None:
+        """Vacía las tablas indicadas, como TRUNCATE."""
+        for name in table_names:
+            self.tables[name] = []
+            self.changed(name)
+
+    def get_document_statistics(self) -> Dict[str, Any]:
+        """Estadísticas agregadas. Los tamaños se estiman como en pgvector (4 bytes por dimensión + 8)."""
+        rows = self.tables[self.collection_name]
+        per_file = [entry["chunks"] for entry in self.get_chunk_counts_by_file()]
+        embedding_bytes = sum(4 * len(row["embedding"]) + 8 for row in rows if row.get("embedding") is not None)
+        processed = [row["processed_at"] for row in self.tables["files"] if row.get("processed_at")]
+        return {
+            "total_files": len(self.tables["files"]),
+            "total_chunks": len(rows),
+            "total_queries": len(self.tables["queries"]),
+            "files_with_chunks": len(per_file),
+            "chunks_per_file": {"min": min(per_file), "avg": round(sum(per_file) / len(per_file), 1),
+                                "max": max(per_file)} if per_file else {"min": None, "avg": None, "max": None},
+            "content_bytes": sum(len(row.get("content", "").encode()) for row in rows),
+            "embedding_bytes": embedding_bytes,
+            "table_bytes": 0,
+            "index_bytes": 0,
+            "embedding_index_bytes": 0,
+            "last_processed": max(processed) if processed else None
+        }
+
+
+class FakeSupabaseStore:
+    """Sustituto de SupabaseVectorStore (ver app.database.supabase_client)."""
+
+    def __init__(self, db: FakeSupabase):
+        self.client = db
+
+    def get_client(self) -> FakeSupabase:
+        return self.client
+
+    def health_check(self) -> bool:
+        return True
@@ -0,0 +1,177 @@
+"""
+Índices locales de búsqueda para el benchmark de recuperación (benchmarks/retrieval.py).
+
+Todos reciben la matriz de embeddings normalizados de los fragmentos (y sus textos) y devuelven,
+para una consulta, los índices de los fragmentos ordenados por su puntuación junto con la similitud
+coseno de cada uno, que es la que compara `match_threshold` en match_documents.
+
+    exact: producto escalar con todos los fragmentos (lo que hace match_documents sin índice).
+    ivf: índice invertido sobre k-means (como ivfflat de pgvector); solo recorre `nprobe` listas.
+    int8: cuantización escalar a 8 bits por dimensión (4 veces menos memoria que float32).
+    hybrid: fusión por rangos recíprocos (RRF) de la búsqueda vectorial y BM25.
+    rerank: búsqueda vectorial de `candidates` fragmentos reordenados con una mezcla de coseno y BM25.
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Resultado de una búsqueda: (índice del fragmento, similitud coseno)
+Hits = List[Tuple[int, float]]
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class ExactIndex:
+    """Búsqueda exhaustiva por similitud coseno."""
+
+    def __init__(self, vectors: np.ndarray, texts: Sequence[str]):
+        self.vectors = vectors
+
+    def search(self, query: np.ndarray, text: str, k: int) -> Hits:
+        scores = self.vectors @ query
+        top = np.argpartition(-scores, min(k, len(scores) - 1))[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def nbytes(self) -> int:
+        return self.vectors.nbytes
+
+
+class IVFIndex:
+    """Índice invertido: k-means con `lists` centroides; se buscan las `nprobe` listas más cercanas."""
+
+    def __init__(self, vectors: np.ndarray, texts: Sequence[str], lists: int = 0, nprobe: int = 4,
+                 iterations: int = 10, seed: int = 0):
+        self.vectors = vectors
+        self.nprobe = nprobe
+        # Raíz cuadrada de las filas (pgvector recomienda filas/1000, que en tablas pequeñas deja una sola lista)
+        lists = min(lists or max(1, int(math.sqrt(len(vectors)))), len(vectors))
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(len(vectors), lists, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(vectors @ centroids.T, axis=1)
+            for c in range(lists):
+                members = vectors[assignment == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[c] = centroid / max(np.linalg.norm(centroid), 1e-12)
+        self.centroids = centroids
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        self.lists = [np.flatnonzero(assignment == c) for c in range(lists)]
+
+    def search(self, query: np.ndarray, text: str, k: int) -> Hits:
+        probes = np.argsort(-(self.centroids @ query))[:self.nprobe]
+        candidates = np.concatenate([self.lists[c] for c in probes])
+        if not len(candidates):
+            return []
+        scores = self.vectors[candidates] @ query
+        order = np.argsort(-scores)[:k]
+        return [(int(candidates[i]), float(scores[i])) for i in order]
+
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + self.centroids.nbytes + sum(ids.nbytes for ids in self.lists)
+
+
+class Int8Index:
+    """Cuantización escalar: cada dimensión se guarda en 8 bits con su propio rango."""
+
+    def __init__(self, vectors: np.ndarray, texts: Sequence[str]):
+        self.offset = vectors.min(axis=0)
+        self.scale = np.maximum(vectors.max(axis=0) - self.offset, 1e-12) / 255
+        self.codes = np.round((vectors - self.offset) / self.scale).astype(np.uint8)
+
+    def search(self, query: np.ndarray, text: str, k: int) -> Hits:
+        # q·x ≈ q·offset + (q*scale)·codes
+        scores = self.codes @ (query * self.scale).astype(np.float32) + float(query @ self.offset)
+        order = np.argsort(-scores)[:k]
+        return [(int(i), float(scores[i])) for i in order]
+
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.offset.nbytes + self.scale.nbytes
+
+
+class BM25:
+    """Puntuación léxica BM25 sobre los textos de los fragmentos."""
+
+    def __init__(self, texts: Sequence[str], k1: float = 1.5, b: float = 0.75):
+        self.k1, self.b = k1, b
+        documents = [Counter(tokenize(text)) for text in texts]
+        self.lengths = np.array([sum(doc.values()) for doc in documents], dtype=np.float32)
+        self.average = float(self.lengths.mean()) if len(documents) else 0.0
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        for index, doc in enumerate(documents):
+            for term, count in doc.items():
+                self.postings.setdefault(term, []).append((index, count))
+        self.size = len(documents)
+
+    def scores(self, text: str) -> np.ndarray:
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(text)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (self.size - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, count in postings:
+                norm = count + self.k1 * (1 - self.b + self.b * self.lengths[index] / self.average)
+                scores[index] += idf * count * (self.k1 + 1) / norm
+        return scores
+
+
+class HybridIndex:
+    """Fusión por rangos recíprocos de la búsqueda vectorial exacta y BM25."""
+
+    def __init__(self, vectors: np.ndarray, texts: Sequence[str], candidates: int = 50, rrf_k: int = 60):
+        self.vectors = vectors
+        self.bm25 = BM25(texts)
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+
+    def search(self, query: np.ndarray, text: str, k: int) -> Hits:
+        similarities = self.vectors @ query
+        fused: Dict[int, float] = {}
+        for scores in (similarities, self.bm25.scores(text)):
+            for rank, index in enumerate(np.argsort(-scores)[:self.candidates]):
+                fused[int(index)] = fused.get(int(index), 0.0) + 1 / (self.rrf_k + rank + 1)
+        ranked = sorted(fused, key=fused.get, reverse=True)[:k]
+        return [(index, float(similarities[index])) for index in ranked]
+
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + sum(len(postings) * 16 for postings in self.bm25.postings.values())
+
+
+class RerankIndex(HybridIndex):
+    """Recupera `candidates` fragmentos por coseno y los reordena mezclando coseno y BM25 normalizado.
+
+    Es un re-ranker léxico y barato; sirve para medir si reordenar compensa la latencia añadida
+    antes de probar un modelo de re-ranking real.
+    """
+
+    def __init__(self, vectors: np.ndarray, texts: Sequence[str], candidates: int = 50, weight: float = 0.5):
+        super().__init__(vectors, texts, candidates)
+        self.weight = weight
+
+    def search(self, query: np.ndarray, text: str, k: int) -> Hits:
+        similarities = self.vectors @ query
+        candidates = np.argsort(-similarities)[:self.candidates]
+        lexical = self.bm25.scores(text)[candidates]
+        lexical = lexical / lexical.max() if lexical.max() > 0 else lexical
+        combined = (1 - self.weight) * similarities[candidates] + self.weight * lexical
+        order = np.argsort(-combined)[:k]
+        return [(int(candidates[i]), float(similarities[candidates[i]])) for i in order]
+
+
+INDEX_TYPES = {
+    "exact": ExactIndex,
+    "ivf": IVFIndex,
+    "int8": Int8Index,
+    "hybrid": HybridIndex,
+    "rerank": RerankIndex,
+}
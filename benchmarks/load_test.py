@@ -0,0 +1,354 @@
+"""
+Pruebas de carga del endpoint /api/query.
+
+Sirve los manejadores de web/api con web/server.py en un puerto local, conectados al servidor de
+OpenAI imitado y a la base de datos en memoria (ver benchmarks/run.py), y los somete a carga:
+
+    closed: N clientes que envían la siguiente consulta al recibir la respuesta anterior.
+    open: llegadas a ritmo fijo (o de Poisson) sin esperar respuestas; la latencia se mide desde el
+          instante programado, así que las esperas en el cliente también cuentan.
+    ramp: carga abierta creciente hasta que el p95 supera --slo-p95 o los errores superan
+          --max-error-rate; informa el máximo de consultas por segundo sostenible.
+
+Las preguntas salen de un archivo (.txt o .jsonl, como en `Main.py batch`), de una exportación de
+la tabla queries (`Main.py admin export --queries`) o se generan sobre el corpus sintético.
+
+Uso:
+    python -m benchmarks.load_test --mode ramp --slo-p95 3 -o carga.json
+    python -m benchmarks.load_test --mode closed --concurrency 16 --from-export export.json --baseline carga.json
+"""
+
+import argparse
+import http.client
+import importlib.util
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+# Añadir el directorio raíz al path para importar los módulos de la aplicación
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+from benchmarks.corpus import generate_chunks, make_queries
+from benchmarks.fake_openai import FakeOpenAIServer, fake_embedding
+from benchmarks.fake_supabase import FakeSupabase
+from benchmarks.run import compare_results, git_commit, percentiles
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# (escenario, métrica) -> True si un valor mayor es mejor
+LOAD_REGRESSION_METRICS = {
+    ("load", "throughput"): True,
+    ("load", "p50"): False,
+    ("load", "p95"): False,
+    ("load", "error_rate"): False,
+    ("load", "timeout_rate"): False,
+    ("load", "max_sustainable_qps"): True,
+}
+
+
+def seed_database(db: FakeSupabase, corpus: List[Dict[str, Any]]):
+    """Inserta los fragmentos del corpus con sus embeddings en la base de datos en memoria."""
+    rows = []
+    for document in corpus:
+        for index, text in enumerate(document["chunks"]):
+            metadata = {"file_id": document["file_id"], "name": document["name"], "chunk_index": index,
+                        "total_chunks": len(document["chunks"])}
+            rows.append({"id": f"{document['file_id']}_{index}", "content": text, "metadata": json.dumps(metadata),
+                         "embedding": fake_embedding(text).tolist(), "file_id": document["file_id"]})
+    db.table(db.collection_name).insert(rows).execute()
+
+
+def load_question_set(args, corpus: List[Dict[str, Any]]) -> List[str]:
+    """Preguntas a reproducir según las opciones de la línea de comandos."""
+    if args.questions:
+        from app.query.batch_query import load_questions
+        return [item["question"] for item in load_questions(args.questions)]
+    if args.from_export:
+        from app.database.export import read_export
+        return [row["query"] for row in read_export(args.from_export, "queries") if row.get("query")]
+    return [item["question"] for item in make_queries(corpus, args.question_count, args.seed)]
+
+
+@contextmanager
+def serve_api(args, db: FakeSupabase) -> Iterator[str]:
+    """Sirve web/api con web/server.py conectado a los sustitutos de OpenAI y Supabase.
+
+    Returns:
+        str: URL base del servidor.
+    """
+    fake_openai = FakeOpenAIServer(
+        embedding_latency=args.embedding_latency,
+        chat_latency=args.chat_latency,
+        chat_latency_per_token=args.chat_latency_per_token,
+        completion_tokens=args.completion_tokens,
+        rate_limit=args.rate_limit,
+        jitter=args.jitter
+    ).start()
+    os.environ.update({
+        "OPENAI_API_KEY": "sk-benchmark",
+        "OPENAI_BASE_URL": fake_openai.url,
+        "SUPABASE_URL": "http://supabase.invalid",
+        "SUPABASE_KEY": "benchmark",
+        "RAG_SLOW_QUERY_THRESHOLD": "0",
+    })
+
+    spec = importlib.util.spec_from_file_location("rag_web_server", os.path.join(ROOT_DIR, "web", "server.py"))
+    web_server = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(web_server)
+
+    routes = web_server.load_api_routes()
+    # Los manejadores crean su cliente de Supabase en cada solicitud
+    for module_name in ("api_query", "api_feedback"):
+        sys.modules[module_name].create_client = lambda *args, **kwargs: db
+
+    server = web_server.RAGHTTPServer(("127.0.0.1", 0), routes, workers=args.workers, max_queue=args.max_queue)
+    thread = threading.Thread(target=server.serve_forever, name="load-test-server", daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+        fake_openai.stop()
+
+
+class LoadClient:
+    """Cliente HTTP con una conexión keep-alive por hilo."""
+
+    def __init__(self, url: str, timeout: float):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def query(self, question: str, scheduled: Optional[float] = None) -> Dict[str, Any]:
+        """Envía una consulta a /api/query.
+
+        Args:
+            question: Pregunta.
+            scheduled: Instante (perf_counter) en que debía enviarse; por defecto, ahora.
+
+        Returns:
+            Dict[str, Any]: 'outcome' (ok, error, timeout o rejected), 'latency' y 'query_steps'.
+        """
+        start = scheduled if scheduled is not None else time.perf_counter()
+        body = json.dumps({"query": question}).encode()
+        try:
+            connection = getattr(self._local, "connection", None)
+            if connection is None:
+                connection = self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            connection.request("POST", "/api/query", body, {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            payload = response.read()
+            if response.getheader("Connection", "").lower() == "close":
+                self._close()
+        except (TimeoutError, OSError, http.client.HTTPException) as e:
+            self._close()
+            outcome = "timeout" if isinstance(e, TimeoutError) else "error"
+            return {"outcome": outcome, "latency": time.perf_counter() - start, "query_steps": {}}
+
+        latency = time.perf_counter() - start
+        if response.status == 503:
+            return {"outcome": "rejected", "latency": latency, "query_steps": {}}
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            data = {"error": "respuesta no JSON"}
+        outcome = "ok" if response.status == 200 and "error" not in data else "error"
+        return {"outcome": outcome, "latency": latency, "query_steps": data.get("metadata", {}).get("query_steps", {})}
+
+    def _close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def closed_loop(client: LoadClient, questions: List[str], concurrency: int, duration: float) -> List[Dict[str, Any]]:
+    """Carga cerrada: cada cliente envía una consulta tras recibir la respuesta anterior."""
+    results: List[Dict[str, Any]] = []
+    lock = threading.Lock()
+    counter = iter(range(sys.maxsize))
+    end = time.perf_counter() + duration
+
+    def worker():
+        while time.perf_counter() < end:
+            with lock:
+                question = questions[next(counter) % len(questions)]
+            result = client.query(question)
+            with lock:
+                results.append(result)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def open_loop(client: LoadClient, questions: List[str], rate: float, duration: float, max_in_flight: int,
+              poisson: bool = False, seed: int = 0) -> List[Dict[str, Any]]:
+    """Carga abierta: `rate` consultas por segundo durante `duration` segundos, con o sin respuesta."""
+    rng = random.Random(seed)
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        start = time.perf_counter()
+        scheduled = start
+        index = 0
+        while scheduled < start + duration:
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(client.query, questions[index % len(questions)], scheduled))
+            index += 1
+            scheduled += rng.expovariate(rate) if poisson else 1.0 / rate
+    return [future.result() for future in futures]
+
+
+def summarize(results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    """Rendimiento, percentiles de latencia, tasas de error y desglose de query_steps."""
+    total = len(results) or 1
+    outcomes = {name: sum(1 for result in results if result["outcome"] == name)
+                for name in ("ok", "error", "timeout", "rejected")}
+    latencies = [result["latency"] for result in results if result["outcome"] == "ok"]
+
+    steps: Dict[str, List[float]] = {}
+    for result in results:
+        for step, seconds in result["query_steps"].items():
+            steps.setdefault(step, []).append(seconds)
+
+    return {
+        "requests": len(results),
+        "seconds": elapsed,
+        "throughput": outcomes["ok"] / elapsed if elapsed else 0.0,
+        "error_rate": outcomes["error"] / total,
+        "timeout_rate": outcomes["timeout"] / total,
+        "rejected_rate": outcomes["rejected"] / total,
+        **percentiles(latencies),
+        "query_steps": {step: {key: values[key] for key in ("p50", "p95")}
+                        for step, values in ((step, percentiles(values)) for step, values in steps.items())}
+    }
+
+
+def run_load_test(args, url: str, questions: List[str]) -> Dict[str, Any]:
+    """Ejecuta el modo indicado y devuelve el resumen de la carga."""
+    client = LoadClient(url, args.timeout)
+
+    if args.mode == "closed":
+        start = time.perf_counter()
+        results = closed_loop(client, questions, args.concurrency, args.duration)
+        return summarize(results, time.perf_counter() - start)
+
+    if args.mode == "open":
+        start = time.perf_counter()
+        results = open_loop(client, questions, args.rate, args.duration, args.max_in_flight, args.poisson, args.seed)
+        return summarize(results, time.perf_counter() - start)
+
+    # Modo ramp: subir el ritmo hasta incumplir el objetivo de latencia o de errores
+    steps, sustainable = [], None
+    rate = args.rate
+    while rate <= args.max_rate:
+        start = time.perf_counter()
+        results = open_loop(client, questions, rate, args.duration, args.max_in_flight, args.poisson, args.seed)
+        step = dict(summarize(results, time.perf_counter() - start), rate=rate)
+        steps.append(step)
+        failures = step["error_rate"] + step["timeout_rate"] + step["rejected_rate"]
+        passed = step.get("p95", float("inf")) <= args.slo_p95 and failures <= args.max_error_rate
+        logger.warning(f"{rate:.1f} consultas/s: p95={step.get('p95', 0):.3f}s, fallos={failures:.1%} "
+                       f"-> {'cumple' if passed else 'no cumple'}")
+        if not passed:
+            break
+        sustainable = step
+        rate += args.rate_step
+
+    summary = dict(sustainable or steps[-1])
+    summary["max_sustainable_qps"] = sustainable["rate"] if sustainable else 0.0
+    summary["steps"] = steps
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Pruebas de carga de /api/query sin conexión")
+    parser.add_argument("--mode", choices=["closed", "open", "ramp"], default="closed", help="Modo de carga")
+    parser.add_argument("--duration", type=float, default=30.0, help="Segundos de carga (por escalón en ramp)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Clientes simultáneos (closed)")
+    parser.add_argument("--rate", type=float, default=2.0, help="Consultas por segundo (open) o ritmo inicial (ramp)")
+    parser.add_argument("--rate-step", type=float, default=2.0, help="Incremento del ritmo por escalón (ramp)")
+    parser.add_argument("--max-rate", type=float, default=200.0, help="Ritmo máximo a probar (ramp)")
+    parser.add_argument("--slo-p95", type=float, default=5.0, help="p95 máximo admitido en segundos (ramp)")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Fracción máxima de fallos (ramp)")
+    parser.add_argument("--poisson", action="store_true", help="Llegadas de Poisson en lugar de ritmo constante")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="Consultas abiertas máximas del generador")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Tiempo máximo de espera de cada consulta")
+    parser.add_argument("--questions", help="Archivo de preguntas (.txt o .jsonl)")
+    parser.add_argument("--from-export", help="Exportación JSON de la tabla queries (admin export --queries)")
+    parser.add_argument("--question-count", type=int, default=500, help="Preguntas sintéticas a generar")
+    parser.add_argument("--documents", type=int, default=100, help="Documentos del corpus sintético")
+    parser.add_argument("--chunks-per-document", type=int, default=20, help="Fragmentos por documento")
+    parser.add_argument("--seed", type=int, default=42, help="Semilla del corpus y las consultas")
+    parser.add_argument("--workers", type=int, default=8, help="Trabajadores del servidor web")
+    parser.add_argument("--max-queue", type=int, default=16, help="Cola máxima del servidor web antes de 503")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Latencia de /embeddings (s)")
+    parser.add_argument("--chat-latency", type=float, default=0.5, help="Latencia base de /chat/completions (s)")
+    parser.add_argument("--chat-latency-per-token", type=float, default=0.002, help="Latencia por token generado (s)")
+    parser.add_argument("--completion-tokens", type=int, default=200, help="Tokens de cada respuesta")
+    parser.add_argument("--rate-limit", type=float, help="Solicitudes por segundo a la API (429 al superarlo)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Variabilidad de la latencia de la API")
+    parser.add_argument("--db-latency", type=float, default=0.005, help="Latencia de cada llamada a la base de datos (s)")
+    parser.add_argument("-o", "--output", default="load_test_results.json", help="Archivo JSON de resultados")
+    parser.add_argument("--baseline", help="Resultados de referencia con los que comparar")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Empeoramiento admitido respecto a la referencia")
+    args = parser.parse_args(argv)
+
+    # El nivel va en el handler: los manejadores de web/api registran cada solicitud con nivel INFO
+    handler = logging.StreamHandler()
+    handler.setLevel(logging.WARNING)
+    logging.basicConfig(level=logging.WARNING, handlers=[handler],
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    corpus = generate_chunks(args.documents, args.chunks_per_document, args.seed)
+    db = FakeSupabase(latency=args.db_latency)
+    seed_database(db, corpus)
+    questions = load_question_set(args, corpus)
+    if not questions:
+        print("No hay preguntas que reproducir")
+        return 1
+
+    with serve_api(args, db) as url:
+        summary = run_load_test(args, url, questions)
+
+    results = {
+        "timestamp": datetime.now().isoformat(),
+        "git_commit": git_commit(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "scenarios": {"load": summary}
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(json.dumps({key: value for key, value in summary.items() if key != "steps"}, indent=2, ensure_ascii=False))
+    print(f"Resultados guardados en {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_results(results, json.load(f), args.tolerance, LOAD_REGRESSION_METRICS)
+        for regression in regressions:
+            print(f"REGRESIÓN {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
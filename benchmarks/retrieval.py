@@ -0,0 +1,455 @@
+"""
+Benchmark de calidad frente a latencia de la recuperación.
+
+Evalúa un conjunto etiquetado de preguntas (pregunta -> fragmentos relevantes) con distintas
+configuraciones de búsqueda sobre un índice local (ver benchmarks/indexes.py), sin llamar a
+Supabase: búsqueda exacta frente a ANN (IVF), cuantización int8, búsqueda híbrida con BM25,
+re-ranking, tamaño de fragmento, top_k y umbral de similitud. Informa recall@k, MRR y latencia de
+búsqueda en una sola tabla y marca las configuraciones de la frontera de Pareto (ninguna otra es a
+la vez más precisa y más rápida).
+
+Etiquetas (JSONL, una pregunta por línea):
+    {"question": "...", "relevant": ["<file_id>#<chunk_index>", ...],
+     "relevant_files": ["<file_id>", ...], "terms": ["palabra", ...]}
+
+    relevant: fragmentos relevantes con la fragmentación almacenada.
+    relevant_files: archivos relevantes (si falta, se deduce de 'relevant').
+    terms: opcional; con otro tamaño de fragmento, son relevantes los fragmentos de los archivos
+           relevantes que contienen alguno de estos términos. Sin 'terms', con otros tamaños de
+           fragmento solo se calculan las métricas por archivo.
+
+Las etiquetas salen de un archivo escrito a mano (--labels), de las consultas con valoración
+positiva de una exportación (--from-export, `Main.py admin export --queries --documents`), o se
+generan sobre el corpus sintético. --save-labels guarda las etiquetas usadas para revisarlas.
+
+Uso:
+    python -m benchmarks.retrieval --indexes exact,ivf,int8,hybrid,rerank --top-k 5,10 -o retrieval.json
+    python -m benchmarks.retrieval --from-export export.json --embedder openai --chunk-sizes 0,1500,3000
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import numpy as np
+from tabulate import tabulate
+
+# Añadir el directorio raíz al path para importar los módulos de la aplicación
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+from app.database.export import read_export
+
+from benchmarks.corpus import generate_chunks, make_queries
+from benchmarks.fake_openai import fake_embedding
+from benchmarks.indexes import INDEX_TYPES, tokenize
+from benchmarks.run import git_commit, percentiles
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+Embedder = Callable[[List[str]], np.ndarray]
+
+
+def chunk_key(file_id: str, chunk_index: int) -> str:
+    """Identificador de un fragmento en las etiquetas."""
+    return f"{file_id}#{chunk_index}"
+
+
+def _parse_json(value: Any, default: Any) -> Any:
+    """Las columnas JSON llegan como texto o ya decodificadas según el cliente que las escribió."""
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return default
+    return default if value is None else value
+
+
+def load_export(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Fragmentos y consultas de una exportación de `admin export`.
+
+    Returns:
+        Dict[str, List[Dict[str, Any]]]: 'chunks' (id, file_id, chunk_index, name, content y
+        embedding si se exportó) y 'queries' (filas de la tabla queries).
+    """
+    chunks = []
+    for row in read_export(path, "documents"):
+        metadata = _parse_json(row.get("metadata"), {})
+        file_id = metadata.get("file_id") or row.get("file_id")
+        if not file_id or not row.get("content"):
+            continue
+        chunk_index = int(metadata.get("chunk_index", len(chunks)))
+        embedding = _parse_json(row.get("embedding"), None)
+        chunks.append({"id": chunk_key(file_id, chunk_index), "file_id": file_id, "chunk_index": chunk_index,
+                       "name": metadata.get("name", file_id), "content": row["content"], "embedding": embedding})
+    return {"chunks": chunks, "queries": list(read_export(path, "queries"))}
+
+
+def labels_from_queries(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Etiquetas a partir de las consultas con valoración positiva (user_feedback > 0).
+
+    Las fuentes de una respuesta valorada como útil se toman como fragmentos relevantes. Las
+    valoraciones negativas no dicen qué fragmento habría sido el correcto, así que se descartan.
+    """
+    labels = []
+    for row in rows:
+        if not row.get("query") or (row.get("user_feedback") or 0) <= 0:
+            continue
+        sources = _parse_json(row.get("sources"), [])
+        relevant = [chunk_key(source["file_id"], source["chunk_index"]) for source in sources
+                    if source.get("file_id") and source.get("chunk_index") is not None]
+        if relevant:
+            labels.append({"question": row["query"], "relevant": sorted(set(relevant))})
+    return labels
+
+
+def synthetic_dataset(documents: int, chunks_per_document: int, questions: int,
+                      seed: int) -> Dict[str, List[Dict[str, Any]]]:
+    """Fragmentos y etiquetas sobre el corpus sintético de benchmarks/corpus.py.
+
+    Son relevantes los fragmentos del documento de la pregunta que contienen alguna de las palabras
+    del tema por las que pregunta.
+    """
+    corpus = generate_chunks(documents, chunks_per_document, seed)
+    chunks = [{"id": chunk_key(document["file_id"], index), "file_id": document["file_id"], "chunk_index": index,
+               "name": document["name"], "content": text, "embedding": None}
+              for document in corpus for index, text in enumerate(document["chunks"])]
+    topics = {document["file_id"]: document["topic"] for document in corpus}
+    labels = []
+    for item in make_queries(corpus, questions, seed + 1):
+        words = set(tokenize(item["question"]))
+        terms = [word for word in topics[item["file_id"]] if word in words]
+        label = {"question": item["question"], "relevant_files": [item["file_id"]], "terms": terms}
+        label["relevant"] = sorted(relevant_chunks(label, chunks, base=False))
+        labels.append(label)
+    return {"chunks": chunks, "labels": labels}
+
+
+def load_labels(path: str) -> List[Dict[str, Any]]:
+    """Lee un archivo de etiquetas JSONL."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_labels(path: str, labels: List[Dict[str, Any]]):
+    """Guarda las etiquetas en JSONL (para revisarlas o completarlas a mano)."""
+    with open(path, "w", encoding="utf-8") as f:
+        for label in labels:
+            f.write(json.dumps(label, ensure_ascii=False) + "\n")
+
+
+def relevant_files(label: Dict[str, Any]) -> Set[str]:
+    return set(label.get("relevant_files") or [key.rsplit("#", 1)[0] for key in label.get("relevant", [])])
+
+
+def relevant_chunks(label: Dict[str, Any], chunks: List[Dict[str, Any]], base: bool) -> Optional[Set[str]]:
+    """Fragmentos relevantes de una etiqueta con una fragmentación dada.
+
+    Args:
+        label: Etiqueta de la pregunta.
+        chunks: Fragmentos indexados.
+        base: True si es la fragmentación con la que se escribió la etiqueta.
+
+    Returns:
+        Set[str] o None: Identificadores relevantes, o None si no se pueden determinar.
+    """
+    if base and label.get("relevant"):
+        return set(label["relevant"])
+    terms = set(label.get("terms") or [])
+    if not terms:
+        return None
+    files = relevant_files(label)
+    return {chunk["id"] for chunk in chunks
+            if chunk["file_id"] in files and terms & set(tokenize(chunk["content"]))}
+
+
+def rechunk(chunks: List[Dict[str, Any]], chunk_size: int, chunk_overlap: int) -> List[Dict[str, Any]]:
+    """Vuelve a fragmentar los documentos (reconstruidos uniendo sus fragmentos en orden).
+
+    Los fragmentos exportados ya se solapan, así que el texto reconstruido repite los solapes; basta
+    para comparar tamaños de fragmento entre sí.
+    """
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=min(chunk_overlap, chunk_size // 4),
+                                              length_function=len)
+    documents: Dict[str, List[Dict[str, Any]]] = {}
+    for chunk in chunks:
+        documents.setdefault(chunk["file_id"], []).append(chunk)
+    result = []
+    for file_id, parts in documents.items():
+        text = "\n\n".join(part["content"] for part in sorted(parts, key=lambda part: part["chunk_index"]))
+        for index, content in enumerate(splitter.split_text(text)):
+            result.append({"id": chunk_key(file_id, index), "file_id": file_id, "chunk_index": index,
+                           "name": parts[0]["name"], "content": content, "embedding": None})
+    return result
+
+
+class EmbeddingCache:
+    """Caché en disco (.npz) de embeddings por modelo y texto, para repetir el benchmark sin coste."""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.vectors: Dict[str, np.ndarray] = {}
+        self.dirty = False
+        if path and os.path.exists(path):
+            with np.load(path) as data:
+                self.vectors = dict(zip(data["keys"].tolist(), data["vectors"]))
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha1(f"{model}\0{text}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        return self.vectors.get(key)
+
+    def put(self, key: str, vector: np.ndarray):
+        self.vectors[key] = vector
+        self.dirty = True
+
+    def save(self):
+        if self.path and self.dirty and self.vectors:
+            keys = list(self.vectors)
+            np.savez(self.path, keys=np.array(keys), vectors=np.stack([self.vectors[key] for key in keys]))
+            self.dirty = False
+
+
+def make_embedder(name: str, cache: EmbeddingCache) -> Embedder:
+    """Función que devuelve los embeddings normalizados (float32) de una lista de textos.
+
+    Args:
+        name: 'fake' (embeddings deterministas de benchmarks/fake_openai.py, sin red) u 'openai'
+            (EmbeddingGenerator de la aplicación, con el modelo configurado).
+        cache: Caché de embeddings.
+    """
+    if name == "openai":
+        from app.document_processing.embeddings import EmbeddingGenerator
+        generator = EmbeddingGenerator()
+        model = generator.model_name
+
+        def compute(texts: List[str]) -> List[Optional[List[float]]]:
+            return generator.generate_embeddings_batch(texts, batch_size=100)
+    else:
+        model = "fake"
+
+        def compute(texts: List[str]) -> List[Optional[List[float]]]:
+            return [fake_embedding(text) for text in texts]
+
+    def embed(texts: List[str]) -> np.ndarray:
+        keys = [EmbeddingCache.key(model, text) for text in texts]
+        missing = [i for i, key in enumerate(keys) if cache.get(key) is None]
+        if missing:
+            for i, vector in zip(missing, compute([texts[i] for i in missing])):
+                if vector is None:
+                    raise RuntimeError(f"No se pudo generar el embedding del texto {i}")
+                cache.put(keys[i], np.asarray(vector, dtype=np.float32))
+        return normalize(np.stack([cache.get(key) for key in keys]))
+
+    return embed
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return (vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)).astype(np.float32)
+
+
+def index_configs(args) -> List[Dict[str, Any]]:
+    """Configuraciones de índice a evaluar: nombre para la tabla, tipo y parámetros."""
+    configs = []
+    for kind in args.indexes:
+        if kind == "ivf":
+            configs += [{"name": f"ivf(nprobe={nprobe})", "kind": kind, "params": {"lists": args.ivf_lists, "nprobe": nprobe}}
+                        for nprobe in args.nprobe]
+        elif kind in ("hybrid", "rerank"):
+            configs.append({"name": f"{kind}(candidates={args.candidates})", "kind": kind,
+                            "params": {"candidates": args.candidates}})
+        else:
+            configs.append({"name": kind, "kind": kind, "params": {}})
+    return configs
+
+
+def evaluate(hits: List[List[tuple]], chunks: List[Dict[str, Any]], relevant: List[Optional[Set[str]]],
+             files: List[Set[str]], top_k: int, threshold: float) -> Dict[str, Optional[float]]:
+    """recall@k y MRR por fragmento y por archivo.
+
+    Args:
+        hits: Resultados de cada pregunta: (índice del fragmento, similitud) ordenados.
+        chunks: Fragmentos indexados.
+        relevant: Fragmentos relevantes de cada pregunta (None si no se conocen).
+        files: Archivos relevantes de cada pregunta.
+        top_k: Número de resultados (num_results en RAGQuerySystem.query).
+        threshold: Similitud mínima (similarity_threshold).
+
+    Returns:
+        Dict[str, Optional[float]]: 'recall', 'mrr', 'file_recall' y 'file_mrr' (medias); las
+        métricas por fragmento son None si ninguna pregunta las tiene.
+    """
+    recall, mrr, file_recall, file_mrr = [], [], [], []
+    for result, wanted, wanted_files in zip(hits, relevant, files):
+        ids = [chunks[index]["id"] for index, similarity in result if similarity >= threshold][:top_k]
+        if wanted:
+            recall.append(len(wanted.intersection(ids)) / len(wanted))
+            mrr.append(next((1 / rank for rank, key in enumerate(ids, 1) if key in wanted), 0.0))
+        if wanted_files:
+            found = [key.rsplit("#", 1)[0] for key in ids]
+            file_recall.append(len(wanted_files.intersection(found)) / len(wanted_files))
+            file_mrr.append(next((1 / rank for rank, file_id in enumerate(found, 1) if file_id in wanted_files), 0.0))
+
+    def mean(values: List[float]) -> Optional[float]:
+        return round(float(np.mean(values)), 4) if values else None
+
+    return {"recall": mean(recall), "mrr": mean(mrr), "file_recall": mean(file_recall), "file_mrr": mean(file_mrr)}
+
+
+def pareto_front(rows: List[Dict[str, Any]], objective: str, latency: str = "p50_ms") -> List[Dict[str, Any]]:
+    """Marca con 'pareto' las filas que ninguna otra supera en `objective` sin ser también más lenta."""
+    for row in rows:
+        row["pareto"] = not any(
+            other is not row and other[objective] >= row[objective] and other[latency] <= row[latency]
+            and (other[objective] > row[objective] or other[latency] < row[latency])
+            for other in rows
+        )
+    return rows
+
+
+def run_sweep(args, chunks: List[Dict[str, Any]], labels: List[Dict[str, Any]], embed: Embedder) -> Dict[str, Any]:
+    """Evalúa todas las combinaciones de tamaño de fragmento, índice, top_k y umbral."""
+    questions = [label["question"] for label in labels]
+    query_vectors = embed(questions)
+    files = [relevant_files(label) for label in labels]
+    k = max(args.top_k)
+    rows = []
+
+    for chunk_size in args.chunk_sizes:
+        base = chunk_size == 0
+        indexed = chunks if base else rechunk(chunks, chunk_size, args.chunk_overlap)
+        if base and all(chunk.get("embedding") for chunk in indexed) and args.embedder == "openai":
+            # Reutilizar los embeddings exportados: son los que usa la aplicación
+            vectors = normalize(np.array([chunk["embedding"] for chunk in indexed], dtype=np.float32))
+        else:
+            vectors = embed([chunk["content"] for chunk in indexed])
+        texts = [chunk["content"] for chunk in indexed]
+        relevant = [relevant_chunks(label, indexed, base) for label in labels]
+        logger.info(f"Fragmentación {chunk_size or 'almacenada'}: {len(indexed)} fragmentos")
+
+        for config in index_configs(args):
+            started = time.perf_counter()
+            index = INDEX_TYPES[config["kind"]](vectors, texts, **config["params"])
+            build = time.perf_counter() - started
+
+            index.search(query_vectors[0], questions[0], k)  # calentamiento
+            hits, latencies = [], []
+            for vector, question in zip(query_vectors, questions):
+                started = time.perf_counter()
+                hits.append(index.search(vector, question, k))
+                latencies.append((time.perf_counter() - started) * 1000)
+            latency = percentiles(latencies)
+
+            for top_k in args.top_k:
+                for threshold in args.thresholds:
+                    rows.append({
+                        "chunk_size": chunk_size or "almacenado",
+                        "index": config["name"],
+                        "top_k": top_k,
+                        "threshold": threshold,
+                        **evaluate(hits, indexed, relevant, files, top_k, threshold),
+                        "p50_ms": round(latency["p50"], 3),
+                        "p95_ms": round(latency["p95"], 3),
+                        "build_s": round(build, 3),
+                        "index_mb": round(index.nbytes() / 1e6, 2),
+                        "chunks": len(indexed)
+                    })
+
+    # Sin métricas por fragmento en alguna fila, la frontera se calcula por archivo
+    objective = "recall" if all(row["recall"] is not None for row in rows) else "file_recall"
+    rows = pareto_front(rows, objective)
+    rows.sort(key=lambda row: (-row[objective], row["p50_ms"]))
+    return {"objective": objective, "questions": len(labels), "rows": rows}
+
+
+def format_table(rows: List[Dict[str, Any]]) -> str:
+    """Tabla de resultados; '*' marca las configuraciones de la frontera de Pareto."""
+    headers = ["", "fragmento", "índice", "top_k", "umbral", "recall@k", "MRR", "recall@k (archivo)",
+               "MRR (archivo)", "p50 ms", "p95 ms", "construcción s", "MB"]
+    table = [["*" if row["pareto"] else "", row["chunk_size"], row["index"], row["top_k"], row["threshold"],
+              "-" if row["recall"] is None else row["recall"], "-" if row["mrr"] is None else row["mrr"],
+              row["file_recall"], row["file_mrr"], row["p50_ms"], row["p95_ms"], row["build_s"], row["index_mb"]]
+             for row in rows]
+    return tabulate(table, headers=headers, tablefmt="grid")
+
+
+def _numbers(value: str, cast: Callable = int) -> List:
+    return [cast(item) for item in value.split(",") if item.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Función principal."""
+    from app.config.settings import CHUNK_OVERLAP
+
+    parser = argparse.ArgumentParser(description="Benchmark de calidad frente a latencia de la recuperación")
+    parser.add_argument("--labels", help="Etiquetas JSONL (pregunta -> fragmentos relevantes)")
+    parser.add_argument("--from-export", help="Exportación con documentos y consultas (admin export: JSON o directorio JSONL/Parquet)")
+    parser.add_argument("--save-labels", help="Guarda en JSONL las etiquetas usadas")
+    parser.add_argument("--indexes", default="exact,ivf,int8,hybrid,rerank", help="Índices separados por comas")
+    parser.add_argument("--nprobe", default="1,4,16", help="Listas exploradas por el índice IVF")
+    parser.add_argument("--ivf-lists", type=int, default=0, help="Listas del índice IVF (0 = raíz de las filas)")
+    parser.add_argument("--candidates", type=int, default=50, help="Candidatos de la búsqueda híbrida y del re-ranking")
+    parser.add_argument("--chunk-sizes", default="0", help="Tamaños de fragmento (0 = fragmentación almacenada)")
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP, help="Solapamiento al volver a fragmentar")
+    parser.add_argument("--top-k", default="5,10", help="Valores de top_k")
+    parser.add_argument("--thresholds", default="0.1", help="Umbrales de similitud")
+    parser.add_argument("--embedder", choices=["fake", "openai"], default="fake", help="Origen de los embeddings")
+    parser.add_argument("--cache", default="retrieval_embeddings.npz", help="Caché de embeddings ('' para desactivarla)")
+    parser.add_argument("--documents", type=int, default=100, help="Documentos del corpus sintético")
+    parser.add_argument("--chunks-per-document", type=int, default=20, help="Fragmentos por documento")
+    parser.add_argument("--questions", type=int, default=200, help="Preguntas sintéticas")
+    parser.add_argument("--seed", type=int, default=42, help="Semilla del corpus y las preguntas")
+    parser.add_argument("-o", "--output", default="retrieval_results.json", help="Archivo JSON de resultados")
+    args = parser.parse_args(argv)
+    args.indexes = [name for name in args.indexes.split(",") if name in INDEX_TYPES]
+    args.nprobe = _numbers(args.nprobe)
+    args.chunk_sizes = _numbers(args.chunk_sizes)
+    args.top_k = _numbers(args.top_k)
+    args.thresholds = _numbers(args.thresholds, float)
+
+    # El nivel va en el handler: algunos módulos suben su propio logger a DEBUG
+    handler = logging.StreamHandler()
+    handler.setLevel(logging.WARNING)
+    logging.basicConfig(level=logging.WARNING, handlers=[handler],
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    if args.from_export:
+        export = load_export(args.from_export)
+        chunks = export["chunks"]
+        labels = load_labels(args.labels) if args.labels else labels_from_queries(export["queries"])
+    else:
+        dataset = synthetic_dataset(args.documents, args.chunks_per_document, args.questions, args.seed)
+        chunks = dataset["chunks"]
+        labels = load_labels(args.labels) if args.labels else dataset["labels"]
+    if not chunks or not labels:
+        print("Error: no hay fragmentos o preguntas etiquetadas (¿la exportación incluye --documents y consultas valoradas?)")
+        return 1
+    if args.save_labels:
+        save_labels(args.save_labels, labels)
+
+    cache = EmbeddingCache(args.cache or None)
+    try:
+        results = run_sweep(args, chunks, labels, make_embedder(args.embedder, cache))
+    finally:
+        cache.save()
+    results.update({"git_commit": git_commit(), "embedder": args.embedder})
+
+    print(format_table(results["rows"]))
+    print(f"{results['questions']} preguntas; * = frontera de Pareto ({results['objective']} frente a p50)")
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"Resultados guardados en {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
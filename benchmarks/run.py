@@ -0,0 +1,351 @@
+"""
+Pruebas de rendimiento sin conexión.
+
+Ejecuta la ingesta y las consultas de la aplicación contra un servidor local que imita la API de
+OpenAI (benchmarks/fake_openai.py) y una base de datos en memoria que imita Supabase
+(benchmarks/fake_supabase.py), sobre un corpus sintético (benchmarks/corpus.py). No necesita
+credenciales ni red y no consume tokens.
+
+Escenarios:
+    ingest: rendimiento de la ingesta (archivos, fragmentos y MB por segundo).
+    query: distribución de la latencia de las consultas con N consultas simultáneas.
+    memory: pico de memoria de Python (tracemalloc) al ingerir el corpus y al consultar.
+
+Uso:
+    python -m benchmarks.run -o resultados.json
+    python -m benchmarks.run --scenarios query --queries 500 --concurrency 8 --compare base.json
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+# Añadir el directorio raíz al path para importar los módulos de la aplicación
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import generate_corpus, make_queries
+from benchmarks.fake_openai import FakeOpenAIServer
+from benchmarks.fake_supabase import FakeSupabase, FakeSupabaseStore
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ("ingest", "query", "memory")
+
+# (escenario, métrica) -> True si un valor mayor es mejor
+REGRESSION_METRICS = {
+    ("ingest", "chunks_per_second"): True,
+    ("ingest", "mb_per_second"): True,
+    ("query", "p50"): False,
+    ("query", "p95"): False,
+    ("query", "throughput"): True,
+    ("memory", "ingest_peak_mb"): False,
+    ("memory", "query_peak_mb"): False,
+}
+
+
+@contextmanager
+def offline_environment(args) -> Iterator[FakeOpenAIServer]:
+    """Arranca el servidor de OpenAI imitado y apunta la configuración de la aplicación a él.
+
+    Las variables se fijan antes de importar los módulos de `app`, que leen la configuración al importarse.
+    """
+    server = FakeOpenAIServer(
+        embedding_latency=args.embedding_latency,
+        chat_latency=args.chat_latency,
+        chat_latency_per_token=args.chat_latency_per_token,
+        completion_tokens=args.completion_tokens,
+        rate_limit=args.rate_limit,
+        jitter=args.jitter
+    ).start()
+    os.environ.update({
+        "OPENAI_API_KEY": "sk-benchmark",
+        "OPENAI_BASE_URL": server.url,
+        "OPENAI_API_BASE": server.url,
+        "SUPABASE_URL": "http://supabase.invalid",
+        "SUPABASE_KEY": "benchmark",
+        # Los registros de consultas lentas y trazas no deben medirse ni escribirse aquí
+        "RAG_SLOW_QUERY_THRESHOLD": "0",
+    })
+    os.environ.pop("RAG_TRACE_FILE", None)
+    os.environ.pop("RAG_TRACE_ENDPOINT", None)
+    try:
+        yield server
+    finally:
+        server.stop()
+
+
+def use_database(db: FakeSupabase):
+    """Hace que VectorDatabase use la base de datos en memoria."""
+    from app.database import supabase_client
+    supabase_client.supabase_client = FakeSupabaseStore(db)
+
+
+def _offline_embeddings(generator):
+    """Sin el vocabulario de tiktoken (se descarga la primera vez) se envían los textos sin tokenizar."""
+    from app.utils.usage import _encoding_for
+    if _encoding_for(generator.model_name) is None:
+        generator.embeddings.check_embedding_ctx_length = False
+    return generator
+
+
+def create_document_manager():
+    """DocumentManager sin cliente ni monitor de Google Drive."""
+    from app.core.document_manager import DocumentManager
+    from app.database.vector_store import VectorDatabase
+    from app.document_processing.document_loader import DocumentProcessor
+    from app.document_processing.embeddings import EmbeddingGenerator
+
+    manager = DocumentManager.__new__(DocumentManager)
+    manager.document_processor = DocumentProcessor()
+    manager.embedding_generator = _offline_embeddings(EmbeddingGenerator())
+    manager.vector_db = VectorDatabase()
+    return manager
+
+
+def create_query_system():
+    """RAGQuerySystem apuntado al entorno sin conexión."""
+    from app.query.rag_query import RAGQuerySystem
+
+    system = RAGQuerySystem()
+    _offline_embeddings(system.embedding_generator)
+    return system
+
+
+def file_metadata(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Metadatos de un documento del corpus con el formato de Google Drive."""
+    with open(document["path"], "rb") as f:
+        checksum = hashlib.md5(f.read()).hexdigest()
+    now = datetime.now().isoformat()
+    return {"file_id": document["file_id"], "name": document["name"], "mime_type": document["mime_type"],
+            "checksum": checksum, "created_time": now, "modified_time": now}
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """Media, percentiles y máximo de una lista de latencias."""
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {"mean": statistics.mean(ordered), "p50": pick(0.5), "p90": pick(0.9), "p95": pick(0.95),
+            "p99": pick(0.99), "max": ordered[-1]}
+
+
+def run_ingest(corpus: List[Dict[str, Any]], db: FakeSupabase, server: FakeOpenAIServer) -> Dict[str, Any]:
+    """Ingiere el corpus completo y mide el rendimiento."""
+    manager = create_document_manager()
+    round_trips, requests = db.round_trips, dict(server.requests)
+    file_times, failed = [], []
+    size = sum(os.path.getsize(document["path"]) for document in corpus)
+
+    start = time.perf_counter()
+    for document in corpus:
+        file_start = time.perf_counter()
+        chunks_before = len(db.tables[db.collection_name])
+        manager._process_file(document["path"], file_metadata(document))
+        file_times.append(time.perf_counter() - file_start)
+        if len(db.tables[db.collection_name]) == chunks_before:
+            failed.append(document["name"])
+    elapsed = time.perf_counter() - start
+
+    chunks = len(db.tables[db.collection_name])
+    return {
+        "files": len(corpus),
+        "failed_files": failed,
+        "chunks": chunks,
+        "seconds": elapsed,
+        "files_per_second": len(corpus) / elapsed,
+        "chunks_per_second": chunks / elapsed,
+        "mb_per_second": size / 1e6 / elapsed,
+        "file_seconds": percentiles(file_times),
+        "db_round_trips": db.round_trips - round_trips,
+        "embedding_requests": server.requests["embeddings"] - requests["embeddings"],
+        "rate_limited_requests": server.requests["rate_limited"] - requests["rate_limited"]
+    }
+
+
+def run_queries(queries: List[Dict[str, Any]], concurrency: int, server: FakeOpenAIServer) -> Dict[str, Any]:
+    """Ejecuta las consultas con `concurrency` hilos y mide la distribución de la latencia."""
+    from app.utils.performance_metrics import performance_tracker
+
+    system = create_query_system()
+    performance_tracker.reset_metrics()
+    requests = dict(server.requests)
+
+    def timed(query: Dict[str, Any]):
+        query_start = time.perf_counter()
+        result = system.query(query["question"])
+        return time.perf_counter() - query_start, result.get("success", False)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed, queries))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency, _ in outcomes]
+    stages = performance_tracker.get_performance_stats()
+    return {
+        "queries": len(queries),
+        "concurrency": concurrency,
+        "errors": sum(1 for _, success in outcomes if not success),
+        "seconds": elapsed,
+        "throughput": len(queries) / elapsed,
+        **percentiles(latencies),
+        "stages_p50": {
+            stage: stages[operation]["median"]
+            for stage, operation in (("embedding", "embedding_generation"), ("search", "similarity_search"),
+                                     ("llm", "llm_response"))
+            if stages.get(operation)
+        },
+        "rate_limited_requests": server.requests["rate_limited"] - requests["rate_limited"]
+    }
+
+
+def run_memory(corpus: List[Dict[str, Any]], queries: List[Dict[str, Any]], server: FakeOpenAIServer) -> Dict[str, Any]:
+    """Mide el pico de memoria de Python de la ingesta y de las consultas (en una base de datos nueva)."""
+    db = FakeSupabase()
+    use_database(db)
+    tracemalloc.start()
+    try:
+        run_ingest(corpus, db, server)
+        _, ingest_peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        run_queries(queries, 1, server)
+        _, query_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"ingest_peak_mb": ingest_peak / 2 ** 20, "query_peak_mb": query_peak / 2 ** 20,
+            "max_rss_mb": _max_rss_mb()}
+
+
+def _max_rss_mb() -> Optional[float]:
+    """Memoria residente máxima del proceso (None si la plataforma no la expone)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2 ** 20 if sys.platform == "darwin" else rss / 2 ** 10
+
+
+def compare_results(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float,
+                    metrics: Optional[Dict[tuple, bool]] = None) -> List[str]:
+    """Compara dos resultados y describe las métricas que empeoraron más de `tolerance` (fracción).
+
+    Args:
+        current: Resultados nuevos.
+        baseline: Resultados de referencia.
+        tolerance: Empeoramiento relativo admitido.
+        metrics: (escenario, métrica) -> True si un valor mayor es mejor (por defecto REGRESSION_METRICS).
+    """
+    regressions = []
+    for (scenario, metric), higher_is_better in (metrics or REGRESSION_METRICS).items():
+        new = current["scenarios"].get(scenario, {}).get(metric)
+        old = baseline.get("scenarios", {}).get(scenario, {}).get(metric)
+        if not new or not old:
+            continue
+        change = (new - old) / old
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(f"{scenario}.{metric}: {old:.4g} -> {new:.4g} ({change:+.1%})")
+    return regressions
+
+
+def git_commit() -> Optional[str]:
+    """Commit actual del repositorio (para saber qué versión se midió)."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmarks(args) -> Dict[str, Any]:
+    """Ejecuta los escenarios indicados y devuelve los resultados."""
+    results = {
+        "timestamp": datetime.now().isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "scenarios": {}
+    }
+    with tempfile.TemporaryDirectory() as corpus_dir, offline_environment(args) as server:
+        corpus = generate_corpus(corpus_dir, args.files, args.pages, args.formats.split(","), args.seed)
+        queries = make_queries(corpus, args.queries, args.seed)
+
+        db = FakeSupabase(latency=args.db_latency)
+        use_database(db)
+        # Las consultas necesitan el corpus ingerido aunque no se mida la ingesta
+        ingest = run_ingest(corpus, db, server)
+        if "ingest" in args.scenarios:
+            results["scenarios"]["ingest"] = ingest
+        if "query" in args.scenarios:
+            results["scenarios"]["query"] = run_queries(queries, args.concurrency, server)
+        if "memory" in args.scenarios:
+            results["scenarios"]["memory"] = run_memory(corpus, queries[:max(1, len(queries) // 10)], server)
+        results["api_requests"] = dict(server.requests)
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Pruebas de rendimiento sin conexión de RAGLEC")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Escenarios separados por comas")
+    parser.add_argument("--files", type=int, default=20, help="Documentos del corpus sintético")
+    parser.add_argument("--pages", type=int, default=5, help="Páginas por documento")
+    parser.add_argument("--formats", default="pdf,docx", help="Formatos del corpus (pdf, docx)")
+    parser.add_argument("--queries", type=int, default=200, help="Consultas del escenario query")
+    parser.add_argument("--concurrency", type=int, default=4, help="Consultas simultáneas")
+    parser.add_argument("--seed", type=int, default=42, help="Semilla del corpus y las consultas")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Latencia de /embeddings (s)")
+    parser.add_argument("--chat-latency", type=float, default=0.5, help="Latencia base de /chat/completions (s)")
+    parser.add_argument("--chat-latency-per-token", type=float, default=0.002, help="Latencia por token generado (s)")
+    parser.add_argument("--completion-tokens", type=int, default=200, help="Tokens de cada respuesta")
+    parser.add_argument("--rate-limit", type=float, help="Solicitudes por segundo a la API (429 al superarlo)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Variabilidad de la latencia de la API")
+    parser.add_argument("--db-latency", type=float, default=0.005, help="Latencia de cada llamada a la base de datos (s)")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="Archivo JSON de resultados")
+    parser.add_argument("--compare", help="Resultados de referencia con los que comparar")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Empeoramiento admitido respecto a la referencia")
+    args = parser.parse_args(argv)
+    args.scenarios = [name for name in args.scenarios.split(",") if name in SCENARIOS]
+
+    # El nivel va en el handler: algunos módulos suben su propio logger a DEBUG
+    handler = logging.StreamHandler()
+    handler.setLevel(logging.WARNING)
+    logging.basicConfig(level=logging.WARNING, handlers=[handler],
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    results = run_benchmarks(args)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(json.dumps(results["scenarios"], indent=2, ensure_ascii=False))
+    print(f"Resultados guardados en {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESIÓN {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
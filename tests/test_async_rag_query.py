@@ -0,0 +1,126 @@
+"""
+Tests para el sistema de consultas RAG asíncrono.
+"""
+
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+import httpx
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+
+class FakeAsyncOpenAI:
+    """Cliente AsyncOpenAI simulado con latencia configurable."""
+
+    def __init__(self, completion_delay=0.0):
+        self.completion_delay = completion_delay
+        self.embedding_calls = 0
+        self.embeddings = SimpleNamespace(create=self._create_embedding)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+
+    async def _create_embedding(self, input, model, timeout=None):
+        self.embedding_calls += 1
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[0.1, 0.2, 0.3])])
+
+    async def _create_completion(self, model, messages, temperature, timeout=None):
+        await asyncio.sleep(self.completion_delay)
+        message = SimpleNamespace(content="Respuesta simulada")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    async def close(self):
+        pass
+
+
+def build_http_client(requests):
+    """Crea un cliente httpx que simula PostgREST y guarda las rutas solicitadas."""
+    def handler(request):
+        requests.append(request.url.path)
+        if request.url.path.endswith("/rpc/match_documents"):
+            return httpx.Response(200, json=[{
+                "id": "doc1",
+                "content": "Contenido",
+                "metadata": {"name": "a.pdf", "file_id": "f1"},
+                "similarity": 0.9
+            }])
+        return httpx.Response(201)
+
+    return httpx.AsyncClient(base_url="https://example.supabase.co/rest/v1",
+                             transport=httpx.MockTransport(handler))
+
+
+class TestAsyncRAGQuerySystem(unittest.TestCase):
+    """Pruebas para AsyncRAGQuerySystem."""
+
+    def test_aquery_returns_answer_and_logs_query(self):
+        """Prueba el flujo completo y que la consulta se registra en segundo plano."""
+        from app.query.async_rag_query import AsyncRAGQuerySystem
+
+        requests = []
+        openai_client = FakeAsyncOpenAI()
+
+        async def run():
+            system = AsyncRAGQuerySystem(openai_client=openai_client, http_client=build_http_client(requests))
+            first = await system.aquery("¿Qué es RAG?")
+            await system.aquery("¿Qué es RAG?")
+            await system.aclose()
+            return first
+
+        result = asyncio.run(run())
+
+        self.assertTrue(result["success"])
+        self.assertEqual(result["answer"], "Respuesta simulada")
+        self.assertEqual(result["sources"][0]["chunk_id"], "doc1")
+        # El segundo embedding sale de la caché
+        self.assertEqual(openai_client.embedding_calls, 1)
+        self.assertEqual(requests.count("/rest/v1/queries"), 2)
+
+    def test_log_query_without_usage_column(self):
+        """Prueba que en bases de datos sin la columna 'usage' la consulta se registra sin ella."""
+        from app.query.async_rag_query import AsyncRAGQuerySystem
+
+        bodies = []
+
+        def handler(request):
+            bodies.append(request.read())
+            if b'"usage"' in request.content:
+                return httpx.Response(400, json={"code": "PGRST204",
+                                                 "message": "Could not find the 'usage' column of 'queries'"})
+            return httpx.Response(201)
+
+        async def run():
+            client = httpx.AsyncClient(base_url="https://example.supabase.co/rest/v1",
+                                       transport=httpx.MockTransport(handler))
+            system = AsyncRAGQuerySystem(openai_client=FakeAsyncOpenAI(), http_client=client)
+            await system._log_query("¿Qué es RAG?", "Respuesta", [], {"input_tokens": 10})
+            await system.aclose()
+
+        asyncio.run(run())
+
+        self.assertEqual(len(bodies), 2)
+        self.assertNotIn(b'"usage"', bodies[1])
+
+    def test_aquery_timeout_cancels_llm_call(self):
+        """Prueba que el plazo total cancela la llamada al LLM en curso."""
+        from app.query.async_rag_query import AsyncRAGQuerySystem
+
+        async def run():
+            system = AsyncRAGQuerySystem(openai_client=FakeAsyncOpenAI(completion_delay=5.0),
+                                         http_client=build_http_client([]))
+            result = await system.aquery("¿Qué es RAG?", timeout=0.2)
+            await system.aclose()
+            return result
+
+        result = asyncio.run(run())
+
+        self.assertFalse(result["success"])
+        self.assertTrue(result["timed_out"])
+
+
+if __name__ == "__main__":
+    unittest.main()
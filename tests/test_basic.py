@@ -260,6 +260,41 @@ class TestRAGQuerySystem(unittest.TestCase):
         self.assertEqual(result["answer"], "Respuesta de prueba")
         self.assertEqual(len(result["sources"]), 2)
 
+    @patch('app.query.rag_query.count_tokens', return_value=7)
+    @patch('app.query.rag_query.ChatOpenAI')
+    @patch('app.query.rag_query.ChatPromptTemplate')
+    @patch('app.query.rag_query.VectorDatabase')
+    @patch('app.query.rag_query.EmbeddingGenerator')
+    def test_query_stream_logs_usage(self, mock_embedding_generator, mock_vector_db, mock_prompt_template,
+                                     mock_chat_openai, mock_count_tokens):
+        """Prueba que la respuesta en streaming registra los tokens del LLM y su coste."""
+        mock_embedding_generator.return_value.generate_embedding.return_value = [0.1] * 1536
+        mock_db_instance = mock_vector_db.return_value
+        mock_db_instance.similarity_search.return_value = [
+            {"id": "doc1", "content": "Contenido", "metadata": {"source": "test1.pdf"}, "similarity": 0.9}
+        ]
+        mock_chain = mock_prompt_template.from_template.return_value.__or__.return_value
+        
+        from app.query.rag_query import RAGQuerySystem
+        rag_system = RAGQuerySystem(model_name="gpt-4o-mini")
+        
+        # La API informa del consumo en el último fragmento
+        mock_chain.stream.return_value = [
+            MagicMock(content="Respuesta ", usage_metadata=None),
+            MagicMock(content="", usage_metadata={"input_tokens": 1000, "output_tokens": 200})
+        ]
+        self.assertEqual("".join(rag_system.query_stream("¿Pregunta?")), "Respuesta ")
+        mock_chat_openai.return_value.bind.assert_called_with(stream_options={"include_usage": True})
+        usage = mock_db_instance.log_query.call_args[0][3]
+        self.assertEqual((usage["input_tokens"], usage["output_tokens"]), (1000, 200))
+        self.assertGreater(usage["cost"], 0)
+        
+        # Sin consumo en el flujo se cuentan los tokens del prompt y de la respuesta
+        mock_chain.stream.return_value = [MagicMock(content="Otra", usage_metadata=None)]
+        list(rag_system.query_stream("¿Otra pregunta?"))
+        usage = mock_db_instance.log_query.call_args[0][3]
+        self.assertEqual((usage["input_tokens"], usage["output_tokens"]), (7, 7))
+
 
 if __name__ == "__main__":
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,99 @@
+"""
+Tests para las consultas RAG por lotes.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+
+def build_rag_system():
+    """Crea un sistema RAG simulado con respuestas deterministas."""
+    rag_system = MagicMock()
+    rag_system.embedding_generator.generate_embeddings_batch.side_effect = (
+        lambda texts, batch_size=20: [[0.1] * 3 for _ in texts]
+    )
+    rag_system.vector_db.similarity_search.return_value = [
+        {"id": "doc1", "content": "Contenido", "metadata": {"name": "a.pdf"}, "similarity": 0.9}
+    ]
+    rag_system.generate_answer.side_effect = lambda question, results: f"Respuesta a {question}"
+    rag_system._extract_sources.return_value = [{"chunk_id": "doc1", "similarity": 0.9}]
+    return rag_system
+
+
+class TestBatchQueryRunner(unittest.TestCase):
+    """Pruebas para BatchQueryRunner."""
+
+    def setUp(self):
+        """Crea un archivo de salida temporal."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_path = os.path.join(self.temp_dir.name, "resultados.jsonl")
+
+    def tearDown(self):
+        """Elimina el directorio temporal."""
+        self.temp_dir.cleanup()
+
+    def test_run_writes_jsonl_and_batches_embeddings(self):
+        """Prueba que cada pregunta se escribe en JSONL y los embeddings se agrupan."""
+        from app.query.batch_query import BatchQueryRunner
+
+        rag_system = build_rag_system()
+        runner = BatchQueryRunner(rag_system, search_workers=4, llm_workers=2, embedding_batch_size=2)
+
+        summary = runner.run(["P1", "P2", "P3"], self.output_path)
+
+        # Tres preguntas en bloques de dos: dos llamadas de embeddings
+        self.assertEqual(rag_system.embedding_generator.generate_embeddings_batch.call_count, 2)
+        self.assertEqual(summary["succeeded"], 3)
+        self.assertEqual(summary["stages"]["llm"]["count"], 3)
+
+        with open(self.output_path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(sorted(r["answer"] for r in records),
+                         ["Respuesta a P1", "Respuesta a P2", "Respuesta a P3"])
+
+    def test_resume_skips_completed_questions(self):
+        """Prueba que la reanudación omite las preguntas ya respondidas con éxito."""
+        from app.query.batch_query import BatchQueryRunner
+
+        with open(self.output_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"id": "q1", "question": "P1", "success": True}) + "\n")
+            f.write(json.dumps({"id": "q2", "question": "P2", "success": False}) + "\n")
+            f.write('{"id": "q3", "quest')  # línea truncada por una interrupción
+
+        rag_system = build_rag_system()
+        runner = BatchQueryRunner(rag_system)
+        questions = [{"id": "q1", "question": "P1"}, {"id": "q2", "question": "P2"},
+                     {"id": "q3", "question": "P3"}]
+
+        summary = runner.run(questions, self.output_path)
+
+        self.assertEqual(summary["skipped"], 1)
+        self.assertEqual(summary["processed"], 2)
+        texts = rag_system.embedding_generator.generate_embeddings_batch.call_args[0][0]
+        self.assertEqual(texts, ["P2", "P3"])
+
+    def test_failed_embedding_is_recorded(self):
+        """Prueba que una pregunta sin embedding se registra como fallida sin llamar al LLM."""
+        from app.query.batch_query import BatchQueryRunner
+
+        rag_system = build_rag_system()
+        rag_system.embedding_generator.generate_embeddings_batch.side_effect = (
+            lambda texts, batch_size=20: [None for _ in texts]
+        )
+        summary = BatchQueryRunner(rag_system).run(["P1"], self.output_path)
+
+        self.assertEqual(summary["failed"], 1)
+        rag_system.generate_answer.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+"""
+Pruebas de los sustitutos sin conexión de las pruebas de rendimiento (benchmarks/).
+"""
+
+import json
+import os
+import sys
+import unittest
+
+import numpy as np
+
+# Añadir el directorio raíz al path para importar los módulos de la aplicación
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+from openai import OpenAI
+
+from benchmarks.fake_openai import FakeOpenAIServer, fake_embedding
+from benchmarks.fake_supabase import FakeSupabase
+from benchmarks.indexes import ExactIndex, Int8Index
+from benchmarks.retrieval import evaluate, labels_from_queries, pareto_front
+from benchmarks.load_test import summarize
+from benchmarks.run import compare_results
+
+
+class TestFakeSupabase(unittest.TestCase):
+    """Pruebas para la base de datos en memoria."""
+
+    def setUp(self):
+        self.db = FakeSupabase()
+        for i, text in enumerate(["contrato de servicio anual", "informe de riesgo técnico", "plan de calidad"]):
+            self.db.table("documents").insert({
+                "id": f"doc-{i}",
+                "content": text,
+                "metadata": json.dumps({"file_id": f"file-{i % 2}", "chunk_index": i}),
+                "embedding": fake_embedding(text).tolist(),
+                "file_id": f"file-{i % 2}"
+            }).execute()
+
+    def test_match_documents(self):
+        """La búsqueda devuelve primero el fragmento con más vocabulario en común."""
+        query = fake_embedding("riesgo técnico del informe").tolist()
+        result = self.db.rpc("match_documents", {"query_embedding": query, "match_threshold": 0.1,
+                                                 "match_count": 2}).execute()
+        self.assertEqual(result.data[0]["id"], "doc-1")
+        self.assertEqual(result.data[0]["metadata"]["file_id"], "file-1")
+
+    def test_filters_and_delete(self):
+        """Los filtros por metadatos y las eliminaciones se comportan como en postgrest."""
+        rows = self.db.table("documents").select("id").filter("metadata->>'file_id'", "eq", "file-0").execute().data
+        self.assertEqual(sorted(row["id"] for row in rows), ["doc-0", "doc-2"])
+        deleted = self.db.rpc("delete_chunks_by_file_id", {"file_id": "file-0"}).execute().data
+        self.assertEqual(deleted, 2)
+        self.assertEqual(len(self.db.table("documents").select("*").execute().data), 1)
+
+
+class TestFakeOpenAI(unittest.TestCase):
+    """Pruebas para el servidor que imita la API de OpenAI."""
+
+    def test_client_roundtrip(self):
+        """El cliente oficial recibe embeddings y respuestas con su consumo de tokens."""
+        with FakeOpenAIServer(embedding_latency=0, chat_latency=0, chat_latency_per_token=0) as server:
+            client = OpenAI(api_key="sk-test", base_url=server.url)
+            embedding = client.embeddings.create(model="text-embedding-3-small", input=["hola mundo"])
+            completion = client.chat.completions.create(model="gpt-4o-mini", max_tokens=10,
+                                                        messages=[{"role": "user", "content": "hola"}])
+
+        self.assertEqual(len(embedding.data[0].embedding), 1536)
+        self.assertAlmostEqual(embedding.data[0].embedding[0], float(fake_embedding("hola mundo")[0]), places=6)
+        self.assertEqual(completion.usage.completion_tokens, 10)
+        self.assertEqual(server.requests["chat"], 1)
+
+    def test_compare_results(self):
+        """Solo se informan los empeoramientos superiores a la tolerancia."""
+        baseline = {"scenarios": {"query": {"p95": 1.0, "throughput": 10.0}}}
+        current = {"scenarios": {"query": {"p95": 1.05, "throughput": 8.0}}}
+        regressions = compare_results(current, baseline, tolerance=0.1)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("query.throughput"))
+
+
+class TestLoadTest(unittest.TestCase):
+    """Pruebas para el resumen de las pruebas de carga."""
+
+    def test_summarize(self):
+        """Las tasas cuentan todas las solicitudes y los percentiles solo las correctas."""
+        results = [{"outcome": "ok", "latency": 0.1 * i, "query_steps": {"openai_call": 0.05 * i}} for i in range(1, 9)]
+        results += [{"outcome": "timeout", "latency": 30.0, "query_steps": {}},
+                    {"outcome": "rejected", "latency": 0.01, "query_steps": {}}]
+        summary = summarize(results, elapsed=2.0)
+
+        self.assertEqual(summary["throughput"], 4.0)
+        self.assertAlmostEqual(summary["timeout_rate"], 0.1)
+        self.assertAlmostEqual(summary["rejected_rate"], 0.1)
+        self.assertAlmostEqual(summary["max"], 0.8)
+        self.assertIn("openai_call", summary["query_steps"])
+
+
+class TestRetrievalBenchmark(unittest.TestCase):
+    """Pruebas para el benchmark de recuperación."""
+
+    def test_labels_and_metrics(self):
+        """Las etiquetas salen de las consultas valoradas y las métricas respetan top_k y el umbral."""
+        rows = [{"query": "¿plazo?", "user_feedback": 1, "sources": json.dumps([{"file_id": "a", "chunk_index": 1}])},
+                {"query": "¿precio?", "user_feedback": -1, "sources": [{"file_id": "b", "chunk_index": 0}]}]
+        labels = labels_from_queries(rows)
+        self.assertEqual(labels, [{"question": "¿plazo?", "relevant": ["a#1"]}])
+
+        chunks = [{"id": "a#0"}, {"id": "a#1"}, {"id": "b#0"}]
+        hits = [[(0, 0.9), (1, 0.8), (2, 0.05)]]
+        metrics = evaluate(hits, chunks, [{"a#1"}], [{"a"}], top_k=2, threshold=0.1)
+        self.assertEqual(metrics, {"recall": 1.0, "mrr": 0.5, "file_recall": 1.0, "file_mrr": 1.0})
+        self.assertEqual(evaluate(hits, chunks, [{"a#1"}], [{"a"}], top_k=1, threshold=0.1)["recall"], 0.0)
+
+    def test_int8_and_pareto(self):
+        """La cuantización conserva el orden de la búsqueda exacta y la frontera descarta las filas dominadas."""
+        texts = ["contrato de servicio anual", "informe de riesgo técnico", "plan de calidad del proyecto"]
+        vectors = np.stack([fake_embedding(text) for text in texts])
+        query = fake_embedding("riesgo del informe técnico")
+        exact = [index for index, _ in ExactIndex(vectors, texts).search(query, "", 3)]
+        quantized = [index for index, _ in Int8Index(vectors, texts).search(query, "", 3)]
+        self.assertEqual(exact[0], quantized[0])
+
+        rows = pareto_front([{"recall": 0.9, "p50_ms": 2.0}, {"recall": 0.8, "p50_ms": 1.0},
+                             {"recall": 0.7, "p50_ms": 1.5}], "recall")
+        self.assertEqual([row["pareto"] for row in rows], [True, True, False])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+"""
+Pruebas del script de limpieza de la base de datos.
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+# Añadir el directorio raíz al path para importar los módulos de la aplicación
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+from app.database.export import read_export
+from benchmarks.fake_supabase import FakeSupabase
+from utilities.clear_database import clear_table, create_backup, truncate_tables
+
+
+class TestClearDatabase(unittest.TestCase):
+    """Pruebas para las funciones de utilities/clear_database.py."""
+
+    def setUp(self):
+        self.db = FakeSupabase()
+        self.db.table("documents").insert([{"id": f"f_{i:02d}", "content": "texto", "embedding": [0.5, 1.0]}
+                                           for i in range(7)]).execute()
+        self.db.table("queries").insert([{"query": f"pregunta {i}"} for i in range(3)]).execute()
+
+    def test_backup_then_delete_in_batches(self):
+        """El backup se escribe comprimido por páginas y las filas se eliminan en lotes por id."""
+        with tempfile.TemporaryDirectory() as backup_path:
+            self.assertTrue(create_backup(self.db, ["documents", "queries"], backup_path))
+            self.assertEqual(len(list(read_export(backup_path, "documents"))), 7)
+            self.assertEqual(os.listdir(backup_path).count("queries.jsonl.gz"), 1)
+
+        round_trips = self.db.round_trips
+        self.assertTrue(clear_table(self.db, "documents", batch_size=3))
+        self.assertEqual(self.db.tables["documents"], [])
+        # Recuento, tres lotes (lectura de ids y DELETE) y la lectura final vacía
+        self.assertEqual(self.db.round_trips - round_trips, 8)
+
+    def test_truncate(self):
+        """TRUNCATE vacía todas las tablas en una llamada; sin la función se recurre a los lotes."""
+        self.assertTrue(truncate_tables(self.db, ["documents", "queries"]))
+        self.assertEqual((self.db.tables["documents"], self.db.tables["queries"]), ([], []))
+        del self.db.functions["truncate_tables"]
+        self.assertFalse(truncate_tables(self.db, ["documents"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
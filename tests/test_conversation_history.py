@@ -0,0 +1,134 @@
+"""
+Tests para la compactación del historial de conversación de la API web.
+"""
+
+import sys
+import threading
+import unittest
+from pathlib import Path
+
+# Agregar el directorio raíz y la carpeta de la API web al path
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+sys.path.append(str(root_dir / "web" / "api"))
+
+from _conversation import HistoryCompactor, QueryRewriter, looks_standalone
+
+
+def build_history(turns):
+    """Crea un historial de preguntas y respuestas largas."""
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Pregunta {i} " + "x" * 400})
+        history.append({"role": "assistant", "content": f"Respuesta {i} " + "y" * 400})
+    return history
+
+
+class TestHistoryCompactor(unittest.TestCase):
+    """Pruebas para HistoryCompactor."""
+
+    def setUp(self):
+        """Crea un compactador con un resumidor que registra sus llamadas."""
+        self.calls = []
+
+        def summarize(previous, messages):
+            self.calls.append((previous, len(messages)))
+            return f"resumen de {len(messages)} mensajes tras '{previous}'"
+
+        self.compactor = HistoryCompactor(summarize, max_tokens=600, keep_last_turns=2)
+
+    def test_short_history_is_kept_verbatim(self):
+        """Prueba que un historial dentro del presupuesto no se resume."""
+        text = self.compactor.compact([{"role": "user", "content": "Hola"}])
+
+        self.assertEqual(text, "User: Hola\n\n")
+        self.assertEqual(self.calls, [])
+
+    def test_long_history_keeps_last_turns_and_summarizes_rest(self):
+        """Prueba que los turnos antiguos se resumen y los recientes se mantienen literales."""
+        text = self.compactor.compact(build_history(6))
+
+        self.assertTrue(text.startswith("Resumen de la conversación anterior:"))
+        self.assertIn("Pregunta 5", text)
+        self.assertNotIn("Pregunta 0", text)
+        self.assertLessEqual(len(text) // 4, 600)
+
+    def test_summary_is_rolled_forward_and_cached(self):
+        """Prueba que cada turno nuevo solo resume los mensajes que acaban de envejecer."""
+        history = build_history(6)
+        self.compactor.compact(history)
+        self.compactor.compact(history)
+        self.assertEqual(len(self.calls), 1)
+
+        history += build_history(1)
+        self.compactor.compact(history)
+
+        self.assertEqual(len(self.calls), 2)
+        previous, new_messages = self.calls[1]
+        self.assertTrue(previous.startswith("resumen de"))
+        self.assertEqual(new_messages, 2)
+
+    def test_slow_summary_is_not_awaited_past_the_budget(self):
+        """Prueba que sin presupuesto se usa el resumen anterior y el nuevo queda listo para el turno siguiente."""
+        history = build_history(6)
+        self.compactor.compact(history)
+        release = threading.Event()
+        summarize = self.compactor.summarize
+
+        def slow_summarize(previous, messages):
+            release.wait(5)
+            return summarize(previous, messages)
+
+        self.compactor.summarize = slow_summarize
+        history += build_history(1)
+        text = self.compactor.compact(history, timeout=0)
+
+        self.assertIn("resumen de 8 mensajes", text)
+        self.assertIn("Respuesta 4", text)
+        self.assertLessEqual(len(text) // 4, 600)
+        release.set()
+        self.compactor._executor.shutdown(wait=True)
+        self.assertEqual(len(self.calls), 2)
+        self.assertIn("resumen de 2 mensajes", self.compactor.compact(history, timeout=0))
+        self.assertEqual(len(self.calls), 2)
+
+
+class TestQueryRewriter(unittest.TestCase):
+    """Pruebas para la reescritura de preguntas de seguimiento."""
+
+    HISTORY = [
+        {"role": "user", "content": "¿Cuáles son los requisitos de la beca?"},
+        {"role": "assistant", "content": "1. Matrícula activa. 2. Promedio mínimo de 8."}
+    ]
+
+    def test_heuristic_detects_follow_ups(self):
+        """Prueba que la heurística distingue preguntas autónomas de seguimientos."""
+        self.assertFalse(looks_standalone("¿y el segundo punto?", self.HISTORY))
+        self.assertFalse(looks_standalone("¿Lo puedes resumir en una frase?", self.HISTORY))
+        self.assertTrue(looks_standalone("¿Qué documentos necesito para la inscripción?", self.HISTORY))
+        self.assertTrue(looks_standalone("¿y el segundo punto?", []))
+
+    def test_rewrites_are_cached_and_standalone_questions_skipped(self):
+        """Prueba que cada seguimiento se reescribe una sola vez y las preguntas autónomas no llaman al modelo."""
+        calls = []
+
+        def rewrite(history_text, question, timeout=None):
+            calls.append(question)
+            return "promedio mínimo requerido para la beca"
+
+        rewriter = QueryRewriter(rewrite)
+
+        self.assertEqual(rewriter.rewrite("¿y el segundo punto?", self.HISTORY),
+                         ("promedio mínimo requerido para la beca", True))
+        self.assertEqual(rewriter.rewrite("¿y el segundo punto?", self.HISTORY)[1], True)
+        self.assertEqual(rewriter.rewrite("¿Qué documentos necesito para la inscripción?", self.HISTORY),
+                         ("¿Qué documentos necesito para la inscripción?", False))
+        self.assertEqual(calls, ["¿y el segundo punto?"])
+
+        # Sin tiempo para llamar al modelo se busca con la pregunta original
+        self.assertEqual(rewriter.rewrite("¿y el primero?", self.HISTORY, allow_model_call=False),
+                         ("¿y el primero?", False))
+
+
+if __name__ == "__main__":
+    unittest.main()
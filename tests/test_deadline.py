@@ -0,0 +1,115 @@
+"""
+Tests para el plazo de las consultas web y sus presupuestos por etapa.
+"""
+
+import sys
+import unittest
+from unittest import mock
+from pathlib import Path
+
+# Agregar el directorio raíz y la carpeta de la API web al path
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+sys.path.append(str(root_dir / "web" / "api"))
+
+from _deadline import Deadline
+
+
+class FakeClock:
+    """Reloj manual para controlar el paso del tiempo."""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestDeadline(unittest.TestCase):
+    """Pruebas para Deadline."""
+
+    def test_full_budget_is_not_degraded(self):
+        """Prueba que con todo el tiempo disponible las etapas reciben su presupuesto nominal."""
+        deadline = Deadline(15.0, 15.0, clock=FakeClock())
+
+        embedding = deadline.stage("embedding")
+        llm = deadline.stage("llm")
+
+        self.assertAlmostEqual(embedding.timeout, 2.25)
+        self.assertFalse(embedding.degraded)
+        # La última etapa recibe todo el tiempo restante
+        self.assertAlmostEqual(llm.timeout, 15.0)
+        self.assertFalse(deadline.stages["llm"]["degraded"])
+
+    def test_late_stages_are_degraded_and_reserve_time(self):
+        """Prueba que un plazo consumido degrada las etapas y reserva el mínimo de las siguientes."""
+        clock = FakeClock()
+        deadline = Deadline(15.0, 15.0, clock=clock)
+
+        clock.now += 11.0
+        search = deadline.stage("search")
+        self.assertTrue(search.degraded)
+        # Quedan 4s y se reservan 2s para el LLM
+        self.assertAlmostEqual(search.timeout, 2.0)
+
+        clock.now += 2.5
+        llm = deadline.stage("llm")
+        self.assertTrue(llm.degraded)
+        self.assertFalse(llm.sufficient)
+
+    def test_embedding_falls_back_to_equivalent_cached_query(self):
+        """Prueba que con presupuesto degradado se usa el embedding de una consulta equivalente."""
+        import query
+
+        query.EMBEDDING_CACHE.set(query.embedding_cache_key("¿Qué es  RAG?"), [0.5, 0.5])
+        self.addCleanup(query.EMBEDDING_CACHE.clear)
+
+        clock = FakeClock()
+        deadline = Deadline(15.0, 15.0, clock=clock)
+        clock.now += 14.8
+        stage = deadline.stage("embedding")
+
+        self.assertEqual(query.get_embedding_within("¿qué es rag?", stage), [0.5, 0.5])
+        self.assertIsNone(query.get_embedding_within("otra pregunta", stage))
+
+    def test_embedding_cache_is_bounded(self):
+        """Prueba que la caché de embeddings descarta las preguntas menos usadas al llenarse."""
+        import query
+
+        self.addCleanup(query.EMBEDDING_CACHE.clear)
+        with mock.patch.object(query.EMBEDDING_CACHE, "max_size", 2):
+            query.EMBEDDING_CACHE.set(query.embedding_cache_key("primera"), [1.0])
+            query.EMBEDDING_CACHE.set(query.embedding_cache_key("segunda"), [2.0])
+            self.assertEqual(query.find_cached_embedding(" PRIMERA "), [1.0])
+            query.EMBEDDING_CACHE.set(query.embedding_cache_key("tercera"), [3.0])
+
+        self.assertEqual(len(query.EMBEDDING_CACHE), 2)
+        self.assertIsNone(query.find_cached_embedding("segunda"))
+        self.assertEqual(query.find_cached_embedding("Primera"), [1.0])
+
+    def test_follow_up_is_rewritten_at_default_budget(self):
+        """Prueba que con MAX_RESPONSE_TIME por defecto se llama al modelo con el presupuesto de la etapa."""
+        import query
+        from _conversation import QueryRewriter
+
+        calls = []
+
+        def rewrite(history_text, question, timeout=None):
+            calls.append(timeout)
+            return "promedio mínimo de la beca"
+
+        original = query.QUERY_REWRITER
+        query.QUERY_REWRITER = QueryRewriter(rewrite)
+        self.addCleanup(setattr, query, "QUERY_REWRITER", original)
+
+        history = [{"role": "user", "content": "¿Requisitos de la beca?"},
+                   {"role": "assistant", "content": "1. Matrícula. 2. Promedio de 8."}]
+        stage = Deadline(query.MAX_RESPONSE_TIME, query.MAX_RESPONSE_TIME, clock=FakeClock()).stage("rewrite")
+
+        self.assertEqual(query.rewrite_search_query("¿y el segundo punto?", history, stage),
+                         ("promedio mínimo de la beca", True))
+        self.assertEqual(calls, [stage.timeout])
+
+
+if __name__ == "__main__":
+    unittest.main()
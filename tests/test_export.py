@@ -0,0 +1,93 @@
+"""
+Pruebas de la exportación por páginas de las tablas.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+# Añadir el directorio raíz al path para importar los módulos de la aplicación
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+from app.database.bulk_import import import_export
+from app.database.export import export_tables, iter_pages, read_embedding_shards, read_export
+from benchmarks.fake_supabase import FakeSupabase
+
+
+class TestExport(unittest.TestCase):
+    """Pruebas para export_tables."""
+
+    def setUp(self):
+        self.db = FakeSupabase()
+        self.db.table("files").insert([{"id": f"f{i}", "name": f"{i}.pdf"} for i in range(3)]).execute()
+        self.db.table("documents").insert([
+            {"id": f"f0_{i:02d}", "content": f"texto {i}", "metadata": {"file_id": "f0", "chunk_index": i},
+             "file_id": "f0", "embedding": json.dumps([i / 4, -1.0, 0.5])}
+            for i in range(10)
+        ]).execute()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_pages_follow_the_key(self):
+        """Cada página continúa tras el último id y el recorrido acaba con una página vacía."""
+        round_trips = self.db.round_trips
+        pages = list(iter_pages(self.db, "documents", "id", page_size=4))
+        self.assertEqual([len(page) for page in pages], [4, 4, 2])
+        self.assertEqual([row["id"] for row in pages[1]], ["f0_04", "f0_05", "f0_06", "f0_07"])
+        self.assertEqual(self.db.round_trips - round_trips, 4)
+
+    def test_resume_binary_jsonl(self):
+        """Una exportación interrumpida se reanuda desde el último id sin duplicar filas."""
+        output = os.path.join(self.tmp.name, "export")
+
+        def interrupt(table, rows):
+            if table == "documents" and rows >= 6:
+                raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            export_tables(self.db, ["files", "documents"], output, embeddings="binary", page_size=3,
+                          compress=True, progress=interrupt)
+        counts = export_tables(self.db, ["files", "documents"], output, embeddings="binary", page_size=3,
+                               compress=True, resume=True)
+        self.assertEqual(counts, {"files": 3, "documents": 10})
+
+        rows = list(read_export(output, "documents"))
+        self.assertEqual([row["id"] for row in rows], [f"f0_{i:02d}" for i in range(10)])
+        self.assertEqual(rows[3]["embedding"], [0.75, -1.0, 0.5])
+
+    def test_json_without_embeddings(self):
+        """El formato JSON histórico se escribe por páginas y puede omitir los embeddings."""
+        output = os.path.join(self.tmp.name, "export.json")
+        export_tables(self.db, ["queries", "documents"], output, fmt="json", embeddings="exclude", page_size=4)
+        with open(output, encoding="utf-8") as f:
+            data = json.load(f)
+        self.assertEqual(data["queries"], [])
+        self.assertEqual(len(data["documents"]), 10)
+        self.assertNotIn("embedding", data["documents"][0])
+        self.assertEqual(data["documents"][0]["metadata"], {"file_id": "f0", "chunk_index": 0})
+
+    def test_npy_shards_and_import(self):
+        """Los embeddings se guardan en matrices con su índice de ids y la exportación se vuelve a importar."""
+        self.db.table("documents").insert({"id": "f0_99", "content": "sin embedding", "file_id": "f0"}).execute()
+        output = os.path.join(self.tmp.name, "export")
+        export_tables(self.db, ["files", "documents"], output, fmt="npy", dtype="float16", page_size=3,
+                      rows_per_file=4)
+
+        shards = list(read_embedding_shards(output))
+        self.assertEqual([len(ids) for ids, _ in shards], [6, 4])
+        self.assertEqual((str(shards[0][1].dtype), shards[0][1].shape), ("float16", (6, 3)))
+        self.assertEqual(shards[1][0][0], "f0_06")
+
+        clone = FakeSupabase()
+        counts = import_export(output, client=clone, batch_size=4)
+        self.assertEqual(counts, {"files": 3, "documents": 11})
+        rows = {row["id"]: row for row in clone.tables["documents"]}
+        self.assertEqual(rows["f0_05"]["embedding"], [1.25, -1.0, 0.5])
+        self.assertNotIn("embedding", rows["f0_99"])
+
+
+if __name__ == "__main__":
+    unittest.main()
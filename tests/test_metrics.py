@@ -0,0 +1,61 @@
+"""
+Tests para las métricas exportadas en formato OpenMetrics.
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+from app.utils.metrics import MetricsRegistry, STAGE_DURATION
+from app.utils.performance_metrics import PerformanceTracker
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    """Pruebas para MetricsRegistry."""
+
+    def test_render_openmetrics_text(self):
+        """Prueba el formato de contadores e histogramas con etiquetas."""
+        registry = MetricsRegistry()
+        requests = registry.counter("requests", "Solicitudes.", ("route",))
+        latency = registry.histogram("latency_seconds", "Latencia.", ("route",), buckets=[0.1, 1.0])
+
+        requests.inc(route="/api/query")
+        requests.inc(2, route="/api/query")
+        latency.observe(0.05, route="/api/query")
+        latency.observe(0.5, route="/api/query")
+
+        text = registry.render()
+
+        self.assertIn("# TYPE requests counter", text)
+        self.assertIn('requests_total{route="/api/query"} 3.0', text)
+        self.assertIn('latency_seconds_bucket{route="/api/query",le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{route="/api/query",le="+Inf"} 2', text)
+        self.assertIn('latency_seconds_count{route="/api/query"} 2', text)
+        self.assertTrue(text.endswith("# EOF\n"))
+
+    def test_labels_must_match(self):
+        """Prueba que una observación sin las etiquetas declaradas se rechaza."""
+        registry = MetricsRegistry()
+        counter = registry.counter("requests", "Solicitudes.", ("route",))
+
+        with self.assertRaises(ValueError):
+            counter.inc(model="gpt")
+
+    def test_tracker_exports_stage_histograms(self):
+        """Prueba que track_query alimenta los histogramas de etapas sin límite de muestras."""
+        tracker = PerformanceTracker()
+        for _ in range(150):
+            tracker.track_query(0.4, 0.1, 0.05, 0.25, model="modelo-prueba", route="prueba")
+
+        snapshot = STAGE_DURATION.labels(stage="llm", model="modelo-prueba", route="prueba").snapshot()
+        self.assertEqual(snapshot["count"], 150)
+        tracker.flush()
+        self.assertEqual(len(tracker.metrics["llm_response"]), 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+Tests para la agregación de métricas entre hilos y procesos.
+"""
+
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+from app.utils.metrics_collector import MetricsCollector, MetricsReporter, parse_address
+from app.utils.performance_metrics import PerformanceTracker
+
+
+class TestThreadBuffers(unittest.TestCase):
+    """Pruebas para los buffers por hilo de PerformanceTracker."""
+
+    def test_concurrent_threads_lose_no_measurements(self):
+        tracker = PerformanceTracker()
+
+        def work():
+            for _ in range(1000):
+                tracker.track_stage("similarity_search", 0.01)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = tracker.get_performance_stats()["similarity_search"]
+        self.assertEqual(stats["total_count"], 8000)
+        self.assertEqual(stats["count"], 100)
+
+
+class TestMetricsCollector(unittest.TestCase):
+    """Pruebas para MetricsCollector y MetricsReporter."""
+
+    def setUp(self):
+        self.collector = MetricsCollector(("127.0.0.1", 0))
+        self.address = self.collector.start()
+
+    def tearDown(self):
+        self.collector.stop()
+
+    def wait_for_workers(self, count):
+        for _ in range(100):
+            if len(self.collector.states) >= count:
+                return
+            time.sleep(0.02)
+        self.fail("El colector no recibió los estados")
+
+    def test_merges_workers_without_double_counting(self):
+        trackers = [PerformanceTracker(), PerformanceTracker()]
+        for index, tracker in enumerate(trackers):
+            for _ in range(10):
+                tracker.track_query(1.0, 0.1, 0.2, 0.7 + index)
+
+        reporters = [MetricsReporter(self.address, tracker, worker=f"worker-{index}")
+                     for index, tracker in enumerate(trackers)]
+        for reporter in reporters:
+            # Los envíos repetidos sustituyen el estado anterior del trabajador
+            reporter.report()
+            reporter.report()
+        self.wait_for_workers(2)
+        time.sleep(0.05)
+
+        stats = self.collector.get_performance_stats()
+        self.assertEqual(stats["total_queries"], 20)
+        self.assertEqual(stats["llm_response"]["total_count"], 20)
+        self.assertEqual(sorted(stats["workers"]), ["worker-0", "worker-1"])
+        for reporter in reporters:
+            reporter._close()
+
+    def test_merged_window_covers_every_worker(self):
+        trackers = [PerformanceTracker(), PerformanceTracker()]
+        for seconds, tracker in zip((1.0, 3.0), trackers):
+            for _ in range(150):
+                tracker.track_stage("llm_response", seconds)
+
+        merged = PerformanceTracker()
+        for tracker in trackers:
+            merged.merge_state(tracker.export_state())
+
+        stats = merged.get_performance_stats()["llm_response"]
+        self.assertEqual((stats["count"], stats["total_count"]), (200, 300))
+        self.assertEqual((stats["min"], stats["avg"], stats["max"]), (1.0, 2.0, 3.0))
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address("10.0.0.1:9000"), ("10.0.0.1", 9000))
+        self.assertEqual(parse_address("9000"), ("127.0.0.1", 9000))
+
+
+if __name__ == "__main__":
+    unittest.main()
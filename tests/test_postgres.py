@@ -0,0 +1,153 @@
+"""
+Pruebas de la carga masiva con COPY y de la escritura por lotes de fragmentos.
+"""
+
+import os
+import struct
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+from psycopg2 import sql
+
+# Añadir el directorio raíz al path para importar los módulos de la aplicación
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+from app.database import vector_store
+from app.database.postgres import binary_copy, copy_line, copy_rows
+from app.database.vector_store import VectorDatabase
+from benchmarks.fake_supabase import FakeSupabase
+
+
+class TestCopyFormats(unittest.TestCase):
+    """Pruebas para los formatos de COPY."""
+
+    def test_copy_line(self):
+        """Las líneas de COPY escapan tabuladores y saltos de línea y escriben los vectores como [x,y]."""
+        line = copy_line({"id": "a", "content": "uno\tdos\n", "metadata": {"p": 1}, "embedding": [0.5, 1.0]},
+                         ["id", "content", "metadata", "embedding", "file_id"])
+        self.assertEqual(line, 'a\tuno\\tdos\\n\t{"p":1}\t[0.5,1.0]\t\\N\n')
+
+    def test_binary_copy(self):
+        """El formato binario lleva la cabecera PGCOPY, jsonb con versión y vectores como float4 big-endian."""
+        rows = [{"id": "a", "metadata": {"p": 1}, "embedding": [0.5, -2.0], "created_at": "2000-01-01T00:00:01+00:00"},
+                {"id": "b"}]
+        data = b"".join(binary_copy(rows, ["id", "metadata", "embedding", "created_at"],
+                                    ["text", "jsonb", "vector", "timestamptz"]))
+        self.assertTrue(data.startswith(b"PGCOPY\n\xff\r\n\x00" + bytes(8)))
+        first = struct.pack(">h", 4) + struct.pack(">i", 1) + b"a" + struct.pack(">i", 8) + b'\x01{"p":1}'
+        first += struct.pack(">i", 12) + struct.pack(">hhff", 2, 0, 0.5, -2.0)
+        first += struct.pack(">iq", 8, 1000000)
+        second = struct.pack(">h", 4) + struct.pack(">i", 1) + b"b" + struct.pack(">i", -1) * 3
+        self.assertEqual(data[19:], first + second + struct.pack(">h", -1))
+
+
+def render(query):
+    """Texto de una consulta de psycopg2.sql sin conexión (los identificadores entre comillas dobles)."""
+    if isinstance(query, sql.Composed):
+        return "".join(render(part) for part in query.seq)
+    if isinstance(query, sql.Identifier):
+        return ".".join(f'"{name}"' for name in query.strings)
+    if isinstance(query, sql.SQL):
+        return query.string
+    return query
+
+
+class TestCopyRows(unittest.TestCase):
+    """Pruebas de las sentencias de copy_rows con un cursor simulado."""
+
+    def run_copy(self, columns, types, sequence):
+        """Ejecuta copy_rows y devuelve las sentencias, sus parámetros y los datos enviados con COPY."""
+        conn = MagicMock()
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = list(types.items())
+        cursor.fetchone.return_value = (sequence,)
+        cursor.rowcount = 2
+        copied = []
+        cursor.copy_expert.side_effect = lambda query, stream: copied.append((render(query), stream.read()))
+
+        rows = [{"id": 1, "query": "¿plazo?"}, {"id": 2, "query": "¿requisitos?"}]
+        self.assertEqual(copy_rows(conn, "queries", columns, rows), 2)
+        conn.__enter__.assert_called_once()
+        statements = [(render(call.args[0]), call.args[1] if len(call.args) > 1 else None)
+                      for call in cursor.execute.call_args_list]
+        return statements, copied
+
+    def test_staging_merge_and_sequence(self):
+        """COPY binario a la tabla temporal, INSERT ... ON CONFLICT DO UPDATE y setval de la secuencia."""
+        statements, copied = self.run_copy(["id", "query"], {"id": "int4", "query": "text"}, "public.queries_id_seq")
+
+        self.assertEqual(statements[0], ('CREATE TEMP TABLE "queries_staging" (LIKE "queries" INCLUDING DEFAULTS) '
+                                         'ON COMMIT DROP', None))
+        self.assertEqual(statements[1][1], ("queries",))
+        self.assertEqual(copied[0][0], 'COPY "queries_staging" ("id", "query") FROM STDIN WITH (FORMAT binary)')
+        self.assertTrue(copied[0][1].startswith(b"PGCOPY\n\xff\r\n\x00"))
+        self.assertEqual(statements[2:], [
+            ('INSERT INTO "queries" ("id", "query") SELECT "id", "query" FROM "queries_staging" '
+             'ON CONFLICT ("id") DO UPDATE SET "query" = EXCLUDED."query"', None),
+            ("SELECT pg_get_serial_sequence(%s, %s)", ("queries", "id")),
+            ('SELECT setval(%s, GREATEST((SELECT MAX("id") FROM "queries"), 1))', ("public.queries_id_seq",))
+        ])
+
+    def test_key_only_does_nothing_on_conflict(self):
+        """Solo con la clave, los conflictos se ignoran; sin secuencia no se llama a setval."""
+        statements, copied = self.run_copy(["id"], {"id": "int4"}, None)
+
+        self.assertEqual(statements[2][0], 'INSERT INTO "queries" ("id") SELECT "id" FROM "queries_staging" '
+                                           'ON CONFLICT ("id") DO NOTHING')
+        # CREATE, tipos de columna (una sola consulta), INSERT y secuencia
+        self.assertEqual(len(statements), 4)
+
+
+class TestAddDocuments(unittest.TestCase):
+    """Pruebas para VectorDatabase.add_documents."""
+
+    @patch("app.database.vector_store.SUPABASE_DB_URL", None)
+    def test_batched_upserts(self):
+        """Sin conexión directa, los fragmentos se guardan en un upsert por lote y el archivo se registra una vez."""
+        db = FakeSupabase()
+        vector_db = VectorDatabase.__new__(VectorDatabase)
+        vector_db.collection_name = db.collection_name
+        vector_db.supabase = db
+        documents = [{"id": f"f_{i}", "content": "texto", "metadata": {"file_id": "f", "name": "f.pdf", "chunk_index": i},
+                      "embedding": [0.1, 0.2]} for i in range(3)]
+
+        self.assertEqual(vector_db.add_documents(documents), 3)
+        # Un upsert y la consulta e inserción del registro del archivo
+        self.assertEqual(db.round_trips, 3)
+        self.assertEqual([row["file_id"] for row in db.tables["documents"]], ["f"] * 3)
+        self.assertEqual(db.tables["files"][0]["name"], "f.pdf")
+
+        documents[0]["content"] = "nuevo"
+        vector_db.add_documents(documents[:1])
+        self.assertEqual(len(db.tables["documents"]), 3)
+        self.assertEqual(db.tables["documents"][0]["content"], "nuevo")
+
+    @patch("app.database.vector_store.SUPABASE_DB_URL", None)
+    @patch("app.database.vector_store.WRITE_BATCH_SIZE", 2)
+    def test_failed_batch_returns_committed_rows(self):
+        """Si falla un lote, se devuelven los fragmentos de los lotes ya confirmados y el archivo no se registra."""
+        db = FakeSupabase()
+        vector_db = VectorDatabase.__new__(VectorDatabase)
+        vector_db.collection_name = db.collection_name
+        vector_db.supabase = db
+        documents = [{"id": f"f_{i}", "content": "texto", "metadata": {"file_id": "f", "chunk_index": i},
+                      "embedding": [0.1, 0.2]} for i in range(5)]
+        upsert = db.table("documents").upsert
+        calls = []
+
+        def failing_upsert(rows):
+            calls.append(rows)
+            if len(calls) == 2:
+                raise RuntimeError("413 Payload Too Large")
+            return upsert(rows)
+
+        with patch.object(db, "table", return_value=MagicMock(upsert=failing_upsert)):
+            self.assertEqual(vector_db.add_documents(documents), 2)
+        self.assertEqual(len(db.tables["documents"]), 2)
+        self.assertEqual(db.tables["files"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+Pruebas del profiler por muestreo.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+# Añadir el directorio raíz al path para importar los módulos de la aplicación
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+from app.utils.profiler import SamplingProfiler, idle, profile_path
+
+
+def busy_loop(seconds):
+    """Consume CPU durante el tiempo indicado."""
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += sum(range(100))
+    return total
+
+
+class TestSamplingProfiler(unittest.TestCase):
+    """Pruebas para SamplingProfiler."""
+
+    def test_profile_formats(self):
+        """El perfil contiene la función activa en ambos formatos."""
+        profiler = SamplingProfiler(interval=0.005)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            collapsed_path = os.path.join(temp_dir, "perfil.collapsed")
+            with profiler.profile(collapsed_path):
+                busy_loop(0.3)
+            with open(collapsed_path) as f:
+                self.assertIn("test_profiler.py:busy_loop", f.read())
+
+            json_path = os.path.join(temp_dir, "perfil.json")
+            profiler.write(json_path)
+            with open(json_path) as f:
+                data = json.load(f)
+
+        profile = data["profiles"][0]
+        self.assertEqual(profile["type"], "sampled")
+        self.assertEqual(len(profile["samples"]), len(profile["weights"]))
+        names = {frame["name"] for frame in data["shared"]["frames"]}
+        self.assertIn("busy_loop", names)
+        self.assertGreater(profiler.sample_count, 10)
+        self.assertLess(profiler.overhead(), 0.05)
+
+    def test_idle_threads_are_skipped_and_written_periodically(self):
+        """Los hilos en espera no aparecen y el perfil se escribe por periodos."""
+        release = threading.Event()
+        idle = threading.Thread(target=release.wait)
+        idle.start()
+        self.addCleanup(idle.join)
+        self.addCleanup(release.set)
+
+        profiler = SamplingProfiler(interval=0.005)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            paths = iter(os.path.join(temp_dir, f"perfil-{i}.collapsed") for i in range(100))
+            profiler.start()
+            profiler.write_every(0.1, lambda: next(paths))
+            busy_loop(0.35)
+            profiler.stop()
+            written = sorted(os.listdir(temp_dir))
+            with open(os.path.join(temp_dir, written[0])) as f:
+                profile = f.read()
+
+        self.assertGreaterEqual(len(written), 2)
+        self.assertIn("busy_loop", profile)
+        self.assertNotIn("threading.py:wait", profile)
+
+    def test_marked_waits_are_skipped(self):
+        """El tiempo dentro de idle() (p. ej. input() en el chat) no entra en el perfil."""
+        def wait_for_user():
+            busy_loop(0.3)
+
+        profiler = SamplingProfiler(interval=0.005)
+        profiler.start()
+        with idle():
+            wait_for_user()
+        busy_loop(0.2)
+        profiler.stop()
+
+        profile = profiler.collapsed()
+        self.assertNotIn("wait_for_user", profile)
+        self.assertIn("busy_loop", profile)
+
+    def test_profile_path(self):
+        """Cada ejecución obtiene su propio archivo."""
+        path = profile_path("perfiles/rag.json", "process")
+        self.assertTrue(path.startswith("perfiles/rag-process-"))
+        self.assertTrue(path.endswith(".json"))
+        self.assertTrue(profile_path("rag", "chat").endswith(".collapsed"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+"""
+Tests para la agrupación de solicitudes idénticas en curso.
+"""
+
+import sys
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+from app.utils.single_flight import SingleFlight, make_key
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Pruebas para SingleFlight."""
+
+    def test_make_key_normalizes_text(self):
+        """Prueba que la clave ignora mayúsculas y espacios pero no los parámetros."""
+        self.assertEqual(make_key("  ¿Qué es  RAG? ", top_k=5), make_key("¿qué es rag?", top_k=5))
+        self.assertNotEqual(make_key("¿Qué es RAG?", top_k=5), make_key("¿Qué es RAG?", top_k=3))
+
+    def test_concurrent_calls_share_one_computation(self):
+        """Prueba que las llamadas simultáneas con la misma clave ejecutan la función una vez."""
+        flights = SingleFlight()
+        calls = []
+        started = threading.Event()
+
+        def compute():
+            calls.append(1)
+            started.set()
+            time.sleep(0.2)
+            return {"answer": 42}
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            leader = executor.submit(flights.do, "k", compute)
+            started.wait(1)
+            followers = [executor.submit(flights.do, "k", compute) for _ in range(4)]
+            results = [leader.result()] + [f.result() for f in followers]
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([shared for _, shared in results], [False, True, True, True, True])
+        self.assertTrue(all(result == {"answer": 42} for result, _ in results))
+
+    def test_late_stream_consumer_receives_all_chunks(self):
+        """Prueba que un consumidor que se une a mitad del flujo recibe todos los fragmentos."""
+        flights = SingleFlight()
+        first_chunk_sent = threading.Event()
+        resume = threading.Event()
+
+        def producer():
+            yield "Hola"
+            first_chunk_sent.set()
+            resume.wait(1)
+            yield " mundo"
+
+        first = flights.stream("k", producer)
+        self.assertEqual(next(first), "Hola")
+        first_chunk_sent.wait(1)
+
+        late = flights.stream("k", producer)
+        resume.set()
+
+        self.assertEqual("Hola" + "".join(first), "Hola mundo")
+        self.assertEqual("".join(late), "Hola mundo")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+Tests para el buffer circular y el sketch de cuantiles.
+"""
+
+import random
+import sys
+import unittest
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+from app.utils.performance_metrics import PerformanceTracker
+from app.utils.sketches import DDSketch, RingBuffer
+
+
+class TestRingBuffer(unittest.TestCase):
+    """Pruebas para RingBuffer."""
+
+    def test_keeps_latest_values_in_order(self):
+        buffer = RingBuffer(3)
+        for value in range(5):
+            buffer.append(value)
+
+        self.assertEqual(buffer.values(), [2.0, 3.0, 4.0])
+        self.assertEqual(buffer.latest(), 4.0)
+        self.assertEqual(len(buffer), 3)
+
+    def test_round_trip(self):
+        buffer = RingBuffer(4)
+        buffer.append(1.5)
+        restored = RingBuffer.from_dict(buffer.to_dict())
+        self.assertEqual(restored.values(), [1.5])
+
+
+class TestDDSketch(unittest.TestCase):
+    """Pruebas para DDSketch."""
+
+    def test_quantiles_within_relative_accuracy(self):
+        rng = random.Random(7)
+        values = sorted(rng.lognormvariate(0, 1) for _ in range(5000))
+        sketch = DDSketch(relative_accuracy=0.01)
+        for value in values:
+            sketch.add(value)
+
+        for q in (0.5, 0.9, 0.99):
+            exact = values[int(q * (len(values) - 1))]
+            self.assertAlmostEqual(sketch.quantile(q) / exact, 1.0, delta=0.011)
+
+    def test_merge_equals_single_sketch(self):
+        values = [0.01 * i for i in range(1, 1000)]
+        whole, left, right = DDSketch(), DDSketch(), DDSketch()
+        for index, value in enumerate(values):
+            whole.add(value)
+            (left if index % 2 else right).add(value)
+
+        left.merge(DDSketch.from_dict(right.to_dict()))
+        for q in (0.5, 0.95, 0.99):
+            self.assertEqual(left.quantile(q), whole.quantile(q))
+        self.assertEqual(left.count, whole.count)
+
+    def test_merge_rejects_different_accuracy(self):
+        with self.assertRaises(ValueError):
+            DDSketch(0.01).merge(DDSketch(0.02))
+
+
+class TestTrackerState(unittest.TestCase):
+    """Pruebas para la combinación de estados de PerformanceTracker."""
+
+    def test_merge_state_from_other_process(self):
+        worker, collector = PerformanceTracker(), PerformanceTracker()
+        for _ in range(20):
+            worker.track_stage("llm_response", 0.5)
+
+        collector.merge_state(worker.export_state())
+        stats = collector.get_performance_stats()["llm_response"]
+        self.assertEqual(stats["total_count"], 20)
+        self.assertAlmostEqual(stats["p99"], 0.5, delta=0.005)
+
+
+if __name__ == "__main__":
+    unittest.main()
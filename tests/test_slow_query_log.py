@@ -0,0 +1,112 @@
+"""
+Pruebas del registro de consultas lentas.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+# Añadir el directorio raíz al path para importar los módulos de la aplicación
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, "web", "api"))
+
+from app.utils.slow_query_log import SlowQueryLog, classify, read_entries, summarize
+
+
+class TestSlowQueryLog(unittest.TestCase):
+    """Pruebas para SlowQueryLog."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "slow.jsonl")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_classify(self):
+        """La etapa que ocupa la mayor parte del tiempo determina la causa."""
+        self.assertEqual(classify(10.0, {"embedding": 0.5, "search": 1.0, "llm": 8.0})["cause"], "llm")
+        self.assertEqual(classify(10.0, {"embedding": 3.0, "search": 3.0, "llm": 3.0})["cause"], "mixta")
+        result = classify(10.0, {"embedding": 0.5, "llm": 1.0})
+        self.assertEqual(result["dominant_stage"], "unaccounted")
+        self.assertEqual(result["cause"], "sin_atribuir")
+
+    def test_record_threshold(self):
+        """Solo se registran las consultas que superan el umbral."""
+        log = SlowQueryLog(self.path, threshold=1.0)
+        self.assertIsNone(log.record("app", "rápida", 0.5, {"llm": 0.4}))
+        entry = log.record("app", "lenta", 2.0, {"search": 1.8}, usage={"input_tokens": 900},
+                           chunks=[{"id": 7, "similarity": 0.812345, "content": "..."}])
+
+        self.assertEqual(entry["cause"], "busqueda")
+        self.assertEqual(entry["prompt_tokens"], 900)
+        self.assertEqual(entry["chunks"], [{"id": 7, "similarity": 0.8123}])
+        self.assertEqual([e["query"] for e in read_entries(self.path)], ["lenta"])
+
+    def test_unwritable_path_does_not_fail_the_query(self):
+        """Si el archivo no se puede crear, la entrada se devuelve igualmente y el archivo se desactiva."""
+        with open(self.path, "w") as f:
+            f.write("")
+        log = SlowQueryLog(os.path.join(self.path, "slow.jsonl"), threshold=0.1)
+
+        with self.assertLogs("app.utils.slow_query_log", level="ERROR") as logs:
+            self.assertEqual(log.record("app", "lenta", 1.0, {"llm": 0.9})["cause"], "llm")
+            self.assertIsNotNone(log.record("app", "lenta", 1.0, {"llm": 0.9}))
+        self.assertEqual(len(logs.output), 1)
+
+    def test_rotation_and_summary(self):
+        """Las entradas rotadas se leen en orden y se resumen por periodo."""
+        log = SlowQueryLog(self.path, threshold=1.0, max_bytes=400, backup_count=10)
+        for i in range(6):
+            log.record("app", f"consulta {i}", 2.0 + i, {"llm": 1.9 + i})
+
+        self.assertTrue(os.path.exists(self.path + ".1"))
+        # Otros archivos junto al registro (copias manuales, archivos de intercambio) no se leen
+        for suffix in (".bak", ".swp"):
+            with open(self.path + suffix, "w") as f:
+                f.write('{"query": "ajena", "timestamp": "2025-01-01T00:00:00"}\n')
+        entries = read_entries(self.path)
+        self.assertEqual([e["query"] for e in entries], [f"consulta {i}" for i in range(6)])
+
+        summary = summarize(entries, "day")
+        self.assertEqual(len(summary), 1)
+        self.assertEqual(summary[0]["count"], 6)
+        self.assertEqual(summary[0]["max"], 7.0)
+        self.assertEqual(summary[0]["causes"], {"llm": 6})
+
+
+class TestWebQueryRecording(unittest.TestCase):
+    """Pruebas del registro de las consultas de los endpoints web."""
+
+    def test_async_endpoint_records_slow_queries(self):
+        """El endpoint ASGI exporta métricas, traza y consulta lenta como el síncrono."""
+        import query
+        import query_async
+
+        result = {"response": "Respuesta", "sources": [], "metadata": {
+            "query": "¿plazo?", "query_steps": {"embedding": 0.2, "search_docs": 0.3, "openai_call": 9.0, "total": 9.6},
+            "chunks": [{"id": 7, "similarity": 0.8}]
+        }}
+
+        async def process(*args):
+            return result
+
+        slow_log = mock.MagicMock()
+        with mock.patch.object(query_async, "_process_query_async", process), \
+                mock.patch.object(query, "slow_query_log", slow_log), \
+                mock.patch.object(query, "performance_tracker") as tracker:
+            self.assertIs(asyncio.run(query_async.process_query_async("¿plazo?")), result)
+
+        route, text, total, steps = slow_log.record.call_args[0]
+        self.assertEqual((route, text, total), ("/api/query_async", "¿plazo?", 9.6))
+        self.assertEqual(steps, {"embedding": 0.2, "search_docs": 0.3, "openai_call": 9.0})
+        self.assertEqual(slow_log.record.call_args[1]["chunks"], [{"id": 7, "similarity": 0.8}])
+        tracker.count_query.assert_called_once_with("ok", model=query.DEFAULT_MODEL, route="/api/query_async")
+
+
+if __name__ == "__main__":
+    unittest.main()
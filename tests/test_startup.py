@@ -0,0 +1,89 @@
+"""
+Pruebas del tiempo de arranque: los módulos pesados solo se importan en los comandos que los usan.
+
+Cada prueba importa un módulo en un proceso nuevo con `python -X importtime` y comprueba qué módulos
+se cargaron. RAG_IMPORT_BUDGET_MS fija el tiempo máximo de importación de Main.py (1000 ms por
+defecto; 0 desactiva esa comprobación).
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from typing import Dict
+
+# Añadir el directorio raíz al path para importar los módulos de la aplicación
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+# Paquetes que tardan cientos de milisegundos en importarse
+HEAVY_MODULES = {"langchain", "langchain_core", "langchain_community", "langchain_openai", "openai", "supabase",
+                 "fitz", "pymupdf", "googleapiclient", "unstructured", "docx2txt", "rich"}
+
+
+def import_times(module: str) -> Dict[str, int]:
+    """Importa un módulo con `-X importtime` en un proceso nuevo.
+
+    Args:
+        module: Nombre del módulo.
+
+    Returns:
+        Dict[str, int]: Microsegundos acumulados de cada módulo importado.
+    """
+    code = f"import sys; sys.path.insert(0, {root_dir!r}); import {module}"
+    # Directorio temporal: Main.py escribe rag_app.log en el directorio actual al importarse
+    with tempfile.TemporaryDirectory() as cwd:
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=cwd,
+                                capture_output=True, text=True, timeout=120)
+    if result.returncode:
+        raise AssertionError(f"No se pudo importar {module}:\n{result.stderr[-2000:]}")
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+def heavy_imports(times: Dict[str, int]) -> Dict[str, int]:
+    """Paquetes pesados importados, con su tiempo acumulado en milisegundos."""
+    return {name: times[name] // 1000 for name in times if name in HEAVY_MODULES}
+
+
+class TestStartupImports(unittest.TestCase):
+    """Pruebas para las importaciones al arrancar."""
+
+    def test_main_imports_no_heavy_modules(self):
+        """Main.py no importa LangChain, OpenAI, Supabase ni los cargadores hasta ejecutar un comando."""
+        times = import_times("Main")
+        self.assertEqual(heavy_imports(times), {})
+
+        budget = float(os.getenv("RAG_IMPORT_BUDGET_MS", "1000"))
+        if budget:
+            self.assertLess(times["Main"] / 1000, budget, "Main.py tarda demasiado en importarse")
+
+    def test_admin_skips_document_processing(self):
+        """admin_cli solo necesita Supabase: ni LangChain, ni OpenAI, ni Google Drive."""
+        heavy = heavy_imports(import_times("app.database.admin_cli"))
+        self.assertFalse(set(heavy) - {"supabase", "rich"}, heavy)
+
+    def test_admin_commands_reach_admin_cli(self):
+        """`Main.py admin <comando> ...` pasa el comando y sus opciones a admin_cli."""
+        env = dict(os.environ, SUPABASE_URL="http://localhost:54321", SUPABASE_KEY="clave")
+        with tempfile.TemporaryDirectory() as cwd:
+            result = subprocess.run([sys.executable, os.path.join(root_dir, "Main.py"), "--profile-interval", "0.02",
+                                     "admin", "stats", "--help"], cwd=cwd, env=env,
+                                    capture_output=True, text=True, timeout=120)
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        self.assertIn("Main.py admin stats [-h] [--json] [--refresh]", result.stdout)
+
+    def test_document_manager_loads_parsers_lazily(self):
+        """Los cargadores de langchain_community y PyMuPDF se importan al cargar el primer documento."""
+        heavy = heavy_imports(import_times("app.core.document_manager"))
+        self.assertFalse(set(heavy) & {"langchain_community", "fitz", "pymupdf", "unstructured"}, heavy)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+"""
+Pruebas del servicio de estadísticas de la base de datos.
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+# Añadir el directorio raíz al path para importar los módulos de la aplicación
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, "web", "api"))
+
+from app.database.statistics import DocumentStatistics, format_bytes
+from app.database.vector_store import VectorDatabase
+from benchmarks.fake_supabase import FakeSupabase
+
+
+def fake_vector_db(db: FakeSupabase) -> VectorDatabase:
+    """VectorDatabase conectada a la base de datos en memoria."""
+    vector_db = VectorDatabase.__new__(VectorDatabase)
+    vector_db.collection_name = db.collection_name
+    vector_db.supabase = db
+    return vector_db
+
+
+class TestDocumentStatistics(unittest.TestCase):
+    """Pruebas para DocumentStatistics."""
+
+    def setUp(self):
+        self.db = FakeSupabase()
+        self.db.table("files").insert([
+            {"id": "a", "name": "a.pdf", "processed_at": "2026-01-02T10:00:00"},
+            {"id": "b", "name": "b.pdf", "processed_at": "2026-03-04T10:00:00"}
+        ]).execute()
+        self.db.table("documents").insert([{"id": f"a_{i}", "content": "texto", "file_id": "a"} for i in range(3)]).execute()
+        self.db.table("queries").insert({"query": "¿plazo?"}).execute()
+        DocumentStatistics.clear_cache()
+
+    def test_rpc_statistics_are_cached(self):
+        """Las estadísticas salen de la función SQL y se reutilizan hasta que caduca la caché."""
+        statistics = DocumentStatistics(fake_vector_db(self.db), ttl=60)
+        stats = statistics.get_statistics()
+        self.assertEqual((stats["total_files"], stats["total_chunks"], stats["total_queries"]), (2, 3, 1))
+        self.assertEqual(stats["chunks_per_file"], {"min": 3, "avg": 3.0, "max": 3})
+        self.assertEqual(stats["content_bytes"], 15)
+        self.assertEqual(statistics.get_chunk_counts(), {"a": {"chunks": 3, "content_bytes": 15}})
+
+        round_trips = self.db.round_trips
+        statistics.get_statistics()
+        self.assertEqual(self.db.round_trips, round_trips)
+        statistics.get_statistics(refresh=True)
+        self.assertEqual(self.db.round_trips, round_trips + 1)
+
+    def test_chunks_without_file_id_share_one_bucket(self):
+        """Los fragmentos sin columna file_id (NULL o '') se agrupan juntos, aunque sus metadatos tengan uno."""
+        self.db.table("documents").insert([
+            {"id": "x_0", "content": "ab", "file_id": "", "metadata": {"file_id": "b"}},
+            {"id": "x_1", "content": "cd", "file_id": None, "metadata": {"file_id": "c"}}
+        ]).execute()
+        statistics = DocumentStatistics(fake_vector_db(self.db), ttl=0)
+
+        self.assertEqual(statistics.get_chunk_counts(), {"a": {"chunks": 3, "content_bytes": 15},
+                                                         None: {"chunks": 2, "content_bytes": 4}})
+        self.assertEqual(statistics.get_statistics()["files_with_chunks"], 2)
+
+    def test_counts_without_function(self):
+        """Sin la función SQL, los totales salen de recuentos en el servidor y no de descargar las tablas."""
+        del self.db.functions["get_document_statistics"]
+        stats = DocumentStatistics(fake_vector_db(self.db), ttl=0).get_statistics()
+        self.assertEqual(stats, {"total_files": 2, "total_chunks": 3, "total_queries": 1,
+                                 "last_processed": "2026-03-04T10:00:00"})
+        self.assertEqual(format_bytes(3 * 1024 * 1024), "3.0 MB")
+
+    def test_public_endpoint_keeps_the_cache(self):
+        """El endpoint web reutiliza DocumentStatistics y no permite recalcular antes de que caduque."""
+        import document_stats
+
+        self.addCleanup(setattr, document_stats, "_statistics", None)
+        with mock.patch.object(document_stats, "create_client", return_value=self.db):
+            stats = document_stats.get_statistics()
+            round_trips = self.db.round_trips
+            document_stats.get_statistics()
+
+        self.assertEqual(stats["total_chunks"], 3)
+        self.assertEqual(self.db.round_trips, round_trips)
+        self.assertIsInstance(document_stats._statistics, DocumentStatistics)
+
+
+if __name__ == "__main__":
+    unittest.main()
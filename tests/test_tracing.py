@@ -0,0 +1,116 @@
+"""
+Tests para las trazas del pipeline RAG.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+# Agregar el directorio raíz y la carpeta de la API web al path
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+sys.path.append(str(root_dir / "web" / "api"))
+
+from app.utils.tracing import OTLPFileExporter, Tracer, annotate_retrieval
+
+
+class RecordingExporter:
+    """Exportador que guarda las trazas en memoria."""
+
+    def __init__(self):
+        self.traces = []
+
+    def export(self, spans):
+        self.traces.append(spans)
+
+
+class TestTracer(unittest.TestCase):
+    """Pruebas para Tracer."""
+
+    def setUp(self):
+        self.exporter = RecordingExporter()
+        self.tracer = Tracer([self.exporter])
+
+    def test_nested_spans_export_once_per_trace(self):
+        @self.tracer.traced("rag.llm", model="modelo")
+        def call_llm():
+            self.tracer.current_span().set_attribute("llm.output_tokens", 42)
+
+        with self.tracer.span("rag.query", top_k=5) as root:
+            with self.tracer.span("rag.search") as search:
+                annotate_retrieval(search, [
+                    {"similarity": 0.8, "metadata": {"file_id": "f1", "name": "a.pdf", "checksum": "abcdef123456",
+                                                     "ingest_trace_id": "1" * 32}},
+                    {"similarity": 0.6, "metadata": {"file_id": "f1", "name": "a.pdf", "checksum": "abcdef123456"}}
+                ])
+            call_llm()
+
+        self.assertEqual(len(self.exporter.traces), 1)
+        spans = {span.name: span for span in self.exporter.traces[0]}
+        self.assertEqual(set(spans), {"rag.query", "rag.search", "rag.llm"})
+        self.assertTrue(all(span.trace_id == root.trace_id for span in spans.values()))
+        self.assertIs(spans["rag.llm"].parent, root)
+        self.assertEqual(spans["rag.llm"].attributes, {"model": "modelo", "llm.output_tokens": 42})
+        self.assertEqual(spans["rag.search"].attributes["rag.chunk_count"], 2)
+        self.assertEqual(spans["rag.search"].attributes["rag.documents"], ["a.pdf@abcdef12"])
+        self.assertEqual(spans["rag.search"].links[0]["trace_id"], "1" * 32)
+        self.assertIsNone(self.tracer.current_span())
+
+    def test_error_sets_status(self):
+        with self.assertRaises(ValueError):
+            with self.tracer.span("rag.query"):
+                raise ValueError("fallo")
+
+        otlp = self.exporter.traces[0][0].to_otlp()
+        self.assertEqual(otlp["status"]["code"], 2)
+
+    def test_record_steps_lays_out_consecutive_spans(self):
+        start = time.time()
+        with self.tracer.record_steps("web.query", start, {"embedding": 0.1, "search_docs": 0.2}) as root:
+            root.child("embedding").set_attribute("cache_hit", True)
+
+        root, embedding, search = self.exporter.traces[0]
+        self.assertEqual(embedding.end_ns, search.start_ns)
+        self.assertAlmostEqual(search.duration, 0.2, places=6)
+        self.assertTrue(embedding.attributes["cache_hit"])
+
+    def test_file_exporter_writes_otlp_json(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "traces.jsonl")
+            tracer = Tracer([OTLPFileExporter(path)])
+            with tracer.span("rag.query", top_k=3):
+                with tracer.span("rag.embedding", cache_hit=False):
+                    pass
+
+            with open(path, encoding="utf-8") as f:
+                payload = json.loads(f.readline())
+
+        spans = payload["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        self.assertEqual([span["name"] for span in spans], ["rag.query", "rag.embedding"])
+        self.assertEqual(spans[1]["parentSpanId"], spans[0]["spanId"])
+        self.assertEqual(spans[0]["attributes"], [{"key": "top_k", "value": {"intValue": "3"}}])
+
+
+class TestPublicResult(unittest.TestCase):
+    """Pruebas para los metadatos que se envían al cliente de la API web."""
+
+    def test_internal_metadata_is_not_sent(self):
+        import query
+
+        result = {"response": "texto", "sources": [], "metadata": {
+            "query": "¿plazo?", "query_steps": {"embedding": 0.1}, "stages": {"llm": {}}, "match_count": 5,
+            "documents": [{"file_id": "a", "ingest_version": 3}], "chunks": [{"id": "a_0"}]
+        }}
+
+        public = query.public_result(result)
+        self.assertEqual(public["metadata"], {"query": "¿plazo?", "query_steps": {"embedding": 0.1}})
+        # El resultado original conserva los diagnósticos para las trazas y el registro de consultas lentas
+        self.assertIn("documents", result["metadata"])
+
+
+if __name__ == "__main__":
+    unittest.main()
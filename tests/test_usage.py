@@ -0,0 +1,59 @@
+"""
+Tests para el consumo de tokens y su agregación.
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+from app.utils.performance_metrics import PerformanceTracker, TOP_USAGE_SIZE
+from app.utils.usage import count_tokens, estimate_cost, model_price
+
+
+class TestUsage(unittest.TestCase):
+    """Pruebas para app.utils.usage."""
+
+    def test_estimate_cost(self):
+        usage = {
+            "llm_model": "gpt-4o-mini", "input_tokens": 1_000_000, "output_tokens": 1_000_000,
+            "embedding_model": "text-embedding-3-small", "embedding_tokens": 1_000_000
+        }
+        self.assertAlmostEqual(estimate_cost(usage), 0.15 + 0.60 + 0.02)
+
+    def test_dated_model_uses_longest_prefix(self):
+        self.assertEqual(model_price("gpt-4o-mini-2024-07-18"), model_price("gpt-4o-mini"))
+        self.assertEqual(model_price("gpt-4o-2024-08-06"), model_price("gpt-4o"))
+        self.assertIsNone(model_price("modelo-desconocido"))
+
+    def test_count_tokens(self):
+        self.assertGreater(count_tokens(["Hola, ¿qué tal?"], "text-embedding-3-small"), 0)
+        self.assertEqual(count_tokens(["", ""], "text-embedding-3-small"), 0)
+
+
+class TestTrackerUsage(unittest.TestCase):
+    """Pruebas para el consumo agregado en PerformanceTracker."""
+
+    def test_keeps_most_expensive_items(self):
+        tracker = PerformanceTracker()
+        for index in range(TOP_USAGE_SIZE + 5):
+            tracker.track_usage("query", f"consulta {index}", {"input_tokens": index, "cost": float(index)})
+        # Consultas repetidas con el mismo coste no deben romper el montículo
+        tracker.track_usage("query", "consulta 30", {"input_tokens": 30, "cost": 30.0})
+        tracker.track_usage("query", "consulta 30", {"input_tokens": 30, "cost": 30.0})
+
+        stats = tracker.get_usage_stats()["query"]
+        self.assertEqual(stats["total"]["count"], TOP_USAGE_SIZE + 7)
+        self.assertEqual(len(stats["top"]), TOP_USAGE_SIZE)
+        self.assertEqual([item["cost"] for item in stats["top"][:3]], [30.0, 30.0, 24.0])
+
+        other = PerformanceTracker()
+        other.merge_state(tracker.export_state())
+        self.assertEqual(other.get_usage_stats()["query"]["total"], stats["total"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+"""
+Pruebas de la eliminación de fragmentos por archivo.
+"""
+
+import os
+import sys
+import unittest
+
+# Añadir el directorio raíz al path para importar los módulos de la aplicación
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+from app.database.vector_store import VectorDatabase
+from benchmarks.fake_supabase import FakeSupabase
+
+
+class TestDeleteChunks(unittest.TestCase):
+    """Pruebas para delete_chunks_by_file_id y delete_chunks_by_file_ids."""
+
+    def setUp(self):
+        self.db = FakeSupabase()
+        self.db.table("documents").insert(
+            [{"id": f"{file_id}_{i}", "content": "texto", "file_id": file_id, "metadata": {"file_id": file_id}}
+             for file_id, chunks in (("a", 3), ("b", 2), ("c", 1)) for i in range(chunks)]
+        ).execute()
+        self.vector_db = VectorDatabase.__new__(VectorDatabase)
+        self.vector_db.collection_name = self.db.collection_name
+        self.vector_db.supabase = self.db
+
+    def test_single_round_trip(self):
+        """Un archivo o varios se eliminan con una sola llamada que devuelve los recuentos."""
+        round_trips = self.db.round_trips
+        self.assertEqual(self.vector_db.delete_chunks_by_file_id("a"), 3)
+        self.assertEqual(self.db.round_trips, round_trips + 1)
+        self.assertEqual(self.vector_db.delete_chunks_by_file_ids(["b", "c", "x"]), {"b": 2, "c": 1})
+        self.assertEqual(self.db.round_trips, round_trips + 2)
+        self.assertEqual(self.db.tables["documents"], [])
+
+    def test_without_functions(self):
+        """Sin las funciones SQL se elimina por la columna file_id pidiendo solo el recuento."""
+        del self.db.functions["delete_chunks_by_file_id"]
+        self.assertEqual(self.vector_db.delete_chunks_by_file_id("a"), 3)
+        self.assertEqual(len(self.db.tables["documents"]), 3)
+
+    def test_backfill_file_ids(self):
+        """La migración copia metadata.file_id a la columna en los fragmentos antiguos, por lotes."""
+        self.db.table("documents").insert([{"id": f"old_{i}", "content": "texto", "file_id": "",
+                                            "metadata": '{"file_id": "old"}'} for i in range(3)]).execute()
+        backfill = self.db.functions["backfill_document_file_ids"]
+        self.assertEqual([backfill(batch_size=2), backfill(batch_size=2), backfill(batch_size=2)], [2, 1, 0])
+        # Los metadatos guardados como texto JSON quedan como objeto
+        self.assertEqual(self.db.tables["documents"][-1]["metadata"], {"file_id": "old"})
+        self.assertEqual(self.vector_db.delete_chunks_by_file_id("old"), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""
+Tests para el servidor HTTP de la API web.
+"""
+
+import http.client
+import json
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+sys.path.append(str(root_dir / "web"))
+
+release_slow = threading.Event()
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    """Manejador al estilo de web/api: escribe el cuerpo sin Content-Length."""
+
+    def do_POST(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.wfile.write(json.dumps({"echo": json.loads(body)}).encode())
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    """Manejador que se bloquea hasta que la prueba lo libera."""
+
+    def do_GET(self):
+        release_slow.wait(5)
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+
+class TestRAGHTTPServer(unittest.TestCase):
+    """Pruebas para RAGHTTPServer."""
+
+    def start_server(self, **kwargs):
+        """Inicia el servidor en un puerto libre y lo detiene al terminar la prueba."""
+        from server import RAGHTTPServer
+
+        server = RAGHTTPServer(("127.0.0.1", 0), {"/api/echo": EchoHandler, "/api/slow": SlowHandler}, **kwargs)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_keep_alive_and_latency_histogram(self):
+        """Prueba que dos solicitudes reutilizan la conexión y quedan en el histograma de la ruta."""
+        server = self.start_server()
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+
+        for value in (1, 2):
+            conn.request("POST", "/api/echo", body=json.dumps(value), headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            self.assertEqual(response.getheader("Content-Length"), str(len(json.dumps({"echo": value}))))
+            self.assertEqual(json.loads(response.read()), {"echo": value})
+        first_socket = conn.sock
+
+        conn.request("GET", "/api/stats")
+        stats = json.loads(conn.getresponse().read())
+        self.assertIs(conn.sock, first_socket)
+        self.assertEqual(stats["routes"]["/api/echo"]["count"], 2)
+        conn.close()
+
+    def test_full_queue_is_rejected_with_retry_after(self):
+        """Prueba que con la cola llena se responde 503 con Retry-After."""
+        server = self.start_server(workers=1, max_queue=0)
+        release_slow.clear()
+        self.addCleanup(release_slow.set)
+
+        slow_conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+        slow_conn.request("GET", "/api/slow")
+        while server.admission.snapshot()["in_flight"] == 0:
+            threading.Event().wait(0.01)
+
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+        conn.request("POST", "/api/echo", body="1")
+        response = conn.getresponse()
+        self.assertEqual(response.status, 503)
+        self.assertGreaterEqual(int(response.getheader("Retry-After")), 1)
+
+        release_slow.set()
+        self.assertEqual(slow_conn.getresponse().status, 200)
+        self.assertEqual(server.admission.snapshot()["rejected"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
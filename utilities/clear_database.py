@@ -2,6 +2,10 @@
 """
 Script para limpiar todas las tablas de la base de datos Supabase utilizada por RAGLEC.
 Este script borrará todos los datos de las tablas documents, files y queries.
+
+Antes de borrar copia cada tabla por páginas en backups/<fecha>/<tabla>.jsonl.gz. Las filas se
+eliminan en lotes ordenados por id, o de una vez con TRUNCATE (--truncate). Una limpieza
+interrumpida se continúa con --resume backups/<fecha>.
 """
 
 import os
@@ -15,57 +19,88 @@ from dotenv import load_dotenv
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 # Importar módulos necesarios después de añadir la ruta
+from app.database.export import export_tables
 from app.database.supabase_client import get_supabase_client
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def create_backup(supabase, table_name, output_dir="backups"):
-    """Crea un backup de los datos de una tabla antes de borrarlos."""
+# Filas por lote al eliminar
+DEFAULT_BATCH_SIZE = 1000
+
+def create_backup(supabase, table_names, backup_path, resume=False):
+    """Crea un backup de los datos de las tablas antes de borrarlos.
+
+    Las tablas se leen por páginas y se escriben en <backup_path>/<tabla>.jsonl.gz, sin cargarlas
+    completas en memoria. Un backup interrumpido se continúa con resume=True.
+
+    Args:
+        supabase: Cliente de Supabase.
+        table_names: Tablas a copiar.
+        backup_path: Directorio del backup.
+        resume: Continuar un backup interrumpido en backup_path.
+
+    Returns:
+        bool: True si se copiaron todas las tablas.
+    """
     try:
-        # Crear directorio de backups si no existe
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        
-        # Obtener datos de la tabla
-        result = supabase.table(table_name).select("*").execute()
-        
-        # Generar nombre de archivo con timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{output_dir}/{table_name}_{timestamp}.json"
-        
-        # Guardar datos en archivo JSON
-        with open(filename, 'w') as f:
-            import json
-            json.dump(result.data, f, indent=2)
-        
-        logger.info(f"Backup de la tabla {table_name} creado en {filename}")
+        def progress(table_name, rows):
+            logger.info(f"Backup de {table_name}: {rows} filas")
+
+        counts = export_tables(supabase, table_names, backup_path, fmt="jsonl", compress=True,
+                               resume=resume, progress=progress)
+        for table_name, rows in counts.items():
+            logger.info(f"Backup de la tabla {table_name} creado en {backup_path} ({rows} filas)")
+        return True
+    except Exception as e:
+        logger.error(f"Error al crear backup de las tablas {', '.join(table_names)}: {e}")
+        return False
+
+def truncate_tables(supabase, table_names):
+    """Vacía las tablas con TRUNCATE mediante la función truncate_tables de supabase_unified.sql.
+
+    Args:
+        supabase: Cliente de Supabase.
+        table_names: Tablas a vaciar.
+
+    Returns:
+        bool: True si se vaciaron; False si la función no existe o no se pudo llamar.
+    """
+    try:
+        supabase.rpc("truncate_tables", {"table_names": list(table_names)}).execute()
+        logger.info(f"Tablas vaciadas con TRUNCATE: {', '.join(table_names)}")
         return True
     except Exception as e:
-        logger.error(f"Error al crear backup de la tabla {table_name}: {e}")
+        logger.warning(f"No se pudo usar TRUNCATE ({e}); se eliminará por lotes")
         return False
 
-def clear_table(supabase, table_name, create_backup_first=True, backup_dir="backups"):
-    """Limpia todos los datos de una tabla."""
+def clear_table(supabase, table_name, batch_size=DEFAULT_BATCH_SIZE):
+    """Limpia todos los datos de una tabla en lotes ordenados por id.
+
+    Cada lote lee los `batch_size` ids más bajos y elimina las filas con id menor o igual que el
+    último, así que cada DELETE es acotado y usa la clave primaria. Si se interrumpe, volver a
+    ejecutarlo continúa con las filas que quedan.
+
+    Args:
+        supabase: Cliente de Supabase.
+        table_name: Nombre de la tabla.
+        batch_size: Filas por lote.
+
+    Returns:
+        bool: True si la tabla quedó vacía.
+    """
     try:
-        # Crear backup si se solicita
-        if create_backup_first:
-            backup_created = create_backup(supabase, table_name, backup_dir)
-            if not backup_created and not confirm_action(f"No se pudo crear backup de {table_name}. ¿Desea continuar con la eliminación?"):
-                return False
-        
-        # Eliminar todos los registros - método diferente según la tabla
-        if table_name == "queries":
-            # La tabla queries usa ID numérico, necesita una condición WHERE
-            logger.info(f"Usando método alternativo para tabla {table_name} con ID numérico")
-            # Usar una condición que siempre sea verdadera para una columna numérica
-            result = supabase.table(table_name).delete().gte("id", 0).execute()
-        else:
-            # Para tablas con ID tipo texto
-            result = supabase.table(table_name).delete().neq("id", "placeholder_to_delete_all").execute()
+        total = supabase.table(table_name).select("id", count="exact", head=True).execute().count or 0
+        deleted = 0
+        while True:
+            rows = supabase.table(table_name).select("id").order("id").limit(batch_size).execute().data
+            if not rows:
+                break
+            supabase.table(table_name).delete().lte("id", rows[-1]["id"]).execute()
+            deleted += len(rows)
+            logger.info(f"Tabla {table_name}: {deleted}/{total} filas eliminadas")
         
-        # Verificar resultado
         logger.info(f"Tabla {table_name} limpiada correctamente")
         return True
     except Exception as e:
@@ -83,6 +118,10 @@ def main():
     parser.add_argument('--no-backup', action='store_true', help='No crear backups antes de borrar datos')
     parser.add_argument('--no-confirm', action='store_true', help='No solicitar confirmación antes de borrar datos')
     parser.add_argument('--backup-dir', default='backups', help='Directorio donde guardar los backups')
+    parser.add_argument('--resume', metavar='BACKUP', help='Continuar una limpieza interrumpida con su directorio de backup')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Filas por lote al eliminar')
+    parser.add_argument('--truncate', action='store_true',
+                        help='Vaciar las tablas con TRUNCATE (función truncate_tables) en lugar de eliminar por lotes')
     parser.add_argument('--tables', nargs='+', default=['documents', 'files', 'queries'], 
                         help='Tablas específicas a limpiar (por defecto: documents, files, queries)')
     
@@ -112,11 +151,22 @@ def main():
             logger.info("Operación cancelada por el usuario")
             return 0
     
+    # Copiar las tablas antes de borrarlas
+    if not args.no_backup:
+        backup_path = args.resume or os.path.join(args.backup_dir, datetime.now().strftime("%Y%m%d_%H%M%S"))
+        if not create_backup(supabase, args.tables, backup_path, resume=bool(args.resume)):
+            if args.no_confirm or not confirm_action("No se pudo crear el backup. ¿Desea continuar con la eliminación?"):
+                return 1
+    
+    if args.truncate and truncate_tables(supabase, args.tables):
+        logger.info("Todas las tablas han sido limpiadas correctamente")
+        return 0
+    
     # Procesar cada tabla
     success = True
     for table_name in args.tables:
         logger.info(f"Procesando tabla: {table_name}")
-        if not clear_table(supabase, table_name, not args.no_backup, args.backup_dir):
+        if not clear_table(supabase, table_name, args.batch_size):
             success = False
     
     if success:
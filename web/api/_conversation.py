@@ -0,0 +1,285 @@
+"""
+Gestión del historial de conversación para el prompt de la API web.
+
+El cliente envía el historial completo en cada turno. `HistoryCompactor` limita su tamaño a un
+presupuesto de tokens: mantiene literales los últimos turnos y sustituye los anteriores por un
+resumen acumulado. Cada resumen se guarda en caché con la clave del hash del prefijo del historial,
+de modo que en una conversación solo se resume cada mensaje una vez. Los resúmenes nuevos se
+calculan en segundo plano: la solicitud solo los espera dentro de su presupuesto y, si no llegan a
+tiempo, usa el resumen en caché del prefijo más largo y el resto de mensajes recortado.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_HEADER = "Resumen de la conversación anterior: "
+
+
+def estimate_tokens(text):
+    """Estimación rápida de tokens (unos 4 caracteres por token en español e inglés)."""
+    return len(text) // 4 + 1 if text else 0
+
+
+def normalize_history(conversation_history):
+    """Devuelve solo los mensajes válidos del historial como diccionarios {role, content}."""
+    if not isinstance(conversation_history, list):
+        return []
+    messages = []
+    for message in conversation_history:
+        if not isinstance(message, dict):
+            continue
+        role = message.get('role', '')
+        content = message.get('content', '')
+        if role and content:
+            messages.append({'role': role, 'content': content})
+    return messages
+
+
+def format_messages(messages):
+    """Formatea mensajes como texto 'Rol: contenido'."""
+    return "".join(f"{message['role'].capitalize()}: {message['content']}\n\n" for message in messages)
+
+
+def prefix_hashes(messages):
+    """Calcula el hash de cada prefijo del historial (el índice i corresponde a messages[:i])."""
+    digest = hashlib.sha256()
+    hashes = [digest.hexdigest()]
+    for message in messages:
+        digest.update(json.dumps(message, sort_keys=True, ensure_ascii=False).encode())
+        hashes.append(digest.hexdigest())
+    return hashes
+
+
+class LRUCache:
+    """Caché LRU sencilla y segura entre hilos."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class HistoryCompactor:
+    """Limita el historial de conversación a un presupuesto de tokens con un resumen acumulado."""
+
+    def __init__(self, summarize, max_tokens=1500, keep_last_turns=3, cache_size=512, max_workers=2):
+        """Inicializa el compactador.
+
+        Args:
+            summarize: Función (resumen_anterior, mensajes) -> nuevo resumen. Puede lanzar excepciones.
+            max_tokens: Presupuesto aproximado de tokens para el historial en el prompt.
+            keep_last_turns: Turnos (pregunta y respuesta) que se mantienen literales.
+            cache_size: Número máximo de resúmenes en caché.
+            max_workers: Hilos que calculan resúmenes en segundo plano.
+        """
+        self.summarize = summarize
+        self.max_tokens = max_tokens
+        self.keep_last_messages = keep_last_turns * 2
+        self.summaries = LRUCache(cache_size)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="history-summary")
+        # Resúmenes en curso por hash del prefijo, para no pedir dos veces el mismo
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def compact(self, conversation_history, timeout=None):
+        """Devuelve el historial formateado dentro del presupuesto de tokens.
+
+        Args:
+            conversation_history: Mensajes enviados por el cliente.
+            timeout: Segundos que se puede esperar un resumen nuevo (None: sin límite). Si se agotan,
+                el resumen sigue calculándose en segundo plano para el turno siguiente.
+
+        Returns:
+            str: Texto del historial para el prompt (vacío si no hay historial).
+        """
+        messages = normalize_history(conversation_history)
+        if not messages:
+            return ""
+
+        if estimate_tokens(format_messages(messages)) <= self.max_tokens:
+            return format_messages(messages)
+
+        # Mantener literales los últimos turnos, reduciéndolos si por sí solos exceden el presupuesto
+        verbatim_budget = self.max_tokens * 3 // 4
+        keep = min(self.keep_last_messages, len(messages))
+        while keep > 1 and estimate_tokens(format_messages(messages[-keep:])) > verbatim_budget:
+            keep -= 1
+
+        older, recent = messages[:-keep], messages[-keep:]
+        recent_text = format_messages(recent)
+        if estimate_tokens(recent_text) > verbatim_budget:
+            # Un único mensaje enorme: se conserva su final, que es lo más cercano a la pregunta
+            recent_text = recent_text[-verbatim_budget * 4:]
+
+        if not older:
+            return recent_text
+        summary, covered = self._summary_for(older, timeout)
+        if covered < len(older):
+            # Mensajes que el resumen aún no cubre: su final, en lo que queda del presupuesto
+            remaining = self.max_tokens - estimate_tokens(SUMMARY_HEADER + summary + "\n\n" + recent_text)
+            if remaining > 0:
+                recent_text = format_messages(older[covered:])[-remaining * 4:] + recent_text
+        if not summary:
+            return recent_text
+        logger.info(f"Historial compactado: {covered} mensajes resumidos, {len(recent)} literales")
+        return f"{SUMMARY_HEADER}{summary}\n\n{recent_text}"
+
+    def _summary_for(self, older, timeout=None):
+        """Obtiene el resumen de los mensajes antiguos reutilizando el resumen del prefijo más largo en caché.
+
+        Returns:
+            tuple: (resumen, número de mensajes del principio que cubre).
+        """
+        hashes = prefix_hashes(older)
+        summary = self.summaries.get(hashes[-1])
+        if summary is not None:
+            return summary, len(older)
+
+        # Buscar el resumen de un prefijo más corto (el del turno anterior, normalmente)
+        start, previous = 0, ""
+        for index in range(len(older) - 1, 0, -1):
+            cached = self.summaries.get(hashes[index])
+            if cached is not None:
+                start, previous = index, cached
+                break
+
+        with self._lock:
+            future = self._pending.get(hashes[-1])
+            if future is None:
+                future = self._executor.submit(self._summarize, hashes[-1], previous, older[start:])
+                self._pending[hashes[-1]] = future
+        try:
+            summary = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            logger.warning(f"Resumen del historial pendiente: se usa el de {start} mensajes en caché")
+            return previous, start
+        if summary is None:
+            return previous, start
+        return summary, len(older)
+
+    def _summarize(self, key, previous, messages):
+        """Calcula un resumen y lo guarda en caché (se ejecuta en segundo plano)."""
+        try:
+            summary = self.summarize(previous, messages)
+            self.summaries.set(key, summary)
+            return summary
+        except Exception as e:
+            # Sin resumen, el prompt conserva los turnos recientes y el final de los anteriores
+            logger.error(f"Error al resumir el historial: {e}")
+            return None
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+
+# Expresiones que suelen indicar que la pregunta depende del contexto anterior
+FOLLOW_UP_STARTS = ("y ", "¿y ", "entonces", "¿entonces", "también", "¿también", "pero ", "¿pero ", "además")
+FOLLOW_UP_WORDS = {
+    "eso", "esto", "esa", "ese", "esos", "esas", "ello", "anterior", "anteriores", "mismo", "misma",
+    "primero", "primera", "segundo", "segunda", "tercero", "tercera", "último", "última", "punto",
+    "ahí", "allí", "aquel", "aquella", "dicho", "dicha",
+}
+# Pronombres átonos que solo indican seguimiento al inicio ("¿lo puedes resumir?")
+FOLLOW_UP_FIRST_WORDS = FOLLOW_UP_WORDS | {"lo", "le", "les"}
+
+
+def looks_standalone(question, messages):
+    """Heurística barata: indica si la pregunta se entiende sin el historial.
+
+    Args:
+        question: Pregunta actual del usuario.
+        messages: Historial normalizado (ver normalize_history).
+
+    Returns:
+        bool: True si no hace falta reescribirla.
+    """
+    if not messages:
+        return True
+    text = " ".join(question.lower().split())
+    if text.startswith(FOLLOW_UP_STARTS):
+        return False
+    words = [word.strip("¿?¡!.,;:()\"'") for word in text.split()]
+    if len(words) <= 3:
+        return False
+    if words[0] in FOLLOW_UP_FIRST_WORDS:
+        return False
+    return not any(word in FOLLOW_UP_WORDS for word in words)
+
+
+class QueryRewriter:
+    """Convierte preguntas de seguimiento en consultas de búsqueda autónomas, con caché."""
+
+    def __init__(self, rewrite, context_messages=4, cache_size=1024):
+        """Inicializa el reescritor.
+
+        Args:
+            rewrite: Función (historial_formateado, pregunta, timeout) -> consulta autónoma. Puede lanzar excepciones.
+            context_messages: Número de mensajes recientes del historial que se pasan al modelo.
+            cache_size: Número máximo de reescrituras en caché.
+        """
+        self.rewrite_fn = rewrite
+        self.context_messages = context_messages
+        self.cache = LRUCache(cache_size)
+
+    def rewrite(self, question, conversation_history, allow_model_call=True, timeout=None):
+        """Obtiene la consulta de búsqueda para una pregunta.
+
+        Args:
+            question: Pregunta actual del usuario.
+            conversation_history: Mensajes enviados por el cliente.
+            allow_model_call: Si es False (poco tiempo) solo se usa la caché.
+            timeout: Segundos disponibles para la llamada al modelo (None: el límite por defecto de `rewrite`).
+
+        Returns:
+            tuple: (consulta de búsqueda, True si es una reescritura).
+        """
+        messages = normalize_history(conversation_history)
+        if looks_standalone(question, messages):
+            return question, False
+
+        recent = messages[-self.context_messages:]
+        key = prefix_hashes(recent)[-1] + hashlib.sha256(question.encode()).hexdigest()
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached, True
+        if not allow_model_call:
+            return question, False
+
+        try:
+            rewritten = self.rewrite_fn(format_messages(recent), question, timeout).strip()
+        except Exception as e:
+            logger.error(f"Error al reescribir la consulta: {e}")
+            return question, False
+
+        if not rewritten:
+            return question, False
+        logger.info(f"Consulta reescrita para la búsqueda: '{question[:50]}' -> '{rewritten[:80]}'")
+        self.cache.set(key, rewritten)
+        return rewritten, True
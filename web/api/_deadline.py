@@ -0,0 +1,91 @@
+"""
+Plazo de una consulta y presupuestos por etapa.
+
+Cada solicitud crea un `Deadline` con el tiempo disponible. Antes de cada etapa (reescritura de la
+consulta, embedding, búsqueda, resumen del historial, LLM) se pide su presupuesto: una parte de MAX_RESPONSE_TIME, recortada para dejar el mínimo que
+necesitan las etapas siguientes. Si el presupuesto queda por debajo del nominal, la etapa se marca
+como degradada y el llamador aplica su alternativa más barata.
+"""
+
+import time
+
+# Etapas en orden de ejecución y fracción de MAX_RESPONSE_TIME asignada a cada una
+STAGE_SHARES = {
+    "rewrite": 0.10,
+    "embedding": 0.15,
+    "search": 0.20,
+    "history": 0.10,
+    "llm": 0.45,
+}
+
+# Tiempo mínimo (segundos) con el que tiene sentido intentar cada etapa
+STAGE_MINIMUMS = {
+    "rewrite": 0.5,
+    "embedding": 0.5,
+    "search": 0.5,
+    # El historial siempre tiene alternativa (el resumen en caché): no reserva tiempo
+    "history": 0.0,
+    "llm": 2.0,
+}
+
+
+class StageBudget:
+    """Presupuesto asignado a una etapa."""
+
+    def __init__(self, name, timeout, nominal):
+        self.name = name
+        self.timeout = timeout
+        self.nominal = nominal
+        self.degraded = timeout < nominal
+
+    @property
+    def sufficient(self):
+        """Indica si el presupuesto alcanza el mínimo de la etapa."""
+        return self.timeout >= STAGE_MINIMUMS[self.name]
+
+    def to_dict(self):
+        return {"budget": round(self.timeout, 3), "nominal": round(self.nominal, 3), "degraded": self.degraded}
+
+
+class Deadline:
+    """Plazo absoluto de una solicitud, propagado a cada etapa."""
+
+    def __init__(self, timeout, total_budget, clock=time.monotonic):
+        """Inicializa el plazo.
+
+        Args:
+            timeout: Segundos disponibles desde ahora.
+            total_budget: Tiempo de referencia (MAX_RESPONSE_TIME) del que salen los presupuestos nominales.
+            clock: Reloj monótono (inyectable en las pruebas).
+        """
+        self._clock = clock
+        self.expires_at = clock() + timeout
+        self.total_budget = total_budget
+        self.stages = {}
+
+    def remaining(self):
+        """Segundos que quedan hasta el plazo (nunca negativo)."""
+        return max(0.0, self.expires_at - self._clock())
+
+    def stage(self, name):
+        """Calcula y registra el presupuesto de una etapa.
+
+        El presupuesto es el nominal de la etapa, limitado por el tiempo restante menos los
+        mínimos reservados para las etapas posteriores. La última etapa recibe todo el tiempo restante.
+
+        Args:
+            name: Nombre de la etapa (clave de STAGE_SHARES).
+
+        Returns:
+            StageBudget: Presupuesto de la etapa.
+        """
+        stage_names = list(STAGE_SHARES)
+        later = stage_names[stage_names.index(name) + 1:]
+        reserved = sum(STAGE_MINIMUMS[stage] for stage in later)
+
+        nominal = STAGE_SHARES[name] * self.total_budget
+        available = max(0.0, self.remaining() - reserved)
+        timeout = available if not later else min(nominal, available)
+        budget = StageBudget(name, timeout, nominal)
+        self.stages[name] = budget.to_dict()
+        return budget
@@ -0,0 +1,103 @@
+from http.server import BaseHTTPRequestHandler
+import json
+import os
+import sys
+import threading
+import time
+import logging
+from types import SimpleNamespace
+from supabase import create_client
+from dotenv import load_dotenv
+
+# Permitir importar los módulos de la aplicación (app/) al ejecutar desde el repositorio
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+# Al desplegar solo web/ en Vercel, app/ no está disponible: se usa la función SQL sin la
+# alternativa de recuentos de DocumentStatistics
+try:
+    from app.database.statistics import DocumentStatistics
+except ImportError:
+    DocumentStatistics = None
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Configuración de Supabase
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+
+# Segundos que se reutilizan las estadísticas entre solicitudes de la misma instancia (el endpoint
+# público nunca funciona sin caché)
+STATS_TTL = max(1.0, float(os.getenv("RAG_STATS_TTL", "60")))
+
+_statistics = None
+_statistics_lock = threading.Lock()
+
+
+class _RPCStatistics:
+    """Estadísticas de get_document_statistics en caché, para despliegues sin app/."""
+
+    def __init__(self, source):
+        self.source = source
+        self.expires = 0.0
+        self.stats = None
+
+    def get_statistics(self):
+        now = time.monotonic()
+        if self.stats is None or self.expires <= now:
+            self.stats = self.source.supabase.rpc("get_document_statistics", {}).execute().data
+            self.expires = now + STATS_TTL
+        return dict(self.stats)
+
+
+def get_statistics():
+    """Estadísticas de la base de datos, calculadas en el servidor y en caché durante RAG_STATS_TTL segundos.
+
+    El endpoint es público: no permite saltarse la caché, de modo que las agregaciones completas
+    de get_document_statistics se ejecutan como mucho una vez por periodo y por instancia.
+
+    Returns:
+        dict: Estadísticas (ver DocumentStatistics.get_statistics).
+    """
+    global _statistics
+    with _statistics_lock:
+        if _statistics is None:
+            # DocumentStatistics solo necesita el cliente y la tabla de fragmentos de VectorDatabase
+            source = SimpleNamespace(supabase=create_client(SUPABASE_URL, SUPABASE_KEY), collection_name="documents")
+            _statistics = (DocumentStatistics(source, ttl=STATS_TTL) if DocumentStatistics
+                           else _RPCStatistics(source))
+        # Con el cerrojo, las solicitudes que llegan mientras caduca la caché esperan a un único cálculo
+        return _statistics.get_statistics()
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.end_headers()
+
+    def do_GET(self):
+        try:
+            if not SUPABASE_URL or not SUPABASE_KEY:
+                status, response = 500, {'error': 'Credenciales de Supabase no configuradas'}
+            else:
+                response = get_statistics()
+                status = 500 if 'error' in response else 200
+        except Exception as e:
+            logger.error(f"Error al obtener las estadísticas: {str(e)}")
+            status, response = 500, {'error': f"Error al obtener las estadísticas: {str(e)}"}
+
+        self.send_response(status)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Cache-Control', f'max-age={int(STATS_TTL)}')
+        self.end_headers()
+        self.wfile.write(json.dumps(response, default=str).encode())
@@ -6,7 +6,9 @@ import time
 from dotenv import load_dotenv
 from openai import OpenAI
 from supabase import create_client
+from supabase.lib.client_options import ClientOptions
 from datetime import datetime
+import sys
 # El módulo re (regular expressions) proporciona soporte para expresiones regulares
 # Se utiliza para buscar y manipular patrones de texto de forma avanzada
 # Algunas funciones principales son:
@@ -53,6 +55,12 @@ else:
     logger.error("API key de OpenAI no encontrada en variables de entorno")
     OPENAI_CLIENT = None
 
+# Permitir importar los módulos auxiliares de esta carpeta tanto en Vercel como en local
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from _conversation import HistoryCompactor, LRUCache, QueryRewriter, format_messages
+from _deadline import Deadline
+
 # Configuración de Supabase
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
@@ -65,10 +73,38 @@ if not SUPABASE_URL or not SUPABASE_KEY:
 DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 DEFAULT_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
 MAX_RESPONSE_TIME = float(os.getenv("MAX_RESPONSE_TIME", "15.0"))  # Tiempo máximo de respuesta
+FAST_MODEL = os.getenv("OPENAI_FAST_MODEL", "gpt-4o-mini")  # Modelo rápido para tareas auxiliares
+HISTORY_SUMMARY_TIMEOUT = 3.0  # Tiempo máximo para resumir el historial (en segundo plano)
+QUERY_REWRITE_TIMEOUT = 1.5  # Tiempo máximo para reescribir una pregunta de seguimiento
 logger.info(f"Modelo OpenAI: {DEFAULT_MODEL}, Modelo de embedding: {DEFAULT_EMBEDDING_MODEL}")
 
-# Cache para evitar generar embeddings repetidos
-EMBEDDING_CACHE = {}
+# Caché LRU para evitar generar embeddings repetidos. La clave es la pregunta normalizada (sin
+# distinguir mayúsculas ni espacios), de modo que la alternativa con presupuesto degradado también
+# es una búsqueda directa y la caché no crece sin límite en un servidor de larga duración.
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "1000"))
+EMBEDDING_CACHE = LRUCache(EMBEDDING_CACHE_SIZE)
+
+# Agrupación de consultas idénticas simultáneas y métricas exportadas en /metrics. Solo están
+# disponibles al ejecutar desde el repositorio (p. ej. con web/server.py); en Vercel cada instancia
+# atiende una solicitud a la vez y no expone métricas.
+try:
+    from app.utils.performance_metrics import performance_tracker
+    from app.utils.single_flight import SingleFlight, make_key
+    from app.utils.slow_query_log import slow_query_log
+    from app.utils.tracing import annotate_retrieval, document_versions, tracer
+    from app.utils.usage import estimate_cost
+    QUERY_FLIGHTS = SingleFlight()
+except ImportError:
+    QUERY_FLIGHTS = None
+    performance_tracker = tracer = estimate_cost = slow_query_log = None
+
+# Paso de query_steps -> operación del rastreador de rendimiento
+METRIC_STAGES = {
+    "embedding": "embedding_generation",
+    "search_docs": "similarity_search",
+    "openai_call": "llm_response",
+    "total": "total_query_time"
+}
 
 # Función para formatear las fuentes de manera segura
 def formatSources(sources):
@@ -91,32 +127,65 @@ def formatSources(sources):
     
     return formatted_sources
 
-def register_query_in_database(query, response, sources):
+def build_query_record(query, response, sources, usage=None):
+    """Construye la fila de la tabla 'queries' para una consulta respondida."""
+    record = {
+        "query": query,
+        "response": response,
+        # Serializar sources como una cadena JSON para almacenarla en la BD
+        "sources": json.dumps(sources),
+        "created_at": datetime.now().isoformat()
+    }
+    if usage:
+        record["usage"] = usage
+    return record
+
+def build_usage(embedding_tokens, completion=None):
+    """Construye el registro de consumo de tokens de una consulta (mismo formato que app.utils.usage).
+    
+    Args:
+        embedding_tokens: Tokens del embedding de la consulta (0 si vino de la caché).
+        completion: Respuesta de chat.completions, o None si no se llamó al LLM.
+    """
+    usage = {"embedding_model": DEFAULT_EMBEDDING_MODEL, "embedding_tokens": embedding_tokens}
+    if completion is not None and completion.usage:
+        usage.update({
+            "llm_model": DEFAULT_MODEL,
+            "input_tokens": completion.usage.prompt_tokens,
+            "output_tokens": completion.usage.completion_tokens
+        })
+    # Sin el paquete app (Vercel) el coste se calcula después a partir de los tokens
+    if estimate_cost is not None:
+        usage["cost"] = estimate_cost(usage)
+    return usage
+
+def register_query_in_database(query, response, sources, usage=None):
     """Registra una consulta en la base de datos.
     
     Args:
         query: Texto de la consulta.
         response: Respuesta generada.
         sources: Fuentes utilizadas.
+        usage: Consumo de tokens de la consulta (ver build_usage).
     
     Returns:
         int or None: ID de la consulta registrada, o None si hubo un error.
     """
     try:
-        # Serializar sources como una cadena JSON para almacenarla en la BD
-        sources_json = json.dumps(sources)
-        
         # Datos para guardar en la tabla queries
-        query_data = {
-            "query": query,
-            "response": response,
-            "sources": sources_json,
-            "created_at": datetime.now().isoformat()
-        }
+        query_data = build_query_record(query, response, sources, usage)
         
         # Insertar en la tabla
         supabase_conn = create_client(SUPABASE_URL, SUPABASE_KEY)
-        insert_result = supabase_conn.table("queries").insert(query_data).execute()
+        try:
+            insert_result = supabase_conn.table("queries").insert(query_data).execute()
+        except Exception as e:
+            # Bases de datos creadas antes de la columna 'usage': registrar la consulta sin ella
+            if "usage" not in query_data or "usage" not in str(e):
+                raise
+            logger.warning("La tabla 'queries' no tiene la columna 'usage'; registrando la consulta sin consumo")
+            query_data.pop("usage")
+            insert_result = supabase_conn.table("queries").insert(query_data).execute()
         logger.info("Consulta registrada correctamente en la tabla 'queries'")
         
         # Obtener el ID de la consulta insertada
@@ -129,8 +198,11 @@ def register_query_in_database(query, response, sources):
         logger.error(f"Error al registrar la consulta en la tabla 'queries': {str(e)}")
         return None
 
-def get_embedding(text, use_cache=True):
-    """Genera un embedding para el texto dado usando la API de OpenAI con caché opcional."""
+def get_embedding(text, use_cache=True, timeout=None, usage=None):
+    """Genera un embedding para el texto dado usando la API de OpenAI con caché opcional.
+    
+    Si se pasa `usage` (diccionario), se guardan en él los tokens facturados en 'embedding_tokens'.
+    """
     if not text:
         logger.error("Texto vacío para generar embedding")
         raise ValueError("No se puede generar embedding para texto vacío")
@@ -138,9 +210,10 @@ def get_embedding(text, use_cache=True):
     start_time = time.time()
     
     # Usar caché si está habilitado
-    if use_cache and text in EMBEDDING_CACHE:
+    cached = find_cached_embedding(text) if use_cache else None
+    if cached is not None:
         logger.info(f"Usando embedding en caché para: {text[:30]}...")
-        return EMBEDDING_CACHE[text]
+        return cached
     
     logger.info("Iniciando generación de embedding...")
     
@@ -148,15 +221,18 @@ def get_embedding(text, use_cache=True):
     try:
         response = OPENAI_CLIENT.embeddings.create(
             input=[text],
-            model=DEFAULT_EMBEDDING_MODEL
+            model=DEFAULT_EMBEDDING_MODEL,
+            timeout=timeout
         )
         logger.info(f"Embedding generado correctamente en {time.time() - start_time:.3f}s")
         
         embedding = response.data[0].embedding
+        if usage is not None and response.usage:
+            usage["embedding_tokens"] = response.usage.prompt_tokens
         
         # Guardar en caché si está habilitado
         if use_cache:
-            EMBEDDING_CACHE[text] = embedding
+            EMBEDDING_CACHE.set(embedding_cache_key(text), embedding)
             
         return embedding
     except Exception as e:
@@ -164,51 +240,352 @@ def get_embedding(text, use_cache=True):
         logger.error(traceback.format_exc())
         raise Exception(f"Error en generación de embedding: {str(e)}")
 
+def embedding_cache_key(text):
+    """Clave de EMBEDDING_CACHE: la pregunta sin distinguir mayúsculas ni espacios."""
+    return " ".join(text.split()).lower()
+
+def find_cached_embedding(text):
+    """Busca en caché el embedding de una consulta equivalente (sin distinguir mayúsculas ni espacios)."""
+    return EMBEDDING_CACHE.get(embedding_cache_key(text))
+
+# Mensaje de sistema con instrucciones estrictas para el modelo
+SYSTEM_MESSAGE = """Eres un asistente restrictivo que SOLAMENTE puede responder usando la información de los documentos proporcionados.
+NUNCA uses conocimiento general o información externa a los documentos.
+DEBES citar la fuente exacta de cada pieza de información como (Documento #, Fragmento # de #).
+Si los documentos NO contienen información relevante, debes responder: "No puedo responder esta pregunta con los documentos proporcionados"."""
+
+def normalize_documents(rows):
+    """Convierte las filas devueltas por match_documents en documentos con formato de fuente."""
+    documents = []
+    if not rows:
+        return documents
+    
+    logger.info(f"Se encontraron {len(rows)} documentos relevantes")
+    for doc in rows:
+        # Verificar que doc sea un diccionario
+        if not isinstance(doc, dict):
+            logger.error(f"Documento no es un diccionario: {type(doc)}")
+            continue
+            
+        # Verificar que metadata existe y es un diccionario
+        metadata = doc.get('metadata', {})
+        if not isinstance(metadata, dict):
+            try:
+                # Intentar deserializar si viene como string
+                if isinstance(metadata, str):
+                    metadata = json.loads(metadata)
+                else:
+                    metadata = {}  # Si no es un diccionario ni string, usar uno vacío
+            except Exception as e:
+                logger.warning(f"Error al deserializar metadata: {e}")
+                metadata = {}  # Si hay error al deserializar, usar uno vacío
+            
+            logger.warning(f"Metadata no es un diccionario: {type(metadata)}")
+        
+        # Log detallado del metadata para debugging
+        logger.info(f"Metadata original: {json.dumps(metadata)}")
+        
+        # Asegurar que total_chunks siempre sea un número (1 por defecto si no existe)
+        total_chunks = metadata.get('total_chunks')
+        if total_chunks is None:
+            total_chunks = 1
+            logger.warning("total_chunks no encontrado en metadata, usando valor por defecto: 1")
+        else:
+            # Intentar convertir a número si es string
+            try:
+                total_chunks = int(total_chunks)
+            except (ValueError, TypeError):
+                logger.warning(f"Error al convertir total_chunks: {total_chunks}, usando valor por defecto: 1")
+                total_chunks = 1
+                
+        # Log de información de los campos principales        
+        logger.info(f"Valores extraídos - file_name: '{metadata.get('name', 'Desconocido')}', " +
+                  f"chunk_index: {metadata.get('chunk_index', 0)}, total_chunks: {total_chunks}")
+                
+        documents.append({
+            'content': doc.get('content', 'Contenido no disponible'),
+            'file_name': metadata.get('name', 'Desconocido'),
+            'file_id': metadata.get('file_id', ''),
+            'chunk_index': metadata.get('chunk_index', 0),
+            'total_chunks': total_chunks,  # Usar el valor procesado
+            'similarity': doc.get('similarity', 0)
+        })
+    
+    return documents
+
+def build_context(documents):
+    """Construye el bloque de contexto del prompt a partir de los documentos."""
+    context = ""
+    for i, doc in enumerate(documents):
+        context += f"\nDocumento {i+1} (Fragmento {doc['chunk_index']+1} de {doc['total_chunks']}):\n{doc['content']}\n"
+    return context
+
+def summarize_history(previous_summary, messages):
+    """Resume mensajes antiguos de la conversación, partiendo del resumen anterior si existe."""
+    prompt = "Resume en un máximo de 5 frases los temas y datos clave de esta conversación, " \
+             "para que un asistente pueda continuarla.\n\n"
+    if previous_summary:
+        prompt += f"Resumen previo: {previous_summary}\n\n"
+    prompt += format_messages(messages)
+    
+    completion = OPENAI_CLIENT.chat.completions.create(
+        model=FAST_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0,
+        max_tokens=250,
+        timeout=HISTORY_SUMMARY_TIMEOUT
+    )
+    return completion.choices[0].message.content.strip()
+
+# Historial acotado: últimos turnos literales y resumen en caché de los anteriores
+HISTORY_COMPACTOR = HistoryCompactor(
+    summarize_history,
+    max_tokens=int(os.getenv("HISTORY_MAX_TOKENS", "1500")),
+    keep_last_turns=int(os.getenv("HISTORY_KEEP_TURNS", "3"))
+)
+
+def rewrite_question(history_text, question, timeout=None):
+    """Convierte una pregunta de seguimiento en una consulta de búsqueda autónoma."""
+    completion = OPENAI_CLIENT.chat.completions.create(
+        model=FAST_MODEL,
+        messages=[
+            {"role": "system", "content": "Reescribe la última pregunta del usuario como una consulta de búsqueda "
+                                          "autónoma, en el mismo idioma, sustituyendo las referencias a la conversación "
+                                          "por su significado. Devuelve solo la consulta."},
+            {"role": "user", "content": f"Conversación:\n{history_text}\nÚltima pregunta: {question}"}
+        ],
+        temperature=0,
+        max_tokens=60,
+        timeout=timeout or QUERY_REWRITE_TIMEOUT
+    )
+    return completion.choices[0].message.content
+
+# Reescritura de preguntas de seguimiento, en caché por (hash del historial reciente, pregunta)
+QUERY_REWRITER = QueryRewriter(rewrite_question)
+
+def rewrite_search_query(query, conversation_history, stage):
+    """Obtiene la consulta de búsqueda dentro del presupuesto de la etapa `rewrite`.
+    
+    Con el presupuesto degradado o insuficiente solo se usa la caché de reescrituras.
+    """
+    return QUERY_REWRITER.rewrite(
+        query, conversation_history,
+        allow_model_call=stage.sufficient and not stage.degraded,
+        timeout=stage.timeout
+    )
+
+def format_conversation_history(conversation_history, timeout=None):
+    """Formatea el historial de conversación para el prompt, compactándolo si excede el presupuesto.
+    
+    Un resumen nuevo solo se espera `timeout` segundos; si no llega, se usa el del turno anterior.
+    """
+    conversation_context = HISTORY_COMPACTOR.compact(conversation_history, timeout=timeout)
+    if conversation_context:
+        logger.info(f"Historial formateado: {len(conversation_context)} caracteres")
+    return conversation_context
+
+def build_messages(query, context, conversation_context, brief=False):
+    """Crea los mensajes de sistema y de usuario para la llamada al modelo.
+    
+    Con brief=True se pide una respuesta corta (presupuesto de tiempo reducido).
+    """
+    history_section = f"Conversación previa:\n{conversation_context}\n" if conversation_context else ""
+    brief_section = "5. Queda poco tiempo: responde de forma breve, en un máximo de tres frases.\n" if brief else ""
+    
+    user_message = f"""
+INSTRUCCIONES ESTRICTAS:
+1. Responde ÚNICAMENTE usando la información presente en los documentos proporcionados.
+2. NO utilices NINGÚN conocimiento que no esté en los documentos.
+3. Cada afirmación DEBE terminar con su cita (Documento #, Fragmento # de #).
+4. Si no encuentras información relevante en los documentos, responde: "No puedo responder esta pregunta con los documentos proporcionados".
+{brief_section}
+{history_section}
+
+Documentos disponibles:
+{context}
+
+Pregunta actual: {query}
+
+RECUERDA: Solo puedes usar información de los documentos proporcionados. Cita TODAS las fuentes.
+"""
+    return [
+        {"role": "system", "content": SYSTEM_MESSAGE},
+        {"role": "user", "content": user_message}
+    ]
+
+def add_citation_warning(response_text, documents):
+    """Añade una advertencia si la respuesta no cita ningún documento."""
+    if documents and not re.search(r'\(Documento \d+', response_text):
+        logger.warning("La respuesta no contiene citas a los documentos - agregando advertencia")
+        response_text += "\n\nADVERTENCIA: Esta respuesta puede no estar basada en los documentos proporcionados. Por favor, solicita aclaración."
+    return response_text
+
+def retrieval_metadata(rows):
+    """Diagnósticos de la búsqueda que necesitan las trazas y el registro de consultas lentas.
+    
+    Args:
+        rows: Filas devueltas por match_documents.
+        
+    Returns:
+        dict: 'documents' (versión de cada documento usado) y 'chunks' (fragmentos recuperados y su
+        similitud), cada uno solo si su destino está disponible.
+    """
+    metadata = {}
+    if tracer is not None:
+        # Versión de cada documento usado, para enlazar la traza con su ingesta
+        metadata["documents"] = document_versions(rows)
+    if slow_query_log is not None:
+        # Fragmentos recuperados, para explicar las consultas lentas
+        metadata["chunks"] = [{"id": row.get("id"), "similarity": row.get("similarity", 0)} for row in rows or []]
+    return metadata
+
+def record_query(result, start_time, route="/api/query"):
+    """Exporta las métricas, la traza y, si fue lenta, el registro de una consulta web.
+    
+    Lo usan el endpoint síncrono (process_query) y el ASGI (query_async.process_query_async).
+    """
+    record_query_metrics(result, route)
+    trace_id = record_query_trace(result, start_time, route)
+    record_slow_query(result, trace_id, route)
+
+def record_query_metrics(result, route="/api/query"):
+    """Exporta los tiempos por etapa y el resultado de una consulta (si las métricas están disponibles)."""
+    if performance_tracker is None:
+        return
+    query_steps = result.get("metadata", {}).get("query_steps", {})
+    for step, operation in METRIC_STAGES.items():
+        if step in query_steps:
+            performance_tracker.track_stage(operation, query_steps[step], model=DEFAULT_MODEL, route=route)
+    status = "error" if "error" in result else result.get("metadata", {}).get("error", "ok")
+    performance_tracker.count_query(status, model=DEFAULT_MODEL, route=route)
+    if "usage" in result.get("metadata", {}):
+        performance_tracker.track_usage("query", result["metadata"].get("query", ""), result["metadata"]["usage"])
+
+def record_query_trace(result, start_time, route="/api/query"):
+    """Exporta la traza de una consulta a partir de sus tiempos por etapa (si el trazador está disponible).
+    
+    Returns:
+        str o None: Identificador de la traza.
+    """
+    if tracer is None:
+        return None
+    metadata = result.get("metadata", {})
+    steps = {step: seconds for step, seconds in metadata.get("query_steps", {}).items() if step not in ("total", "error_time")}
+    usage = metadata.get("usage", {})
+    attributes = {
+        "route": route,
+        "model": DEFAULT_MODEL,
+        "top_k": metadata.get("num_results"),
+        "similarity_threshold": metadata.get("similarity_threshold"),
+        "query.rewritten": "search_query" in metadata,
+        "cost_usd": usage.get("cost")
+    }
+    with tracer.record_steps("web.query", start_time, steps, attributes) as root:
+        if "error" in result or metadata.get("error"):
+            root.error = str(result.get("error") or metadata.get("error"))
+        if root.child("embedding"):
+            root.child("embedding").set_attributes(cache_hit=metadata.get("embedding_cached"),
+                                                   **{"embedding.tokens": usage.get("embedding_tokens")})
+        if root.child("search_docs"):
+            search_span = root.child("search_docs")
+            search_span.set_attribute("top_k", metadata.get("match_count"))
+            annotate_retrieval(search_span, result.get("sources", []), metadata.get("documents", []))
+        if root.child("openai_call"):
+            root.child("openai_call").set_attributes(**{
+                "llm.input_tokens": usage.get("input_tokens"),
+                "llm.output_tokens": usage.get("output_tokens"),
+                "llm.degraded": metadata.get("stages", {}).get("llm", {}).get("degraded")
+            })
+    return root.trace_id
+
+def record_slow_query(result, trace_id=None, route="/api/query"):
+    """Guarda la consulta en el registro de consultas lentas si superó el umbral."""
+    if slow_query_log is None or "metadata" not in result:
+        return
+    metadata = result["metadata"]
+    query_steps = metadata.get("query_steps", {})
+    steps = {step: seconds for step, seconds in query_steps.items() if step not in ("total", "error_time")}
+    total = query_steps.get("total", metadata.get("processing_time", 0.0))
+    slow_query_log.record(route, metadata.get("query", ""), total, steps,
+                          usage=metadata.get("usage"), chunks=metadata.get("chunks"), trace_id=trace_id)
+
 def process_query(query, similarity_threshold=0.1, num_results=5, timeout=MAX_RESPONSE_TIME, conversation_history=[]):
-    """Procesa una consulta usando la API de OpenAI y Supabase directamente."""
+    """Procesa una consulta, compartiendo el cálculo con las consultas idénticas que estén en curso."""
+    def compute():
+        start_time = time.time()
+        result = _process_query(query, similarity_threshold, num_results, timeout, conversation_history)
+        record_query(result, start_time)
+        return result
+    
+    if QUERY_FLIGHTS is None:
+        return compute()
+    
+    key = make_key(query, similarity_threshold=similarity_threshold, num_results=num_results,
+                   conversation_history=conversation_history or [])
+    try:
+        result, shared = QUERY_FLIGHTS.do(key, compute, timeout=timeout)
+    except TimeoutError:
+        return {"error": "Tiempo agotado esperando una consulta idéntica en curso"}
+    
+    if shared:
+        logger.info("Resultado compartido con una consulta idéntica en curso")
+    # Copia para que cada solicitud pueda añadir su query_id sin afectar a las demás
+    return dict(result)
+
+def _process_query(query, similarity_threshold, num_results, timeout, conversation_history):
+    """Procesa una consulta usando la API de OpenAI y Supabase directamente.
+    
+    El plazo se propaga a cada etapa. Cuando el presupuesto de una etapa queda por debajo del
+    nominal se aplica una alternativa más barata: embedding en caché, menos resultados en la
+    búsqueda o una respuesta más corta. El detalle queda en metadata["stages"].
+    """
     start_time = time.time()
+    deadline = Deadline(timeout, MAX_RESPONSE_TIME)
     query_steps = {}
     
     try:
-        # Inicializar clientes
         if not OPENAI_CLIENT:
             return {"error": "API key de OpenAI no configurada"}
         
         if not SUPABASE_URL or not SUPABASE_KEY:
             return {"error": "Credenciales de Supabase no configuradas"}
-            
-        try:
-            supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-            init_time = time.time() - start_time
-            query_steps["init"] = init_time
-            logger.info(f"Clientes inicializados en {init_time:.3f}s")
-        except Exception as e:
-            logger.error(f"Error al inicializar Supabase: {str(e)}")
-            return {"error": f"Error al conectar con Supabase: {str(e)}"}
+        
+        # 0. Reescribir las preguntas de seguimiento como consultas autónomas para la búsqueda
+        rewrite_start = time.time()
+        search_query, rewritten = rewrite_search_query(query, conversation_history, deadline.stage("rewrite"))
+        query_steps["rewrite"] = time.time() - rewrite_start
         
         # 1. Generar embedding de la consulta
         logger.info("Generando embedding de la consulta...")
         embed_start = time.time()
-        
-        try:
-            query_embedding = get_embedding(query)
-            query_steps["embedding"] = time.time() - embed_start
-            logger.info(f"Embedding generado en {query_steps['embedding']:.3f}s")
-        except Exception as e:
-            logger.error(f"Error al generar embedding: {str(e)}")
-            return {"error": f"Error al generar embedding: {str(e)}"}
+        embedding_cached = find_cached_embedding(search_query) is not None
+        embedding_usage = {}
+        query_embedding = get_embedding_within(search_query, deadline.stage("embedding"), embedding_usage)
+        query_steps["embedding"] = time.time() - embed_start
+        if query_embedding is None:
+            return {"error": "Tiempo insuficiente para generar el embedding de la consulta"}
+        logger.info(f"Embedding obtenido en {query_steps['embedding']:.3f}s")
         
         # 2. Buscar documentos similares
         logger.info("Buscando documentos similares...")
-        search_start = time.time()
+        search_stage = deadline.stage("search")
+        if not search_stage.sufficient:
+            return {"error": "Tiempo insuficiente para buscar documentos"}
+        
+        match_count = num_results
+        if search_stage.degraded:
+            match_count = max(2, num_results // 2)
+            logger.warning(f"Presupuesto de búsqueda reducido ({search_stage.timeout:.2f}s): top_k {num_results} -> {match_count}")
         
+        search_start = time.time()
         try:
+            supabase = create_client(SUPABASE_URL, SUPABASE_KEY, ClientOptions(postgrest_client_timeout=search_stage.timeout))
             result = supabase.rpc(
                 'match_documents',
                 {
                     'query_embedding': query_embedding,
                     'match_threshold': similarity_threshold,
-                    'match_count': num_results
+                    'match_count': match_count
                 }
             ).execute()
             query_steps["search_docs"] = time.time() - search_start
@@ -216,175 +593,71 @@ def process_query(query, similarity_threshold=0.1, num_results=5, timeout=MAX_RE
             logger.error(f"Error en búsqueda de Supabase: {str(e)}")
             return {"error": f"Error en búsqueda de documentos: {str(e)}"}
         
-        # Actualizar tiempo restante
-        time_used = time.time() - start_time
-        time_remaining = timeout - time_used
-        logger.info(f"Tiempo usado: {time_used:.3f}s, restante: {time_remaining:.3f}s")
-        
-        if time_remaining < 3.0:
-            return {"error": "Tiempo insuficiente después de la búsqueda"}
-        
         # Preparar documentos
         logger.info("Procesando resultados de la búsqueda...")
-        documents = []
-        if result.data:
-            logger.info(f"Se encontraron {len(result.data)} documentos relevantes")
-            for doc in result.data:
-                # Verificar que doc sea un diccionario
-                if not isinstance(doc, dict):
-                    logger.error(f"Documento no es un diccionario: {type(doc)}")
-                    continue
-                    
-                # Verificar que metadata existe y es un diccionario
-                metadata = doc.get('metadata', {})
-                if not isinstance(metadata, dict):
-                    try:
-                        # Intentar deserializar si viene como string
-                        if isinstance(metadata, str):
-                            metadata = json.loads(metadata)
-                        else:
-                            metadata = {}  # Si no es un diccionario ni string, usar uno vacío
-                    except Exception as e:
-                        logger.warning(f"Error al deserializar metadata: {e}")
-                        metadata = {}  # Si hay error al deserializar, usar uno vacío
-                    
-                    logger.warning(f"Metadata no es un diccionario: {type(metadata)}")
-                
-                # Log detallado del metadata para debugging
-                logger.info(f"Metadata original: {json.dumps(metadata)}")
-                
-                # Asegurar que total_chunks siempre sea un número (1 por defecto si no existe)
-                total_chunks = metadata.get('total_chunks')
-                if total_chunks is None:
-                    total_chunks = 1
-                    logger.warning("total_chunks no encontrado en metadata, usando valor por defecto: 1")
-                else:
-                    # Intentar convertir a número si es string
-                    try:
-                        total_chunks = int(total_chunks)
-                    except (ValueError, TypeError):
-                        logger.warning(f"Error al convertir total_chunks: {total_chunks}, usando valor por defecto: 1")
-                        total_chunks = 1
-                        
-                # Log de información de los campos principales        
-                logger.info(f"Valores extraídos - file_name: '{metadata.get('name', 'Desconocido')}', " +
-                          f"chunk_index: {metadata.get('chunk_index', 0)}, total_chunks: {total_chunks}")
-                        
-                documents.append({
-                    'content': doc.get('content', 'Contenido no disponible'),
-                    'file_name': metadata.get('name', 'Desconocido'),
-                    'file_id': metadata.get('file_id', ''),
-                    'chunk_index': metadata.get('chunk_index', 0),
-                    'total_chunks': total_chunks,  # Usar el valor procesado
-                    'similarity': doc.get('similarity', 0)
-                })
+        documents = normalize_documents(result.data)
+        metadata = {
+            "query": query,
+            "similarity_threshold": similarity_threshold,
+            "num_results": num_results,
+            "query_steps": query_steps,
+            "stages": deadline.stages,
+            "match_count": match_count,
+            "embedding_cached": embedding_cached
+        }
+        if rewritten:
+            metadata["search_query"] = search_query
+        metadata.update(retrieval_metadata(result.data))
         
         # No se encontraron documentos relevantes
         if not documents:
             logger.warning("No se encontraron documentos relevantes para la consulta")
             query_steps["total"] = time.time() - start_time
+            metadata["processing_time"] = query_steps["total"]
+            metadata["usage"] = build_usage(embedding_usage.get("embedding_tokens", 0))
             return {
                 "response": "No se encontraron documentos relevantes para tu consulta. Por favor, intenta reformular tu pregunta o ajusta el umbral de similitud.",
                 "sources": [],
-                "metadata": {
-                    "query": query,
-                    "processing_time": time.time() - start_time,
-                    "similarity_threshold": similarity_threshold,
-                    "num_results": num_results,
-                    "query_steps": query_steps
-                }
+                "metadata": metadata
             }
         
         # Construir el contexto
         logger.info("Construyendo contexto para el prompt...")
         context_start = time.time()
-        context = ""
-        for i, doc in enumerate(documents):
-            context += f"\nDocumento {i+1} (Fragmento {doc['chunk_index']+1} de {doc['total_chunks']}):\n{doc['content']}\n"
+        context = build_context(documents)
         query_steps["context_building"] = time.time() - context_start
         
-        # Actualizar tiempo restante
-        time_used = time.time() - start_time
-        time_remaining = timeout - time_used
-        logger.info(f"Tiempo usado: {time_used:.3f}s, restante: {time_remaining:.3f}s")
+        # El historial se compacta antes de calcular el presupuesto del LLM; el resumen nuevo solo se
+        # espera dentro del presupuesto de su etapa
+        conversation_context = format_conversation_history(conversation_history, deadline.stage("history").timeout)
         
-        if time_remaining < 3.0:
+        # 3. Generar la respuesta
+        llm_stage = deadline.stage("llm")
+        if not llm_stage.sufficient:
             return {"error": "Tiempo insuficiente después de construir el contexto"}
         
-        # Llamar directamente a la API de OpenAI
-        logger.info("Llamando a la API de OpenAI...")
-        logger.info(f"Usando modelo: {DEFAULT_MODEL}")
-        
-        # Formatear el historial de conversación para incluirlo en el prompt
-        conversation_context = ""
-        if conversation_history and isinstance(conversation_history, list) and len(conversation_history) > 0:
-            logger.info(f"Formateando historial de conversación ({len(conversation_history)} mensajes)")
-            for message in conversation_history:
-                role = message.get('role', '')
-                content = message.get('content', '')
-                if role and content:
-                    conversation_context += f"{role.capitalize()}: {content}\n\n"
-            logger.info(f"Historial formateado: {len(conversation_context)} caracteres")
-        
-        # Crear el prompt con instrucciones estrictas
-        system_message = """Eres un asistente restrictivo que SOLAMENTE puede responder usando la información de los documentos proporcionados.
-NUNCA uses conocimiento general o información externa a los documentos.
-DEBES citar la fuente exacta de cada pieza de información como (Documento #, Fragmento # de #).
-Si los documentos NO contienen información relevante, debes responder: "No puedo responder esta pregunta con los documentos proporcionados"."""
+        messages = build_messages(query, context, conversation_context, brief=llm_stage.degraded)
+        max_tokens = 500 if llm_stage.degraded else 1000
         
-        user_message = f"""
-INSTRUCCIONES ESTRICTAS:
-1. Responde ÚNICAMENTE usando la información presente en los documentos proporcionados.
-2. NO utilices NINGÚN conocimiento que no esté en los documentos.
-3. Cada afirmación DEBE terminar con su cita (Documento #, Fragmento # de #).
-4. Si no encuentras información relevante en los documentos, responde: "No puedo responder esta pregunta con los documentos proporcionados".
-
-{f"Conversación previa:\n{conversation_context}\n" if conversation_context else ""}
-
-Documentos disponibles:
-{context}
-
-Pregunta actual: {query}
-
-RECUERDA: Solo puedes usar información de los documentos proporcionados. Cita TODAS las fuentes.
-"""
-        
-        # Adaptamos los tokens según el tiempo restante
-        max_tokens = 1000
-        if time_remaining < 10.0:
-            max_tokens = 500  # Reducir tokens si queda poco tiempo
-        
-        # Llamar a la API con timeout adaptado al tiempo restante
+        logger.info(f"Llamando a la API de OpenAI ({DEFAULT_MODEL}) con {llm_stage.timeout:.2f}s de presupuesto...")
         openai_start = time.time()
         try:
-            # Usamos un timeout reducido - nunca mayor que el tiempo restante menos un margen
-            openai_timeout = min(time_remaining - 1.0, 15.0)
-            
             completion = OPENAI_CLIENT.chat.completions.create(
                 model=DEFAULT_MODEL,
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": user_message}
-                ],
+                messages=messages,
                 temperature=0.3,  # Reducir temperatura para respuestas más deterministas (antes era 0.7)
                 max_tokens=max_tokens,
-                timeout=openai_timeout
+                timeout=llm_stage.timeout
             )
             
             response_text = completion.choices[0].message.content
             query_steps["openai_call"] = time.time() - openai_start
+            metadata["usage"] = build_usage(embedding_usage.get("embedding_tokens", 0), completion)
             
             # Verificar que la respuesta incluya citas de documentos
-            if documents and not re.search(r'\(Documento \d+', response_text):
-                logger.warning("La respuesta no contiene citas a los documentos - agregando advertencia")
-                response_text += "\n\nADVERTENCIA: Esta respuesta puede no estar basada en los documentos proporcionados. Por favor, solicita aclaración."
-                
-                # Opcional: Forzar una respuesta que indique que no se encontró información
-                # response_text = "No puedo responder esta pregunta con información específica de los documentos proporcionados. Por favor, reformula tu pregunta o solicita información disponible en los documentos."
+            response_text = add_citation_warning(response_text, documents)
             
-            logger.info(f"Hora fin de llamada a OpenAI: {time.strftime('%Y-%m-%d %H:%M:%S')}")
             logger.info(f"Tiempo total de llamada a OpenAI: {time.time() - openai_start:.2f}s")
-            logger.info("Respuesta generada correctamente")
             logger.info(f"Longitud de la respuesta: {len(response_text)}")
         
         except Exception as e:
@@ -393,18 +666,13 @@ RECUERDA: Solo puedes usar información de los documentos proporcionados. Cita T
             
             # Manejar específicamente errores de timeout
             error_str = str(e).lower()
-            if "timeout" in error_str:
+            if "timeout" in error_str or "timed out" in error_str:
+                metadata["error"] = "timeout"
+                metadata["processing_time"] = time.time() - start_time
                 return {
                     "response": "Lo siento, la respuesta está tomando demasiado tiempo. Por favor, intenta una pregunta más específica o más corta.",
                     "sources": documents,
-                    "metadata": {
-                        "error": "timeout",
-                        "query": query,
-                        "processing_time": time.time() - start_time,
-                        "similarity_threshold": similarity_threshold,
-                        "num_results": num_results,
-                        "query_steps": query_steps
-                    }
+                    "metadata": metadata
                 }
             
             return {"error": f"Error al generar respuesta con OpenAI: {str(e)}"}
@@ -413,27 +681,14 @@ RECUERDA: Solo puedes usar información de los documentos proporcionados. Cita T
         processing_time = time.time() - start_time
         logger.info(f"Proceso completo en {processing_time:.2f} segundos")
         query_steps["total"] = processing_time
+        metadata["processing_time"] = processing_time
         
         # Log detallado de tiempos por etapa
         for step, duration in query_steps.items():
             logger.info(f"  - Tiempo {step}: {duration:.3f}s")
         
-        result = {
-            "response": response_text,
-            "sources": documents,
-            "metadata": {
-                "query": query,
-                "processing_time": processing_time,
-                "similarity_threshold": similarity_threshold,
-                "num_results": num_results,
-                "query_steps": query_steps
-            }
-        }
-        
-        # Ya no registramos la consulta aquí para evitar duplicados
-        # La consulta ya se registra en el manejador HTTP (Handler.do_POST)
-        
-        return result
+        # La consulta se registra en el manejador HTTP (Handler.do_POST)
+        return {"response": response_text, "sources": documents, "metadata": metadata}
     
     except Exception as e:
         logger.error(f"Error en process_query: {e}")
@@ -443,10 +698,84 @@ RECUERDA: Solo puedes usar información de los documentos proporcionados. Cita T
             "error": str(e),
             "traceback": traceback.format_exc(),
             "metadata": {
-                "query_steps": query_steps
+                "query_steps": query_steps,
+                "stages": deadline.stages
             }
         }
 
+def get_embedding_within(query, stage, usage=None):
+    """Obtiene el embedding de la consulta respetando el presupuesto de la etapa.
+    
+    Con presupuesto degradado se prefiere el embedding en caché de una consulta equivalente;
+    si la llamada a la API falla o agota su tiempo, también se recurre a la caché. La consulta a la
+    caché es una búsqueda directa por la pregunta normalizada, así que la alternativa no consume el
+    presupuesto que ya se ha agotado.
+    
+    Returns:
+        El embedding, o None si no hay tiempo ni embedding en caché.
+    """
+    cached = find_cached_embedding(query) if stage.degraded or not stage.sufficient else None
+    if cached is not None:
+        logger.warning(f"Presupuesto de embedding reducido ({stage.timeout:.2f}s): usando embedding en caché")
+        return cached
+    if not stage.sufficient:
+        return None
+    
+    try:
+        return get_embedding(query, timeout=stage.timeout, usage=usage)
+    except Exception:
+        cached = find_cached_embedding(query)
+        if cached is None:
+            raise
+        logger.warning("Fallo al generar el embedding: usando embedding en caché de una consulta equivalente")
+        return cached
+
+# Metadatos de diagnóstico interno (trazas, registro de consultas lentas) que no se envían al cliente
+INTERNAL_METADATA = ("documents", "chunks", "stages", "match_count", "embedding_cached")
+
+def public_result(rag_result):
+    """Copia del resultado sin los metadatos de diagnóstico interno, para enviarla al cliente."""
+    metadata = rag_result.get("metadata")
+    if not isinstance(metadata, dict):
+        return rag_result
+    public_metadata = {key: value for key, value in metadata.items() if key not in INTERNAL_METADATA}
+    return {**rag_result, "metadata": public_metadata}
+
+def check_rag_result(rag_result):
+    """Valida el resultado de process_query y normaliza sus fuentes.
+    
+    Args:
+        rag_result: Resultado devuelto por process_query.
+    
+    Returns:
+        str or None: Mensaje de error para el cliente, o None si el resultado es válido.
+    """
+    # Verificar el tipo de rag_result
+    if not isinstance(rag_result, dict):
+        logger.error(f"Tipo inesperado de rag_result: {type(rag_result)}")
+        log_to_file(f"Error: Tipo inesperado de rag_result: {type(rag_result)}")
+        return "Error interno: resultado inesperado"
+    
+    if "error" in rag_result:
+        logger.error(f"Error devuelto por process_query: {rag_result['error']}")
+        log_to_file(f"Error en process_query: {rag_result['error']}")
+        return f"No se pudo procesar tu consulta: {rag_result['error']}"
+    
+    # Verificar que rag_result contiene respuesta y fuentes
+    if "response" not in rag_result:
+        logger.error("rag_result no contiene campo 'response'")
+        log_to_file("Error: rag_result no contiene campo 'response'")
+        return "Error interno: formato de respuesta incorrecto"
+    
+    # Asegurar que sources sea una lista
+    if "sources" not in rag_result or not isinstance(rag_result["sources"], list):
+        logger.warning("rag_result contiene sources en formato incorrecto, ajustando")
+        rag_result["sources"] = []
+    
+    # Normalizar las fuentes usando la función de formato segura
+    rag_result["sources"] = formatSources(rag_result["sources"])
+    return None
+
 class Handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
         self.send_response(200)
@@ -549,47 +878,24 @@ class Handler(BaseHTTPRequestHandler):
                 process_time = time.time() - start_time
                 logger.info(f"process_query completado en {process_time:.3f}s")
                 
-                # Verificar el tipo de rag_result
-                if not isinstance(rag_result, dict):
-                    logger.error(f"Tipo inesperado de rag_result: {type(rag_result)}")
-                    response = {'error': f"Error interno: resultado inesperado"}
-                    self.wfile.write(json.dumps(response).encode())
-                    log_to_file(f"Error: Tipo inesperado de rag_result: {type(rag_result)}")
-                    return
-                
-                if "error" in rag_result:
-                    logger.error(f"Error devuelto por process_query: {rag_result['error']}")
-                    response = {'error': f"No se pudo procesar tu consulta: {rag_result['error']}"}
+                # Validar el resultado y normalizar sus fuentes
+                result_error = check_rag_result(rag_result)
+                if result_error:
+                    response = {'error': result_error}
                     self.wfile.write(json.dumps(response).encode())
-                    log_to_file(f"Error en process_query: {rag_result['error']}")
                     return
                 
-                # Verificar que rag_result contiene respuesta y fuentes
-                if "response" not in rag_result:
-                    logger.error("rag_result no contiene campo 'response'")
-                    response = {'error': "Error interno: formato de respuesta incorrecto"}
-                    self.wfile.write(json.dumps(response).encode())
-                    log_to_file("Error: rag_result no contiene campo 'response'")
-                    return
-                
-                # Asegurar que sources sea una lista
-                if "sources" not in rag_result or not isinstance(rag_result["sources"], list):
-                    logger.warning("rag_result contiene sources en formato incorrecto, ajustando")
-                    rag_result["sources"] = []
-                
-                # Normalizar las fuentes usando la función de formato segura
-                rag_result["sources"] = formatSources(rag_result["sources"])
-                
                 logger.info(f"Respuesta generada ({len(rag_result['response'])} caracteres): {rag_result['response'][:100]}...")
                 
                 # Registrar la consulta en la tabla 'queries'
-                query_id = register_query_in_database(query, rag_result["response"], rag_result["sources"])
+                query_id = register_query_in_database(query, rag_result["response"], rag_result["sources"],
+                                                      rag_result.get("metadata", {}).get("usage"))
                 if query_id:
                     rag_result["query_id"] = query_id
                 
                 # Enviar respuesta
                 logger.info(f"Enviando respuesta al cliente: {time.time() - start_time:.3f}s")
-                response_json = json.dumps(rag_result)
+                response_json = json.dumps(public_result(rag_result))
                 log_to_file(f"Respuesta preparada (longitud: {len(response_json)})")
                 self.wfile.write(response_json.encode())
                 logger.info(f"=== FIN DE SOLICITUD === Total: {time.time() - start_time:.3f}s")
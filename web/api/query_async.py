@@ -0,0 +1,374 @@
+"""
+Endpoint asíncrono de consultas RAG.
+
+Aplicación ASGI equivalente a `query.Handler`, construida sobre `AsyncOpenAI` y llamadas a la API
+REST de Supabase (PostgREST) con `httpx.AsyncClient`. Ninguna etapa bloquea un hilo, por lo que un
+solo proceso puede atender muchas consultas simultáneas. El plazo de la solicitud se propaga a cada
+llamada y, si se agota o el cliente se desconecta, las llamadas en curso se cancelan.
+
+Ejecución local:
+    uvicorn query_async:app --app-dir web/api --port 8001
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import traceback
+
+import httpx
+from openai import AsyncOpenAI
+
+# Permitir importar los módulos hermanos (query.py) tanto en Vercel como en local
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from _deadline import Deadline
+from query import (
+    DEFAULT_EMBEDDING_MODEL,
+    DEFAULT_MODEL,
+    EMBEDDING_CACHE,
+    LOG_DEBUG,
+    MAX_RESPONSE_TIME,
+    SUPABASE_KEY,
+    SUPABASE_URL,
+    add_citation_warning,
+    build_context,
+    build_messages,
+    build_query_record,
+    build_usage,
+    check_rag_result,
+    embedding_cache_key,
+    find_cached_embedding,
+    format_conversation_history,
+    log_to_file,
+    normalize_documents,
+    openai_api_key,
+    public_result,
+    record_query,
+    retrieval_metadata,
+    rewrite_search_query,
+)
+
+logger = logging.getLogger(__name__)
+
+# Ruta con la que se etiquetan las métricas, trazas y consultas lentas de este endpoint
+ROUTE = "/api/query_async"
+
+# Cliente global asíncrono de OpenAI
+ASYNC_OPENAI_CLIENT = AsyncOpenAI(api_key=openai_api_key) if openai_api_key else None
+
+# Cliente HTTP para PostgREST; se crea al primer uso dentro del bucle de eventos del servidor
+_rest_client = None
+
+def get_rest_client():
+    """Obtiene el cliente asíncrono compartido para la API REST de Supabase."""
+    global _rest_client
+    if _rest_client is None:
+        _rest_client = httpx.AsyncClient(
+            base_url=f"{SUPABASE_URL}/rest/v1",
+            headers={
+                "apikey": SUPABASE_KEY,
+                "Authorization": f"Bearer {SUPABASE_KEY}",
+                "Content-Type": "application/json"
+            },
+            timeout=10.0
+        )
+    return _rest_client
+
+def log_in_background(message):
+    """Escribe en el log de depuración sin bloquear el bucle de eventos."""
+    if LOG_DEBUG:
+        asyncio.get_running_loop().run_in_executor(None, log_to_file, message)
+
+async def get_embedding_async(text, timeout=None, usage=None):
+    """Genera el embedding de la consulta con AsyncOpenAI, usando la caché compartida con query.py."""
+    if not text:
+        raise ValueError("No se puede generar embedding para texto vacío")
+
+    cached = find_cached_embedding(text)
+    if cached is not None:
+        logger.info(f"Usando embedding en caché para: {text[:30]}...")
+        return cached
+
+    response = await ASYNC_OPENAI_CLIENT.embeddings.create(
+        input=[text.replace("\n", " ")],
+        model=DEFAULT_EMBEDDING_MODEL,
+        timeout=timeout
+    )
+    embedding = response.data[0].embedding
+    if usage is not None and response.usage:
+        usage["embedding_tokens"] = response.usage.prompt_tokens
+    EMBEDDING_CACHE.set(embedding_cache_key(text), embedding)
+    return embedding
+
+async def register_query_async(query, response, sources, usage=None, timeout=5.0):
+    """Registra la consulta en la tabla 'queries' y devuelve su ID (o None si falla)."""
+    try:
+        result = await get_rest_client().post(
+            "/queries",
+            json=build_query_record(query, response, sources, usage),
+            headers={"Prefer": "return=representation"},
+            timeout=timeout
+        )
+        result.raise_for_status()
+        rows = result.json()
+        return rows[0].get("id") if rows else None
+    except Exception as e:
+        logger.error(f"Error al registrar la consulta en la tabla 'queries': {str(e)}")
+        return None
+
+async def get_embedding_within_async(query, stage, usage=None):
+    """Versión asíncrona de query.get_embedding_within."""
+    cached = find_cached_embedding(query) if stage.degraded or not stage.sufficient else None
+    if cached is not None:
+        logger.warning(f"Presupuesto de embedding reducido ({stage.timeout:.2f}s): usando embedding en caché")
+        return cached
+    if not stage.sufficient:
+        return None
+
+    try:
+        return await asyncio.wait_for(get_embedding_async(query, stage.timeout, usage), stage.timeout)
+    except Exception:
+        cached = find_cached_embedding(query)
+        if cached is None:
+            raise
+        logger.warning("Fallo al generar el embedding: usando embedding en caché de una consulta equivalente")
+        return cached
+
+async def process_query_async(query, similarity_threshold=0.1, num_results=5, timeout=MAX_RESPONSE_TIME, conversation_history=None):
+    """Versión asíncrona de process_query con el mismo formato de resultado y los mismos presupuestos por etapa.
+    
+    Como el endpoint síncrono, exporta las métricas, la traza y el registro de consultas lentas de
+    cada consulta (fuera del bucle de eventos, porque pueden escribir en disco).
+    """
+    start_time = time.time()
+    result = await _process_query_async(query, similarity_threshold, num_results, timeout, conversation_history)
+    await asyncio.get_running_loop().run_in_executor(None, record_query, result, start_time, ROUTE)
+    return result
+
+async def _process_query_async(query, similarity_threshold, num_results, timeout, conversation_history):
+    """Procesa la consulta con llamadas asíncronas a OpenAI y PostgREST."""
+    start_time = time.time()
+    deadline = Deadline(timeout, MAX_RESPONSE_TIME)
+    query_steps = {}
+
+    try:
+        # 0. Reescribir las preguntas de seguimiento (llamada síncrona, fuera del bucle de eventos)
+        rewrite_start = time.time()
+        search_query, rewritten = await asyncio.get_running_loop().run_in_executor(
+            None, rewrite_search_query, query, conversation_history, deadline.stage("rewrite")
+        )
+        query_steps["rewrite"] = time.time() - rewrite_start
+
+        # 1. Generar embedding de la consulta
+        embed_start = time.time()
+        embedding_cached = find_cached_embedding(search_query) is not None
+        embedding_usage = {}
+        query_embedding = await get_embedding_within_async(search_query, deadline.stage("embedding"), embedding_usage)
+        query_steps["embedding"] = time.time() - embed_start
+        if query_embedding is None:
+            return {"error": "Tiempo insuficiente para generar el embedding de la consulta"}
+
+        # 2. Buscar documentos similares
+        search_stage = deadline.stage("search")
+        if not search_stage.sufficient:
+            return {"error": "Tiempo insuficiente para buscar documentos"}
+        match_count = max(2, num_results // 2) if search_stage.degraded else num_results
+
+        search_start = time.time()
+        search_response = await get_rest_client().post("/rpc/match_documents", json={
+            'query_embedding': query_embedding,
+            'match_threshold': similarity_threshold,
+            'match_count': match_count
+        }, timeout=search_stage.timeout)
+        search_response.raise_for_status()
+        query_steps["search_docs"] = time.time() - search_start
+
+        rows = search_response.json()
+        documents = normalize_documents(rows)
+        metadata = {
+            "query": query,
+            "similarity_threshold": similarity_threshold,
+            "num_results": num_results,
+            "query_steps": query_steps,
+            "stages": deadline.stages,
+            "match_count": match_count,
+            "embedding_cached": embedding_cached
+        }
+        if rewritten:
+            metadata["search_query"] = search_query
+        metadata.update(retrieval_metadata(rows))
+
+        if not documents:
+            query_steps["total"] = time.time() - start_time
+            metadata["processing_time"] = query_steps["total"]
+            metadata["usage"] = build_usage(embedding_usage.get("embedding_tokens", 0))
+            return {
+                "response": "No se encontraron documentos relevantes para tu consulta. Por favor, intenta reformular tu pregunta o ajusta el umbral de similitud.",
+                "sources": [],
+                "metadata": metadata
+            }
+
+        # La espera del resumen del historial (acotada por su etapa) ocurre fuera del bucle de eventos
+        conversation_context = await asyncio.get_running_loop().run_in_executor(
+            None, format_conversation_history, conversation_history, deadline.stage("history").timeout
+        )
+
+        # 3. Generar la respuesta
+        llm_stage = deadline.stage("llm")
+        if not llm_stage.sufficient:
+            return {"error": "Tiempo insuficiente después de construir el contexto"}
+
+        context = build_context(documents)
+        messages = build_messages(query, context, conversation_context, brief=llm_stage.degraded)
+
+        openai_start = time.time()
+        completion = await asyncio.wait_for(ASYNC_OPENAI_CLIENT.chat.completions.create(
+            model=DEFAULT_MODEL,
+            messages=messages,
+            temperature=0.3,
+            max_tokens=500 if llm_stage.degraded else 1000,
+            timeout=llm_stage.timeout
+        ), llm_stage.timeout)
+        query_steps["openai_call"] = time.time() - openai_start
+
+        response_text = add_citation_warning(completion.choices[0].message.content, documents)
+
+        query_steps["total"] = time.time() - start_time
+        metadata["processing_time"] = query_steps["total"]
+        metadata["usage"] = build_usage(embedding_usage.get("embedding_tokens", 0), completion)
+        return {"response": response_text, "sources": documents, "metadata": metadata}
+
+    except (asyncio.TimeoutError, httpx.TimeoutException):
+        logger.error(f"La consulta superó el plazo de {timeout:.1f}s; llamadas en curso canceladas")
+        query_steps["error_time"] = time.time() - start_time
+        return {
+            "response": "Lo siento, la respuesta está tomando demasiado tiempo. Por favor, intenta una pregunta más específica o más corta.",
+            "sources": [],
+            "metadata": {"error": "timeout", "query": query, "query_steps": query_steps, "stages": deadline.stages}
+        }
+    except Exception as e:
+        logger.error(f"Error en process_query_async: {e}")
+        logger.error(traceback.format_exc())
+        query_steps["error_time"] = time.time() - start_time
+        return {"error": str(e), "metadata": {"query_steps": query_steps, "stages": deadline.stages}}
+
+async def handle_query(body):
+    """Procesa el cuerpo de una solicitud POST y devuelve el diccionario de respuesta."""
+    start_time = time.time()
+
+    try:
+        if not body:
+            return {'error': 'No se recibieron datos en la solicitud'}
+
+        try:
+            data = json.loads(body)
+        except json.JSONDecodeError as e:
+            return {'error': f'Error al decodificar JSON: {str(e)}'}
+
+        query = data.get('query', '')
+        conversation_history = data.get('conversation_history', [])
+        log_in_background(f"Consulta asíncrona recibida: {query[:200]}")
+
+        if not query:
+            return {'error': 'La consulta está vacía'}
+
+        if not ASYNC_OPENAI_CLIENT:
+            return {'error': 'API key de OpenAI no configurada'}
+
+        if not SUPABASE_URL or not SUPABASE_KEY:
+            return {'error': 'Credenciales de Supabase no configuradas'}
+
+        remaining_time = MAX_RESPONSE_TIME - (time.time() - start_time)
+        rag_result = await process_query_async(query, timeout=remaining_time, conversation_history=conversation_history)
+
+        result_error = check_rag_result(rag_result)
+        if result_error:
+            return {'error': result_error}
+
+        query_id = await register_query_async(query, rag_result["response"], rag_result["sources"],
+                                              rag_result.get("metadata", {}).get("usage"))
+        if query_id:
+            rag_result["query_id"] = query_id
+
+        logger.info(f"Consulta asíncrona completada en {time.time() - start_time:.3f}s")
+        return public_result(rag_result)
+    except Exception as e:
+        logger.error(f"Error general: {str(e)}")
+        logger.error(traceback.format_exc())
+        return {'error': f"Error general: {str(e)}"}
+
+
+async def read_body(receive):
+    """Lee el cuerpo completo de una solicitud ASGI."""
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            return body
+
+async def wait_for_disconnect(receive):
+    """Espera hasta que el cliente cierre la conexión."""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+async def send_response(send, origin, payload=None):
+    """Envía una respuesta con las cabeceras CORS usadas por query.Handler."""
+    body = json.dumps(payload).encode() if payload is not None else b""
+    headers = [
+        (b"access-control-allow-origin", origin.encode()),
+        (b"access-control-allow-methods", b"POST, GET, OPTIONS"),
+        (b"access-control-allow-headers", b"Content-Type"),
+        (b"content-length", str(len(body)).encode())
+    ]
+    if payload is not None:
+        headers.append((b"content-type", b"application/json"))
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+async def app(scope, receive, send):
+    """Aplicación ASGI del endpoint de consultas."""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if _rest_client is not None:
+                    await _rest_client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    if scope["type"] != "http":
+        return
+
+    headers = dict(scope.get("headers", []))
+    origin = headers.get(b"origin", b"*").decode()
+
+    if scope["method"] == "OPTIONS":
+        await send_response(send, "*")
+        return
+
+    body = await read_body(receive)
+    if body is None:
+        return
+
+    # Cancelar el procesamiento si el cliente se desconecta antes de recibir la respuesta
+    work = asyncio.ensure_future(handle_query(body))
+    disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+    done, _ = await asyncio.wait({work, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+
+    if work not in done:
+        work.cancel()
+        logger.warning("El cliente se desconectó; consulta cancelada")
+        return
+
+    disconnect.cancel()
+    await send_response(send, origin, work.result())
@@ -0,0 +1,334 @@
+"""
+Servidor HTTP para alojar la API web fuera de Vercel.
+
+Reutiliza los manejadores de `web/api` (query, feedback, document_stats, test) sobre un servidor con hilos que:
+- mantiene conexiones keep-alive (HTTP/1.1 con Content-Length en cada respuesta),
+- ejecuta las solicitudes en un pool acotado de trabajadores,
+- aplica control de admisión según la profundidad de la cola: cuando está llena responde
+  503 con Retry-After en lugar de dejar que la solicitud agote su tiempo,
+- registra un histograma de latencias por ruta, consultable en GET /api/stats (JSON) y junto con
+  el resto de métricas de la aplicación en GET /metrics (formato OpenMetrics para Prometheus),
+- opcionalmente envía sus estadísticas a un colector común cuando se ejecutan varias instancias,
+- opcionalmente se perfila por muestreo mientras está en marcha (--profile).
+
+Uso:
+    python web/server.py --port 8001 --workers 8 --max-queue 16
+"""
+
+import argparse
+import importlib.util
+import io
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# Añadir el directorio raíz al path para importar los módulos de la aplicación
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.metrics import CONTENT_TYPE, registry
+from app.utils.metrics_collector import MetricsReporter, parse_address
+from app.utils.profiler import SamplingProfiler, profile_path
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "api")
+
+# Ruta -> (archivo de web/api, nombre de la clase manejadora)
+API_ROUTES = {
+    "/api/query": ("query.py", "Handler"),
+    "/api/feedback": ("feedback.py", "Handler"),
+    "/api/document_stats": ("document_stats.py", "Handler"),
+    "/api/test": ("test.py", "handler"),
+}
+
+STATS_ROUTE = "/api/stats"
+METRICS_ROUTE = "/metrics"
+
+REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "Duración de las solicitudes HTTP por ruta en segundos.", ("route",)
+)
+REJECTED_REQUESTS = registry.counter(
+    "http_rejected_requests", "Solicitudes rechazadas con 503 por el control de admisión.", ("route",)
+)
+
+
+def load_api_routes():
+    """Carga las clases manejadoras de web/api indexadas por ruta.
+
+    Los módulos se cargan por ruta de archivo para que `test.py` no choque con el paquete `test`
+    de la biblioteca estándar.
+
+    Returns:
+        dict: Ruta -> clase manejadora.
+    """
+    if API_DIR not in sys.path:
+        sys.path.append(API_DIR)
+
+    routes = {}
+    for route, (filename, class_name) in API_ROUTES.items():
+        module_name = f"api_{os.path.splitext(filename)[0]}"
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(API_DIR, filename))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+        routes[route] = getattr(module, class_name)
+    return routes
+
+
+class AdmissionController:
+    """Control de admisión basado en la profundidad de la cola de trabajo."""
+
+    def __init__(self, workers, max_queue):
+        """Inicializa el controlador.
+
+        Args:
+            workers: Número de trabajadores del pool.
+            max_queue: Número máximo de solicitudes esperando un trabajador.
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.rejected = 0
+        self._avg_latency = 1.0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """Admite una solicitud si la cola no está llena.
+
+        Returns:
+            bool: True si la solicitud fue admitida.
+        """
+        with self._lock:
+            if self.in_flight - self.workers >= self.max_queue:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, latency):
+        """Libera el lugar de una solicitud admitida y actualiza la latencia media móvil."""
+        with self._lock:
+            self.in_flight -= 1
+            self._avg_latency = 0.8 * self._avg_latency + 0.2 * latency
+
+    def retry_after(self):
+        """Estima en segundos cuándo habrá capacidad libre (entre 1 y 30)."""
+        with self._lock:
+            queued = max(0, self.in_flight - self.workers) + 1
+            estimate = self._avg_latency * queued / self.workers
+        return max(1, min(30, math.ceil(estimate)))
+
+    def snapshot(self):
+        """Obtiene el estado actual del controlador."""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "queue_depth": max(0, self.in_flight - self.workers),
+                "rejected": self.rejected
+            }
+
+
+class RouterHandler(BaseHTTPRequestHandler):
+    """Enruta cada solicitud al manejador de web/api correspondiente.
+
+    Los manejadores de web/api escriben el cuerpo directamente tras `end_headers` y no envían
+    Content-Length. Aquí se difiere `end_headers` y se captura el cuerpo para añadir la cabecera,
+    lo que permite reutilizar la conexión.
+    """
+
+    protocol_version = "HTTP/1.1"
+    _buffering = False
+
+    def do_GET(self):
+        self._dispatch("do_GET")
+
+    def do_POST(self):
+        self._dispatch("do_POST")
+
+    def do_OPTIONS(self):
+        self._dispatch("do_OPTIONS")
+
+    def end_headers(self):
+        if not self._buffering:
+            super().end_headers()
+
+    def _dispatch(self, method):
+        route = urlsplit(self.path).path.rstrip("/")
+
+        if route == STATS_ROUTE and method == "do_GET":
+            self._send_json(200, self.server.get_stats())
+            return
+
+        if route == METRICS_ROUTE and method == "do_GET":
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        route_cls = self.server.routes.get(route)
+        if route_cls is None or not hasattr(route_cls, method):
+            status = 404 if route_cls is None else 405
+            self._send_json(status, {"error": f"Ruta no disponible: {method[3:]} {route}"}, close=True)
+            return
+
+        admission = self.server.admission
+        if not admission.try_acquire():
+            retry_after = admission.retry_after()
+            logger.warning(f"Cola llena; solicitud a {route} rechazada (Retry-After: {retry_after}s)")
+            REJECTED_REQUESTS.inc(route=route)
+            self._send_json(503, {"error": "Servidor saturado, inténtalo de nuevo más tarde"},
+                            close=True, extra_headers={"Retry-After": str(retry_after)})
+            return
+
+        start_time = time.perf_counter()
+        try:
+            self.server.pool.submit(self._run_route, route_cls, method).result()
+        finally:
+            latency = time.perf_counter() - start_time
+            admission.release(latency)
+            REQUEST_DURATION.observe(latency, route=route)
+
+    def _run_route(self, route_cls, method):
+        """Ejecuta el manejador capturando su respuesta para enviarla con Content-Length."""
+        real_wfile = self.wfile
+        body = io.BytesIO()
+        self.wfile = body
+        self._buffering = True
+        try:
+            getattr(route_cls, method)(self)
+        except Exception as e:
+            logger.error(f"Error no controlado en {self.path}: {e}")
+            self._headers_buffer = []
+            body = io.BytesIO(json.dumps({"error": f"Error general: {str(e)}"}).encode())
+            self.send_response(500)
+            self.send_header("Content-Type", "application/json")
+        finally:
+            self.wfile = real_wfile
+            self._buffering = False
+
+        payload = body.getvalue()
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_json(self, status, payload, close=False, extra_headers=None):
+        """Envía una respuesta JSON propia del servidor (estadísticas y errores)."""
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        if close:
+            # El cuerpo de la solicitud no se leyó: la conexión no puede reutilizarse
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+
+class RAGHTTPServer(ThreadingHTTPServer):
+    """Servidor HTTP con pool acotado de trabajadores y control de admisión."""
+
+    daemon_threads = True
+
+    def __init__(self, address, routes, workers=8, max_queue=16, keep_alive_timeout=5.0):
+        """Inicializa el servidor.
+
+        Args:
+            address: Tupla (host, puerto).
+            routes: Ruta -> clase manejadora (ver load_api_routes).
+            workers: Número de solicitudes procesadas simultáneamente.
+            max_queue: Número de solicitudes que pueden esperar un trabajador antes de responder 503.
+            keep_alive_timeout: Segundos que se mantiene abierta una conexión inactiva.
+        """
+        # Cada conexión tiene su propio hilo; cerrar las inactivas evita acumular hilos ociosos
+        handler = type("Handler", (RouterHandler,), {"timeout": keep_alive_timeout})
+        super().__init__(address, handler)
+        self.routes = routes
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-worker")
+        self.admission = AdmissionController(workers, max_queue)
+
+    def get_stats(self):
+        """Obtiene los histogramas por ruta y el estado del control de admisión."""
+        return {
+            "routes": {route: REQUEST_DURATION.labels(route=route).snapshot() for route in self.routes},
+            "admission": self.admission.snapshot()
+        }
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+
+def main():
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Servidor HTTP de la API web de RAGLEC")
+    parser.add_argument("--host", default=os.getenv("RAG_SERVER_HOST", "0.0.0.0"), help="Dirección de escucha")
+    parser.add_argument("--port", type=int, default=int(os.getenv("RAG_SERVER_PORT", "8001")), help="Puerto")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("RAG_SERVER_WORKERS", "8")),
+                        help="Solicitudes procesadas simultáneamente")
+    parser.add_argument("--max-queue", type=int, default=int(os.getenv("RAG_SERVER_MAX_QUEUE", "16")),
+                        help="Solicitudes en espera antes de responder 503")
+    parser.add_argument("--keep-alive-timeout", type=float, default=5.0,
+                        help="Segundos que se mantiene abierta una conexión inactiva")
+    parser.add_argument("--metrics-collector", metavar="HOST:PUERTO", default=os.getenv("RAG_METRICS_COLLECTOR"),
+                        help="Envía las estadísticas de rendimiento al colector (python Main.py collector)")
+    parser.add_argument("--profile", metavar="RUTA", default=os.getenv("RAG_PROFILE"),
+                        help="Perfila el servidor por muestreo y guarda un perfil periódicamente y al detenerlo (.json para speedscope)")
+    parser.add_argument("--profile-interval", type=float, default=float(os.getenv("RAG_PROFILE_INTERVAL", "0.01")),
+                        help="Segundos entre muestras del profiler")
+    parser.add_argument("--profile-every", type=float, default=float(os.getenv("RAG_PROFILE_EVERY", "60")),
+                        help="Segundos entre perfiles guardados mientras el servidor está en marcha (0: solo al detenerlo)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    reporter = None
+    if args.metrics_collector:
+        reporter = MetricsReporter(parse_address(args.metrics_collector))
+        reporter.start()
+
+    server = RAGHTTPServer((args.host, args.port), load_api_routes(), workers=args.workers,
+                           max_queue=args.max_queue, keep_alive_timeout=args.keep_alive_timeout)
+    logger.info(f"Servidor escuchando en http://{args.host}:{args.port} "
+                f"({args.workers} trabajadores, cola máxima {args.max_queue})")
+    profiler = SamplingProfiler(interval=args.profile_interval) if args.profile else None
+    if profiler:
+        profiler.start()
+        if args.profile_every > 0:
+            # Un archivo por periodo con solo sus muestras, sin esperar a que se detenga el servidor
+            profiler.write_every(args.profile_every, lambda: profile_path(args.profile, "web"))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Servidor detenido")
+    finally:
+        server.server_close()
+        if profiler:
+            profiler.stop()
+            profiler.write(profile_path(args.profile, "web"), reset=True)
+        if reporter:
+            # Enviar al colector las solicitudes atendidas desde el último envío
+            reporter.stop()
+
+
+if __name__ == "__main__":
+    main()